@@ -0,0 +1,57 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Cost of turning pubkey hashes into base58 addresses and back.
+
+Summarizing the outputs of a block into addresses encodes one hash160 per
+output, many of them repeated. Measures str() of P2PKHBitcoinAddress with
+and without the address cache, the batch encoder over the same hashes and
+parsing the address strings. Run with:
+
+    python -m benchmarks.bench_base58
+"""
+
+import random
+import time
+
+import bitcoin.wallet
+from bitcoin.base58 import decode_check, encode_check
+from bitcoin.wallet import CBitcoinAddress, P2PKHBitcoinAddress
+
+N_HASHES = 100000
+N_DISTINCT = 20000
+
+
+def main():
+    rnd = random.Random(0)
+    distinct = [rnd.getrandbits(160).to_bytes(20, 'little') for _ in range(N_DISTINCT)]
+    hashes = [rnd.choice(distinct) for _ in range(N_HASHES)]
+    addrs = [P2PKHBitcoinAddress.from_bytes(h) for h in hashes]
+    nVersion = addrs[0].nVersion
+    cache = bitcoin.wallet.address_cache
+    print(f'{N_HASHES} pubkey hashes, {N_DISTINCT} distinct')
+    print(f'{"method":>24s} {"total":>10s} {"per hash":>10s}')
+
+    def run(name, f):
+        start = time.perf_counter()
+        r = f()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>24s} {elapsed * 1000:8.1f}ms {elapsed / N_HASHES * 1e6:8.2f}us')
+        return r
+
+    expected = run('encode_check', lambda: [encode_check(h, nVersion) for h in hashes])
+    cache.clear()
+    assert run('str(), cold cache', lambda: [str(a) for a in addrs]) == expected
+    assert run('str(), warm cache', lambda: [str(a) for a in addrs]) == expected
+    cache.clear()
+    assert run('encode_many, cold cache', lambda: P2PKHBitcoinAddress.encode_many(hashes)) == expected
+    assert run('encode_many, warm cache', lambda: P2PKHBitcoinAddress.encode_many(hashes)) == expected
+    run('decode_check', lambda: [decode_check(s) for s in expected])
+    cache.clear()
+    run('CBitcoinAddress, cold', lambda: [CBitcoinAddress(s) for s in expected])
+    run('CBitcoinAddress, warm', lambda: [CBitcoinAddress(s) for s in expected])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Throughput of the bech32 segwit address codec.
+
+Encodes and decodes 100k P2WPKH and P2WSH addresses one at a time, through
+the batch encode_many()/decode_many() with and without NumPy, and through
+str() and the constructor of CBech32BitcoinAddress. Run with:
+
+    python -m benchmarks.bench_bech32
+"""
+
+import random
+import time
+
+import bitcoin
+import bitcoin.segwit_addr
+from bitcoin.segwit_addr import decode, decode_many, encode, encode_many
+from bitcoin.wallet import CBech32BitcoinAddress, CBitcoinAddress
+
+N_ADDRESSES = 100000
+
+
+def main():
+    rnd = random.Random(0)
+    witprogs = [rnd.getrandbits(160).to_bytes(20, 'little') for _ in range(N_ADDRESSES * 3 // 4)]
+    witprogs += [rnd.getrandbits(256).to_bytes(32, 'little') for _ in range(N_ADDRESSES // 4)]
+    hrp = bitcoin.params.BECH32_HRP
+    print(f'{N_ADDRESSES} addresses, hrp {hrp}')
+    print(f'{"method":>28s} {"total":>10s} {"per address":>12s}')
+
+    def run(name, f):
+        start = time.perf_counter()
+        r = f()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>28s} {elapsed * 1000:8.1f}ms {elapsed / N_ADDRESSES * 1e6:10.2f}us')
+        return r
+
+    addrs = run('encode', lambda: [encode(hrp, 0, p) for p in witprogs])
+    run('decode', lambda: [decode(hrp, a) for a in addrs])
+    np = bitcoin.segwit_addr._np
+    for use_np in (False, True):
+        if use_np and np is None:
+            print('numpy not installed')
+            break
+        bitcoin.segwit_addr._np = np if use_np else None
+        try:
+            suffix = ', numpy' if use_np else ''
+            assert run('encode_many' + suffix, lambda: encode_many(hrp, 0, witprogs)) == addrs
+            decoded = run('decode_many' + suffix, lambda: decode_many(hrp, addrs))
+            assert [p for v, p in decoded] == witprogs
+        finally:
+            bitcoin.segwit_addr._np = np
+    objs = run('CBitcoinAddress', lambda: [CBitcoinAddress(a) for a in addrs])
+    run('str', lambda: [str(o) for o in objs])
+    run('CBech32Data.encode_many', lambda: CBech32BitcoinAddress.encode_many(0, witprogs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Throughput of BIP158 basic block filters.
+
+Builds the filters of a range of synthetic blocks of P2WPKH outputs, appends
+them to a BlockFilterStore and matches a wallet's scripts against the whole
+range, with and without NumPy. Run with:
+
+    python -m benchmarks.bench_blockfilter
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import bitcoin.blockfilter
+from bitcoin.blockfilter import BlockFilterStore, CBlockFilter
+from bitcoin.core import CBlock, COutPoint, CScript, CTransaction, CTxIn, CTxOut
+
+N_BLOCKS = 100
+N_TXS = 500
+N_WALLET = 200
+
+
+def make_blocks() -> (list, list):
+    rnd = random.Random(0)
+
+    def randbytes(n: int) -> bytes:
+        return rnd.getrandbits(n * 8).to_bytes(n, 'little')
+
+    blocks = []
+    prev_scripts = []
+    for _ in range(N_BLOCKS):
+        vtx = []
+        spent = []
+        for _ in range(N_TXS):
+            vout = [CTxOut(rnd.randrange(10 ** 8), CScript(b'\x00\x14' + randbytes(20))) for _ in range(2)]
+            vtx.append(CTransaction([CTxIn(COutPoint(randbytes(32), 0))], vout))
+            spent.append(b'\x00\x14' + randbytes(20))
+        blocks.append(CBlock(hashPrevBlock=randbytes(32), vtx=vtx))
+        prev_scripts.append(spent)
+    return blocks, prev_scripts
+
+
+def main():
+    blocks, prev_scripts = make_blocks()
+    wallet = [b'\x00\x14' + bytes([i % 256, i // 256]) * 10 for i in range(N_WALLET - 2)]
+    wallet += [bytes(blocks[7].vtx[3].vout[0].scriptPubKey), prev_scripts[42][0]]
+    print(f'{N_BLOCKS} blocks of {N_TXS} transactions, {N_WALLET} wallet scripts')
+    print(f'{"numpy":>6s} {"build":>10s} {"per block":>10s} {"append":>10s} {"match":>10s} {"matched":>8s}')
+    np = bitcoin.blockfilter._np
+    tmp = tempfile.mkdtemp()
+    try:
+        for use_np in (False, True):
+            if use_np and np is None:
+                print('numpy not installed')
+                break
+            bitcoin.blockfilter._np = np if use_np else None
+            try:
+                start = time.perf_counter()
+                filters = [CBlockFilter.from_block(b, s) for b, s in zip(blocks, prev_scripts)]
+                build = time.perf_counter() - start
+
+                path = os.path.join(tmp, f'filters{int(use_np)}')
+                start = time.perf_counter()
+                with BlockFilterStore(path) as store:
+                    for f in filters:
+                        store.append(f)
+                append = time.perf_counter() - start
+
+                with BlockFilterStore(path) as store:
+                    start = time.perf_counter()
+                    matched = store.match_range(wallet, 0)
+                    match = time.perf_counter() - start
+            finally:
+                bitcoin.blockfilter._np = np
+            print(f'{str(use_np):>6s} {build * 1000:8.1f}ms {build / N_BLOCKS * 1000:8.2f}ms '
+                  f'{append * 1000:8.1f}ms {match * 1000:8.1f}ms {len(matched):8d}')
+    finally:
+        shutil.rmtree(tmp)
+    print(f'filter size {sum(len(f.encoded) for f in filters) // N_BLOCKS} bytes per block')
+
+
+if __name__ == '__main__':
+    main()
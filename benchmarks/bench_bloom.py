@@ -0,0 +1,62 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Cost of building and querying an SPV bloom filter.
+
+Inserts a growing number of outpoints into a CBloomFilter sized for them and
+then tests as many outpoints again, half of them inserted, once element by
+element with insert() and contains(), and once with insert_many() and
+contains_many(), with NumPy when it is installed and with the pure Python
+fallback. Run with:
+
+    python -m benchmarks.bench_bloom
+"""
+
+import os
+import time
+
+import bitcoin.bloom
+from bitcoin.bloom import CBloomFilter
+from bitcoin.core import COutPoint
+
+
+def make_outpoints(n: int) -> list:
+    return [COutPoint(os.urandom(32), i % 4) for i in range(n)]
+
+
+def per_element(f: CBloomFilter, elems: list, probe: list):
+    for elem in elems:
+        f.insert(elem)
+    for elem in probe:
+        f.contains(elem)
+
+
+def batch(f: CBloomFilter, elems: list, probe: list):
+    f.insert_many(elems)
+    f.contains_many(probe)
+
+
+def main():
+    np = bitcoin.bloom._np
+    print(f'{"elements":>8s} {"hashes":>6s} {"per element":>12s} {"batch":>12s} {"batch numpy":>12s}')
+    for n in (1000, 10000, 50000):
+        elems = make_outpoints(n)
+        probe = elems[::2] + make_outpoints(n // 2)
+        res = []
+        for f, use_np in ((per_element, False), (batch, False), (batch, True)):
+            if use_np and np is None:
+                res.append(None)
+                continue
+            bitcoin.bloom._np = np if use_np else None
+            bloom = CBloomFilter(n, 0.0001, 0, CBloomFilter.UPDATE_ALL)
+            start = time.perf_counter()
+            f(bloom, elems, probe)
+            res.append(time.perf_counter() - start)
+        bitcoin.bloom._np = np
+        cols = ' '.join(f'{r * 1e3:10.1f}ms' if r is not None else f'{"n/a":>12s}' for r in res)
+        print(f'{n:8d} {bloom.nHashFuncs:6d} {cols}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Cost of classifying the outputs of a block.
+
+Classifies a block with a mix of P2PKH, P2SH, P2WPKH, P2WSH and nonstandard
+outputs, once with the CScript template predicates (parsing the script for
+P2PKH as the non-canonical address path does), once output by output with
+ClassifyScriptPubKey() and once with ClassifyBlockOutputs(). Address
+derivation with CBitcoinAddress.from_scriptPubKey() is timed as well. The
+best of five runs is reported. Run with:
+
+    python -m benchmarks.bench_classify
+"""
+
+import os
+import random
+import time
+
+from bitcoin.core import CBlock, CScript, CTransaction, CTxIn, CTxOut
+from bitcoin.core.script import (OP_0, OP_CHECKSIG, OP_DUP, OP_EQUAL, OP_EQUALVERIFY, OP_HASH160, OP_RETURN,
+                                 ClassifyBlockOutputs, ClassifyScriptPubKey)
+from bitcoin.wallet import CBitcoinAddress, CBitcoinAddressError
+
+N_TXS = 2000
+N_OUTS = 5
+
+
+def make_script(rnd: random.Random) -> CScript:
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return CScript([OP_DUP, OP_HASH160, os.urandom(20), OP_EQUALVERIFY, OP_CHECKSIG])
+    if kind == 1:
+        return CScript([OP_HASH160, os.urandom(20), OP_EQUAL])
+    if kind == 2:
+        return CScript([OP_0, os.urandom(20)])
+    if kind == 3:
+        return CScript([OP_0, os.urandom(32)])
+    return CScript([OP_RETURN, os.urandom(40)])
+
+
+def make_block() -> CBlock:
+    rnd = random.Random(0)
+    vtx = [CTransaction([CTxIn()], [CTxOut(1000, make_script(rnd)) for _ in range(N_OUTS)]) for _ in range(N_TXS)]
+    return CBlock(vtx=vtx)
+
+
+def classify_predicates(block: CBlock):
+    for tx in block.vtx:
+        for txout in tx.vout:
+            s = txout.scriptPubKey
+            if s.is_p2sh() or s.is_witness_v0_keyhash() or s.is_witness_v0_scripthash():
+                continue
+            ops = tuple(s)
+            if len(ops) == 5 and ops[0] == OP_DUP and ops[1] == OP_HASH160 and ops[3] == OP_EQUALVERIFY:
+                continue
+
+
+def classify_each(block: CBlock):
+    for tx in block.vtx:
+        for txout in tx.vout:
+            ClassifyScriptPubKey(txout.scriptPubKey)
+
+
+def addresses(block: CBlock):
+    for tx in block.vtx:
+        for txout in tx.vout:
+            try:
+                CBitcoinAddress.from_scriptPubKey(txout.scriptPubKey)
+            except CBitcoinAddressError:
+                pass
+
+
+def main():
+    block = make_block()
+    n = N_TXS * N_OUTS
+    print(f'{"method":>22s} {"total":>10s} {"per output":>12s}')
+    for name, f in (('template predicates', classify_predicates),
+                    ('ClassifyScriptPubKey', classify_each),
+                    ('ClassifyBlockOutputs', ClassifyBlockOutputs),
+                    ('address derivation', addresses)):
+        elapsed = float('inf')
+        for _ in range(5):
+            start = time.perf_counter()
+            f(block)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(f'{name:>22s} {elapsed * 1e3:8.1f}ms {elapsed / n * 1e6:10.2f}us')
+
+
+if __name__ == '__main__':
+    main()
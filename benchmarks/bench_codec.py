@@ -0,0 +1,79 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Json codec throughput on typical upstream payloads.
+
+Compares the previous json.dumps(...).encode('utf8') / json.loads round trip
+with exr.codec on an evm block with full transactions and a transaction
+receipt with logs. The exr package imports uwsgi, run with:
+
+    uwsgi --pythonpath . --pyrun benchmarks/bench_codec.py
+"""
+
+import json
+import timeit
+
+from exr import codec
+
+
+def _hex(i: int, size: int = 32) -> str:
+    return '0x' + ('%x' % i).rjust(size * 2, '0')
+
+
+def make_tx(i: int) -> dict:
+    return {
+        'blockHash': _hex(1), 'blockNumber': hex(15000000), 'from': _hex(i, 20), 'to': _hex(i + 1, 20),
+        'gas': hex(21000), 'gasPrice': hex(30000000000), 'hash': _hex(i), 'input': '0x' + 'ab' * 68,
+        'nonce': hex(i), 'transactionIndex': hex(i), 'value': hex(10 ** 18), 'type': '0x2',
+        'v': '0x1', 'r': _hex(i * 7), 's': _hex(i * 11), 'chainId': '0x1', 'accessList': [],
+    }
+
+
+BLOCK = {
+    'jsonrpc': '2.0', 'id': 1,
+    'result': {
+        'number': hex(15000000), 'hash': _hex(1), 'parentHash': _hex(2), 'nonce': '0x0000000000000000',
+        'sha3Uncles': _hex(3), 'logsBloom': '0x' + '00' * 256, 'transactionsRoot': _hex(4),
+        'stateRoot': _hex(5), 'receiptsRoot': _hex(6), 'miner': _hex(7, 20), 'difficulty': '0x0',
+        'totalDifficulty': hex(58750003716598352816469), 'extraData': '0x', 'size': hex(80000),
+        'gasLimit': hex(30000000), 'gasUsed': hex(15000000), 'timestamp': hex(1655000000),
+        'transactions': [make_tx(i) for i in range(200)], 'uncles': [],
+    },
+}
+
+RECEIPT = {
+    'jsonrpc': '2.0', 'id': 1,
+    'result': {
+        'blockHash': _hex(1), 'blockNumber': hex(15000000), 'contractAddress': None,
+        'cumulativeGasUsed': hex(1000000), 'effectiveGasPrice': hex(30000000000), 'from': _hex(8, 20),
+        'gasUsed': hex(150000), 'logsBloom': '0x' + '00' * 256, 'status': '0x1', 'to': _hex(9, 20),
+        'transactionHash': _hex(10), 'transactionIndex': '0x5', 'type': '0x2',
+        'logs': [{
+            'address': _hex(i, 20), 'topics': [_hex(i), _hex(i + 1), _hex(i + 2)], 'data': _hex(i * 3),
+            'blockNumber': hex(15000000), 'transactionHash': _hex(10), 'transactionIndex': '0x5',
+            'blockHash': _hex(1), 'logIndex': hex(i), 'removed': False,
+        } for i in range(12)],
+    },
+}
+
+
+def main():
+    print(f'backend: {codec.BACKEND}')
+    for name, doc in (('block', BLOCK), ('receipt', RECEIPT)):
+        raw = json.dumps(doc).encode('utf8')
+        n = 200 if name == 'block' else 5000
+        cases = (
+            ('json dumps', lambda: json.dumps(doc).encode('utf8')),
+            ('codec dumps', lambda: codec.dumps(doc)),
+            ('json loads', lambda: json.loads(raw)),
+            ('codec loads', lambda: codec.loads(raw)),
+        )
+        print(f'{name} ({len(raw)} bytes)')
+        for case, fn in cases:
+            t = min(timeit.repeat(fn, number=n, repeat=5))
+            print(f'  {case:12s} {t / n * 1e6:10.1f} us')
+
+
+if __name__ == '__main__':
+    main()
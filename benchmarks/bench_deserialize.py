@@ -0,0 +1,71 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Block deserialization throughput.
+
+Builds a mainnet-sized block (about 1.5 MB, 3000 transactions with a mix of
+p2pkh spends and segwit spends carrying witnesses) and compares
+deserializing it through a BytesIO stream with the BytesCursor used by
+CBlock.deserialize(), and with CLazyBlock which only indexes the
+transactions. Run with:
+
+    python -m benchmarks.bench_deserialize
+"""
+
+import os
+import random
+import timeit
+from io import BytesIO
+
+from bitcoin.core import (CBlock, CLazyBlock, COutPoint, CScript, CScriptWitness, CTransaction, CTxIn,
+                          CTxInWitness, CTxOut, CTxWitness, Hash)
+
+
+def make_tx(rnd: random.Random, segwit: bool) -> CTransaction:
+    n_in = rnd.choice((1, 1, 2, 3))
+    n_out = rnd.choice((1, 2, 2, 3))
+    vin = []
+    wit = []
+    for _ in range(n_in):
+        prevout = COutPoint(os.urandom(32), rnd.randrange(4))
+        if segwit:
+            vin.append(CTxIn(prevout, CScript(), 0xfffffffd))
+            wit.append(CTxInWitness(CScriptWitness((os.urandom(72), os.urandom(33)))))
+        else:
+            vin.append(CTxIn(prevout, CScript(os.urandom(107)), 0xffffffff))
+    vout = [CTxOut(rnd.randrange(10 ** 8), CScript(b'\x76\xa9\x14' + os.urandom(20) + b'\x88\xac'))
+            for _ in range(n_out)]
+    return CTransaction(vin, vout, 0, 2, CTxWitness(wit) if segwit else CTxWitness())
+
+
+def make_block(n_tx: int = 3000, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    coinbase = CTransaction([CTxIn(COutPoint(), CScript(b'\x03\x01\x02\x03' + os.urandom(20)))],
+                            [CTxOut(625000000, CScript(b'\x00\x14' + os.urandom(20)))])
+    vtx = [coinbase] + [make_tx(rnd, rnd.random() < 0.7) for _ in range(n_tx - 1)]
+    block = CBlock(nVersion=0x20000000, hashPrevBlock=Hash(b'prev'), nTime=1650000000, nBits=0x170901ba,
+                   vtx=vtx)
+    return block.serialize()
+
+
+def main():
+    raw = make_block()
+    print(f'block: {len(raw)} bytes')
+    assert CBlock.stream_deserialize(BytesIO(raw)).serialize() == CBlock.deserialize(raw).serialize()
+    cases = (
+        ('BytesIO', lambda: CBlock.stream_deserialize(BytesIO(raw))),
+        ('BytesCursor', lambda: CBlock.deserialize(raw)),
+        ('memoryview', lambda: CBlock.deserialize(memoryview(raw))),
+        ('lazy', lambda: CLazyBlock.deserialize(raw)),
+        ('lazy+merkle', lambda: CLazyBlock.deserialize(raw).vMerkleTree),
+        ('lazy+weight', lambda: CLazyBlock.deserialize(raw).GetWeight()),
+        ('lazy+1 tx', lambda: CLazyBlock.deserialize(raw).vtx[1500]),
+    )
+    for name, fn in cases:
+        t = min(timeit.repeat(fn, number=3, repeat=5)) / 3
+        print(f'  {name:12s} {t * 1e3:8.1f} ms  {len(raw) / t / 1e6:6.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
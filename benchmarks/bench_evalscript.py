@@ -0,0 +1,48 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Script interpreter overhead of EvalScript().
+
+Evaluates scripts that do not check signatures, so that the time measured
+is spent decoding and dispatching opcodes rather than in ECDSA: a P2PKH
+style hash check, a long arithmetic script and a script that mostly
+consists of branches that are not taken. Run with:
+
+    python -m benchmarks.bench_evalscript
+"""
+
+import os
+import time
+
+from bitcoin.core import COutPoint, CScript, CTransaction, CTxIn, CTxOut, Hash160
+from bitcoin.core.script import (OP_1, OP_1ADD, OP_2DUP, OP_ADD, OP_DROP, OP_DUP, OP_ELSE, OP_ENDIF,
+                                 OP_EQUAL, OP_EQUALVERIFY, OP_HASH160, OP_IF, OP_NOTIF, OP_SWAP)
+from bitcoin.core.scripteval import EvalScript
+
+
+def make_cases():
+    pub = os.urandom(33)
+    hash_check = CScript([OP_DUP, OP_HASH160, Hash160(pub), OP_EQUALVERIFY, OP_1])
+    arithmetic = CScript([OP_1] + [OP_DUP, OP_1ADD, OP_SWAP, OP_DROP] * 40 + [41, OP_EQUAL])
+    branches = CScript(([OP_1, OP_NOTIF] + [OP_2DUP, OP_ADD, OP_DROP, OP_DROP] * 8 + [OP_ENDIF]) * 3 +
+                       [OP_1, OP_IF, OP_1, OP_ELSE] + [OP_2DUP, OP_DROP, OP_DROP] * 25 + [OP_ENDIF])
+    return [('p2pkh hash check', [pub], hash_check),
+            ('arithmetic', [], arithmetic),
+            ('untaken branches', [], branches)]
+
+
+def main():
+    tx = CTransaction([CTxIn(COutPoint(os.urandom(32), 0))], [CTxOut(0, CScript())])
+    n = 2000
+    print(f'{"script":>18s} {"ops":>5s} {"per eval":>10s}')
+    for name, stack, script in make_cases():
+        start = time.perf_counter()
+        for _ in range(n):
+            EvalScript(list(stack), script, tx, 0)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>18s} {len(list(script.raw_iter())):5d} {elapsed / n * 1e6:8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Per-request cost of debug logging with the log level at WARNING.
+
+Compares the eager str.format() calls previously made in call_xrfunc with the
+deferred structured logger. The exr package imports uwsgi, run with:
+
+    uwsgi --pythonpath . --pyrun benchmarks/bench_logging.py
+"""
+
+import io
+import logging
+import timeit
+
+from exr import log
+
+ENV = {
+    'REQUEST_METHOD': 'POST',
+    'PATH_INFO': '/xr/BLOCK/xrGetBlocks',
+    'CONTENT_TYPE': 'application/json',
+    'CONTENT_LENGTH': '1024',
+    'REMOTE_ADDR': '10.0.0.1',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'HTTP_XR_PUBKEY': '02' + 'ab' * 32,
+    'HTTP_XR_SIGNATURE': 'cd' * 65,
+    'HTTP_XR_PAYMENT': 'ef' * 250,
+    'wsgi.input': io.BytesIO(b'[]'),
+    'wsgi.errors': io.StringIO(),
+    'wsgi.url_scheme': 'http',
+}
+PARAMS = ['%064x' % i for i in range(50)]
+
+logger = log.get_logger('bench')
+
+
+def eager():
+    logging.debug('call_xrfunc_namesp: {} token: {} xrfunc: {} env: {}'.format('xr', 'BLOCK', 'xrGetBlocks', ENV))
+    logging.debug('request_body_data: {}'.format(PARAMS))
+    logging.debug('params: {}'.format(PARAMS))
+    logging.debug('CALL_URL_is_xr_plugin_xrfunc: {} params: {} env: {}'.format('xrGetBlocks', PARAMS, ENV))
+
+
+def deferred():
+    logger.debug('call_xrfunc', namesp='xr', token='BLOCK', xrfunc='xrGetBlocks', env=ENV)
+    logger.debug('request body', data=PARAMS)
+    logger.debug('request params', params=PARAMS)
+    logger.debug('call_url xrouter plugin', xrfunc='xrGetBlocks', params=PARAMS, env=ENV)
+
+
+def main():
+    log.setup('WARNING')
+    n = 20000
+    for name, fn in (('eager', eager), ('deferred', deferred)):
+        t = min(timeit.repeat(fn, number=n, repeat=5))
+        print(f'{name:10s} {t / n * 1e6:8.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
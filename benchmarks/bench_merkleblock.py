@@ -0,0 +1,75 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Cost of serving a BIP37 filtered block.
+
+Builds a block of P2PKH transactions, then deserializes it and creates the
+merkleblock for a bloom filter watching a few of its addresses, from a
+CBlock and from a CLazyBlock whose transactions are matched straight from
+the serialized block, with and without NumPy. The size of the merkleblock
+can be compared with the size of the block. Run with:
+
+    python -m benchmarks.bench_merkleblock
+"""
+
+import random
+import time
+
+import bitcoin.bloom
+from bitcoin.bloom import CBloomFilter, CMerkleBlock
+from bitcoin.core import CBlock, CLazyBlock, COutPoint, CScript, CTransaction, CTxIn, CTxOut
+from bitcoin.core.script import OP_CHECKSIG, OP_DUP, OP_EQUALVERIFY, OP_HASH160
+
+N_TXS = 2000
+N_WATCHED = 20
+
+
+def make_block() -> (bytes, list):
+    rnd = random.Random(0)
+
+    def randbytes(n: int) -> bytes:
+        return rnd.getrandbits(n * 8).to_bytes(n, 'little')
+
+    vtx = []
+    pubkey_hashes = []
+    for i in range(N_TXS):
+        vin = [CTxIn(COutPoint(randbytes(32), 0), CScript([randbytes(71), b'\x02' + randbytes(32)]))
+               for _ in range(2)]
+        vout = []
+        for _ in range(2):
+            h = randbytes(20)
+            pubkey_hashes.append(h)
+            vout.append(CTxOut(rnd.randrange(10 ** 8), CScript([OP_DUP, OP_HASH160, h, OP_EQUALVERIFY, OP_CHECKSIG])))
+        vtx.append(CTransaction(vin, vout))
+    return CBlock(vtx=vtx).serialize(), rnd.sample(pubkey_hashes, N_WATCHED)
+
+
+def make_filter(watched: list) -> CBloomFilter:
+    bloom = CBloomFilter(N_WATCHED * 2, 0.0001, 0, CBloomFilter.UPDATE_ALL)
+    bloom.insert_many(watched)
+    return bloom
+
+
+def main():
+    serialized, watched = make_block()
+    print(f'block of {N_TXS} transactions, {len(serialized)} bytes, {N_WATCHED} watched addresses')
+    print(f'{"block class":>12s} {"numpy":>6s} {"time":>10s} {"matched":>8s} {"merkleblock":>12s}')
+    np = bitcoin.bloom._np
+    for use_np in (False, True):
+        if use_np and np is None:
+            continue
+        bitcoin.bloom._np = np if use_np else None
+        for cls in (CBlock, CLazyBlock):
+            bloom = make_filter(watched)
+            start = time.perf_counter()
+            merkle_block = CMerkleBlock.from_block(cls.deserialize(serialized), bloom)
+            elapsed = time.perf_counter() - start
+            size = len(merkle_block.serialize())
+            print(f'{cls.__name__:>12s} {str(use_np):>6s} {elapsed * 1e3:8.1f}ms '
+                  f'{len(merkle_block.vMatchedTxn):8d} {size:10d}B')
+    bitcoin.bloom._np = np
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Throughput of reading P2P messages from a recorded peer stream.
+
+Records a stream of tx, inv, block and ping messages, as relayed by a
+peer, and reads it back with MsgSerializable.stream_deserialize() and with
+a MessageFramer fed 64KiB chunks, as received from a socket: framing and
+checksums only, decoding every message, and decoding blocks lazily. Run
+with:
+
+    python -m benchmarks.bench_messages
+"""
+
+import io
+import random
+import time
+
+from bitcoin.core import CBlock, COutPoint, CScript, CTransaction, CTxIn, CTxOut
+from bitcoin.messages import MessageFramer, MsgSerializable, msg_block, msg_inv, msg_ping, msg_tx
+from bitcoin.net import CInv
+
+N_TXS = 5000
+N_BLOCKS = 10
+BLOCK_TXS = 2000
+CHUNK_SIZE = 1 << 16
+
+
+def make_stream() -> (bytes, int):
+    rnd = random.Random(0)
+
+    def make_tx(i: int) -> CTransaction:
+        return CTransaction([CTxIn(COutPoint(rnd.getrandbits(256).to_bytes(32, 'little'), 0), CScript(b'\x00' * 107))],
+                            [CTxOut(i, CScript(b'\x00\x14' + rnd.getrandbits(160).to_bytes(20, 'little')))
+                             for _ in range(2)])
+
+    parts = []
+    for i in range(N_TXS):
+        tx = make_tx(i)
+        inv = msg_inv()
+        inv.inv = [CInv()]
+        inv.inv[0].type = 1
+        inv.inv[0].hash = tx.GetTxid()
+        m = msg_tx()
+        m.tx = tx
+        parts += [inv.to_bytes(), m.to_bytes()]
+        if i % (N_TXS // N_BLOCKS) == 0:
+            m = msg_block()
+            m.block = CBlock(nNonce=i, vtx=[make_tx(j) for j in range(BLOCK_TXS)])
+            parts += [m.to_bytes(), msg_ping(i).to_bytes()]
+    return b''.join(parts), len(parts)
+
+
+def main():
+    stream, n_msgs = make_stream()
+    print(f'{n_msgs} messages, {len(stream) / 1e6:.1f}MB')
+    print(f'{"method":>24s} {"total":>10s} {"MB/s":>8s} {"msgs/s":>10s}')
+
+    def run(name, f):
+        start = time.perf_counter()
+        n = f()
+        elapsed = time.perf_counter() - start
+        assert n == n_msgs, n
+        print(f'{name:>24s} {elapsed * 1000:8.1f}ms {len(stream) / elapsed / 1e6:8.1f} {n / elapsed:10.0f}')
+
+    def stream_deserialize():
+        f = io.BytesIO(stream)
+        n = 0
+        while f.tell() < len(stream):
+            MsgSerializable.stream_deserialize(f)
+            n += 1
+        return n
+
+    def framer(lazy=False, decode=True):
+        def f():
+            framer = MessageFramer(lazy=lazy)
+            n = 0
+            for pos in range(0, len(stream), CHUNK_SIZE):
+                framer.feed(stream[pos:pos + CHUNK_SIZE])
+                if decode:
+                    for _ in framer:
+                        n += 1
+                else:
+                    while framer.read_frame() is not None:
+                        n += 1
+            return n
+        return f
+
+    run('stream_deserialize', stream_deserialize)
+    run('framer, frames only', framer(decode=False))
+    run('framer', framer())
+    run('framer, lazy blocks', framer(lazy=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Round trips of bitcoin.rpc against a local JSON-RPC server.
+
+Fetches block hashes one call at a time, through Proxy.batch(), from
+several threads sharing one proxy and with all calls in flight at once on an
+AsyncProxy. The server answers immediately, so this measures the client and
+HTTP overhead per call. Then fetches a block of about 1MB as hex over
+JSON-RPC and in binary over REST, decoded as a CBlock and a CLazyBlock. Run
+with:
+
+    python -m benchmarks.bench_rpc
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bitcoin.core import CBlock, COutPoint, CScript, CTransaction, CTxIn, CTxOut
+from bitcoin.rpc import AsyncProxy, Proxy
+
+N_CALLS = 5000
+N_THREADS = 4
+N_BLOCKS = 20
+
+
+def make_block() -> CBlock:
+    vtx = [CTransaction([CTxIn(COutPoint(i.to_bytes(32, 'little'), 0), CScript(b'\x00' * 107))],
+                        [CTxOut(i, CScript(b'\x00\x14' + bytes(20))) for _ in range(2)])
+           for i in range(4000)]
+    return CBlock(vtx=vtx)
+
+
+BLOCK = make_block().serialize()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+        def dispatch(r):
+            if r['method'] == 'getblock':
+                return {'result': BLOCK.hex(), 'error': None, 'id': r['id']}
+            return {'result': '%064x' % r['params'][0], 'error': None, 'id': r['id']}
+
+        if isinstance(request, list):
+            response = [dispatch(r) for r in request]
+        else:
+            response = dispatch(request)
+        self.reply(json.dumps(response).encode(), 'application/json')
+
+    def do_GET(self):
+        self.reply(BLOCK, 'application/octet-stream')
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://u:p@127.0.0.1:%d' % server.server_address[1]
+    proxy = Proxy(url)
+    print(f'{N_CALLS} getblockhash calls')
+    print(f'{"method":>24s} {"total":>10s} {"per call":>10s}')
+
+    def run(name, f):
+        start = time.perf_counter()
+        r = f()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>24s} {elapsed * 1000:8.1f}ms {elapsed / N_CALLS * 1e6:8.1f}us')
+        return r
+
+    try:
+        expected = run('serial', lambda: [proxy.getblockhash(i) for i in range(N_CALLS)])
+        for chunk_size in (10, 100, 1000):
+            calls = [('getblockhash', i) for i in range(N_CALLS)]
+            assert run(f'batch, chunks of {chunk_size}', lambda: proxy.batch(calls, chunk_size=chunk_size)) == expected
+
+        def worker(start):
+            for i in range(start, N_CALLS, N_THREADS):
+                proxy.getblockhash(i)
+
+        def threaded():
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(N_THREADS)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        run(f'{N_THREADS} threads, one proxy', threaded)
+
+        async def gather():
+            async with AsyncProxy(url, max_connections=N_THREADS) as aproxy:
+                return await asyncio.gather(*(aproxy.getblockhash(i) for i in range(N_CALLS)))
+        assert run(f'asyncio, {N_THREADS} connections', lambda: asyncio.run(gather())) == expected
+
+        rest_proxy = Proxy(url, rest=True)
+        print(f'{N_BLOCKS} getblock calls, {len(BLOCK)} bytes per block')
+        for name, p, lazy in (('json-rpc', proxy, False), ('rest', rest_proxy, False),
+                              ('json-rpc, lazy', proxy, True), ('rest, lazy', rest_proxy, True)):
+            start = time.perf_counter()
+            for _ in range(N_BLOCKS):
+                p.getblock(b'\x00' * 32, lazy=lazy)
+            elapsed = time.perf_counter() - start
+            print(f'{name:>24s} {elapsed * 1000:8.1f}ms {elapsed / N_BLOCKS * 1000:8.2f}ms')
+        rest_proxy.close()
+    finally:
+        proxy.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
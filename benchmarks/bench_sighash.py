@@ -0,0 +1,52 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Signature hash cost of signing every input of a transaction.
+
+Computes the legacy and the BIP143 (segwit v0) signature hash of every input
+of transactions with a growing number of inputs, with and without a
+PrecomputedTransactionData. Without it every segwit input rehashes all
+prevouts, sequences and outputs, and every legacy input reserializes them.
+The legacy hash covers the whole transaction, so its total cost grows
+quadratically either way. Run with:
+
+    python -m benchmarks.bench_sighash
+"""
+
+import os
+import time
+
+from bitcoin.core import COutPoint, CScript, CTransaction, CTxIn, CTxOut
+from bitcoin.core.script import (OP_CHECKSIG, OP_DUP, OP_EQUALVERIFY, OP_HASH160, SIGHASH_ALL,
+                                 SIGVERSION_BASE, SIGVERSION_WITNESS_V0, PrecomputedTransactionData, SignatureHash)
+
+
+def make_tx(n_in: int) -> CTransaction:
+    vin = [CTxIn(COutPoint(os.urandom(32), i % 4), CScript(), 0xfffffffd) for i in range(n_in)]
+    vout = [CTxOut(10000, CScript(b'\x00\x14' + os.urandom(20))) for _ in range(max(n_in // 10, 1))]
+    return CTransaction(vin, vout, nVersion=2)
+
+
+def sign_all(tx: CTransaction, script: CScript, sigversion: int, precompute: bool):
+    cache = PrecomputedTransactionData(tx) if precompute else None
+    for i in range(len(tx.vin)):
+        SignatureHash(script, tx, i, SIGHASH_ALL, amount=10000, sigversion=sigversion, cache=cache)
+
+
+def main():
+    script = CScript([OP_DUP, OP_HASH160, os.urandom(20), OP_EQUALVERIFY, OP_CHECKSIG])
+    print(f'{"sigversion":>10s} {"inputs":>8s} {"uncached":>12s} {"precomputed":>12s}')
+    for name, sigversion in (('base', SIGVERSION_BASE), ('witness_v0', SIGVERSION_WITNESS_V0)):
+        for n in (100, 250, 500, 1000):
+            tx = make_tx(n)
+            res = []
+            for precompute in (False, True):
+                start = time.perf_counter()
+                sign_all(tx, script, sigversion, precompute)
+                res.append(time.perf_counter() - start)
+            print(f'{name:>10s} {n:8d} {res[0] * 1e3:10.1f}ms {res[1] * 1e3:10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
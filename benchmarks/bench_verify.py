@@ -0,0 +1,91 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Script verification throughput of VerifyBlockScripts() by worker count.
+
+Builds a block of P2PKH spends signed with a handful of keys and verifies
+all of its inputs with 1 to N worker processes, N being the number of CPUs
+unless given on the command line. Then times VerifyTransactionInputs() on a
+4 input transaction in process, with a pool started for the call and with a
+long-lived executor. The signature cache is disabled so every run does the
+full ECDSA verification. Run with:
+
+    python -m benchmarks.bench_verify [max_workers]
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import sys
+import time
+
+import bitcoin.core.scripteval
+from bitcoin.core import CBlock, COutPoint, CScript, CTransaction, CTxIn, CTxOut, Hash160
+from bitcoin.core.script import (OP_CHECKSIG, OP_DUP, OP_EQUALVERIFY, OP_HASH160, SIGHASH_ALL,
+                                 PrecomputedTransactionData, SignatureHash)
+from bitcoin.core.scripteval import SCRIPT_VERIFY_P2SH, VerifyBlockScripts, VerifyTransactionInputs
+from bitcoin.wallet import CKey
+
+
+def make_block(n_tx: int = 200, n_in: int = 5):
+    keys = [CKey(hashlib.sha256(bytes([i])).digest()) for i in range(8)]
+    prevouts = {}
+    vtx = [CTransaction([CTxIn(COutPoint(), CScript([0, 0]))], [CTxOut(0, CScript())])]
+    for i in range(n_tx):
+        spent = []
+        for j in range(n_in):
+            key = keys[(i + j) % len(keys)]
+            prevout = COutPoint(os.urandom(32), j)
+            prevouts[prevout] = CScript([OP_DUP, OP_HASH160, Hash160(key.pub), OP_EQUALVERIFY, OP_CHECKSIG])
+            spent.append((prevout, key))
+        tx = CTransaction([CTxIn(prevout) for prevout, _ in spent], [CTxOut(10000, CScript())])
+        txdata = PrecomputedTransactionData(tx)
+        vin = []
+        for j, (prevout, key) in enumerate(spent):
+            h = SignatureHash(prevouts[prevout], tx, j, SIGHASH_ALL, cache=txdata)
+            vin.append(CTxIn(prevout, CScript([key.sign(h) + bytes([SIGHASH_ALL]), key.pub])))
+        vtx.append(CTransaction(vin, tx.vout))
+    return CBlock(vtx=vtx), prevouts
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    bitcoin.core.scripteval.signature_cache = None
+    block, prevouts = make_block()
+    n_inputs = sum(len(tx.vin) for tx in block.vtx[1:])
+    print(f'{n_inputs} inputs')
+    print(f'{"workers":>8s} {"time":>10s} {"inputs/s":>10s} {"speedup":>8s}')
+    base = None
+    for workers in range(1, max_workers + 1):
+        # the pool is started up front, process startup is not measured
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            executor.submit(int).result()
+            start = time.perf_counter()
+            if workers == 1:
+                VerifyBlockScripts(block, prevouts, flags={SCRIPT_VERIFY_P2SH}, max_workers=1)
+            else:
+                VerifyBlockScripts(block, prevouts, flags={SCRIPT_VERIFY_P2SH}, executor=executor)
+            elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f'{workers:8d} {elapsed * 1e3:8.1f}ms {n_inputs / elapsed:10.0f} {base / elapsed:7.2f}x')
+
+    block, prevouts = make_block(n_tx=1, n_in=4)
+    tx = block.vtx[1]
+    print('4 input transaction')
+
+    def run(name, n, **kwargs):
+        start = time.perf_counter()
+        for _ in range(n):
+            VerifyTransactionInputs(tx, prevouts, flags={SCRIPT_VERIFY_P2SH}, **kwargs)
+        print(f'{name:>24s} {(time.perf_counter() - start) / n * 1e3:8.2f}ms')
+
+    run('in process', 100)
+    run(f'pool of {max_workers} per call', 10, max_workers=max_workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        executor.submit(int).result()
+        run(f'executor of {max_workers}', 100, executor=executor)
+
+
+if __name__ == '__main__':
+    main()
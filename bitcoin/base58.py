@@ -22,12 +22,22 @@ if sys.version > '3':
     _bchr = lambda x: bytes([x])
     _bord = lambda x: x
 
-import binascii
+import collections
+import threading
 
 import bitcoin.core
 
 B58_DIGITS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 
+# every pair of digits, indexed by its value in [0, 58**2)
+_B58_PAIRS = [a + b for a in B58_DIGITS for b in B58_DIGITS]
+
+# maps base58 characters to their values and anything else to 0xff
+_B58_VALUES = bytearray(b'\xff' * 256)
+for _i, _c in enumerate(B58_DIGITS.encode('ascii')):
+    _B58_VALUES[_c] = _i
+_B58_VALUES = bytes(_B58_VALUES)
+
 class Base58Error(Exception):
     pass
 
@@ -40,75 +50,185 @@ class InvalidBase58Error(Base58Error):
 
 def encode(b):
     """Encode bytes to a base58-encoded string"""
+    n = int.from_bytes(b, 'big')
 
-    # Convert big-endian bytes to integer
-    n = int('0x0' + binascii.hexlify(b).decode('utf8'), 16)
-
-    # Divide that integer into bas58
+    # Two digits at a time; the leading pair may start with a zero digit
+    pairs = _B58_PAIRS
     res = []
-    while n > 0:
-        n, r = divmod(n, 58)
-        res.append(B58_DIGITS[r])
-    res = ''.join(res[::-1])
+    while n:
+        n, r = divmod(n, 3364)
+        res.append(pairs[r])
+    res.reverse()
+    res = ''.join(res).lstrip('1')
 
     # Encode leading zeros as base58 zeros
-    czero = b'\x00'
-    if sys.version > '3':
-        # In Python3 indexing a bytes returns numbers, not characters.
-        czero = 0
-    pad = 0
-    for c in b:
-        if c == czero:
-            pad += 1
-        else:
-            break
-    return B58_DIGITS[0] * pad + res
+    pad = len(b) - len(bytes(b).lstrip(b'\x00'))
+    return '1' * pad + res
 
 def decode(s):
     """Decode a base58-encoding string, returning bytes"""
     if not s:
         return b''
 
+    try:
+        values = s.encode('ascii').translate(_B58_VALUES)
+    except UnicodeEncodeError:
+        values = b'\xff' * len(s)
+    if b'\xff' in values:
+        c = s[values.index(b'\xff')]
+        raise InvalidBase58Error('Character %r is not a valid base58 character' % c)
+
     # Convert the string to an integer
     n = 0
-    for c in s:
-        n *= 58
-        if c not in B58_DIGITS:
-            raise InvalidBase58Error('Character %r is not a valid base58 character' % c)
-        digit = B58_DIGITS.index(c)
-        n += digit
-
-    # Convert the integer to bytes
-    h = '%x' % n
-    if len(h) % 2:
-        h = '0' + h
-    res = binascii.unhexlify(h.encode('utf8'))
-
-    # Add padding back.
-    pad = 0
-    for c in s[:-1]:
-        if c == B58_DIGITS[0]: pad += 1
-        else: break
-    return b'\x00' * pad + res
+    for digit in values:
+        n = n * 58 + digit
+
+    # Convert the integer to bytes, adding the padding back
+    pad = len(s) - len(s.lstrip('1'))
+    return b'\x00' * pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
 
 
 class Base58ChecksumError(Base58Error):
     """Raised on Base58 checksum errors"""
     pass
 
+DEFAULT_MAX_CACHE_ENTRIES = 100000
+
+class Base58Cache(object):
+    """Bounded cache of checksummed base58 strings
+
+    Maps (data, nVersion) to the base58 string and the string back to
+    (data, nVersion), so that encoding the same payload again, or decoding
+    a string that was seen before, skips both the base conversion and the
+    double-SHA256 checksum. Only strings with a valid checksum are stored.
+
+    The least recently used entries are evicted when full. All methods are
+    thread-safe. hits and misses count lookups in either direction.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the string of a (data, nVersion) key, or the key of a string
+
+        Returns None if not cached.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            # both halves of the pair, so that they are evicted together
+            self._entries.move_to_end(key)
+            self._entries.move_to_end(value)
+            self.hits += 1
+            return value
+
+    def add(self, data, nVersion, s):
+        """Record s as the base58 string of data and nVersion"""
+        key = (bytes(data), nVersion)
+        with self._lock:
+            self._entries[key] = s
+            self._entries[s] = key
+            self._entries.move_to_end(key)
+            self._entries.move_to_end(s)
+            while len(self._entries) > self.max_entries * 2:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries) // 2
+
+def encode_check(data, nVersion, cache=None):
+    """Encode data with a version byte and checksum to a base58 string
+
+    If cache is a Base58Cache it is consulted first and updated.
+    """
+    if cache is not None:
+        s = cache.get((data, nVersion))
+        if s is not None:
+            return s
+    vs = _bchr(nVersion) + data
+    s = encode(vs + bitcoin.core.Hash(vs)[:4])
+    if cache is not None:
+        cache.add(data, nVersion, s)
+    return s
+
+def encode_check_many(datas, nVersion, cache=None):
+    """Encode many payloads with the same version byte, see encode_check()
+
+    Returns a list of strings. Payloads that repeat within datas are only
+    encoded once.
+    """
+    prefix = _bchr(nVersion)
+    Hash = bitcoin.core.Hash
+    pairs = _B58_PAIRS
+    seen = {}
+    r = []
+    for data in datas:
+        s = seen.get(data)
+        if s is None:
+            if cache is not None:
+                s = cache.get((data, nVersion))
+            if s is None:
+                vs = prefix + data
+                vs += Hash(vs)[:4]
+                n = int.from_bytes(vs, 'big')
+                res = []
+                while n:
+                    n, m = divmod(n, 3364)
+                    res.append(pairs[m])
+                res.reverse()
+                s = '1' * (len(vs) - len(vs.lstrip(b'\x00'))) + ''.join(res).lstrip('1')
+                if cache is not None:
+                    cache.add(data, nVersion, s)
+            seen[data] = s
+        r.append(s)
+    return r
+
+def decode_check(s, cache=None):
+    """Decode a base58 string with a version byte and checksum
+
+    Returns (data, nVersion). Raises Base58ChecksumError if the checksum
+    does not match. If cache is a Base58Cache it is consulted first and
+    updated.
+    """
+    if cache is not None:
+        key = cache.get(s)
+        if key is not None:
+            return key
+    k = decode(s)
+    verbyte, data, check0 = k[0:1], k[1:-4], k[-4:]
+    check1 = bitcoin.core.Hash(verbyte + data)[:4]
+    if check0 != check1:
+        raise Base58ChecksumError('Checksum mismatch: expected %r, calculated %r' % (check0, check1))
+    nVersion = _bord(verbyte[0])
+    if cache is not None:
+        cache.add(data, nVersion, s)
+    return (data, nVersion)
+
 class CBase58Data(bytes):
     """Base58-encoded data
 
     Includes a version and checksum.
+
+    Subclasses may set _cache to a Base58Cache to cache their string forms.
     """
-    def __new__(cls, s):
-        k = decode(s)
-        verbyte, data, check0 = k[0:1], k[1:-4], k[-4:]
-        check1 = bitcoin.core.Hash(verbyte + data)[:4]
-        if check0 != check1:
-            raise Base58ChecksumError('Checksum mismatch: expected %r, calculated %r' % (check0, check1))
+    _cache = None
 
-        return cls.from_bytes(data, _bord(verbyte[0]))
+    def __new__(cls, s):
+        data, nVersion = decode_check(s, cls._cache)
+        return cls.from_bytes(data, nVersion)
 
     def __init__(self, s):
         """Initialize from base58-encoded string
@@ -128,6 +248,17 @@ class CBase58Data(bytes):
 
         return self
 
+    @classmethod
+    def encode_many(cls, datas, nVersion):
+        """Return the base58 strings of many payloads with the same nVersion
+
+        Equivalent to [str(cls.from_bytes(data, nVersion)) for data in datas]
+        without creating the instances.
+        """
+        if not (0 <= nVersion <= 255):
+            raise ValueError('nVersion must be in range 0 to 255 inclusive; got %d' % nVersion)
+        return encode_check_many(datas, nVersion, cls._cache)
+
     def to_bytes(self):
         """Convert to bytes instance
 
@@ -138,9 +269,7 @@ class CBase58Data(bytes):
 
     def __str__(self):
         """Convert to string"""
-        vs = _bchr(self.nVersion) + self
-        check = bitcoin.core.Hash(vs)[0:4]
-        return encode(vs + check)
+        return encode_check(b'' + self, self.nVersion, self._cache)
 
     def __repr__(self):
         return '%s(%r)' % (self.__class__.__name__, str(self))
@@ -152,5 +281,9 @@ __all__ = (
         'encode',
         'decode',
         'Base58ChecksumError',
+        'Base58Cache',
+        'encode_check',
+        'encode_check_many',
+        'decode_check',
         'CBase58Data',
 )
@@ -19,7 +19,7 @@ if sys.version > '3':
     _bchr = lambda x: bytes([x])
     _bord = lambda x: x
 
-from bitcoin.segwit_addr import encode, decode
+from bitcoin.segwit_addr import encode, decode, encode_many
 import bitcoin
 
 class Bech32Error(Exception):
@@ -59,6 +59,17 @@ class CBech32Data(bytes):
 
         return self
 
+    @classmethod
+    def encode_many(cls, witver, witprogs):
+        """Return the bech32 strings of many witness programs of one version
+
+        Equivalent to [str(cls.from_bytes(witver, witprog)) for witprog in
+        witprogs] without creating the instances.
+        """
+        if not (0 <= witver <= 16):
+            raise ValueError('witver must be in range 0 to 16 inclusive; got %d' % witver)
+        return encode_many(bitcoin.params.BECH32_HRP, witver, witprogs)
+
     def to_bytes(self):
         """Convert to bytes instance
 
@@ -0,0 +1,457 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Compact block filters (BIP158)
+
+Builds the Golomb-coded set basic filter of a block, matches scripts against
+it and keeps the filters of a chain in an append-only memory-mapped store
+indexed by height.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import mmap
+import os
+import struct
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+import bitcoin.core
+import bitcoin.core.serialize
+from bitcoin.core.script import OP_RETURN
+from bitcoin.core.serialize import BytesSerializer, VarIntSerializer
+
+BASIC_FILTER_P = 19
+BASIC_FILTER_M = 784931
+
+BLOCK_FILTER_BASIC = 0
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _rotl64(x, b):
+    return ((x << b) & _MASK64) | (x >> (64 - b))
+
+def SipHash(k0, k1, data):
+    """SipHash-2-4 of data with the 128-bit key (k0, k1), as CSipHasher"""
+    v0 = k0 ^ 0x736f6d6570736575
+    v1 = k1 ^ 0x646f72616e646f6d
+    v2 = k0 ^ 0x6c7967656e657261
+    v3 = k1 ^ 0x7465646279746573
+    n = len(data)
+    nblocks = n // 8
+    ms = list(struct.unpack_from(b'<%dQ' % nblocks, data))
+    ms.append(((n & 0xff) << 56) | int.from_bytes(data[nblocks * 8:], 'little'))
+    for m in ms:
+        v3 ^= m
+        for _ in range(2):
+            v0 = (v0 + v1) & _MASK64; v1 = _rotl64(v1, 13); v1 ^= v0; v0 = _rotl64(v0, 32)
+            v2 = (v2 + v3) & _MASK64; v3 = _rotl64(v3, 16); v3 ^= v2
+            v0 = (v0 + v3) & _MASK64; v3 = _rotl64(v3, 21); v3 ^= v0
+            v2 = (v2 + v1) & _MASK64; v1 = _rotl64(v1, 17); v1 ^= v2; v2 = _rotl64(v2, 32)
+        v0 ^= m
+    v2 ^= 0xff
+    for _ in range(4):
+        v0 = (v0 + v1) & _MASK64; v1 = _rotl64(v1, 13); v1 ^= v0; v0 = _rotl64(v0, 32)
+        v2 = (v2 + v3) & _MASK64; v3 = _rotl64(v3, 16); v3 ^= v2
+        v0 = (v0 + v3) & _MASK64; v3 = _rotl64(v3, 21); v3 ^= v0
+        v2 = (v2 + v1) & _MASK64; v1 = _rotl64(v1, 17); v1 ^= v2; v2 = _rotl64(v2, 32)
+    return v0 ^ v1 ^ v2 ^ v3
+
+def _np_rotl64(x, b):
+    return (x << _np.uint64(b)) | (x >> _np.uint64(64 - b))
+
+def _np_sipround(v0, v1, v2, v3):
+    v0 += v1; v1 = _np_rotl64(v1, 13); v1 ^= v0; v0 = _np_rotl64(v0, 32)
+    v2 += v3; v3 = _np_rotl64(v3, 16); v3 ^= v2
+    v0 += v3; v3 = _np_rotl64(v3, 21); v3 ^= v0
+    v2 += v1; v1 = _np_rotl64(v1, 17); v1 ^= v2; v2 = _np_rotl64(v2, 32)
+    return v0, v1, v2, v3
+
+def _np_siphash(keys, elems, n, length):
+    """SipHash-2-4 of equal length elements with NumPy
+
+    keys is a k x 2 uint64 array of (k0, k1) and elems the concatenation of
+    n elements of length bytes each. Returns a k x n uint64 array.
+    """
+    k0 = keys[:, 0:1]
+    k1 = keys[:, 1:2]
+    shape = (len(keys), n)
+    v0 = _np.broadcast_to(k0 ^ _np.uint64(0x736f6d6570736575), shape).copy()
+    v1 = _np.broadcast_to(k1 ^ _np.uint64(0x646f72616e646f6d), shape).copy()
+    v2 = _np.broadcast_to(k0 ^ _np.uint64(0x6c7967656e657261), shape).copy()
+    v3 = _np.broadcast_to(k1 ^ _np.uint64(0x7465646279746573), shape).copy()
+    # pad every element to whole 8 byte words, the last one carrying the length
+    nwords = length // 8 + 1
+    m = _np.zeros((n, nwords * 8), dtype=_np.uint8)
+    if length:
+        m[:, :length] = _np.frombuffer(elems, dtype=_np.uint8).reshape(n, length)
+    m[:, -1] = length & 0xff
+    words = m.view('<u8').astype(_np.uint64)
+    for j in range(nwords):
+        w = words[:, j]
+        v3 ^= w
+        v0, v1, v2, v3 = _np_sipround(v0, v1, v2, v3)
+        v0, v1, v2, v3 = _np_sipround(v0, v1, v2, v3)
+        v0 ^= w
+    v2 ^= _np.uint64(0xff)
+    for _ in range(4):
+        v0, v1, v2, v3 = _np_sipround(v0, v1, v2, v3)
+    return v0 ^ v1 ^ v2 ^ v3
+
+def _np_fastrange64(x, n):
+    """(x * n) >> 64 of a uint64 array x and n < 2**64, n may be an array"""
+    n = _np.asarray(n, dtype=_np.uint64)
+    mask = _np.uint64(0xFFFFFFFF)
+    x_hi, x_lo = x >> _np.uint64(32), x & mask
+    n_hi, n_lo = n >> _np.uint64(32), n & mask
+    mid = x_hi * n_lo + ((x_lo * n_lo) >> _np.uint64(32))
+    mid2 = x_lo * n_hi + (mid & mask)
+    return x_hi * n_hi + (mid >> _np.uint64(32)) + (mid2 >> _np.uint64(32))
+
+def _np_hash_to_range(keys, elements, F):
+    """Hash elements into [0, F) under every key in keys
+
+    Returns a len(keys) x len(elements) uint64 array. F is either an integer
+    or a sequence with one range per key.
+    """
+    hashes = _np.empty((len(keys), len(elements)), dtype=_np.uint64)
+    by_length = {}
+    for i, e in enumerate(elements):
+        by_length.setdefault(len(e), []).append(i)
+    for length, idxs in by_length.items():
+        hashes[:, idxs] = _np_siphash(keys, b''.join(elements[i] for i in idxs), len(idxs), length)
+    if not isinstance(F, int):
+        F = _np.array(F, dtype=_np.uint64).reshape(-1, 1)
+    return _np_fastrange64(hashes, F)
+
+
+class GCSFilter(object):
+    """A Golomb-coded set
+
+    Elements are hashed with SipHash into [0, N * M), sorted, and the
+    differences between consecutive values are Golomb-Rice coded with
+    parameter P. Matching may return false positives with probability 1/M
+    per element, never false negatives.
+
+    encoded holds the serialized filter: N as a compact size followed by the
+    coded differences, most significant bit first.
+    """
+    __slots__ = ['k0', 'k1', 'P', 'M', 'N', 'encoded', '_values']
+
+    def __init__(self, k0, k1, P, M, encoded=b'\x00'):
+        self.k0 = k0
+        self.k1 = k1
+        self.P = P
+        self.M = M
+        self.encoded = bytes(encoded)
+        self.N = bitcoin.core.serialize.BytesCursor(self.encoded).read_varint()
+        self._values = None
+
+    @property
+    def F(self):
+        return self.N * self.M
+
+    def hash_to_range(self, element):
+        """Map element to [0, F)"""
+        return (SipHash(self.k0, self.k1, element) * self.F) >> 64
+
+    @classmethod
+    def from_elements(cls, k0, k1, P, M, elements):
+        """Build a filter of a set of elements"""
+        elements = set(bytes(e) for e in elements)
+        N = len(elements)
+        F = N * M
+        if _np is not None and N:
+            values = sorted(_np_hash_to_range(_np.array([(k0, k1)], dtype=_np.uint64),
+                                              list(elements), F)[0].tolist())
+        else:
+            values = sorted((SipHash(k0, k1, e) * F) >> 64 for e in elements)
+
+        # Golomb-Rice code the differences, most significant bit first. Bits
+        # are accumulated in an integer and flushed as whole bytes.
+        out = bytearray()
+        acc = 0
+        nbits = 0
+        last = 0
+        rmask = (1 << P) - 1
+        for value in values:
+            delta = value - last
+            last = value
+            q = delta >> P
+            # q ones, a zero, then the P low bits
+            acc = (((acc << (q + 1)) | (((1 << q) - 1) << 1)) << P) | (delta & rmask)
+            nbits += q + 1 + P
+            if nbits >= 64:
+                out += (acc >> (nbits & 7)).to_bytes(nbits >> 3, 'big')
+                nbits &= 7
+                acc &= (1 << nbits) - 1
+        if nbits:
+            pad = -nbits & 7
+            out += (acc << pad).to_bytes((nbits + pad) >> 3, 'big')
+        body = bytes(out)
+
+        self = cls(k0, k1, P, M, VarIntSerializer.serialize(N) + body)
+        self._values = values
+        return self
+
+    def decode(self):
+        """Return the sorted hashed values of the elements"""
+        if self._values is not None:
+            return self._values
+        f = bitcoin.core.serialize.BytesCursor(self.encoded)
+        f.read_varint()
+        data = self.encoded[f.pos:]
+        self._values = self._decode(data)
+        return self._values
+
+    def _decode(self, data):
+        P = self.P
+        nbits = len(data) * 8
+        # zero padding, so that a 64 bit window can be read at any position
+        data = data + b'\x00' * 8
+        values = []
+        pos = 0
+        last = 0
+        for _ in range(self.N):
+            # unary coded quotient, up to 57 bits per window
+            q = 0
+            while True:
+                w = (int.from_bytes(data[pos >> 3:(pos >> 3) + 8], 'big') << (pos & 7)) & _MASK64
+                ones = 64 - (~w & _MASK64).bit_length()
+                if ones < 57:
+                    q += ones
+                    pos += ones + 1
+                    break
+                q += 57
+                pos += 57
+            w = (int.from_bytes(data[pos >> 3:(pos >> 3) + 8], 'big') << (pos & 7)) & _MASK64
+            pos += P
+            if pos > nbits:
+                raise ValueError('GCS filter truncated')
+            last += (q << P) | (w >> (64 - P))
+            values.append(last)
+        return values
+
+    def match(self, element):
+        """Test if element may be in the set"""
+        return self.match_any([element])
+
+    def match_any(self, elements):
+        """Test if any of elements may be in the set"""
+        if not self.N:
+            return False
+        F = self.F
+        queries = set((SipHash(self.k0, self.k1, bytes(e)) * F) >> 64 for e in elements)
+        return not queries.isdisjoint(self.decode())
+
+
+class CBlockFilter(bitcoin.core.serialize.ImmutableSerializable):
+    """The compact filter of a block
+
+    Serialized as in the cfilter message: the filter type, the block hash
+    and the encoded filter.
+    """
+    __slots__ = ['filter_type', 'block_hash', 'filter']
+
+    def __init__(self, block_hash, encoded=b'\x00', filter_type=BLOCK_FILTER_BASIC):
+        if filter_type != BLOCK_FILTER_BASIC:
+            raise ValueError('Unknown block filter type %d' % filter_type)
+        if len(block_hash) != 32:
+            raise ValueError('block_hash must be 32 bytes')
+        object.__setattr__(self, 'filter_type', filter_type)
+        object.__setattr__(self, 'block_hash', bytes(block_hash))
+        k0, k1 = struct.unpack(b'<QQ', block_hash[:16])
+        object.__setattr__(self, 'filter', GCSFilter(k0, k1, BASIC_FILTER_P, BASIC_FILTER_M, encoded))
+
+    @classmethod
+    def from_block(cls, block, prev_scripts=()):
+        """Build the basic filter of a block
+
+        prev_scripts are the scriptPubKeys of the outputs spent by the block,
+        in any order, as found in its undo data.
+        """
+        elements = set()
+        for tx in block.vtx:
+            for txout in tx.vout:
+                script = txout.scriptPubKey
+                if len(script) and script[0] != OP_RETURN:
+                    elements.add(bytes(script))
+        for script in prev_scripts:
+            if len(script):
+                elements.add(bytes(script))
+        block_hash = block.GetHash()
+        k0, k1 = struct.unpack(b'<QQ', block_hash[:16])
+        gcs = GCSFilter.from_elements(k0, k1, BASIC_FILTER_P, BASIC_FILTER_M, elements)
+        self = cls(block_hash, gcs.encoded)
+        self.filter._values = gcs._values
+        return self
+
+    @property
+    def encoded(self):
+        return self.filter.encoded
+
+    def GetFilterHash(self):
+        return bitcoin.core.Hash(self.filter.encoded)
+
+    def ComputeHeader(self, prev_header):
+        """Return the filter header chaining this filter to prev_header"""
+        return bitcoin.core.Hash(self.GetFilterHash() + prev_header)
+
+    def match_any(self, scripts):
+        return self.filter.match_any(scripts)
+
+    @classmethod
+    def stream_deserialize(cls, f):
+        filter_type = struct.unpack(b'<B', bitcoin.core.serialize.ser_read(f, 1))[0]
+        block_hash = bitcoin.core.serialize.ser_read(f, 32)
+        encoded = BytesSerializer.stream_deserialize(f)
+        return cls(block_hash, encoded, filter_type)
+
+    def stream_serialize(self, f):
+        f.write(struct.pack(b'<B', self.filter_type))
+        f.write(self.block_hash)
+        BytesSerializer.stream_serialize(self.filter.encoded, f)
+
+    def __repr__(self):
+        return 'CBlockFilter(lx(%r), x(%r))' % (bitcoin.core.b2lx(self.block_hash),
+                                                 bitcoin.core.b2x(self.filter.encoded))
+
+
+def match_filters(filters, scripts):
+    """Match many scripts against many block filters
+
+    filters is a sequence of CBlockFilter and scripts the scriptPubKeys to
+    look for. Returns the indexes in filters of the blocks that may contain
+    any of the scripts. With NumPy the scripts are hashed for all filters at
+    once.
+    """
+    scripts = list(set(bytes(s) for s in scripts))
+    if not scripts or not filters:
+        return []
+    if _np is None:
+        return [i for i, f in enumerate(filters) if f.match_any(scripts)]
+
+    gcss = [f.filter for f in filters]
+    keys = _np.array([(g.k0, g.k1) for g in gcss], dtype=_np.uint64)
+    queries = _np_hash_to_range(keys, scripts, [g.F for g in gcss])
+    return [i for i, g in enumerate(gcss)
+            if g.N and not set(queries[i].tolist()).isdisjoint(g.decode())]
+
+
+class BlockFilterStore(object):
+    """Append-only store of the basic filters of a chain, indexed by height
+
+    Filters are appended to path + '.dat'. path + '.idx' has one fixed size
+    record per height, starting at 0, with the offset and size of the
+    filter, the block hash and the filter header. Both files are memory
+    mapped for reading. A record is only written once its filter is on disk,
+    so a store that was interrupted while appending loses at most the last
+    filter.
+    """
+
+    _record = struct.Struct(b'<QI32s32s')
+
+    def __init__(self, path):
+        self.path = path
+        self._dat = open(path + '.dat', 'a+b')
+        self._idx = open(path + '.idx', 'a+b')
+        self._dat_map = None
+        self._idx_map = None
+        # drop a partially written record and any filter without a record
+        self._count = os.fstat(self._idx.fileno()).st_size // self._record.size
+        self._idx.truncate(self._count * self._record.size)
+        self._dat_size = 0
+        self._tip_header = b'\x00' * 32
+        if self._count:
+            offset, size, block_hash, header = self._read_record(self._count - 1)
+            self._dat_size = offset + size
+            self._tip_header = header
+        self._dat.truncate(self._dat_size)
+        self._unmap()
+
+    def close(self):
+        self._unmap()
+        self._dat.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _unmap(self):
+        for m in (self._dat_map, self._idx_map):
+            if m is not None:
+                m.close()
+        self._dat_map = self._idx_map = None
+
+    def _read_record(self, height):
+        if height < 0 or height >= self._count:
+            raise IndexError('No filter at height %d' % height)
+        if self._idx_map is None or len(self._idx_map) < (height + 1) * self._record.size:
+            # the files grew since they were mapped, records are only
+            # written after their filter so the data file is complete
+            self._unmap()
+            self._idx_map = mmap.mmap(self._idx.fileno(), 0, access=mmap.ACCESS_READ)
+            self._dat_map = mmap.mmap(self._dat.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._record.unpack_from(self._idx_map, height * self._record.size)
+
+    def tip_header(self):
+        """Return the filter header of the last filter, zeros if empty"""
+        return self._tip_header
+
+    def append(self, block_filter):
+        """Append the filter of the block at height len(self)
+
+        Returns the filter header.
+        """
+        header = block_filter.ComputeHeader(self._tip_header)
+        encoded = block_filter.encoded
+        self._dat.write(encoded)
+        self._dat.flush()
+        self._idx.write(self._record.pack(self._dat_size, len(encoded), block_filter.block_hash, header))
+        self._idx.flush()
+        self._dat_size += len(encoded)
+        self._count += 1
+        self._tip_header = header
+        return header
+
+    def get(self, height):
+        """Return the CBlockFilter at height"""
+        offset, size, block_hash, header = self._read_record(height)
+        return CBlockFilter(block_hash, self._dat_map[offset:offset + size])
+
+    def get_header(self, height):
+        return self._read_record(height)[3]
+
+    def get_block_hash(self, height):
+        return self._read_record(height)[2]
+
+    def match_range(self, scripts, start, stop=None):
+        """Return the heights in [start, stop) whose filters may match any
+        of scripts, see match_filters()"""
+        if stop is None or stop > self._count:
+            stop = self._count
+        filters = [self.get(h) for h in range(start, stop)]
+        return [start + i for i in match_filters(filters, scripts)]
+
+
+__all__ = (
+        'BASIC_FILTER_P',
+        'BASIC_FILTER_M',
+        'BLOCK_FILTER_BASIC',
+        'SipHash',
+        'GCSFilter',
+        'CBlockFilter',
+        'match_filters',
+        'BlockFilterStore',
+)
@@ -17,8 +17,15 @@ import struct
 import sys
 import math
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
 import bitcoin.core
 import bitcoin.core.serialize
+from bitcoin.core.script import (OP_PUSHDATA1, OP_PUSHDATA2, OP_PUSHDATA4, OP_1, OP_16, OP_CHECKSIG,
+                                 OP_CHECKMULTISIG)
 
 def _ROTL32(x, r):
     assert x <= 0xFFFFFFFF
@@ -83,6 +90,150 @@ def MurmurHash3(nHashSeed, vDataToHash):
 
     return h1 & 0xFFFFFFFF
 
+def _murmur3_mix_blocks(vDataToHash):
+    """Returns the seed independent part of MurmurHash3: the mixed 32-bit
+    blocks of vDataToHash followed by the mixed tail"""
+    n = len(vDataToHash) // 4
+    ks = []
+    for k1 in struct.unpack_from(b"<%dL" % n, vDataToHash):
+        k1 = (k1 * 0xcc9e2d51) & 0xFFFFFFFF
+        k1 = ((k1 << 15) & 0xFFFFFFFF) | (k1 >> 17)
+        ks.append((k1 * 0x1b873593) & 0xFFFFFFFF)
+    tail = bytearray(vDataToHash[n * 4:])
+    k1 = 0
+    for i, b in enumerate(tail):
+        k1 ^= b << (8 * i)
+    k1 = (k1 * 0xcc9e2d51) & 0xFFFFFFFF
+    k1 = ((k1 << 15) & 0xFFFFFFFF) | (k1 >> 17)
+    return ks, (k1 * 0x1b873593) & 0xFFFFFFFF
+
+def _murmur3_seeded(h1, ks, tail, n):
+    """Completes MurmurHash3 for seed h1 from the output of _murmur3_mix_blocks()"""
+    for k1 in ks:
+        h1 ^= k1
+        h1 = ((h1 << 13) & 0xFFFFFFFF) | (h1 >> 19)
+        h1 = (h1 * 5 + 0xe6546b64) & 0xFFFFFFFF
+    h1 ^= tail ^ n
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85ebca6b) & 0xFFFFFFFF
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xc2b2ae35) & 0xFFFFFFFF
+    return h1 ^ (h1 >> 16)
+
+def MurmurHash3Many(nHashSeeds, vDataToHash):
+    """MurmurHash3 of vDataToHash for every seed in nHashSeeds
+
+    Returns a list with one hash per seed, equal to
+    [MurmurHash3(seed, vDataToHash) for seed in nHashSeeds] but the data is
+    only unpacked and mixed once.
+    """
+    ks, tail = _murmur3_mix_blocks(vDataToHash)
+    n = len(vDataToHash) & 0xFFFFFFFF
+    return [_murmur3_seeded(h1, ks, tail, n) for h1 in nHashSeeds]
+
+def _np_rotl32(x, r):
+    return (x << r) | (x >> (32 - r))
+
+def _np_murmur3(seeds, elems, n, length):
+    """MurmurHash3 of equal length elements with NumPy
+
+    seeds is a uint32 array of k seeds and elems the concatenation of n
+    elements of length bytes each. Returns a k x n uint32 array.
+    """
+    h = _np.repeat(seeds[:, None], n, axis=1)
+    if not length:
+        m = _np.zeros((n, 0), dtype=_np.uint8)
+    else:
+        m = _np.frombuffer(elems, dtype=_np.uint8).reshape(n, length)
+    nblocks = length // 4
+    if nblocks:
+        # the block mixing doesn't depend on the seed, do it once for all
+        k = _np.ascontiguousarray(m[:, :nblocks * 4]).view('<u4').astype(_np.uint32)
+        k = _np_rotl32(k * _np.uint32(0xcc9e2d51), 15) * _np.uint32(0x1b873593)
+        for j in range(nblocks):
+            h ^= k[:, j]
+            h = _np_rotl32(h, 13) * _np.uint32(5) + _np.uint32(0xe6546b64)
+    if length & 3:
+        k1 = _np.zeros(n, dtype=_np.uint32)
+        for i in range(length & 3):
+            k1 ^= m[:, nblocks * 4 + i].astype(_np.uint32) << _np.uint32(8 * i)
+        h ^= _np_rotl32(k1 * _np.uint32(0xcc9e2d51), 15) * _np.uint32(0x1b873593)
+    h ^= _np.uint32(length & 0xFFFFFFFF)
+    h ^= h >> 16
+    h *= _np.uint32(0x85ebca6b)
+    h ^= h >> 13
+    h *= _np.uint32(0xc2b2ae35)
+    h ^= h >> 16
+    return h
+
+def _script_ops(script):
+    """Yields (opcode, data) for every opcode of script, data being None
+    for opcodes that push nothing. Stops at the first truncated push, like
+    GetOp() in Bitcoin Core."""
+    script = bytes(script)
+    i = 0
+    n = len(script)
+    while i < n:
+        op = script[i]
+        i += 1
+        if op > OP_PUSHDATA4:
+            yield op, None
+            continue
+        if op < OP_PUSHDATA1:
+            size = op
+        elif op == OP_PUSHDATA1:
+            if i + 1 > n:
+                return
+            size = script[i]
+            i += 1
+        elif op == OP_PUSHDATA2:
+            if i + 2 > n:
+                return
+            size = struct.unpack_from(b'<H', script, i)[0]
+            i += 2
+        else:
+            if i + 4 > n:
+                return
+            size = struct.unpack_from(b'<I', script, i)[0]
+            i += 4
+        if i + size > n:
+            return
+        yield op, script[i:i + size]
+        i += size
+
+def _script_pushes(script):
+    """Yields the non-empty data pushed by script"""
+    for op, data in _script_ops(script):
+        if data:
+            yield data
+
+def _is_valid_pubkey_size(data):
+    return (len(data) == 33 and data[0] in (2, 3)) or (len(data) == 65 and data[0] in (4, 6, 7))
+
+def _is_pubkey_or_multisig(script):
+    """Test if script is a pay-to-pubkey or bare multisig scriptPubKey, as
+    Solver() in Bitcoin Core would classify it"""
+    n = len(script)
+    if (n == 35 or n == 67) and script[0] == n - 2 and script[-1] == OP_CHECKSIG:
+        return _is_valid_pubkey_size(script[1:-1])
+
+    if n < 1 or script[-1] != OP_CHECKMULTISIG:
+        return False
+    ops = _script_ops(script)
+    op, data = next(ops)
+    if not OP_1 <= op <= OP_16:
+        return False
+    nRequired = op - OP_1 + 1
+    nKeys = 0
+    for op, data in ops:
+        if data is None or not _is_valid_pubkey_size(data):
+            break
+        nKeys += 1
+    else:
+        return False
+    return (OP_1 <= op <= OP_16 and op - OP_1 + 1 == nKeys and nRequired <= nKeys and
+            next(ops, None) == (OP_CHECKMULTISIG, None) and next(ops, None) is None)
+
 
 class CBloomFilter(bitcoin.core.serialize.Serializable):
     # 20,000 items with fp rate < 0.1% or 10,000 items and <0.0001%
@@ -134,8 +285,12 @@ class CBloomFilter(bitcoin.core.serialize.Serializable):
         if len(self.vData) == 1 and self.vData[0] == 0xff:
             return
 
+        # same as bloom_hash(i, elem), but the blocks of elem are only mixed once
+        ks, tail = _murmur3_mix_blocks(elem)
+        n = len(elem) & 0xFFFFFFFF
+        nbits = len(self.vData) * 8
         for i in range(0, self.nHashFuncs):
-            nIndex = self.bloom_hash(i, elem)
+            nIndex = _murmur3_seeded(((i * 0xFBA4C795) + self.nTweak) & 0xFFFFFFFF, ks, tail, n) % nbits
             # Sets bit nIndex of vData
             self.vData[nIndex >> 3] |= self.__bit_mask[7 & nIndex]
 
@@ -150,18 +305,174 @@ class CBloomFilter(bitcoin.core.serialize.Serializable):
         if len(self.vData) == 1 and self.vData[0] == 0xff:
             return True
 
+        ks, tail = _murmur3_mix_blocks(elem)
+        n = len(elem) & 0xFFFFFFFF
+        nbits = len(self.vData) * 8
         for i in range(0, self.nHashFuncs):
-            nIndex = self.bloom_hash(i, elem)
+            nIndex = _murmur3_seeded(((i * 0xFBA4C795) + self.nTweak) & 0xFFFFFFFF, ks, tail, n) % nbits
             if not (self.vData[nIndex >> 3] & self.__bit_mask[7 & nIndex]):
                 return False
         return True
 
+    def _hash_seeds(self):
+        return [((i * 0xFBA4C795) + self.nTweak) & 0xFFFFFFFF for i in range(self.nHashFuncs)]
+
+    def _np_bit_indexes(self, elems):
+        """Returns the bit indexes of elems as a nHashFuncs x len(elems) array"""
+        seeds = _np.array(self._hash_seeds(), dtype=_np.uint32)
+        nbits = len(self.vData) * 8
+        by_length = {}
+        for i, elem in enumerate(elems):
+            by_length.setdefault(len(elem), []).append(i)
+        r = _np.empty((self.nHashFuncs, len(elems)), dtype=_np.uint32)
+        for length, idxs in by_length.items():
+            h = _np_murmur3(seeds, b''.join(elems[i] for i in idxs), len(idxs), length)
+            r[:, idxs] = h % _np.uint32(nbits)
+        return r
+
+    def _prepare_many(self, elems):
+        return [elem.serialize() if isinstance(elem, bitcoin.core.COutPoint) else bytes(elem) for elem in elems]
+
+    def insert_many(self, elems):
+        """Insert every element of elems in the filter.
+
+        Sets the same bits as calling insert() for each element. The hashes
+        are computed with NumPy when it is installed.
+        """
+        elems = self._prepare_many(elems)
+
+        if len(self.vData) == 1 and self.vData[0] == 0xff:
+            return
+
+        if not elems or not self.nHashFuncs:
+            return
+
+        if _np is not None:
+            bits = _np.zeros(len(self.vData) * 8, dtype=_np.bool_)
+            bits[self._np_bit_indexes(elems).ravel()] = True
+            vData = _np.frombuffer(self.vData, dtype=_np.uint8)
+            vData |= _np.packbits(bits, bitorder='little')
+            return
+
+        seeds = self._hash_seeds()
+        nbits = len(self.vData) * 8
+        for elem in elems:
+            for h in MurmurHash3Many(seeds, elem):
+                nIndex = h % nbits
+                self.vData[nIndex >> 3] |= self.__bit_mask[7 & nIndex]
+
+    def contains_many(self, elems):
+        """Test if the filter contains each element of elems
+
+        Returns a list of booleans, one for every element, as contains()
+        would. The hashes are computed with NumPy when it is installed.
+        """
+        elems = self._prepare_many(elems)
+
+        if len(self.vData) == 1 and self.vData[0] == 0xff:
+            return [True] * len(elems)
+
+        if not elems:
+            return []
+
+        if _np is not None:
+            bits = _np.unpackbits(_np.frombuffer(self.vData, dtype=_np.uint8), bitorder='little')
+            return bits[self._np_bit_indexes(elems)].all(axis=0).tolist()
+
+        seeds = self._hash_seeds()
+        nbits = len(self.vData) * 8
+        r = []
+        for elem in elems:
+            for h in MurmurHash3Many(seeds, elem):
+                nIndex = h % nbits
+                if not (self.vData[nIndex >> 3] & self.__bit_mask[7 & nIndex]):
+                    r.append(False)
+                    break
+            else:
+                r.append(True)
+        return r
+
     def IsWithinSizeConstraints(self):
         return len(self.vData) <= self.MAX_BLOOM_FILTER_SIZE and self.nHashFuncs <= self.MAX_HASH_FUNCS
 
-    def IsRelevantAndUpdate(tx, tx_hash):
-        # Not useful for a client, so not implemented yet.
-        raise NotImplementedError
+    def _batch_contains(self, txs):
+        """Returns a contains() for the elements IsRelevantAndUpdate() tests
+        in txs, a list of (tx_hash, vin, vout) as _is_relevant_and_update()
+        takes. Their bit indexes are all computed at once with NumPy, testing
+        an element then only looks the bits up, which stays correct as
+        matching outputs are inserted."""
+        elems = set()
+        for tx_hash, vin, vout in txs:
+            elems.add(tx_hash)
+            for scriptPubKey in vout:
+                elems.update(_script_pushes(scriptPubKey))
+            for prevout, scriptSig in vin:
+                elems.add(bytes(prevout))
+                elems.update(_script_pushes(scriptSig))
+        elems = list(elems)
+        rows = dict(zip(elems, self._np_bit_indexes(elems).T.tolist()))
+        vData = self.vData
+        bit_mask = self.__bit_mask
+
+        def contains(elem):
+            for nIndex in rows[elem]:
+                if not (vData[nIndex >> 3] & bit_mask[7 & nIndex]):
+                    return False
+            return True
+        return contains
+
+    def _is_relevant_and_update(self, tx_hash, vin, vout, contains=None):
+        """IsRelevantAndUpdate() of a transaction given as its txid, an
+        iterable of (serialized prevout, scriptSig) and a sequence of
+        scriptPubKeys"""
+        if not self.vData:  # zero-size = "match-all" filter
+            return True
+
+        if contains is None:
+            contains = self.contains
+        fFound = contains(tx_hash)
+        update = self.nFlags & self.UPDATE_MASK
+        for i, scriptPubKey in enumerate(vout):
+            # only the first matching push of each output matters
+            for data in _script_pushes(scriptPubKey):
+                if contains(data):
+                    fFound = True
+                    if (update == self.UPDATE_ALL or
+                            (update == self.UPDATE_P2PUBKEY_ONLY and _is_pubkey_or_multisig(bytes(scriptPubKey)))):
+                        self.insert(tx_hash + struct.pack(b'<I', i))
+                    break
+
+        if fFound:
+            return True
+
+        for prevout, scriptSig in vin:
+            # Match if the filter contains an outpoint tx spends
+            if contains(bytes(prevout)):
+                return True
+            # or any data pushed by a scriptSig
+            for data in _script_pushes(scriptSig):
+                if contains(data):
+                    return True
+        return False
+
+    def IsRelevantAndUpdate(self, tx, tx_hash=None):
+        """Test if a transaction matches the filter, updating the filter
+
+        tx matches if the filter contains its txid, any data pushed by the
+        scriptPubKeys of its outputs, any outpoint it spends or any data
+        pushed by its scriptSigs. When an output matches its outpoint is
+        inserted in the filter as nFlags dictate, UPDATE_ALL for every
+        matching output and UPDATE_P2PUBKEY_ONLY for pay-to-pubkey and
+        bare multisig outputs only, so later transactions spending it match
+        as well.
+
+        tx_hash - txid of tx, computed if not given
+        """
+        if tx_hash is None:
+            tx_hash = tx.GetTxid()
+        return self._is_relevant_and_update(tx_hash,
+                                            ((txin.prevout.serialize(), txin.scriptSig) for txin in tx.vin),
+                                            [txout.scriptPubKey for txout in tx.vout])
 
     __struct = struct.Struct(b'<IIB')
 
@@ -187,7 +498,191 @@ class CBloomFilter(bitcoin.core.serialize.Serializable):
             bitcoin.core.serialize.BytesSerializer.stream_serialize(bytes(self.vData), f)
         f.write(self.__struct.pack(self.nHashFuncs, self.nTweak, self.nFlags))
 
+
+class CPartialMerkleTree(bitcoin.core.serialize.Serializable):
+    """A pruned merkle tree proving which transactions of a block matched
+
+    Built from the txids of a block and whether each of them matched, it
+    keeps the hashes of the matching transactions and just enough other
+    hashes to compute the merkle root, in depth-first order, with one bit
+    per visited node telling whether it is the parent of a match. See BIP37.
+    """
+
+    def __init__(self, txids=(), matches=(), tree=None):
+        """Create a partial merkle tree
+
+        txids   - txids of every transaction of the block
+        matches - sequence of booleans, True for the transactions to include
+        tree    - optional full merkle tree of txids as built by
+                  CBlock.build_merkle_tree_from_txids(), e.g. the block's
+                  vMerkleTree, to avoid hashing the pruned branches again
+        """
+        self.nTransactions = len(txids)
+        self.vBits = []
+        self.vHash = []
+        if not self.nTransactions:
+            return
+        if tree is None:
+            tree = bitcoin.core.CBlock.build_merkle_tree_from_txids(list(txids))
+        # offset of every level in the deepest first tree
+        offsets = [0]
+        height = 0
+        while self.calc_tree_width(height) > 1:
+            offsets.append(offsets[-1] + self.calc_tree_width(height))
+            height += 1
+        self._traverse_and_build(height, 0, tree, offsets, matches)
+
+    def calc_tree_width(self, height):
+        """Number of nodes at height, 0 being the transactions"""
+        return (self.nTransactions + (1 << height) - 1) >> height
+
+    def _traverse_and_build(self, height, pos, tree, offsets, matches):
+        fParentOfMatch = any(matches[pos << height:min((pos + 1) << height, self.nTransactions)])
+        self.vBits.append(fParentOfMatch)
+        if height == 0 or not fParentOfMatch:
+            self.vHash.append(tree[offsets[height] + pos])
+        else:
+            self._traverse_and_build(height - 1, pos * 2, tree, offsets, matches)
+            if pos * 2 + 1 < self.calc_tree_width(height - 1):
+                self._traverse_and_build(height - 1, pos * 2 + 1, tree, offsets, matches)
+
+    def _traverse_and_extract(self, height, pos, used, vMatch):
+        if used[0] >= len(self.vBits):
+            raise ValueError('partial merkle tree overflowed its bits')
+        fParentOfMatch = self.vBits[used[0]]
+        used[0] += 1
+        if height == 0 or not fParentOfMatch:
+            if used[1] >= len(self.vHash):
+                raise ValueError('partial merkle tree overflowed its hashes')
+            h = self.vHash[used[1]]
+            used[1] += 1
+            if height == 0 and fParentOfMatch:
+                vMatch.append((pos, h))
+            return h
+        left = self._traverse_and_extract(height - 1, pos * 2, used, vMatch)
+        if pos * 2 + 1 < self.calc_tree_width(height - 1):
+            right = self._traverse_and_extract(height - 1, pos * 2 + 1, used, vMatch)
+            if right == left:
+                # the left and right branches must never be identical, as the
+                # transaction hashes covered by them must each be unique
+                raise ValueError('partial merkle tree has identical branches')
+        else:
+            right = left
+        return bitcoin.core.Hash(left + right)
+
+    def extract_matches(self):
+        """Check the tree and extract the matching transactions
+
+        Returns (merkle_root, matches) where matches is a list of
+        (index, txid) of the matching transactions, in block order. Raises
+        ValueError if the tree is malformed. The caller still has to compare
+        the merkle root with the one of the block header.
+        """
+        if self.nTransactions == 0:
+            raise ValueError('partial merkle tree has no transactions')
+        if self.nTransactions > bitcoin.core.MAX_BLOCK_WEIGHT // bitcoin.core.MIN_TRANSACTION_WEIGHT:
+            raise ValueError('partial merkle tree has too many transactions')
+        if len(self.vHash) > self.nTransactions:
+            raise ValueError('partial merkle tree has more hashes than transactions')
+        if len(self.vBits) < len(self.vHash):
+            raise ValueError('partial merkle tree has fewer bits than hashes')
+        height = 0
+        while self.calc_tree_width(height) > 1:
+            height += 1
+        used = [0, 0]
+        vMatch = []
+        root = self._traverse_and_extract(height, 0, used, vMatch)
+        # all bits up to the padding of the last byte and all hashes must be consumed
+        if (used[0] + 7) // 8 != (len(self.vBits) + 7) // 8:
+            raise ValueError('partial merkle tree has unused bits')
+        if used[1] != len(self.vHash):
+            raise ValueError('partial merkle tree has unused hashes')
+        return root, vMatch
+
+    __struct = struct.Struct(b'<I')
+
+    @classmethod
+    def stream_deserialize(cls, f):
+        self = cls()
+        self.nTransactions = cls.__struct.unpack(bitcoin.core.ser_read(f, 4))[0]
+        self.vHash = bitcoin.core.serialize.uint256VectorSerializer.stream_deserialize(f)
+        vBytes = bytearray(bitcoin.core.serialize.BytesSerializer.stream_deserialize(f))
+        self.vBits = [bool(vBytes[p >> 3] & (1 << (p & 7))) for p in range(len(vBytes) * 8)]
+        return self
+
+    def stream_serialize(self, f):
+        f.write(self.__struct.pack(self.nTransactions))
+        bitcoin.core.serialize.uint256VectorSerializer.stream_serialize(self.vHash, f)
+        vBytes = bytearray((len(self.vBits) + 7) // 8)
+        for p, bit in enumerate(self.vBits):
+            if bit:
+                vBytes[p >> 3] |= 1 << (p & 7)
+        bitcoin.core.serialize.BytesSerializer.stream_serialize(bytes(vBytes), f)
+
+
+class CMerkleBlock(bitcoin.core.serialize.Serializable):
+    """A block header and a CPartialMerkleTree of the matching transactions
+
+    This is the payload of the merkleblock message sent to SPV clients in
+    place of a block. vMatchedTxn lists the (index, txid) of the matching
+    transactions when the CMerkleBlock was created with from_block(), it is
+    not serialized.
+    """
+
+    def __init__(self, header=None, txn=None):
+        self.header = header if header is not None else bitcoin.core.CBlockHeader()
+        self.txn = txn if txn is not None else CPartialMerkleTree()
+        self.vMatchedTxn = []
+
+    @classmethod
+    def from_block(cls, block, bloom=None, txids=None):
+        """Create the merkleblock of a block
+
+        The transactions matching the CBloomFilter bloom, which is updated
+        as IsRelevantAndUpdate() does, or whose txid is in txids are
+        included. Transactions of a CLazyBlock are matched straight from the
+        block buffer without being decoded.
+        """
+        vtx = block.vtx
+        tree = block.vMerkleTree
+        n = len(vtx)
+        tx_hashes = tree[:n]
+        matched = [False] * n
+        if bloom is not None and n:
+            if isinstance(vtx, bitcoin.core._LazyTxVector):
+                txs = [(tx_hashes[i],) + vtx.inputs_outputs(i) for i in range(n)]
+            else:
+                txs = [(tx_hashes[i],
+                        [(txin.prevout.serialize(), txin.scriptSig) for txin in vtx[i].vin],
+                        [txout.scriptPubKey for txout in vtx[i].vout]) for i in range(n)]
+            contains = bloom._batch_contains(txs) if _np is not None and bloom.vData and bloom.nHashFuncs else None
+            matched = [bloom._is_relevant_and_update(tx_hash, vin, vout, contains) for tx_hash, vin, vout in txs]
+
+        matches = [False] * n
+        self = cls(block.get_header())
+        for i in range(n):
+            tx_hash = tx_hashes[i]
+            if matched[i] or (txids is not None and tx_hash in txids):
+                matches[i] = True
+                self.vMatchedTxn.append((i, tx_hash))
+        self.txn = CPartialMerkleTree(tx_hashes, matches, tree)
+        return self
+
+    @classmethod
+    def stream_deserialize(cls, f):
+        header = bitcoin.core.CBlockHeader.stream_deserialize(f)
+        txn = CPartialMerkleTree.stream_deserialize(f)
+        return cls(header, txn)
+
+    def stream_serialize(self, f):
+        self.header.stream_serialize(f)
+        self.txn.stream_serialize(f)
+
+
 __all__ = (
         'MurmurHash3',
+        'MurmurHash3Many',
         'CBloomFilter',
+        'CPartialMerkleTree',
+        'CMerkleBlock',
 )
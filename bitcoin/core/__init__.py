@@ -12,6 +12,7 @@
 from __future__ import absolute_import, division, print_function
 
 import binascii
+import hashlib
 import struct
 import sys
 import time
@@ -30,8 +31,18 @@ COIN = 100000000
 MAX_BLOCK_SIZE = 1000000
 MAX_BLOCK_WEIGHT = 4000000
 MAX_BLOCK_SIGOPS = MAX_BLOCK_SIZE/50
+MIN_TRANSACTION_WEIGHT = 4 * 60
 WITNESS_COINBASE_SCRIPTPUBKEY_MAGIC = _bytes([OP_RETURN, 0x24, 0xaa, 0x21, 0xa9, 0xed])
 
+# Precompiled formats of the fixed size fields, see ser_unpack()
+_int32 = struct.Struct(b"<i")
+_uint16 = struct.Struct(b"<H")
+_uint32 = struct.Struct(b"<I")
+_int64 = struct.Struct(b"<q")
+_uint64 = struct.Struct(b"<Q")
+_outpoint = struct.Struct(b"<32sI")
+_header = struct.Struct(b"<i32s32sIII")
+
 def MoneyRange(nValue, params=None):
     global coreparams
     if not params:
@@ -140,8 +151,7 @@ class COutPoint(ImmutableSerializable):
 
     @classmethod
     def stream_deserialize(cls, f):
-        hash = ser_read(f,32)
-        n = struct.unpack(b"<I", ser_read(f,4))[0]
+        hash, n = ser_unpack(f, _outpoint)
         return cls(hash, n)
 
     def stream_serialize(self, f):
@@ -204,7 +214,7 @@ class CTxIn(ImmutableSerializable):
     def stream_deserialize(cls, f):
         prevout = COutPoint.stream_deserialize(f)
         scriptSig = script.CScript(BytesSerializer.stream_deserialize(f))
-        nSequence = struct.unpack(b"<I", ser_read(f,4))[0]
+        nSequence = ser_unpack(f, _uint32)[0]
         return cls(prevout, scriptSig, nSequence)
 
     def stream_serialize(self, f):
@@ -267,7 +277,7 @@ class CTxOut(ImmutableSerializable):
 
     @classmethod
     def stream_deserialize(cls, f):
-        nValue = struct.unpack(b"<q", ser_read(f,8))[0]
+        nValue = ser_unpack(f, _int64)[0]
         scriptPubKey = script.CScript(BytesSerializer.stream_deserialize(f))
         return cls(nValue, scriptPubKey)
 
@@ -385,9 +395,20 @@ class CTxWitness(ImmutableSerializable):
             return cls(txwitness.vtxinwit)
 
 
+def _stripped_txid(view, start, wit, end):
+    """Hash the witness-stripped form of the transaction serialized in
+    view[start:end], wit being the offset of its witness data or None"""
+    if wit is None:
+        return Hash(view[start:end])
+    h = hashlib.sha256(view[start:start + 4])
+    h.update(view[start + 6:wit])
+    h.update(view[end - 4:end])
+    return hashlib.sha256(h.digest()).digest()
+
+
 class CTransaction(ImmutableSerializable):
     """A transaction"""
-    __slots__ = ['nVersion', 'vin', 'vout', 'nLockTime', 'wit']
+    __slots__ = ['nVersion', 'vin', 'vout', 'nLockTime', 'wit', '_cached_GetTxid', '_cached_sizes']
 
     def __init__(self, vin=(), vout=(), nLockTime=0, nVersion=1, witness=CTxWitness()):
         """Create a new transaction
@@ -417,24 +438,53 @@ class CTransaction(ImmutableSerializable):
         inputs. If the behavior of DecodeHexTx() is needed it could be added,
         but not here.
         """
-        # FIXME can't assume f is seekable
-        nVersion = struct.unpack(b"<i", ser_read(f,4))[0]
-        pos = f.tell()
-        markerbyte = struct.unpack(b'B', ser_read(f, 1))[0]
-        flagbyte = struct.unpack(b'B', ser_read(f, 1))[0]
-        if markerbyte == 0 and flagbyte == 1:
+        cursor = f.__class__ is BytesCursor
+        if cursor:
+            start = f.pos
+        nVersion = ser_unpack(f, _int32)[0]
+        if cursor:
+            # peek at the marker instead of reading and seeking back
+            segwit = f.peek(2) == b'\x00\x01'
+            if segwit:
+                f.pos += 2
+        else:
+            # FIXME can't assume f is seekable
+            pos = f.tell()
+            segwit = ser_read(f, 2) == b'\x00\x01'
+            if not segwit:
+                f.seek(pos) # put marker byte back, since we don't have peek
+        wit_pos = None
+        if segwit:
             vin = VectorSerializer.stream_deserialize(CTxIn, f)
             vout = VectorSerializer.stream_deserialize(CTxOut, f)
+            if cursor:
+                wit_pos = f.pos
             wit = CTxWitness(tuple(0 for dummy in range(len(vin))))
             wit = wit.stream_deserialize(f)
-            nLockTime = struct.unpack(b"<I", ser_read(f,4))[0]
-            return cls(vin, vout, nLockTime, nVersion, wit)
+            nLockTime = ser_unpack(f, _uint32)[0]
+            tx = cls(vin, vout, nLockTime, nVersion, wit)
         else:
-            f.seek(pos) # put marker byte back, since we don't have peek
             vin = VectorSerializer.stream_deserialize(CTxIn, f)
             vout = VectorSerializer.stream_deserialize(CTxOut, f)
-            nLockTime = struct.unpack(b"<I", ser_read(f,4))[0]
-            return cls(vin, vout, nLockTime, nVersion)
+            nLockTime = ser_unpack(f, _uint32)[0]
+            tx = cls(vin, vout, nLockTime, nVersion)
+        if cursor and not issubclass(cls, CMutableTransaction):
+            tx._cache_serialized(f.view, start, wit_pos, f.pos)
+        return tx
+
+    def _cache_serialized(self, view, start, wit, end):
+        """Set the cached txid, hash and sizes from the buffer the transaction
+        was deserialized from, so they never have to be re-serialized"""
+        txid = _stripped_txid(view, start, wit, end)
+        stripped_size = end - start if wit is None else wit - start - 2 + 4
+        if wit is None or self.wit.is_null():
+            # serialize() drops a segwit marker without witness data
+            h, size = txid, stripped_size
+        else:
+            h, size = Hash(view[start:end]), end - start
+        object.__setattr__(self, '_cached_GetTxid', txid)
+        object.__setattr__(self, '_cached_GetHash', h)
+        object.__setattr__(self, '_cached_sizes', (stripped_size, size))
 
 
     def stream_serialize(self, f, include_witness=True):
@@ -479,12 +529,23 @@ class CTransaction(ImmutableSerializable):
         """Get the transaction ID.  This differs from the transactions hash as
             given by GetHash.  GetTxid excludes witness data, while GetHash
             includes it. """
-        if self.wit != CTxWitness():
-            txid = Hash(CTransaction(self.vin, self.vout, self.nLockTime,
-                self.nVersion).serialize())
-        else:
-            txid = Hash(self.serialize())
-        return txid
+        try:
+            return self._cached_GetTxid
+        except AttributeError:
+            txid = Hash(self.serialize(dict(include_witness=False)))
+            object.__setattr__(self, '_cached_GetTxid', txid)
+            return txid
+
+    def get_size(self, include_witness=True):
+        """Return the serialized size, with or without witness data"""
+        try:
+            sizes = self._cached_sizes
+        except AttributeError:
+            stripped_size = len(self.serialize(dict(include_witness=False)))
+            size = stripped_size if self.wit.is_null() else len(self.serialize())
+            sizes = (stripped_size, size)
+            object.__setattr__(self, '_cached_sizes', sizes)
+        return sizes[1] if include_witness else sizes[0]
 
 @__make_mutable
 class CMutableTransaction(CTransaction):
@@ -517,6 +578,14 @@ class CMutableTransaction(CTransaction):
 
         return cls(vin, vout, tx.nLockTime, tx.nVersion, tx.wit)
 
+    def GetTxid(self):
+        """Get the transaction ID, see CTransaction.GetTxid()"""
+        return Hash(self.serialize(dict(include_witness=False)))
+
+    def get_size(self, include_witness=True):
+        """Return the serialized size, with or without witness data"""
+        return len(self.serialize(dict(include_witness=include_witness)))
+
 
 class CBlockHeader(ImmutableSerializable):
     """A block header"""
@@ -534,12 +603,7 @@ class CBlockHeader(ImmutableSerializable):
 
     @classmethod
     def stream_deserialize(cls, f):
-        nVersion = struct.unpack(b"<i", ser_read(f,4))[0]
-        hashPrevBlock = ser_read(f,32)
-        hashMerkleRoot = ser_read(f,32)
-        nTime = struct.unpack(b"<I", ser_read(f,4))[0]
-        nBits = struct.unpack(b"<I", ser_read(f,4))[0]
-        nNonce = struct.unpack(b"<I", ser_read(f,4))[0]
+        nVersion, hashPrevBlock, hashMerkleRoot, nTime, nBits, nNonce = ser_unpack(f, _header)
         return cls(nVersion, hashPrevBlock, hashMerkleRoot, nTime, nBits, nNonce)
 
     def stream_serialize(self, f):
@@ -729,9 +793,288 @@ class CBlock(CBlockHeader):
             object.__setattr__(self, '_cached_GetHash', _cached_GetHash)
             return _cached_GetHash
 
+    def get_size(self, include_witness=True):
+        """Return the serialized size of the block"""
+        return (80 + len(VarIntSerializer.serialize(len(self.vtx))) +
+                sum(tx.get_size(include_witness) for tx in self.vtx))
+
     def GetWeight(self):
         """Return the block weight: (stripped_size * 3) + total_size"""
-        return len(self.serialize(dict(include_witness=False))) * 3 + len(self.serialize())
+        return self.get_size(include_witness=False) * 3 + self.get_size()
+
+def _varint_at(view, pos):
+    """Read a compact size integer at pos, returning (value, new pos)"""
+    r = view[pos]
+    if r < 0xfd:
+        return r, pos + 1
+    elif r == 0xfd:
+        return _uint16.unpack_from(view, pos + 1)[0], pos + 3
+    elif r == 0xfe:
+        return _uint32.unpack_from(view, pos + 1)[0], pos + 5
+    else:
+        return _uint64.unpack_from(view, pos + 1)[0], pos + 9
+
+def _skip_bytes_at(view, pos):
+    n, pos = _varint_at(view, pos)
+    if n > MAX_SIZE:
+        raise SerializationError('Asked to read 0x%x bytes; MAX_SIZE exceeded' % n)
+    return pos + n
+
+def _index_txs(view, pos):
+    """Record where each transaction of a serialized vector starts and ends
+
+    Walks the length prefixes of the transactions starting at pos without
+    decoding anything. Returns (index, end) where index is a list of
+    (start, end, witness_start, has_witness) tuples. witness_start is the
+    offset of the witness data for transactions serialized with the segwit
+    marker and None otherwise.
+    """
+    index = []
+    try:
+        n, pos = _varint_at(view, pos)
+        for i in range(n):
+            start = pos
+            pos += 4
+            segwit = view[pos] == 0 and view[pos + 1] == 1
+            if segwit:
+                pos += 2
+            n_in, pos = _varint_at(view, pos)
+            for j in range(n_in):
+                pos = _skip_bytes_at(view, pos + 36) + 4
+            n_out, pos = _varint_at(view, pos)
+            for j in range(n_out):
+                pos = _skip_bytes_at(view, pos + 8)
+            wit = None
+            has_witness = False
+            if segwit:
+                wit = pos
+                for j in range(n_in):
+                    n_items, pos = _varint_at(view, pos)
+                    has_witness |= n_items > 0
+                    for k in range(n_items):
+                        pos = _skip_bytes_at(view, pos)
+            pos += 4
+            if pos > len(view):
+                raise IndexError
+            index.append((start, pos, wit, has_witness))
+    except (IndexError, struct.error):
+        raise SerializationTruncationError('Serialized transactions truncated at offset %i' % pos)
+    return index, pos
+
+
+class _LazyTxVector(object):
+    """Read-only sequence of the transactions of a CLazyBlock
+
+    Transactions are decoded from the block buffer when first accessed and
+    kept. txid(), wtxid() and size() hash or measure the serialized
+    transaction in the buffer without decoding it.
+    """
+    __slots__ = ['_view', '_index', '_txs']
+
+    def __init__(self, view, index):
+        self._view = view
+        self._index = index
+        self._txs = [None] * len(index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(len(self._index))))
+        tx = self._txs[i]
+        if tx is None:
+            start, end, wit, has_witness = self._index[i]
+            tx = self._txs[i] = CTransaction.deserialize(self._view[start:end])
+        return tx
+
+    def __iter__(self):
+        for i in range(len(self._index)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+    def stripped_parts(self, i):
+        """Return the buffer slices making up the witness-stripped transaction"""
+        start, end, wit, has_witness = self._index[i]
+        view = self._view
+        if wit is None:
+            return (view[start:end],)
+        return (view[start:start + 4], view[start + 6:wit], view[end - 4:end])
+
+    def raw(self, i, include_witness=True):
+        """Return transaction i as serialized by CTransaction.serialize()"""
+        start, end, wit, has_witness = self._index[i]
+        if include_witness and has_witness:
+            return self._view[start:end].tobytes()
+        return b''.join(p.tobytes() for p in self.stripped_parts(i))
+
+    def inputs_outputs(self, i):
+        """Return the inputs and outputs of transaction i as buffer slices
+
+        Returns (vin, vout) where vin is a list of (prevout, scriptSig) and
+        vout a list of scriptPubKeys, without decoding the transaction.
+        """
+        start, end, wit, has_witness = self._index[i]
+        view = self._view
+        pos = start + 6 if wit is not None else start + 4
+        n, pos = _varint_at(view, pos)
+        vin = []
+        for j in range(n):
+            n_script, script_start = _varint_at(view, pos + 36)
+            vin.append((view[pos:pos + 36], view[script_start:script_start + n_script]))
+            pos = script_start + n_script + 4
+        n, pos = _varint_at(view, pos)
+        vout = []
+        for j in range(n):
+            n_script, pos = _varint_at(view, pos + 8)
+            vout.append(view[pos:pos + n_script])
+            pos += n_script
+        return vin, vout
+
+    def txid(self, i):
+        start, end, wit, has_witness = self._index[i]
+        return _stripped_txid(self._view, start, wit, end)
+
+    def wtxid(self, i):
+        """Return the hash of transaction i, see CTransaction.GetHash()"""
+        start, end, wit, has_witness = self._index[i]
+        if not has_witness:
+            return self.txid(i)
+        return Hash(self._view[start:end])
+
+    def size(self, i, include_witness=True):
+        """Return the serialized size of transaction i"""
+        start, end, wit, has_witness = self._index[i]
+        if include_witness and has_witness:
+            return end - start
+        if wit is None:
+            return end - start
+        return wit - start - 2 + 4
+
+    def has_witness(self, i):
+        return self._index[i][3]
+
+    def is_canonical(self):
+        """True if every transaction in the buffer is serialized the way
+        CTransaction.serialize() would, i.e. no segwit marker without any
+        witness data"""
+        return all(has_witness or wit is None for start, end, wit, has_witness in self._index)
+
+
+class CLazyBlock(CBlock):
+    """A block that decodes its transactions on demand
+
+    Deserializing only parses the header and records where each transaction
+    starts and ends in the serialized block. Transactions in vtx are decoded
+    the first time they are accessed, the merkle trees are built on first use
+    from txids and wtxids hashed directly from the buffer, and the weight is
+    computed from the recorded offsets. The buffer passed to deserialize()
+    is referenced, not copied, and must not be modified afterwards.
+
+    Constructing a CLazyBlock directly is not supported, use deserialize().
+    """
+    __slots__ = ['_view', '_vtx', '_vMerkleTree', '_vWitnessMerkleTree']
+
+    def __init__(self, *args, **kwargs):
+        raise TypeError('CLazyBlock can only be created with deserialize()')
+
+    @classmethod
+    def stream_deserialize(cls, f):
+        """Deserialize a block
+
+        f should be a BytesCursor, as passed by deserialize(). Other streams
+        are read to the end.
+        """
+        if f.__class__ is not BytesCursor:
+            f = BytesCursor(f.read())
+        start = f.pos
+        view = f.view[start:]
+        fields = ser_unpack(f, _header)
+        index, end = _index_txs(view, 80)
+        f.pos = start + end
+        view = view[:end]
+
+        self = cls.__new__(cls)
+        CBlockHeader.__init__(self, *fields)
+        object.__setattr__(self, '_cached_GetHash', Hash(view[:80]))
+        object.__setattr__(self, '_view', view)
+        object.__setattr__(self, '_vtx', _LazyTxVector(view, index))
+        return self
+
+    @property
+    def vtx(self):
+        return self._vtx
+
+    @property
+    def vMerkleTree(self):
+        try:
+            return self._vMerkleTree
+        except AttributeError:
+            vtx = self._vtx
+            tree = tuple(self.build_merkle_tree_from_txids([vtx.txid(i) for i in range(len(vtx))]))
+            object.__setattr__(self, '_vMerkleTree', tree)
+            return tree
+
+    @property
+    def vWitnessMerkleTree(self):
+        try:
+            return self._vWitnessMerkleTree
+        except AttributeError:
+            vtx = self._vtx
+            tree = ()
+            if any(vtx.has_witness(i) for i in range(len(vtx))):
+                hashes = [b'\x00' * 32] + [vtx.wtxid(i) for i in range(1, len(vtx))]
+                tree = tuple(self.build_merkle_tree_from_txids(hashes))
+            object.__setattr__(self, '_vWitnessMerkleTree', tree)
+            return tree
+
+    def calc_merkle_root(self):
+        """Calculate the merkle root
+
+        Uses the cached merkle tree, which was built from the serialized
+        transactions.
+        """
+        if not len(self._vtx):
+            raise ValueError('Block contains no transactions')
+        return self.vMerkleTree[-1]
+
+    def calc_witness_merkle_root(self):
+        """Calculate the witness merkle root"""
+        if not len(self._vtx):
+            raise ValueError('Block contains no transactions')
+        if not self.vWitnessMerkleTree:
+            raise NoWitnessData
+        return self.vWitnessMerkleTree[-1]
+
+    def stream_serialize(self, f, include_witness=True):
+        vtx = self._vtx
+        if include_witness and vtx.is_canonical():
+            f.write(self._view)
+            return
+        f.write(self._view[:80])
+        VarIntSerializer.stream_serialize(len(vtx), f)
+        for i in range(len(vtx)):
+            f.write(vtx.raw(i, include_witness))
+
+    def get_size(self, include_witness=True):
+        """Return the serialized size of the block"""
+        vtx = self._vtx
+        n = len(vtx)
+        return (80 + len(VarIntSerializer.serialize(n)) +
+                sum(vtx.size(i, include_witness) for i in range(n)))
+
+    def GetWeight(self):
+        """Return the block weight: (stripped_size * 3) + total_size"""
+        return self.get_size(include_witness=False) * 3 + self.get_size()
+
 
 class CoreChainParams(object):
     """Define consensus-critical parameters of a given instance of the Bitcoin system"""
@@ -794,8 +1137,7 @@ def CheckTransaction(tx):
         raise CheckTransactionError("CheckTransaction() : vout empty")
 
     # Size limits
-    base_tx = CTransaction(tx.vin, tx.vout, tx.nLockTime, tx.nVersion)
-    if len(base_tx.serialize()) > MAX_BLOCK_SIZE:
+    if tx.get_size(include_witness=False) > MAX_BLOCK_SIZE:
         raise CheckTransactionError("CheckTransaction() : size limits failed")
 
     # Check for negative or overflow output values
@@ -906,7 +1248,7 @@ def CheckBlock(block, fCheckPoW = True, fCheckMerkleRoot = True, cur_time=None):
     # Size limits
     if not block.vtx:
         raise CheckBlockError("CheckBlock() : vtx empty")
-    if len(block.serialize(dict(include_witness=False))) > MAX_BLOCK_SIZE:
+    if block.get_size(include_witness=False) > MAX_BLOCK_SIZE:
         raise CheckBlockError("CheckBlock() : block larger than MAX_BLOCK_SIZE")
 
     if block.GetWeight() > MAX_BLOCK_WEIGHT:
@@ -969,6 +1311,7 @@ __all__ = (
         'COIN',
         'MAX_BLOCK_SIZE',
         'MAX_BLOCK_SIGOPS',
+        'MIN_TRANSACTION_WEIGHT',
         'MoneyRange',
         'x',
         'b2x',
@@ -988,6 +1331,7 @@ __all__ = (
         'CTxInWitness',
         'CBlockHeader',
         'CBlock',
+        'CLazyBlock',
         'CoreChainParams',
         'CoreMainParams',
         'CoreTestNetParams',
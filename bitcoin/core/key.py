@@ -36,6 +36,8 @@ _ssl = ctypes.cdll.LoadLibrary(ctypes.util.find_library('ssl') or 'libeay32')
 _libsecp256k1_path = ctypes.util.find_library('secp256k1')
 _libsecp256k1_enable_signing = False
 _libsecp256k1_context = None
+_libsecp256k1_enable_verification = False
+_libsecp256k1_verify_context = None
 _libsecp256k1 = None
 
 
@@ -203,7 +205,10 @@ _NID_secp256k1 = 714 # from openssl/obj_mac.h
 _ssl.EC_KEY_new_by_curve_name(_NID_secp256k1)
 
 SECP256K1_FLAGS_TYPE_CONTEXT = (1 << 0)
+SECP256K1_FLAGS_BIT_CONTEXT_VERIFY = (1 << 8)
 SECP256K1_FLAGS_BIT_CONTEXT_SIGN = (1 << 9)
+SECP256K1_CONTEXT_VERIFY = \
+    (SECP256K1_FLAGS_TYPE_CONTEXT | SECP256K1_FLAGS_BIT_CONTEXT_VERIFY)
 SECP256K1_CONTEXT_SIGN = \
     (SECP256K1_FLAGS_TYPE_CONTEXT | SECP256K1_FLAGS_BIT_CONTEXT_SIGN)
 
@@ -212,8 +217,35 @@ def is_libsec256k1_available():
     return _libsecp256k1_path is not None
 
 
-def use_libsecp256k1_for_signing(do_use):
+def _load_libsecp256k1():
     global _libsecp256k1
+
+    if not is_libsec256k1_available():
+        raise ImportError("unable to locate libsecp256k1")
+
+    if _libsecp256k1 is None:
+        lib = ctypes.cdll.LoadLibrary(_libsecp256k1_path)
+        lib.secp256k1_context_create.restype = ctypes.c_void_p
+        lib.secp256k1_context_create.errcheck = _check_res_void_p
+        lib.secp256k1_context_randomize.restype = ctypes.c_int
+        lib.secp256k1_context_randomize.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+
+        # Opaque secp256k1_pubkey and secp256k1_ecdsa_signature structs are
+        # passed as 64 byte buffers
+        lib.secp256k1_ec_pubkey_parse.restype = ctypes.c_int
+        lib.secp256k1_ec_pubkey_parse.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t]
+        lib.secp256k1_ecdsa_signature_parse_compact.restype = ctypes.c_int
+        lib.secp256k1_ecdsa_signature_parse_compact.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.secp256k1_ecdsa_signature_normalize.restype = ctypes.c_int
+        lib.secp256k1_ecdsa_signature_normalize.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.secp256k1_ecdsa_verify.restype = ctypes.c_int
+        lib.secp256k1_ecdsa_verify.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p]
+        _libsecp256k1 = lib
+
+    return _libsecp256k1
+
+
+def use_libsecp256k1_for_signing(do_use):
     global _libsecp256k1_context
     global _libsecp256k1_enable_signing
 
@@ -221,15 +253,9 @@ def use_libsecp256k1_for_signing(do_use):
         _libsecp256k1_enable_signing = False
         return
 
-    if not is_libsec256k1_available():
-        raise ImportError("unable to locate libsecp256k1")
+    _load_libsecp256k1()
 
     if _libsecp256k1_context is None:
-        _libsecp256k1 = ctypes.cdll.LoadLibrary(_libsecp256k1_path)
-        _libsecp256k1.secp256k1_context_create.restype = ctypes.c_void_p
-        _libsecp256k1.secp256k1_context_create.errcheck = _check_res_void_p
-        _libsecp256k1.secp256k1_context_randomize.restype = ctypes.c_int
-        _libsecp256k1.secp256k1_context_randomize.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
         _libsecp256k1_context = _libsecp256k1.secp256k1_context_create(SECP256K1_CONTEXT_SIGN)
         assert(_libsecp256k1_context is not None)
         seed = urandom(32)
@@ -241,6 +267,129 @@ def use_libsecp256k1_for_signing(do_use):
     _libsecp256k1_enable_signing = True
 
 
+def use_libsecp256k1_for_verification(do_use):
+    """Verify signatures with libsecp256k1 instead of OpenSSL
+
+    Enabled by default when libsecp256k1 can be found.
+    """
+    global _libsecp256k1_verify_context
+    global _libsecp256k1_enable_verification
+
+    if not do_use:
+        _libsecp256k1_enable_verification = False
+        return
+
+    _load_libsecp256k1()
+
+    if _libsecp256k1_verify_context is None:
+        _libsecp256k1_verify_context = _libsecp256k1.secp256k1_context_create(SECP256K1_CONTEXT_VERIFY)
+        assert(_libsecp256k1_verify_context is not None)
+
+    _libsecp256k1_enable_verification = True
+
+
+def _parse_der_lax(sig):
+    """Parse a DER signature as leniently as OpenSSL did
+
+    Port of ecdsa_signature_parse_der_lax() from Bitcoin Core, which
+    accepts the encoding violations that made it into the chain before
+    BIP66. Returns the 64 byte compact r || s encoding, with r and s both
+    zero if either is too large, or None if sig can't be parsed at all.
+    """
+    inputlen = len(sig)
+    pos = 0
+
+    def read_len(pos):
+        # Returns (length, pos) or (None, pos) if the length is invalid
+        lenbyte = _bord(sig[pos])
+        pos += 1
+        if not lenbyte & 0x80:
+            return lenbyte, pos
+        lenbyte -= 0x80
+        if lenbyte > inputlen - pos:
+            return None, pos
+        while lenbyte > 0 and _bord(sig[pos]) == 0:
+            pos += 1
+            lenbyte -= 1
+        if lenbyte >= 8:
+            return None, pos
+        n = 0
+        while lenbyte > 0:
+            n = (n << 8) + _bord(sig[pos])
+            pos += 1
+            lenbyte -= 1
+        return n, pos
+
+    # Sequence tag byte
+    if pos == inputlen or _bord(sig[pos]) != 0x30:
+        return None
+    pos += 1
+
+    # Sequence length bytes, ignored
+    if pos == inputlen:
+        return None
+    lenbyte = _bord(sig[pos])
+    pos += 1
+    if lenbyte & 0x80:
+        lenbyte -= 0x80
+        if lenbyte > inputlen - pos:
+            return None
+        pos += lenbyte
+
+    ints = []
+    for _ in range(2):
+        # Integer tag byte
+        if pos == inputlen or _bord(sig[pos]) != 0x02:
+            return None
+        pos += 1
+
+        # Integer length
+        if pos == inputlen:
+            return None
+        n, pos = read_len(pos)
+        if n is None or n > inputlen - pos:
+            return None
+        ints.append(sig[pos:pos + n].lstrip(b'\x00'))
+        pos += n
+
+    # Garbage after the integers is ignored
+    r, s = ints
+    if len(r) > 32 or len(s) > 32:
+        return b'\x00' * 64
+    return r.rjust(32, b'\x00') + s.rjust(32, b'\x00')
+
+
+def _parse_pubkey_with_libsecp256k1(pubkey):
+    """Return the parsed secp256k1_pubkey buffer or None if invalid"""
+    parsed = ctypes.create_string_buffer(64)
+    if not _libsecp256k1.secp256k1_ec_pubkey_parse(
+            _libsecp256k1_verify_context, parsed, pubkey, len(pubkey)):
+        return None
+    return parsed
+
+
+def _verify_with_libsecp256k1(parsed_pubkey, hash, sig): # pylint: disable=redefined-builtin
+    """Verify a DER signature against a parsed pubkey like Bitcoin Core
+
+    Signatures are parsed leniently and normalized to lower-S first, as
+    the low S rule is policy rather than consensus.
+    """
+    if parsed_pubkey is None or not sig:
+        return False
+    # secp256k1_ecdsa_signature_parse_der() is not used as it reads
+    # negative integers as zero, where OpenSSL took them as unsigned
+    compact = _parse_der_lax(sig)
+    if compact is None:
+        return False
+    ctx = _libsecp256k1_verify_context
+    raw_sig = ctypes.create_string_buffer(64)
+    if not _libsecp256k1.secp256k1_ecdsa_signature_parse_compact(ctx, raw_sig, compact):
+        # r or s not below the curve order, an invalid signature
+        _libsecp256k1.secp256k1_ecdsa_signature_parse_compact(ctx, raw_sig, b'\x00' * 64)
+    _libsecp256k1.secp256k1_ecdsa_signature_normalize(ctx, raw_sig, raw_sig)
+    return _libsecp256k1.secp256k1_ecdsa_verify(ctx, raw_sig, hash, parsed_pubkey) == 1
+
+
 
 # From openssl/ecdsa.h
 class ECDSA_SIG_st(ctypes.Structure):
@@ -255,6 +404,8 @@ class CECKey:
 
     def __init__(self):
         self.k = _ssl.EC_KEY_new_by_curve_name(_NID_secp256k1)
+        # libsecp256k1 parse of the public key, cleared when the key changes
+        self._libsecp256k1_pubkey = None
 
     def __del__(self):
         if _ssl:
@@ -262,6 +413,7 @@ class CECKey:
         self.k = None
 
     def set_secretbytes(self, secret):
+        self._libsecp256k1_pubkey = None
         priv_key = _ssl.BN_bin2bn(secret, 32, None)
         group = _ssl.EC_KEY_get0_group(self.k)
         pub_key = _ssl.EC_POINT_new(group)
@@ -276,10 +428,12 @@ class CECKey:
         return self.k
 
     def set_privkey(self, key):
+        self._libsecp256k1_pubkey = None
         self.mb = ctypes.create_string_buffer(key)
         return _ssl.d2i_ECPrivateKey(ctypes.byref(self.k), ctypes.byref(ctypes.pointer(self.mb)), len(key))
 
     def set_pubkey(self, key):
+        self._libsecp256k1_pubkey = None
         self.mb = ctypes.create_string_buffer(key)
         return _ssl.o2i_ECPublicKey(ctypes.byref(self.k), ctypes.byref(ctypes.pointer(self.mb)), len(key))
 
@@ -433,6 +587,12 @@ class CECKey:
         if not sig:
           return False
 
+        if _libsecp256k1_enable_verification and len(hash) == 32:
+            parsed_pubkey = self._libsecp256k1_pubkey
+            if parsed_pubkey is None:
+                parsed_pubkey = self._libsecp256k1_pubkey = _parse_pubkey_with_libsecp256k1(self.get_pubkey())
+            return _verify_with_libsecp256k1(parsed_pubkey, hash, sig)
+
         # New versions of OpenSSL will reject non-canonical DER signatures. de/re-serialize first.
         norm_sig = ctypes.c_void_p(0)
         _ssl.d2i_ECDSA_SIG(ctypes.byref(norm_sig), ctypes.byref(ctypes.c_char_p(sig)), len(sig))
@@ -464,6 +624,7 @@ class CECKey:
 
         if check is non-zero, additional checks are performed
         """
+        self._libsecp256k1_pubkey = None
         i = int(recid / 2)
 
         r = None
@@ -573,12 +734,25 @@ class CPubKey(bytes):
 
     def __new__(cls, buf, _cec_key=None):
         self = super(CPubKey, cls).__new__(cls, buf)
+        if _cec_key is None and _libsecp256k1_enable_verification:
+            # OpenSSL is only needed if something falls back to it
+            self._openssl_key = None
+            self._libsecp256k1_pubkey = _parse_pubkey_with_libsecp256k1(self)
+            self.is_fullyvalid = self._libsecp256k1_pubkey is not None
+            return self
         if _cec_key is None:
             _cec_key = CECKey()
-        self._cec_key = _cec_key
+        self._openssl_key = _cec_key
         self.is_fullyvalid = _cec_key.set_pubkey(self) is not None
         return self
 
+    @property
+    def _cec_key(self):
+        if self._openssl_key is None:
+            self._openssl_key = CECKey()
+            self._openssl_key.set_pubkey(self)
+        return self._openssl_key
+
     @classmethod
     def recover_compact(cls, hash, sig): # pylint: disable=redefined-builtin
         """Recover a public key from a compact signature."""
@@ -612,6 +786,13 @@ class CPubKey(bytes):
         return len(self) == 33
 
     def verify(self, hash, sig): # pylint: disable=redefined-builtin
+        if _libsecp256k1_enable_verification and len(hash) == 32:
+            # The pubkey is parsed once and kept with the instance
+            try:
+                parsed_pubkey = self._libsecp256k1_pubkey
+            except AttributeError:
+                parsed_pubkey = self._libsecp256k1_pubkey = _parse_pubkey_with_libsecp256k1(self)
+            return _verify_with_libsecp256k1(parsed_pubkey, hash, sig)
         return self._cec_key.verify(hash, sig)
 
     def __str__(self):
@@ -625,6 +806,13 @@ class CPubKey(bytes):
         else:
             return '%s(b%s)' % (self.__class__.__name__, super(CPubKey, self).__repr__())
 
+if is_libsec256k1_available():
+    try:
+        use_libsecp256k1_for_verification(True)
+    except (OSError, AttributeError):
+        # unusable or too old library, verify with OpenSSL
+        _libsecp256k1_enable_verification = False
+
 __all__ = (
         'CECKey',
         'CPubKey',
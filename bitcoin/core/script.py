@@ -850,6 +850,90 @@ class CScriptWitness(ImmutableSerializable):
             BytesSerializer.stream_serialize(s, f)
 
 
+TX_NONSTANDARD = 'nonstandard'
+TX_PUBKEYHASH = 'pubkeyhash'
+TX_SCRIPTHASH = 'scripthash'
+TX_WITNESS_V0_KEYHASH = 'witness_v0_keyhash'
+TX_WITNESS_V0_SCRIPTHASH = 'witness_v0_scripthash'
+
+_NONSTANDARD = (TX_NONSTANDARD, None)
+
+def ClassifyScriptPubKey(scriptPubKey):
+    """Classify a scriptPubKey as one of the standard hash templates
+
+    Returns (type, hash) where type is TX_PUBKEYHASH, TX_SCRIPTHASH,
+    TX_WITNESS_V0_KEYHASH or TX_WITNESS_V0_SCRIPTHASH and hash the 20 or 32
+    byte hash committed to, or (TX_NONSTANDARD, None) for anything else.
+
+    Only canonical encodings of the templates are recognized; the length
+    picks the template and the opcodes are compared at fixed offsets, so the
+    script is never parsed. scriptPubKey may be any bytes-like object.
+    """
+    if not isinstance(scriptPubKey, bytes):
+        scriptPubKey = bytes(scriptPubKey)
+    n = len(scriptPubKey)
+    if n == 25:
+        if scriptPubKey[0:3] == b'\x76\xa9\x14' and scriptPubKey[23:25] == b'\x88\xac':
+            return (TX_PUBKEYHASH, scriptPubKey[3:23])
+    elif n == 23:
+        if scriptPubKey[0:2] == b'\xa9\x14' and scriptPubKey[22:23] == b'\x87':
+            return (TX_SCRIPTHASH, scriptPubKey[2:22])
+    elif n == 22:
+        if scriptPubKey[0:2] == b'\x00\x14':
+            return (TX_WITNESS_V0_KEYHASH, scriptPubKey[2:22])
+    elif n == 34:
+        if scriptPubKey[0:2] == b'\x00\x20':
+            return (TX_WITNESS_V0_SCRIPTHASH, scriptPubKey[2:34])
+    return _NONSTANDARD
+
+def ClassifyScriptPubKeys(scriptPubKeys):
+    """Classify a sequence of scriptPubKeys
+
+    Returns a list of (type, hash) tuples in the same order, see
+    ClassifyScriptPubKey(). The scripts must be bytes or CScript instances.
+    """
+    # same tests as ClassifyScriptPubKey(), inlined to avoid a call per script
+    P2PKH_HEAD, P2PKH_TAIL = b'\x76\xa9\x14', b'\x88\xac'
+    P2SH_HEAD, P2WPKH_HEAD, P2WSH_HEAD = b'\xa9\x14', b'\x00\x14', b'\x00\x20'
+    r = []
+    append = r.append
+    for s in scriptPubKeys:
+        n = len(s)
+        if n == 25:
+            if s[0:3] == P2PKH_HEAD and s[23:25] == P2PKH_TAIL:
+                append((TX_PUBKEYHASH, s[3:23]))
+                continue
+        elif n == 23:
+            if s[0:2] == P2SH_HEAD and s[22:23] == b'\x87':
+                append((TX_SCRIPTHASH, s[2:22]))
+                continue
+        elif n == 22:
+            if s[0:2] == P2WPKH_HEAD:
+                append((TX_WITNESS_V0_KEYHASH, s[2:22]))
+                continue
+        elif n == 34:
+            if s[0:2] == P2WSH_HEAD:
+                append((TX_WITNESS_V0_SCRIPTHASH, s[2:34]))
+                continue
+        append(_NONSTANDARD)
+    return r
+
+def ClassifyBlockOutputs(block):
+    """Classify the outputs of every transaction in a block
+
+    Returns a list with one entry per transaction in block.vtx, each a list
+    of (type, hash) tuples for its outputs, see ClassifyScriptPubKey().
+    """
+    r = ClassifyScriptPubKeys([txout.scriptPubKey for tx in block.vtx for txout in tx.vout])
+    res = []
+    i = 0
+    for tx in block.vtx:
+        j = i + len(tx.vout)
+        res.append(r[i:j])
+        i = j
+    return res
+
+
 SIGHASH_ALL = 1
 SIGHASH_NONE = 2
 SIGHASH_SINGLE = 3
@@ -924,7 +1008,51 @@ def CompareBigEndian(c1, c2):
     return 0
 
 
-def RawSignatureHash(script, txTo, inIdx, hashtype):
+SIGVERSION_BASE = 0
+SIGVERSION_WITNESS_V0 = 1
+
+def _serialize_prevouts(txTo):
+    return [struct.pack(b"<32sI", txin.prevout.hash, txin.prevout.n) for txin in txTo.vin]
+
+def _hash_prevouts(txTo):
+    return bitcoin.core.Hash(b''.join(_serialize_prevouts(txTo)))
+
+def _hash_sequence(txTo):
+    return bitcoin.core.Hash(b''.join(struct.pack(b"<I", txin.nSequence) for txin in txTo.vin))
+
+def _serialize_outputs(txTo):
+    return b''.join(txout.serialize() for txout in txTo.vout)
+
+def _hash_outputs(txTo):
+    return bitcoin.core.Hash(_serialize_outputs(txTo))
+
+class PrecomputedTransactionData(object):
+    """Precomputed signature hash data of a transaction
+
+    hashPrevouts, hashSequence and hashOutputs are the BIP143 midstates,
+    prevouts, blank_txins and outputs are the serialized pieces
+    RawSignatureHash() puts together for legacy signatures. None of them
+    depend on the input being signed. Computing them once and passing this
+    object to SignatureHash() or RawSignatureHash() as cache (or to
+    EvalScript() and VerifyScript() as txdata) makes signing or verifying
+    every input of a transaction much cheaper, and linear in the number of
+    inputs for segwit.
+
+    The transaction must not be modified while the object is in use.
+    """
+    __slots__ = ['hashPrevouts', 'hashSequence', 'hashOutputs', 'prevouts', 'blank_txins', 'outputs']
+
+    def __init__(self, txTo):
+        self.prevouts = _serialize_prevouts(txTo)
+        # inputs other than the one being signed have an empty scriptSig
+        self.blank_txins = [prevout + struct.pack(b"<BI", 0, txin.nSequence)
+                            for prevout, txin in zip(self.prevouts, txTo.vin)]
+        self.outputs = _serialize_outputs(txTo)
+        self.hashPrevouts = bitcoin.core.Hash(b''.join(self.prevouts))
+        self.hashSequence = _hash_sequence(txTo)
+        self.hashOutputs = bitcoin.core.Hash(self.outputs)
+
+def RawSignatureHash(script, txTo, inIdx, hashtype, cache=None):
     """Consensus-correct SignatureHash
 
     Returns (hash, err) to precisely match the consensus-critical behavior of
@@ -932,61 +1060,69 @@ def RawSignatureHash(script, txTo, inIdx, hashtype):
 
     If you're just writing wallet software you probably want SignatureHash()
     instead.
+
+    The serialization of the modified transaction is written straight from
+    txTo, substituting the script of the input being signed, rather than
+    from a modified copy of it.
+
+    cache - PrecomputedTransactionData of txTo
     """
     HASH_ONE = b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
 
     if inIdx >= len(txTo.vin):
         return (HASH_ONE, "inIdx %d out of range (%d)" % (inIdx, len(txTo.vin)))
-    txtmp = bitcoin.core.CMutableTransaction.from_tx(txTo)
-
-    for txin in txtmp.vin:
-        txin.scriptSig = b''
-    txtmp.vin[inIdx].scriptSig = FindAndDelete(script, CScript([OP_CODESEPARATOR]))
+    txin = txTo.vin[inIdx]
+    txin_signed = (struct.pack(b"<32sI", txin.prevout.hash, txin.prevout.n) +
+                   BytesSerializer.serialize(FindAndDelete(script, CScript([OP_CODESEPARATOR]))) +
+                   struct.pack(b"<I", txin.nSequence))
 
-    if (hashtype & 0x1f) == SIGHASH_NONE:
-        txtmp.vout = []
+    basetype = hashtype & 0x1f
+    if basetype == SIGHASH_SINGLE and inIdx >= len(txTo.vout):
+        return (HASH_ONE, "outIdx %d out of range (%d)" % (inIdx, len(txTo.vout)))
 
-        for i in range(len(txtmp.vin)):
-            if i != inIdx:
-                txtmp.vin[i].nSequence = 0
-
-    elif (hashtype & 0x1f) == SIGHASH_SINGLE:
-        outIdx = inIdx
-        if outIdx >= len(txtmp.vout):
-            return (HASH_ONE, "outIdx %d out of range (%d)" % (outIdx, len(txtmp.vout)))
-
-        tmp = txtmp.vout[outIdx]
-        txtmp.vout = []
-        for i in range(outIdx):
-            txtmp.vout.append(bitcoin.core.CTxOut())
-        txtmp.vout.append(tmp)
-
-        for i in range(len(txtmp.vin)):
-            if i != inIdx:
-                txtmp.vin[i].nSequence = 0
+    parts = [struct.pack(b"<i", txTo.nVersion)]
 
     if hashtype & SIGHASH_ANYONECANPAY:
-        tmp = txtmp.vin[inIdx]
-        txtmp.vin = []
-        txtmp.vin.append(tmp)
-
-    txtmp.wit = bitcoin.core.CTxWitness()
-    s = txtmp.serialize()
-    s += struct.pack(b"<i", hashtype)
-
-    hash = bitcoin.core.Hash(s)
-
-    return (hash, None)
-
-SIGVERSION_BASE = 0
-SIGVERSION_WITNESS_V0 = 1
-
-def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERSION_BASE):
+        parts.append(b'\x01')
+        parts.append(txin_signed)
+    else:
+        parts.append(VarIntSerializer.serialize(len(txTo.vin)))
+        if basetype == SIGHASH_NONE or basetype == SIGHASH_SINGLE:
+            # sequences of the other inputs are zeroed
+            prevouts = cache.prevouts if cache is not None else _serialize_prevouts(txTo)
+            blank_txins = [prevout + b'\x00\x00\x00\x00\x00' for prevout in prevouts]
+        elif cache is not None:
+            blank_txins = cache.blank_txins
+        else:
+            blank_txins = [struct.pack(b"<32sIBI", i.prevout.hash, i.prevout.n, 0, i.nSequence)
+                           for i in txTo.vin]
+        parts.extend(blank_txins[:inIdx])
+        parts.append(txin_signed)
+        parts.extend(blank_txins[inIdx + 1:])
+
+    if basetype == SIGHASH_NONE:
+        parts.append(b'\x00')
+    elif basetype == SIGHASH_SINGLE:
+        # outputs before the signed one are CTxOut(): nValue -1, empty script
+        parts.append(VarIntSerializer.serialize(inIdx + 1))
+        parts.append(b'\xff\xff\xff\xff\xff\xff\xff\xff\x00' * inIdx)
+        parts.append(txTo.vout[inIdx].serialize())
+    else:
+        parts.append(VarIntSerializer.serialize(len(txTo.vout)))
+        parts.append(cache.outputs if cache is not None else _serialize_outputs(txTo))
+
+    parts.append(struct.pack(b"<Ii", txTo.nLockTime, hashtype))
+
+    return (bitcoin.core.Hash(b''.join(parts)), None)
+
+def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERSION_BASE, cache=None):
     """Calculate a signature hash
 
     'Cooked' version that checks if inIdx is out of bounds - this is *not*
     consensus-correct behavior, but is what you probably want for general
     wallet use.
+
+    cache - PrecomputedTransactionData of txTo
     """
 
     if sigversion == SIGVERSION_WITNESS_V0:
@@ -995,22 +1131,13 @@ def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERS
         hashOutputs  = b'\x00'*32
 
         if not (hashtype & SIGHASH_ANYONECANPAY):
-            serialize_prevouts = bytes()
-            for i in txTo.vin:
-                serialize_prevouts += i.prevout.serialize()
-            hashPrevouts = bitcoin.core.Hash(serialize_prevouts)
+            hashPrevouts = cache.hashPrevouts if cache is not None else _hash_prevouts(txTo)
 
         if (not (hashtype & SIGHASH_ANYONECANPAY) and (hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-            serialize_sequence = bytes()
-            for i in txTo.vin:
-                serialize_sequence += struct.pack("<I", i.nSequence)
-            hashSequence = bitcoin.core.Hash(serialize_sequence)
+            hashSequence = cache.hashSequence if cache is not None else _hash_sequence(txTo)
 
         if ((hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-            serialize_outputs = bytes()
-            for o in txTo.vout:
-                serialize_outputs += o.serialize()
-            hashOutputs = bitcoin.core.Hash(serialize_outputs)
+            hashOutputs = cache.hashOutputs if cache is not None else _hash_outputs(txTo)
         elif ((hashtype & 0x1f) == SIGHASH_SINGLE and inIdx < len(txTo.vout)):
             serialize_outputs = txTo.vout[inIdx].serialize()
             hashOutputs = bitcoin.core.Hash(serialize_outputs)
@@ -1031,7 +1158,7 @@ def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERS
 
     assert not script.is_witness_scriptpubkey()
 
-    (h, err) = RawSignatureHash(script, txTo, inIdx, hashtype)
+    (h, err) = RawSignatureHash(script, txTo, inIdx, hashtype, cache)
     if err is not None:
         raise ValueError(err)
     return h
@@ -1171,6 +1298,14 @@ __all__ = (
         'CScriptTruncatedPushDataError',
         'CScript',
         'CScriptWitness',
+        'TX_NONSTANDARD',
+        'TX_PUBKEYHASH',
+        'TX_SCRIPTHASH',
+        'TX_WITNESS_V0_KEYHASH',
+        'TX_WITNESS_V0_SCRIPTHASH',
+        'ClassifyScriptPubKey',
+        'ClassifyScriptPubKeys',
+        'ClassifyBlockOutputs',
         'SIGHASH_ALL',
         'SIGHASH_NONE',
         'SIGHASH_SINGLE',
@@ -1182,4 +1317,5 @@ __all__ = (
 
         'SIGVERSION_BASE',
         'SIGVERSION_WITNESS_V0',
+        'PrecomputedTransactionData',
 )
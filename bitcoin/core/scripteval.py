@@ -24,7 +24,13 @@ if sys.version > '3':
     long = int
     _bord = lambda x: x
 
+import collections
+import concurrent.futures
 import hashlib
+import itertools
+import os
+import struct
+import threading
 
 import bitcoin.core
 import bitcoin.core._bignum
@@ -131,10 +137,123 @@ def _CastToBool(s):
     return False
 
 
-def _CheckSig(sig, pubkey, script, txTo, inIdx, err_raiser):
-    key = bitcoin.core.key.CECKey()
-    key.set_pubkey(pubkey)
+DEFAULT_MAX_SIGCACHE_ENTRIES = 100000
+DEFAULT_MAX_PUBKEY_CACHE_ENTRIES = 10000
 
+class SignatureCache(object):
+    """Bounded cache of valid signatures, like Bitcoin Core's sigcache
+
+    Entries are salted hashes of (sighash, pubkey, sig) triples that passed
+    ECDSA verification, so checking the same signature again, e.g. when
+    re-validating mempool transactions or re-checking a block, skips the EC
+    maths. Only valid signatures are stored; invalid ones are checked every
+    time. Parsed public keys are kept in a second cache so that a key used
+    in several signatures is only parsed once.
+
+    Both caches evict the least recently used entry when full. All methods
+    are thread-safe. hits and misses count signature lookups, pubkey_hits
+    and pubkey_misses count parsed key lookups.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_SIGCACHE_ENTRIES,
+                 max_pubkeys=DEFAULT_MAX_PUBKEY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.max_pubkeys = max_pubkeys
+        self._salt = os.urandom(32)
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._pubkeys = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.pubkey_hits = 0
+        self.pubkey_misses = 0
+
+    def _entry(self, h, pubkey, sig):
+        return hashlib.sha256(self._salt + h + struct.pack(b"<I", len(pubkey)) + pubkey + sig).digest()
+
+    def contains(self, h, pubkey, sig):
+        """Return True if the signature is known to be valid"""
+        entry = self._entry(h, pubkey, sig)
+        with self._lock:
+            if entry in self._entries:
+                self._entries.move_to_end(entry)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, h, pubkey, sig):
+        """Record a signature as valid"""
+        entry = self._entry(h, pubkey, sig)
+        with self._lock:
+            self._entries[entry] = None
+            self._entries.move_to_end(entry)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_key(self, pubkey):
+        """Return pubkey as a CPubKey
+
+        Keys that fail to parse are returned as is, but not cached.
+        """
+        pubkey = bytes(pubkey)
+        with self._lock:
+            key = self._pubkeys.get(pubkey)
+            if key is not None:
+                self._pubkeys.move_to_end(pubkey)
+                self.pubkey_hits += 1
+                return key
+            self.pubkey_misses += 1
+
+        key = bitcoin.core.key.CPubKey(pubkey)
+        if not key.is_fullyvalid:
+            return key
+
+        with self._lock:
+            self._pubkeys[pubkey] = key
+            while len(self._pubkeys) > self.max_pubkeys:
+                self._pubkeys.popitem(last=False)
+        return key
+
+    def verify(self, h, pubkey, sig):
+        """Verify a DER signature of h, skipping signatures known to be valid"""
+        pubkey = bytes(pubkey)
+        sig = bytes(sig)
+        if self.contains(h, pubkey, sig):
+            return True
+        if not self.get_key(pubkey).verify(h, sig):
+            return False
+        self.add(h, pubkey, sig)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pubkeys.clear()
+            self.hits = self.misses = self.pubkey_hits = self.pubkey_misses = 0
+
+    def stats(self):
+        """Return the cache sizes and hit rates as a dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            pubkey_lookups = self.pubkey_hits + self.pubkey_misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'pubkeys': len(self._pubkeys),
+                'pubkey_hits': self.pubkey_hits,
+                'pubkey_misses': self.pubkey_misses,
+                'pubkey_hit_rate': self.pubkey_hits / pubkey_lookups if pubkey_lookups else 0.0,
+            }
+
+# Signature cache used by EvalScript(), set to None to verify every signature
+# from scratch
+signature_cache = SignatureCache()
+
+
+def _CheckSig(sig, pubkey, script, txTo, inIdx, err_raiser, amount=0, sigversion=SIGVERSION_BASE, txdata=None):
     if len(sig) == 0:
         return False
     hashtype = _bord(sig[-1])
@@ -148,11 +267,19 @@ def _CheckSig(sig, pubkey, script, txTo, inIdx, err_raiser):
     # imply the scriptSig being checked doesn't correspond to a valid txout -
     # that should cause other validation machinery to fail long before we ever
     # got here.
-    (h, err) = RawSignatureHash(script, txTo, inIdx, hashtype)
-    return key.verify(h, sig)
+    if sigversion == SIGVERSION_WITNESS_V0:
+        h = SignatureHash(script, txTo, inIdx, hashtype, amount=amount, sigversion=sigversion, cache=txdata)
+    else:
+        (h, err) = RawSignatureHash(script, txTo, inIdx, hashtype, txdata)
+
+    cache = signature_cache
+    if cache is not None:
+        return cache.verify(h, pubkey, sig)
+    return bitcoin.core.key.CPubKey(pubkey).verify(h, sig)
 
 
-def _CheckMultiSig(opcode, script, stack, txTo, inIdx, flags, err_raiser, nOpCount):
+def _CheckMultiSig(opcode, script, stack, txTo, inIdx, flags, err_raiser, nOpCount,
+                   amount=0, sigversion=SIGVERSION_BASE, txdata=None):
     i = 1
     if len(stack) < i:
         err_raiser(MissingOpArgumentsError, opcode, stack, i)
@@ -184,10 +311,12 @@ def _CheckMultiSig(opcode, script, stack, txTo, inIdx, flags, err_raiser, nOpCou
     # Drop the signature, since there's no way for a signature to sign itself
     #
     # Of course, this can only come up in very contrived cases now that
-    # scriptSig and scriptPubKey are processed separately.
-    for k in range(sigs_count):
-        sig = stack[-isig - k]
-        script = FindAndDelete(script, CScript([sig]))
+    # scriptSig and scriptPubKey are processed separately. Witness scripts
+    # are not subject to it.
+    if sigversion == SIGVERSION_BASE:
+        for k in range(sigs_count):
+            sig = stack[-isig - k]
+            script = FindAndDelete(script, CScript([sig]))
 
     success = True
 
@@ -195,7 +324,7 @@ def _CheckMultiSig(opcode, script, stack, txTo, inIdx, flags, err_raiser, nOpCou
         sig = stack[-isig]
         pubkey = stack[-ikey]
 
-        if _CheckSig(sig, pubkey, script, txTo, inIdx, err_raiser):
+        if _CheckSig(sig, pubkey, script, txTo, inIdx, err_raiser, amount, sigversion, txdata):
             isig += 1
             sigs_count -= 1
 
@@ -358,14 +487,465 @@ def _BinOp(opcode, stack, err_raiser):
     stack.append(bitcoin.core._bignum.bn2vch(bn))
 
 
-def _CheckExec(vfExec):
-    for b in vfExec:
-        if not b:
-            return False
-    return True
+DEFAULT_MAX_COMPILED_SCRIPTS = 10000
+
+class CompiledScript(object):
+    """A script decoded once into the form EvalScript() executes
+
+    ops      - Opcode of every instruction
+
+    data     - Push data of every instruction, as returned by
+               CScript.raw_iter()
+
+    pcs      - Byte offset of every instruction in the script
+
+    pushes   - Value pushed on the stack by push and small integer opcodes,
+               None for all others
+
+    opcounts - Number of opcodes counted towards MAX_SCRIPT_OPCODES before
+               every instruction, and in total as the last item
+
+    jumps    - Index of the ELSE or ENDIF matching every IF, NOTIF and ELSE,
+               or the number of instructions if there is none. Used to skip
+               branches that are not executed. None if the script contains
+               instructions that fail even when not executed, in which case
+               such branches are stepped through instead.
+
+    errors   - Per instruction error raised whenever the instruction is
+               reached, as (exception class, args), or None if there are
+               no such errors
+
+    error    - Decoding error raised after the last instruction, as
+               (exception class, args), or None
+    """
+    __slots__ = ['ops', 'data', 'pcs', 'pushes', 'opcounts', 'jumps', 'errors', 'error']
+
+    def __init__(self, script):
+        ops = []
+        data = []
+        pcs = []
+        self.error = None
+        try:
+            for (sop, sop_data, sop_pc) in script.raw_iter():
+                ops.append(sop)
+                data.append(sop_data)
+                pcs.append(sop_pc)
+        except CScriptTruncatedPushDataError as err:
+            self.error = (CScriptTruncatedPushDataError, (str(err), err.data))
+        except CScriptInvalidError as err:
+            self.error = (err.__class__, err.args)
+
+        pushes = []
+        opcounts = [0]
+        errors = [None] * len(ops)
+        jumps = [None] * len(ops)
+        open_blocks = []
+        for i, sop in enumerate(ops):
+            if sop <= OP_PUSHDATA4:
+                pushes.append(data[i])
+                if len(data[i]) > MAX_SCRIPT_ELEMENT_SIZE:
+                    errors[i] = (EvalScriptError,
+                                 ('PUSHDATA of length %d; maximum allowed is %d' %
+                                        (len(data[i]), MAX_SCRIPT_ELEMENT_SIZE),))
+            elif sop == OP_1NEGATE or OP_1 <= sop <= OP_16:
+                pushes.append(bitcoin.core._bignum.bn2vch(sop - (OP_1 - 1)))
+            else:
+                pushes.append(None)
+                if sop in DISABLED_OPCODES:
+                    errors[i] = (EvalScriptError, ('opcode %s is disabled' % OPCODE_NAMES[sop],))
+
+            opcounts.append(opcounts[-1] + (sop > OP_16))
+
+            if sop == OP_IF or sop == OP_NOTIF:
+                open_blocks.append(i)
+            elif sop == OP_ELSE and open_blocks:
+                jumps[open_blocks[-1]] = i
+                open_blocks[-1] = i
+            elif sop == OP_ENDIF and open_blocks:
+                jumps[open_blocks.pop()] = i
+        for i in open_blocks:
+            jumps[i] = len(ops)
+
+        has_errors = errors.count(None) != len(errors)
+        self.ops = tuple(ops)
+        self.data = tuple(data)
+        self.pcs = tuple(pcs)
+        self.pushes = tuple(pushes)
+        self.opcounts = tuple(opcounts)
+        self.jumps = None if has_errors else tuple(jumps)
+        self.errors = tuple(errors) if has_errors else None
+
+    def is_push_only(self):
+        return self.opcounts[-1] == 0 and OP_RESERVED not in self.ops
+
+_compiled_scripts = {}
+
+def CompileScript(script, cache=True):
+    """Return script as a CompiledScript
+
+    Compiled scripts that contain more than pushes, i.e. scriptPubKeys,
+    redeem scripts and the like rather than scriptSigs, are kept in a
+    bounded cache so that common templates are only decoded once.
+    """
+    key = bytes(script)
+    compiled = _compiled_scripts.get(key)
+    if compiled is not None:
+        return compiled
+
+    compiled = CompiledScript(CScript(key))
+    if cache and not compiled.is_push_only():
+        if len(_compiled_scripts) >= DEFAULT_MAX_COMPILED_SCRIPTS:
+            try:
+                del _compiled_scripts[next(iter(_compiled_scripts))]
+            except (KeyError, StopIteration, RuntimeError):
+                pass # evicted by another thread
+        _compiled_scripts[key] = compiled
+    return compiled
+
+
+class _EvalState(object):
+    """Execution state of _EvalScript()
+
+    Instances are also the err_raiser passed to the opcode helpers: calling
+    one raises the given EvalScriptError subclass with the state of the
+    instruction being executed filled in.
+    """
+    __slots__ = ['stack', 'altstack', 'vfExec', 'scriptIn', 'compiled', 'txTo', 'inIdx', 'flags',
+                 'amount', 'sigversion', 'txdata', 'pbegincodehash', 'nOpCount', 'i']
+
+    def __init__(self, stack, scriptIn, compiled, txTo, inIdx, flags, amount, sigversion, txdata):
+        self.stack = stack
+        self.altstack = []
+        self.vfExec = []
+        self.scriptIn = scriptIn
+        self.compiled = compiled
+        self.txTo = txTo
+        self.inIdx = inIdx
+        self.flags = flags
+        self.amount = amount
+        self.sigversion = sigversion
+        self.txdata = txdata
+        self.pbegincodehash = 0
+        self.nOpCount = [0]
+        self.i = 0
+
+    def __call__(self, cls, *args):
+        i = self.i
+        compiled = self.compiled
+        raise cls(*args,
+                  sop=compiled.ops[i],
+                  sop_data=compiled.data[i],
+                  sop_pc=compiled.pcs[i],
+                  stack=self.stack, scriptIn=self.scriptIn, txTo=self.txTo, inIdx=self.inIdx,
+                  flags=self.flags, altstack=self.altstack, vfExec=self.vfExec,
+                  pbegincodehash=self.pbegincodehash, nOpCount=self.nOpCount[0])
+
+def _CheckArgs(st, sop, n):
+    if len(st.stack) < n:
+        st(MissingOpArgumentsError, sop, st.stack, n)
+
+# Opcode implementations, called as handler(state, opcode) for instructions
+# being executed. Pushes and IF/NOTIF/ELSE/ENDIF are handled by
+# _EvalScript() itself.
+
+def _OpUnsupported(st, sop):
+    st(EvalScriptError, 'unsupported opcode 0x%x' % sop)
+
+def _OpBinOp(st, sop):
+    _BinOp(sop, st.stack, st)
+
+def _OpUnaryOp(st, sop):
+    _UnaryOp(sop, st.stack, st)
+
+def _Op2Drop(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    stack.pop()
+    stack.pop()
+
+def _Op2Dup(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    v1 = stack[-2]
+    v2 = stack[-1]
+    stack.append(v1)
+    stack.append(v2)
+
+def _Op2Over(st, sop):
+    _CheckArgs(st, sop, 4)
+    stack = st.stack
+    v1 = stack[-4]
+    v2 = stack[-3]
+    stack.append(v1)
+    stack.append(v2)
+
+def _Op2Rot(st, sop):
+    _CheckArgs(st, sop, 6)
+    stack = st.stack
+    v1 = stack[-6]
+    v2 = stack[-5]
+    del stack[-6]
+    del stack[-5]
+    stack.append(v1)
+    stack.append(v2)
+
+def _Op2Swap(st, sop):
+    _CheckArgs(st, sop, 4)
+    stack = st.stack
+    tmp = stack[-4]
+    stack[-4] = stack[-2]
+    stack[-2] = tmp
+
+    tmp = stack[-3]
+    stack[-3] = stack[-1]
+    stack[-1] = tmp
+
+def _Op3Dup(st, sop):
+    _CheckArgs(st, sop, 3)
+    stack = st.stack
+    v1 = stack[-3]
+    v2 = stack[-2]
+    v3 = stack[-1]
+    stack.append(v1)
+    stack.append(v2)
+    stack.append(v3)
+
+def _OpCheckMultiSig(st, sop):
+    tmpScript = CScript(st.scriptIn[st.pbegincodehash:])
+    _CheckMultiSig(sop, tmpScript, st.stack, st.txTo, st.inIdx, st.flags, st, st.nOpCount,
+                   st.amount, st.sigversion, st.txdata)
+
+def _OpCheckSig(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    vchPubKey = stack[-1]
+    vchSig = stack[-2]
+    tmpScript = CScript(st.scriptIn[st.pbegincodehash:])
+
+    # Drop the signature, since there's no way for a signature to sign itself
+    #
+    # Of course, this can only come up in very contrived cases now that
+    # scriptSig and scriptPubKey are processed separately.
+    if st.sigversion == SIGVERSION_BASE:
+        tmpScript = FindAndDelete(tmpScript, CScript([vchSig]))
+
+    ok = _CheckSig(vchSig, vchPubKey, tmpScript, st.txTo, st.inIdx,
+                   st, st.amount, st.sigversion, st.txdata)
+    if not ok and sop == OP_CHECKSIGVERIFY:
+        st(VerifyOpFailedError, sop)
+
+    else:
+        stack.pop()
+        stack.pop()
+
+        if ok:
+            if sop != OP_CHECKSIGVERIFY:
+                stack.append(b"\x01")
+        else:
+            # FIXME: this is incorrect, but not caught by existing
+            # test cases
+            stack.append(b"\x00")
+
+def _OpCodeSeparator(st, sop):
+    # scriptCode starts after the separator, which is a single byte
+    st.pbegincodehash = st.compiled.pcs[st.i] + 1
+
+def _OpDepth(st, sop):
+    st.stack.append(bitcoin.core._bignum.bn2vch(len(st.stack)))
+
+def _OpDrop(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.pop()
+
+def _OpDup(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(st.stack[-1])
+
+def _OpEqual(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    v1 = stack.pop()
+    v2 = stack.pop()
+
+    if v1 == v2:
+        stack.append(b"\x01")
+    else:
+        stack.append(b"")
+
+def _OpEqualVerify(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    if stack[-1] == stack[-2]:
+        stack.pop()
+        stack.pop()
+    else:
+        st(VerifyOpFailedError, sop)
+
+def _OpFromAltStack(st, sop):
+    if len(st.altstack) < 1:
+        st(MissingOpArgumentsError, sop, st.altstack, 1)
+    st.stack.append(st.altstack.pop())
+
+def _OpHash160(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(bitcoin.core.serialize.Hash160(st.stack.pop()))
 
+def _OpHash256(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(bitcoin.core.serialize.Hash(st.stack.pop()))
 
-def _EvalScript(stack, scriptIn, txTo, inIdx, flags=()):
+def _OpIfDup(st, sop):
+    _CheckArgs(st, sop, 1)
+    vch = st.stack[-1]
+    if _CastToBool(vch):
+        st.stack.append(vch)
+
+def _OpNip(st, sop):
+    _CheckArgs(st, sop, 2)
+    del st.stack[-2]
+
+def _OpNop(st, sop):
+    pass
+
+def _OpUpgradableNop(st, sop):
+    if SCRIPT_VERIFY_DISCOURAGE_UPGRADABLE_NOPS in st.flags:
+        st(EvalScriptError, "%s reserved for soft-fork upgrades" % OPCODE_NAMES[sop])
+
+def _OpOver(st, sop):
+    _CheckArgs(st, sop, 2)
+    st.stack.append(st.stack[-2])
+
+def _OpPickRoll(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    n = _CastToBigNum(stack.pop(), st)
+    if n < 0 or n >= len(stack):
+        st(EvalScriptError, "Argument for %s out of bounds" % OPCODE_NAMES[sop])
+    vch = stack[-n-1]
+    if sop == OP_ROLL:
+        del stack[-n-1]
+    stack.append(vch)
+
+def _OpReturn(st, sop):
+    st(EvalScriptError, "OP_RETURN called")
+
+def _OpRipemd160(st, sop):
+    _CheckArgs(st, sop, 1)
+    h = hashlib.new('ripemd160')
+    h.update(st.stack.pop())
+    st.stack.append(h.digest())
+
+def _OpRot(st, sop):
+    _CheckArgs(st, sop, 3)
+    stack = st.stack
+    tmp = stack[-3]
+    stack[-3] = stack[-2]
+    stack[-2] = tmp
+
+    tmp = stack[-2]
+    stack[-2] = stack[-1]
+    stack[-1] = tmp
+
+def _OpSize(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(bitcoin.core._bignum.bn2vch(len(st.stack[-1])))
+
+def _OpSha1(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(hashlib.sha1(st.stack.pop()).digest())
+
+def _OpSha256(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.stack.append(hashlib.sha256(st.stack.pop()).digest())
+
+def _OpSwap(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    tmp = stack[-2]
+    stack[-2] = stack[-1]
+    stack[-1] = tmp
+
+def _OpToAltStack(st, sop):
+    _CheckArgs(st, sop, 1)
+    st.altstack.append(st.stack.pop())
+
+def _OpTuck(st, sop):
+    _CheckArgs(st, sop, 2)
+    stack = st.stack
+    stack.insert(len(stack) - 2, stack[-1])
+
+def _OpVerify(st, sop):
+    _CheckArgs(st, sop, 1)
+    if _CastToBool(st.stack[-1]):
+        st.stack.pop()
+    else:
+        st(VerifyOpFailedError, sop)
+
+def _OpWithin(st, sop):
+    _CheckArgs(st, sop, 3)
+    stack = st.stack
+    bn3 = _CastToBigNum(stack[-1], st)
+    bn2 = _CastToBigNum(stack[-2], st)
+    bn1 = _CastToBigNum(stack[-3], st)
+    stack.pop()
+    stack.pop()
+    stack.pop()
+    v = (bn2 <= bn1) and (bn1 < bn3)
+    if v:
+        stack.append(b"\x01")
+    else:
+        # FIXME: this is incorrect, but not caught by existing
+        # test cases
+        stack.append(b"\x00")
+
+_OPCODE_HANDLERS = [_OpUnsupported] * 256
+for _sop in _ISA_BINOP:
+    _OPCODE_HANDLERS[_sop] = _OpBinOp
+for _sop in _ISA_UNOP:
+    _OPCODE_HANDLERS[_sop] = _OpUnaryOp
+for _sop in range(OP_NOP1, OP_NOP10 + 1):
+    _OPCODE_HANDLERS[_sop] = _OpUpgradableNop
+for _sop, _handler in ((OP_2DROP, _Op2Drop),
+                       (OP_2DUP, _Op2Dup),
+                       (OP_2OVER, _Op2Over),
+                       (OP_2ROT, _Op2Rot),
+                       (OP_2SWAP, _Op2Swap),
+                       (OP_3DUP, _Op3Dup),
+                       (OP_CHECKMULTISIG, _OpCheckMultiSig),
+                       (OP_CHECKMULTISIGVERIFY, _OpCheckMultiSig),
+                       (OP_CHECKSIG, _OpCheckSig),
+                       (OP_CHECKSIGVERIFY, _OpCheckSig),
+                       (OP_CODESEPARATOR, _OpCodeSeparator),
+                       (OP_DEPTH, _OpDepth),
+                       (OP_DROP, _OpDrop),
+                       (OP_DUP, _OpDup),
+                       (OP_EQUAL, _OpEqual),
+                       (OP_EQUALVERIFY, _OpEqualVerify),
+                       (OP_FROMALTSTACK, _OpFromAltStack),
+                       (OP_HASH160, _OpHash160),
+                       (OP_HASH256, _OpHash256),
+                       (OP_IFDUP, _OpIfDup),
+                       (OP_NIP, _OpNip),
+                       (OP_NOP, _OpNop),
+                       (OP_OVER, _OpOver),
+                       (OP_PICK, _OpPickRoll),
+                       (OP_ROLL, _OpPickRoll),
+                       (OP_RETURN, _OpReturn),
+                       (OP_RIPEMD160, _OpRipemd160),
+                       (OP_ROT, _OpRot),
+                       (OP_SIZE, _OpSize),
+                       (OP_SHA1, _OpSha1),
+                       (OP_SHA256, _OpSha256),
+                       (OP_SWAP, _OpSwap),
+                       (OP_TOALTSTACK, _OpToAltStack),
+                       (OP_TUCK, _OpTuck),
+                       (OP_VERIFY, _OpVerify),
+                       (OP_WITHIN, _OpWithin)):
+    _OPCODE_HANDLERS[_sop] = _handler
+del _sop, _handler
+
+
+def _EvalScript(stack, scriptIn, txTo, inIdx, flags=(), amount=0, sigversion=SIGVERSION_BASE, txdata=None):
     """Evaluate a script
 
     """
@@ -378,332 +958,92 @@ def _EvalScript(stack, scriptIn, txTo, inIdx, flags=()):
                               inIdx=inIdx,
                               flags=flags)
 
-    altstack = []
-    vfExec = []
-    pbegincodehash = 0
-    nOpCount = [0]
-    for (sop, sop_data, sop_pc) in scriptIn.raw_iter():
-        fExec = _CheckExec(vfExec)
-
-        def err_raiser(cls, *args):
-            """Helper function for raising EvalScriptError exceptions
-
-            cls   - subclass you want to raise
-
-            *args - arguments
-
-            Fills in the state of execution for you.
-            """
-            raise cls(*args,
-                    sop=sop,
-                    sop_data=sop_data,
-                    sop_pc=sop_pc,
-                    stack=stack, scriptIn=scriptIn, txTo=txTo, inIdx=inIdx, flags=flags,
-                    altstack=altstack, vfExec=vfExec, pbegincodehash=pbegincodehash, nOpCount=nOpCount[0])
-
-
-        if sop in DISABLED_OPCODES:
-            err_raiser(EvalScriptError, 'opcode %s is disabled' % OPCODE_NAMES[sop])
+    compiled = CompileScript(scriptIn)
+    st = _EvalState(stack, scriptIn, compiled, txTo, inIdx, flags, amount, sigversion, txdata)
+    ops = compiled.ops
+    pushes = compiled.pushes
+    jumps = compiled.jumps
+    errors = compiled.errors
+    altstack = st.altstack
+    vfExec = st.vfExec
+    nOpCount = st.nOpCount
+    handlers = _OPCODE_HANDLERS
+
+    # Number of False entries in vfExec, instructions are only executed when
+    # it is zero
+    nFalse = 0
+    i = 0
+    n = len(ops)
+    while i < n:
+        st.i = i
+        sop = ops[i]
+        next_i = i + 1
+
+        if errors is not None and errors[i] is not None:
+            st(*errors[i])
 
         if sop > OP_16:
             nOpCount[0] += 1
             if nOpCount[0] > MAX_SCRIPT_OPCODES:
-                err_raiser(MaxOpCountError)
-
-        def check_args(n):
-            if len(stack) < n:
-                err_raiser(MissingOpArgumentsError, sop, stack, n)
+                st(MaxOpCountError)
 
+        if not nFalse and pushes[i] is not None:
+            stack.append(pushes[i])
+            if sop <= OP_PUSHDATA4:
+                # the stack size isn't checked after data pushes
+                i = next_i
+                continue
 
-        if sop <= OP_PUSHDATA4:
-            if len(sop_data) > MAX_SCRIPT_ELEMENT_SIZE:
-                err_raiser(EvalScriptError,
-                           'PUSHDATA of length %d; maximum allowed is %d' %
-                                (len(sop_data), MAX_SCRIPT_ELEMENT_SIZE))
+        elif OP_IF <= sop <= OP_ENDIF:
+            if sop == OP_IF or sop == OP_NOTIF:
+                val = False
 
-            elif fExec:
-                stack.append(sop_data)
-                continue
+                if not nFalse:
+                    _CheckArgs(st, sop, 1)
+                    val = _CastToBool(stack.pop())
+                    if sop == OP_NOTIF:
+                        val = not val
 
-        elif fExec or (OP_IF <= sop <= OP_ENDIF):
-
-            if sop == OP_1NEGATE or ((sop >= OP_1) and (sop <= OP_16)):
-                v = sop - (OP_1 - 1)
-                stack.append(bitcoin.core._bignum.bn2vch(v))
-
-            elif sop in _ISA_BINOP:
-                _BinOp(sop, stack, err_raiser)
-
-            elif sop in _ISA_UNOP:
-                _UnaryOp(sop, stack, err_raiser)
-
-            elif sop == OP_2DROP:
-                check_args(2)
-                stack.pop()
-                stack.pop()
-
-            elif sop == OP_2DUP:
-                check_args(2)
-                v1 = stack[-2]
-                v2 = stack[-1]
-                stack.append(v1)
-                stack.append(v2)
-
-            elif sop == OP_2OVER:
-                check_args(4)
-                v1 = stack[-4]
-                v2 = stack[-3]
-                stack.append(v1)
-                stack.append(v2)
-
-            elif sop == OP_2ROT:
-                check_args(6)
-                v1 = stack[-6]
-                v2 = stack[-5]
-                del stack[-6]
-                del stack[-5]
-                stack.append(v1)
-                stack.append(v2)
-
-            elif sop == OP_2SWAP:
-                check_args(4)
-                tmp = stack[-4]
-                stack[-4] = stack[-2]
-                stack[-2] = tmp
-
-                tmp = stack[-3]
-                stack[-3] = stack[-1]
-                stack[-1] = tmp
-
-            elif sop == OP_3DUP:
-                check_args(3)
-                v1 = stack[-3]
-                v2 = stack[-2]
-                v3 = stack[-1]
-                stack.append(v1)
-                stack.append(v2)
-                stack.append(v3)
-
-            elif sop == OP_CHECKMULTISIG or sop == OP_CHECKMULTISIGVERIFY:
-                tmpScript = CScript(scriptIn[pbegincodehash:])
-                _CheckMultiSig(sop, tmpScript, stack, txTo, inIdx, flags, err_raiser, nOpCount)
-
-            elif sop == OP_CHECKSIG or sop == OP_CHECKSIGVERIFY:
-                check_args(2)
-                vchPubKey = stack[-1]
-                vchSig = stack[-2]
-                tmpScript = CScript(scriptIn[pbegincodehash:])
-
-                # Drop the signature, since there's no way for a signature to sign itself
-                #
-                # Of course, this can only come up in very contrived cases now that
-                # scriptSig and scriptPubKey are processed separately.
-                tmpScript = FindAndDelete(tmpScript, CScript([vchSig]))
-
-                ok = _CheckSig(vchSig, vchPubKey, tmpScript, txTo, inIdx,
-                               err_raiser)
-                if not ok and sop == OP_CHECKSIGVERIFY:
-                    err_raiser(VerifyOpFailedError, sop)
-
-                else:
-                    stack.pop()
-                    stack.pop()
-
-                    if ok:
-                        if sop != OP_CHECKSIGVERIFY:
-                            stack.append(b"\x01")
-                    else:
-                        # FIXME: this is incorrect, but not caught by existing
-                        # test cases
-                        stack.append(b"\x00")
-
-            elif sop == OP_CODESEPARATOR:
-                pbegincodehash = sop_pc
-
-            elif sop == OP_DEPTH:
-                bn = len(stack)
-                stack.append(bitcoin.core._bignum.bn2vch(bn))
-
-            elif sop == OP_DROP:
-                check_args(1)
-                stack.pop()
-
-            elif sop == OP_DUP:
-                check_args(1)
-                v = stack[-1]
-                stack.append(v)
+                vfExec.append(val)
+                if not val:
+                    nFalse += 1
 
             elif sop == OP_ELSE:
                 if len(vfExec) == 0:
-                    err_raiser(EvalScriptError, 'ELSE found without prior IF')
+                    st(EvalScriptError, 'ELSE found without prior IF')
                 vfExec[-1] = not vfExec[-1]
+                nFalse += -1 if vfExec[-1] else 1
 
             elif sop == OP_ENDIF:
                 if len(vfExec) == 0:
-                    err_raiser(EvalScriptError, 'ENDIF found without prior IF')
-                vfExec.pop()
-
-            elif sop == OP_EQUAL:
-                check_args(2)
-                v1 = stack.pop()
-                v2 = stack.pop()
-
-                if v1 == v2:
-                    stack.append(b"\x01")
-                else:
-                    stack.append(b"")
-
-            elif sop == OP_EQUALVERIFY:
-                check_args(2)
-                v1 = stack[-1]
-                v2 = stack[-2]
-
-                if v1 == v2:
-                    stack.pop()
-                    stack.pop()
-                else:
-                    err_raiser(VerifyOpFailedError, sop)
-
-            elif sop == OP_FROMALTSTACK:
-                if len(altstack) < 1:
-                    err_raiser(MissingOpArgumentsError, sop, altstack, 1)
-                v = altstack.pop()
-                stack.append(v)
-
-            elif sop == OP_HASH160:
-                check_args(1)
-                stack.append(bitcoin.core.serialize.Hash160(stack.pop()))
-
-            elif sop == OP_HASH256:
-                check_args(1)
-                stack.append(bitcoin.core.serialize.Hash(stack.pop()))
-
-            elif sop == OP_IF or sop == OP_NOTIF:
-                val = False
+                    st(EvalScriptError, 'ENDIF found without prior IF')
+                if not vfExec.pop():
+                    nFalse -= 1
 
-                if fExec:
-                    check_args(1)
-                    vch = stack.pop()
-                    val = _CastToBool(vch)
-                    if sop == OP_NOTIF:
-                        val = not val
+            elif not nFalse:
+                handlers[sop](st, sop)
 
-                vfExec.append(val)
+        elif not nFalse:
+            handlers[sop](st, sop)
 
+        # size limits
+        if len(stack) + len(altstack) > MAX_STACK_ITEMS:
+            st(EvalScriptError, 'max stack items limit reached')
 
-            elif sop == OP_IFDUP:
-                check_args(1)
-                vch = stack[-1]
-                if _CastToBool(vch):
-                    stack.append(vch)
-
-            elif sop == OP_NIP:
-                check_args(2)
-                del stack[-2]
-
-            elif sop == OP_NOP:
-                pass
-
-            elif sop >= OP_NOP1 and sop <= OP_NOP10:
-                if SCRIPT_VERIFY_DISCOURAGE_UPGRADABLE_NOPS in flags:
-                    err_raiser(EvalScriptError, "%s reserved for soft-fork upgrades" % OPCODE_NAMES[sop])
-                else:
-                    pass
-
-            elif sop == OP_OVER:
-                check_args(2)
-                vch = stack[-2]
-                stack.append(vch)
-
-            elif sop == OP_PICK or sop == OP_ROLL:
-                check_args(2)
-                n = _CastToBigNum(stack.pop(), err_raiser)
-                if n < 0 or n >= len(stack):
-                    err_raiser(EvalScriptError, "Argument for %s out of bounds" % OPCODE_NAMES[sop])
-                vch = stack[-n-1]
-                if sop == OP_ROLL:
-                    del stack[-n-1]
-                stack.append(vch)
-
-            elif sop == OP_RETURN:
-                err_raiser(EvalScriptError, "OP_RETURN called")
-
-            elif sop == OP_RIPEMD160:
-                check_args(1)
-
-                h = hashlib.new('ripemd160')
-                h.update(stack.pop())
-                stack.append(h.digest())
-
-            elif sop == OP_ROT:
-                check_args(3)
-                tmp = stack[-3]
-                stack[-3] = stack[-2]
-                stack[-2] = tmp
-
-                tmp = stack[-2]
-                stack[-2] = stack[-1]
-                stack[-1] = tmp
-
-            elif sop == OP_SIZE:
-                check_args(1)
-                bn = len(stack[-1])
-                stack.append(bitcoin.core._bignum.bn2vch(bn))
-
-            elif sop == OP_SHA1:
-                check_args(1)
-                stack.append(hashlib.sha1(stack.pop()).digest())
-
-            elif sop == OP_SHA256:
-                check_args(1)
-                stack.append(hashlib.sha256(stack.pop()).digest())
-
-            elif sop == OP_SWAP:
-                check_args(2)
-                tmp = stack[-2]
-                stack[-2] = stack[-1]
-                stack[-1] = tmp
-
-            elif sop == OP_TOALTSTACK:
-                check_args(1)
-                v = stack.pop()
-                altstack.append(v)
-
-            elif sop == OP_TUCK:
-                check_args(2)
-                vch = stack[-1]
-                stack.insert(len(stack) - 2, vch)
-
-            elif sop == OP_VERIFY:
-                check_args(1)
-                v = _CastToBool(stack[-1])
-                if v:
-                    stack.pop()
-                else:
-                    raise err_raiser(VerifyOpFailedError, sop)
-
-            elif sop == OP_WITHIN:
-                check_args(3)
-                bn3 = _CastToBigNum(stack[-1], err_raiser)
-                bn2 = _CastToBigNum(stack[-2], err_raiser)
-                bn1 = _CastToBigNum(stack[-3], err_raiser)
-                stack.pop()
-                stack.pop()
-                stack.pop()
-                v = (bn2 <= bn1) and (bn1 < bn3)
-                if v:
-                    stack.append(b"\x01")
-                else:
-                    # FIXME: this is incorrect, but not caught by existing
-                    # test cases
-                    stack.append(b"\x00")
+        # Jump straight to the ELSE or ENDIF ending a branch that isn't
+        # executed, unless the opcode limit is reached in between
+        if nFalse == 1 and jumps is not None and OP_IF <= sop <= OP_ELSE and not vfExec[-1]:
+            target = jumps[i]
+            skipped = compiled.opcounts[target] - compiled.opcounts[next_i]
+            if nOpCount[0] + skipped <= MAX_SCRIPT_OPCODES:
+                nOpCount[0] += skipped
+                next_i = target
 
-            else:
-                err_raiser(EvalScriptError, 'unsupported opcode 0x%x' % sop)
+        i = next_i
 
-        # size limits
-        if len(stack) + len(altstack) > MAX_STACK_ITEMS:
-            err_raiser(EvalScriptError, 'max stack items limit reached')
+    if compiled.error is not None:
+        cls, args = compiled.error
+        raise cls(*args)
 
     # Unterminated IF/NOTIF/ELSE block
     if len(vfExec):
@@ -715,22 +1055,31 @@ def _EvalScript(stack, scriptIn, txTo, inIdx, flags=()):
                               flags=flags)
 
 
-def EvalScript(stack, scriptIn, txTo, inIdx, flags=()):
+def EvalScript(stack, scriptIn, txTo, inIdx, flags=(), amount=0, sigversion=SIGVERSION_BASE, txdata=None):
     """Evaluate a script
 
-    stack    - Initial stack
+    stack      - Initial stack
 
-    scriptIn - Script
+    scriptIn   - Script
 
-    txTo     - Transaction the script is a part of
+    txTo       - Transaction the script is a part of
 
-    inIdx    - txin index of the scriptSig
+    inIdx      - txin index of the scriptSig
 
-    flags    - SCRIPT_VERIFY_* flags to apply
+    flags      - SCRIPT_VERIFY_* flags to apply
+
+    amount     - Value of the output being spent, for SIGVERSION_WITNESS_V0
+
+    sigversion - SIGVERSION_BASE or SIGVERSION_WITNESS_V0 to evaluate a
+                 witness script
+
+    txdata     - PrecomputedTransactionData of txTo, shared by all the
+                 inputs of the transaction
     """
 
     try:
-        _EvalScript(stack, scriptIn, txTo, inIdx, flags=flags)
+        _EvalScript(stack, scriptIn, txTo, inIdx, flags=flags, amount=amount, sigversion=sigversion,
+                    txdata=txdata)
     except CScriptInvalidError as err:
         raise EvalScriptError(repr(err),
                               stack=stack,
@@ -742,7 +1091,7 @@ def EvalScript(stack, scriptIn, txTo, inIdx, flags=()):
 class VerifyScriptError(bitcoin.core.ValidationError):
     pass
 
-def VerifyScript(scriptSig, scriptPubKey, txTo, inIdx, flags=()):
+def VerifyScript(scriptSig, scriptPubKey, txTo, inIdx, flags=(), txdata=None):
     """Verify a scriptSig satisfies a scriptPubKey
 
     scriptSig    - Signature
@@ -753,13 +1102,16 @@ def VerifyScript(scriptSig, scriptPubKey, txTo, inIdx, flags=()):
 
     inIdx        - Index of the transaction input containing scriptSig
 
+    txdata       - PrecomputedTransactionData of txTo, create it once when
+                   verifying several inputs of the same transaction
+
     Raises a ValidationError subclass if the validation fails.
     """
     stack = []
-    EvalScript(stack, scriptSig, txTo, inIdx, flags=flags)
+    EvalScript(stack, scriptSig, txTo, inIdx, flags=flags, txdata=txdata)
     if SCRIPT_VERIFY_P2SH in flags:
         stackCopy = list(stack)
-    EvalScript(stack, scriptPubKey, txTo, inIdx, flags=flags)
+    EvalScript(stack, scriptPubKey, txTo, inIdx, flags=flags, txdata=txdata)
     if len(stack) == 0:
         raise VerifyScriptError("scriptPubKey left an empty stack")
     if not _CastToBool(stack[-1]):
@@ -780,7 +1132,7 @@ def VerifyScript(scriptSig, scriptPubKey, txTo, inIdx, flags=()):
 
         pubKey2 = CScript(stack.pop())
 
-        EvalScript(stack, pubKey2, txTo, inIdx, flags=flags)
+        EvalScript(stack, pubKey2, txTo, inIdx, flags=flags, txdata=txdata)
 
         if not len(stack):
             raise VerifyScriptError("P2SH inner scriptPubKey left an empty stack")
@@ -822,6 +1174,194 @@ def VerifySignature(txFrom, txTo, inIdx):
     VerifyScript(txin.scriptSig, txout.scriptPubKey, txTo, inIdx)
 
 
+class VerifyInputError(VerifyScriptError):
+    """An input failed VerifyTransactionInputs() or VerifyBlockScripts()
+
+    tx_index - Index of the transaction in the block, 0 for a single
+               transaction
+
+    txid     - Txid of the transaction
+
+    inIdx    - Index of the failing input
+    """
+    def __init__(self, msg, tx_index, txid, inIdx):
+        super(VerifyInputError, self).__init__(
+                'input %d of tx %s: %s' % (inIdx, bitcoin.core.b2lx(txid), msg))
+        self.tx_index = tx_index
+        self.txid = txid
+        self.inIdx = inIdx
+
+_SCRIPT_VERIFY_FLAG_NAMES = dict((flag, name) for name, flag in SCRIPT_VERIFY_FLAGS_BY_NAME.items())
+
+# Fewer inputs than this are verified in the calling process even when an
+# executor is available, as shipping them to a worker costs more than
+# verifying them
+PARALLEL_MIN_INPUTS = 32
+
+def _SpendsWitnessProgram(scriptSig, scriptPubKey):
+    """Return True if scriptPubKey is a witness program, or a P2SH
+    scriptPubKey that scriptSig redeems with one"""
+    if scriptPubKey.is_witness_scriptpubkey():
+        return True
+    if not scriptPubKey.is_p2sh():
+        return False
+    try:
+        pushes = list(scriptSig)
+    except CScriptInvalidError:
+        return False
+    return bool(pushes) and isinstance(pushes[-1], bytes) and CScript(pushes[-1]).is_witness_scriptpubkey()
+
+def _VerifyInputs(tx, inputs, flags):
+    """Verify (inIdx, scriptPubKey) inputs of tx in order
+
+    Returns (inIdx, msg) of the first failing input or None.
+    """
+    txdata = PrecomputedTransactionData(tx)
+    for inIdx, scriptPubKey in inputs:
+        txin = tx.vin[inIdx]
+        if scriptPubKey is None:
+            return (inIdx, 'prevout %r not found' % (txin.prevout,))
+        scriptPubKey = CScript(scriptPubKey)
+        # VerifyScript() does not evaluate witnesses, the legacy rules alone
+        # would accept any witness program spend
+        if _SpendsWitnessProgram(txin.scriptSig, scriptPubKey):
+            return (inIdx, 'witness program spends can not be verified')
+        try:
+            VerifyScript(txin.scriptSig, scriptPubKey, tx, inIdx, flags, txdata)
+        except bitcoin.core.ValidationError as err:
+            return (inIdx, str(err))
+    return None
+
+def _VerifyInputsChunk(chunk, flag_names):
+    """Verify a chunk of inputs in a worker process
+
+    Transactions are passed serialized, flags by name, as neither survive
+    pickling. Returns (tx_index, inIdx, msg) of the first failing input or
+    None.
+    """
+    flags = set(SCRIPT_VERIFY_FLAGS_BY_NAME[name] for name in flag_names)
+    for tx_index, tx, inputs in chunk:
+        err = _VerifyInputs(bitcoin.core.CTransaction.deserialize(tx), inputs, flags)
+        if err is not None:
+            return (tx_index,) + err
+    return None
+
+def _VerifyScripts(txs, work, flags, max_workers, executor):
+    """Verify the inputs listed in work, spreading them over a process pool
+
+    txs is a list of (tx_index, tx), work a list of (txs position, inIdx,
+    scriptPubKey) in validation order. Raises VerifyInputError for the
+    input that comes first in work among the failing ones, regardless of the
+    order the workers finish in.
+    """
+    if executor is None and max_workers is None:
+        max_workers = 1
+    n_workers = max_workers or getattr(executor, '_max_workers', None) or 1
+
+    # A few chunks per worker keeps them busy when some inputs are much
+    # more expensive than others
+    chunk_size = max(len(work) // (n_workers * 4), 1)
+    if (executor is None and max_workers == 1) or len(work) < PARALLEL_MIN_INPUTS or len(work) <= chunk_size:
+        chunks = None
+    else:
+        chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+
+    def fail(res):
+        tx_index, tx = txs[res[0]]
+        raise VerifyInputError(res[2], tx_index, tx.GetTxid(), res[1])
+
+    if chunks is None:
+        for pos, group in itertools.groupby(work, key=lambda w: w[0]):
+            err = _VerifyInputs(txs[pos][1], [(inIdx, spk) for _, inIdx, spk in group], flags)
+            if err is not None:
+                fail((pos,) + err)
+        return
+
+    flag_names = sorted(_SCRIPT_VERIFY_FLAG_NAMES[flag] for flag in flags)
+    serialized = {}
+    jobs = []
+    for chunk in chunks:
+        job = []
+        for pos, group in itertools.groupby(chunk, key=lambda w: w[0]):
+            tx = serialized.get(pos)
+            if tx is None:
+                tx = serialized[pos] = txs[pos][1].serialize()
+            job.append((pos, tx, [(inIdx, None if spk is None else bytes(spk)) for _, inIdx, spk in group]))
+        jobs.append(job)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+    try:
+        futures = [executor.submit(_VerifyInputsChunk, job, flag_names) for job in jobs]
+        for future in futures:
+            res = future.result()
+            if res is not None:
+                for f in futures:
+                    f.cancel()
+                fail(res)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def VerifyTransactionInputs(tx, prevouts, flags=(), max_workers=None, executor=None):
+    """Verify the scriptSigs of all inputs of a transaction
+
+    tx          - Spending transaction
+
+    prevouts    - Mapping of COutPoint to the scriptPubKey being spent
+
+    flags       - SCRIPT_VERIFY_* flags to apply
+
+    max_workers - Number of worker processes to start for this call. By
+                  default, or with 1, the inputs are verified in this
+                  process.
+
+    executor    - concurrent.futures executor to spread the inputs over
+
+    Raises VerifyInputError for the first failing input, in input order.
+    Spends of witness programs, bare or nested in P2SH, are not verified
+    and raise VerifyInputError as well. Inputs are verified in separate processes as ECDSA verification holds
+    the GIL most of the time. Starting a pool takes far longer than
+    verifying a typical transaction, callers verifying in parallel should
+    keep a ProcessPoolExecutor around and pass it as executor. Fewer than
+    PARALLEL_MIN_INPUTS inputs are always verified in this process.
+    """
+    work = [(0, inIdx, prevouts.get(txin.prevout)) for inIdx, txin in enumerate(tx.vin)]
+    _VerifyScripts([(0, tx)], work, flags, max_workers, executor)
+
+def VerifyBlockScripts(block, prevouts, flags=(), max_workers=None, executor=None):
+    """Verify the scriptSigs of all transactions in a block
+
+    block       - CBlock, the coinbase is skipped
+
+    prevouts    - Mapping of COutPoint to scriptPubKey for the outputs spent
+                  by the block. Outputs created earlier in the block are
+                  looked up in the block itself.
+
+    flags, max_workers and executor are as for VerifyTransactionInputs().
+
+    Raises VerifyInputError for the first failing input, in block order,
+    which includes spends of witness programs as they are not verified.
+    """
+    created = {}
+    txs = []
+    work = []
+    for tx_index, tx in enumerate(block.vtx):
+        if tx_index > 0 or not tx.is_coinbase():
+            pos = len(txs)
+            txs.append((tx_index, tx))
+            for inIdx, txin in enumerate(tx.vin):
+                scriptPubKey = created.get(txin.prevout)
+                if scriptPubKey is None:
+                    scriptPubKey = prevouts.get(txin.prevout)
+                work.append((pos, inIdx, scriptPubKey))
+        txid = tx.GetTxid()
+        for n, txout in enumerate(tx.vout):
+            created[bitcoin.core.COutPoint(txid, n)] = txout.scriptPubKey
+    _VerifyScripts(txs, work, flags, max_workers, executor)
+
+
 __all__ = (
         'MAX_STACK_ITEMS',
         'SCRIPT_VERIFY_P2SH',
@@ -835,14 +1375,24 @@ __all__ = (
         'SCRIPT_VERIFY_CLEANSTACK',
         'SCRIPT_VERIFY_CHECKLOCKTIMEVERIFY',
         'SCRIPT_VERIFY_FLAGS_BY_NAME',
+        'DEFAULT_MAX_SIGCACHE_ENTRIES',
+        'DEFAULT_MAX_PUBKEY_CACHE_ENTRIES',
+        'SignatureCache',
         'EvalScriptError',
         'MaxOpCountError',
         'MissingOpArgumentsError',
         'ArgumentsInvalidError',
         'VerifyOpFailedError',
+        'DEFAULT_MAX_COMPILED_SCRIPTS',
+        'CompiledScript',
+        'CompileScript',
         'EvalScript',
         'VerifyScriptError',
         'VerifyScript',
         'VerifySignatureError',
         'VerifySignature',
+        'PARALLEL_MIN_INPUTS',
+        'VerifyInputError',
+        'VerifyTransactionInputs',
+        'VerifyBlockScripts',
 )
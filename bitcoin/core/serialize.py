@@ -82,6 +82,123 @@ def ser_read(f, n):
     return r
 
 
+_uint8 = struct.Struct(b'<B')
+_uint16 = struct.Struct(b'<H')
+_uint32 = struct.Struct(b'<I')
+_uint64 = struct.Struct(b'<Q')
+
+
+class BytesCursor(object):
+    """Read-only stream over an in-memory buffer
+
+    Accepts bytes or anything supporting the buffer protocol (bytearray,
+    memoryview, mmap) without copying it. Fixed size fields are unpacked
+    in place with struct.unpack_from() and only the byte strings that end up
+    in the deserialized objects are copied out of the buffer. Behaves like a
+    read-only BytesIO otherwise, so it can be handed to any
+    stream_deserialize() implementation.
+    """
+    __slots__ = ['buf', 'view', 'pos', 'end']
+
+    def __init__(self, buf, pos=0):
+        view = memoryview(buf)
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        # Slicing bytes directly is a single copy; other buffers go through
+        # the memoryview.
+        self.buf = buf if isinstance(buf, bytes) else None
+        self.view = view
+        self.pos = pos
+        self.end = len(view)
+
+    def read(self, n=-1):
+        pos = self.pos
+        if n < 0 or pos + n > self.end:
+            n = max(self.end - pos, 0)
+        self.pos = pos + n
+        if self.buf is not None:
+            return self.buf[pos:pos + n]
+        return self.view[pos:pos + n].tobytes()
+
+    def peek(self, n=1):
+        """Return up to n bytes without advancing"""
+        pos = self.pos
+        return self.view[pos:pos + n].tobytes()
+
+    def unpack(self, st):
+        """Unpack a struct.Struct at the current position and advance"""
+        pos = self.pos
+        if pos + st.size > self.end:
+            raise SerializationTruncationError('Asked to read %i bytes, but only got %i' %
+                                               (st.size, max(self.end - pos, 0)))
+        self.pos = pos + st.size
+        return st.unpack_from(self.view, pos)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.end
+        if pos < 0:
+            raise ValueError('negative seek position %d' % pos)
+        self.pos = pos
+        return pos
+
+    def remaining(self):
+        return max(self.end - self.pos, 0)
+
+    def read_varint(self):
+        """Read a compact size integer, see VarIntSerializer"""
+        pos = self.pos
+        if pos >= self.end:
+            raise SerializationTruncationError('Asked to read 1 bytes, but only got 0')
+        r = self.view[pos]
+        self.pos = pos + 1
+        if r < 0xfd:
+            return r
+        elif r == 0xfd:
+            return self.unpack(_uint16)[0]
+        elif r == 0xfe:
+            return self.unpack(_uint32)[0]
+        else:
+            return self.unpack(_uint64)[0]
+
+    def read_varbytes(self):
+        """Read a compact size length prefixed byte string, see BytesSerializer"""
+        n = self.read_varint()
+        if n > MAX_SIZE:
+            raise SerializationError('Asked to read 0x%x bytes; MAX_SIZE exceeded' % n)
+        pos = self.pos
+        if pos + n > self.end:
+            raise SerializationTruncationError('Asked to read %i bytes, but only got %i' %
+                                               (n, max(self.end - pos, 0)))
+        self.pos = pos + n
+        if self.buf is not None:
+            return self.buf[pos:pos + n]
+        return self.view[pos:pos + n].tobytes()
+
+
+def ser_unpack(f, st):
+    """Read and unpack a struct.Struct from a stream
+
+    Unpacks in place when f is a BytesCursor, otherwise reads st.size bytes
+    with ser_read(). Returns the unpacked tuple.
+    """
+    if f.__class__ is BytesCursor:
+        # inlined BytesCursor.unpack(), this is on every hot path
+        pos = f.pos
+        end = pos + st.size
+        if end > f.end:
+            raise SerializationTruncationError('Asked to read %i bytes, but only got %i' %
+                                               (st.size, max(f.end - pos, 0)))
+        f.pos = end
+        return st.unpack_from(f.view, pos)
+    return st.unpack(ser_read(f, st.size))
+
+
 class Serializable(object):
     """Base class for serializable objects"""
 
@@ -111,9 +228,9 @@ class Serializable(object):
         If allow_padding is False and not all bytes are consumed during
         deserialization DeserializationExtraDataError will be raised.
         """
-        fd = _BytesIO(buf)
+        fd = BytesCursor(buf)
         r = cls.stream_deserialize(fd, **params)
-        if not allow_padding:
+        if not allow_padding and fd.remaining():
             padding = fd.read()
             if len(padding) != 0:
                 raise DeserializationExtraDataError('Not all bytes consumed during deserialization',
@@ -185,8 +302,8 @@ class Serializer(object):
 
     @classmethod
     def deserialize(cls, buf):
-        if isinstance(buf, str) or isinstance(buf, bytes):
-            buf = _BytesIO(buf)
+        if isinstance(buf, (bytes, bytearray, memoryview)):
+            buf = BytesCursor(buf)
         return cls.stream_deserialize(buf)
 
 
@@ -210,15 +327,17 @@ class VarIntSerializer(Serializer):
 
     @classmethod
     def stream_deserialize(cls, f):
-        r = _bord(ser_read(f, 1))
+        if f.__class__ is BytesCursor:
+            return f.read_varint()
+        r = ser_unpack(f, _uint8)[0]
         if r < 0xfd:
             return r
         elif r == 0xfd:
-            return struct.unpack(b'<H', ser_read(f, 2))[0]
+            return ser_unpack(f, _uint16)[0]
         elif r == 0xfe:
-            return struct.unpack(b'<I', ser_read(f, 4))[0]
+            return ser_unpack(f, _uint32)[0]
         else:
-            return struct.unpack(b'<Q', ser_read(f, 8))[0]
+            return ser_unpack(f, _uint64)[0]
 
 
 class BytesSerializer(Serializer):
@@ -230,6 +349,8 @@ class BytesSerializer(Serializer):
 
     @classmethod
     def stream_deserialize(cls, f):
+        if f.__class__ is BytesCursor:
+            return f.read_varbytes()
         l = VarIntSerializer.stream_deserialize(f)
         return ser_read(f, l)
 
@@ -364,6 +485,8 @@ __all__ = (
         'SerializationTruncationError',
         'DeserializationExtraDataError',
         'ser_read',
+        'BytesCursor',
+        'ser_unpack',
         'Serializable',
         'ImmutableSerializable',
         'Serializer',
@@ -11,7 +11,6 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import hashlib
 import random
 import struct
 import time
@@ -47,6 +46,12 @@ MSG_WITNESS_TX = MSG_TX | MSG_WITNESS_FLAG,
 MSG_FILTERED_WITNESS_BLOCK = MSG_FILTERED_BLOCK | MSG_WITNESS_FLAG,
 
 
+# magic, command, payload length, checksum
+_msg_header = struct.Struct(b'<4s12sI4s')
+
+MSG_HEADER_SIZE = _msg_header.size
+
+
 class MsgSerializable(Serializable):
     def __init__(self, protover=PROTO_VERSION):
         self.protover = protover
@@ -58,59 +63,44 @@ class MsgSerializable(Serializable):
     def msg_deser(cls, f, protover=PROTO_VERSION):
         raise NotImplementedError
 
+    @classmethod
+    def from_payload(cls, payload, protover=PROTO_VERSION, lazy=False):
+        """Deserialize a message from its payload
+
+        payload may be any buffer, it is read in place. With lazy True the
+        message may reference payload rather than copy out of it, see
+        msg_block.
+        """
+        return cls.msg_deser(BytesCursor(payload), protover)
+
     def to_bytes(self):
         f = _BytesIO()
         self.msg_ser(f)
         body = f.getvalue()
-        res = bitcoin.params.MESSAGE_START
-        res += self.command
-        res += b"\x00" * (12 - len(self.command))
-        res += struct.pack(b"<I", len(body))
-
-        # add checksum
-        th = hashlib.sha256(body).digest()
-        h = hashlib.sha256(th).digest()
-        res += h[:4]
-
-        res += body
-        return res
+        return _msg_header.pack(bitcoin.params.MESSAGE_START, self.command, len(body), Hash(body)[:4]) + body
 
     @classmethod
     def from_bytes(cls, b, protover=PROTO_VERSION):
-        f = _BytesIO(b)
-        return MsgSerializable.stream_deserialize(f, protover=protover)
+        return MsgSerializable.stream_deserialize(BytesCursor(b), protover=protover)
 
     @classmethod
     def stream_deserialize(cls, f, protover=PROTO_VERSION):
-        recvbuf = ser_read(f, 4 + 12 + 4 + 4)
+        """Deserialize a message, None if its command is unknown"""
+        magic, command, msglen, checksum = _msg_header.unpack(ser_read(f, MSG_HEADER_SIZE))
 
         # check magic
-        if recvbuf[:4] != bitcoin.params.MESSAGE_START:
+        if magic != bitcoin.params.MESSAGE_START:
             raise ValueError("Invalid message start '%s', expected '%s'" %
-                             (b2x(recvbuf[:4]), b2x(bitcoin.params.MESSAGE_START)))
+                             (b2x(magic), b2x(bitcoin.params.MESSAGE_START)))
 
-        # remaining header fields: command, msg length, checksum
-        command = recvbuf[4:4+12].split(b"\x00", 1)[0]
-        msglen = struct.unpack(b"<i", recvbuf[4+12:4+12+4])[0]
-        checksum = recvbuf[4+12+4:4+12+4+4]
-
-        # read message body
-        recvbuf += ser_read(f, msglen)
-
-        msg = recvbuf[4+12+4+4:4+12+4+4+msglen]
-        th = hashlib.sha256(msg).digest()
-        h = hashlib.sha256(th).digest()
-        if checksum != h[:4]:
-            raise ValueError("got bad checksum %s" % repr(recvbuf))
-            recvbuf = recvbuf[4+12+4+4+msglen:]
+        msg = ser_read(f, msglen)
+        if checksum != Hash(msg)[:4]:
+            raise ValueError("got bad checksum %s" % repr(msg))
 
+        command = command.split(b"\x00", 1)[0]
         if command in messagemap:
-            cls = messagemap[command]
-            #        print("Going to deserialize '%s'" % msg)
-            return cls.msg_deser(_BytesIO(msg))
-        else:
-            print("Command '%s' not in messagemap" % repr(command))
-            return None
+            return messagemap[command].from_payload(msg, protover)
+        return None
 
     def stream_serialize(self, f):
         data = self.to_bytes()
@@ -392,6 +382,20 @@ class msg_block(MsgSerializable):
         c.block = CBlock.stream_deserialize(f)
         return c
 
+    @classmethod
+    def from_payload(cls, payload, protover=PROTO_VERSION, lazy=False):
+        """Deserialize a block message from its payload
+
+        With lazy True the block is a CLazyBlock that references payload
+        and decodes its transactions when they are accessed, so payload
+        must not be modified afterwards.
+        """
+        if not lazy:
+            return super(msg_block, cls).from_payload(payload, protover)
+        c = cls()
+        c.block = CLazyBlock.deserialize(payload)
+        return c
+
     def msg_ser(self, f):
         self.block.stream_serialize(f)
 
@@ -507,6 +511,145 @@ messagemap = {}
 for cls in msg_classes:
     messagemap[cls.command] = cls
 
+DEFAULT_FRAMER_BUFFER_SIZE = 1 << 20
+
+
+class MessageFramer(object):
+    """Splits the stream of messages received from a peer into messages
+
+    Received data goes into a buffer that is reused from message to message,
+    either copied in with feed(), or received into it directly: receive(sock)
+    does so for a socket, and get_buffer() and buffer_updated() are the
+    asyncio.BufferedProtocol methods of the same names, so a protocol can
+    delegate to them.
+
+    read_frame() returns the command and payload of the next complete
+    message. The payload is a memoryview into the buffer, valid until data
+    is added again; its checksum is verified in place. read_message() and
+    iterating over the framer decode the payloads of messages with known
+    commands straight from the buffer, skipping others. With lazy True,
+    blocks are decoded as CLazyBlock: large ones keep the buffer they were
+    received in, the framer carrying on in a new one, smaller ones are
+    copied out.
+
+    Messages with a payload over max_size raise ValueError as soon as their
+    header is received, as do a bad magic or checksum; the stream can not be
+    read further then.
+    """
+
+    def __init__(self, protover=PROTO_VERSION, max_size=MAX_SIZE, buffer_size=DEFAULT_FRAMER_BUFFER_SIZE,
+                 lazy=False):
+        self.protover = protover
+        self.max_size = max_size
+        self.buffer_size = buffer_size
+        self.lazy = lazy
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        # size of the message at _start once its header is known
+        self._need = MSG_HEADER_SIZE
+
+    def __len__(self):
+        """Bytes received and not yet returned as messages"""
+        return self._end - self._start
+
+    def get_buffer(self, sizehint=-1):
+        """Return a writable buffer for at least sizehint bytes of data"""
+        start, end = self._start, self._end
+        # at least a quarter of the buffer, so that receives are not tiny
+        want = max(sizehint, self._need - (end - start), self.buffer_size // 4)
+        if start == end:
+            start = end = self._start = self._end = 0
+        if len(self._buf) - end < want:
+            n = end - start
+            if len(self._buf) - n >= want:
+                # move the start of the pending message to the front
+                self._view[:n] = self._view[start:end]
+            else:
+                buf = bytearray(max(n + want, 2 * len(self._buf)))
+                buf[:n] = self._view[start:end]
+                self._buf = buf
+                self._view = memoryview(buf)
+            start, end = self._start, self._end = 0, n
+        return self._view[end:]
+
+    def buffer_updated(self, nbytes):
+        """Add nbytes written to the buffer returned by get_buffer()"""
+        self._end += nbytes
+
+    def feed(self, data):
+        """Add received data"""
+        n = len(data)
+        self.get_buffer(n)[:n] = data
+        self._end += n
+
+    def receive(self, sock):
+        """Receive from a socket into the buffer, return the bytes received"""
+        n = sock.recv_into(self.get_buffer())
+        self._end += n
+        return n
+
+    def read_frame(self):
+        """Return the (command, payload) of the next message, None if it has
+        not been received completely"""
+        start = self._start
+        avail = self._end - start
+        if avail < MSG_HEADER_SIZE:
+            return None
+        magic, command, msglen, checksum = _msg_header.unpack_from(self._buf, start)
+        if magic != bitcoin.params.MESSAGE_START:
+            raise ValueError("Invalid message start '%s', expected '%s'" %
+                             (b2x(magic), b2x(bitcoin.params.MESSAGE_START)))
+        if msglen > self.max_size:
+            raise ValueError('message of %d bytes, limit is %d' % (msglen, self.max_size))
+        self._need = MSG_HEADER_SIZE + msglen
+        if avail < self._need:
+            return None
+
+        payload = self._view[start + MSG_HEADER_SIZE:start + self._need]
+        if checksum != Hash(payload)[:4]:
+            raise ValueError('got bad checksum for %r message' % command)
+        self._start = start + self._need
+        self._need = MSG_HEADER_SIZE
+        return command.split(b"\x00", 1)[0], payload
+
+    def read_message(self):
+        """Return the next message with a known command, None if there is
+        no complete one"""
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return None
+            command, payload = frame
+            cls = messagemap.get(command)
+            if cls is None:
+                continue
+            if self.lazy and cls is msg_block:
+                if len(payload) >= self.buffer_size // 4:
+                    self._detach()
+                else:
+                    payload = bytes(payload)
+                return cls.from_payload(payload, self.protover, lazy=True)
+            return cls.from_payload(payload, self.protover)
+
+    def _detach(self):
+        # leave the current buffer to the messages referencing it
+        n = self._end - self._start
+        buf = bytearray(max(self.buffer_size, n))
+        buf[:n] = self._view[self._start:self._end]
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._start, self._end = 0, n
+
+    def __iter__(self):
+        while True:
+            msg = self.read_message()
+            if msg is None:
+                return
+            yield msg
+
+
 
 __all__ = (
         'MSG_TX',
@@ -518,6 +661,7 @@ __all__ = (
         'MSG_WITNESS_BLOCK',
         'MSG_WITNESS_FLAG',
         'MSG_FILTERED_WITNESS_BLOCK',
+        'MSG_HEADER_SIZE',
         'MsgSerializable',
         'msg_version',
         'msg_verack',
@@ -536,4 +680,6 @@ __all__ = (
         'msg_mempool',
         'msg_classes',
         'messagemap',
+        'DEFAULT_FRAMER_BUFFER_SIZE',
+        'MessageFramer',
 )
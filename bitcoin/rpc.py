@@ -30,20 +30,27 @@ try:
     import http.client as httplib
 except ImportError:
     import httplib
+import asyncio
 import base64
 import binascii
+import collections
 import decimal
+import functools
+import itertools
 import json
 import os
 import platform
 import sys
+import threading
+import time
+import types
 try:
     import urllib.parse as urlparse
 except ImportError:
     import urlparse
 
 import bitcoin
-from bitcoin.core import COIN, x, lx, b2lx, CBlock, CBlockHeader, CTransaction, COutPoint, CTxOut
+from bitcoin.core import COIN, x, lx, b2lx, CBlock, CBlockHeader, CLazyBlock, CTransaction, COutPoint, CTxOut
 from bitcoin.core.script import CScript
 from bitcoin.wallet import CBitcoinAddress, CBitcoinSecret
 
@@ -51,6 +58,31 @@ DEFAULT_USER_AGENT = "AuthServiceProxy/0.1"
 
 DEFAULT_HTTP_TIMEOUT = 30
 
+DEFAULT_MAX_CONNECTIONS = 8
+
+DEFAULT_RETRIES = 2
+
+DEFAULT_BATCH_SIZE = 100
+
+# Calls that can be repeated without side effects, so they are retried
+# transparently when the connection fails.
+IDEMPOTENT_METHODS = frozenset((
+    'decoderawtransaction', 'decodescript', 'estimatesmartfee', 'getbestblockhash', 'getblock',
+    'getblockchaininfo', 'getblockcount', 'getblockfilter', 'getblockhash', 'getblockheader',
+    'getblockstats', 'getchaintips', 'getconnectioncount', 'getdifficulty', 'getinfo',
+    'getmempoolentry', 'getmempoolinfo', 'getmininginfo', 'getnetworkhashps', 'getnetworkinfo',
+    'getpeerinfo', 'getrawmempool', 'getrawtransaction', 'getreceivedbyaddress', 'gettransaction',
+    'gettxout', 'gettxoutproof', 'gettxoutsetinfo', 'help', 'listunspent', 'uptime',
+    'validateaddress', 'verifytxoutproof',
+))
+
+# Failures of a connection that did not produce a response; a kept-alive
+# connection the server has closed in the meantime shows up as one of these.
+_CONNECTION_ERRORS = (ConnectionError, httplib.BadStatusLine, httplib.ImproperConnectionState)
+
+# REST endpoints of the node that Proxy fetches binary objects from.
+_REST_RESOURCES = ('block', 'tx')
+
 # (un)hexlify to/from unicode, needed for Python3
 unhexlify = binascii.unhexlify
 hexlify = binascii.hexlify
@@ -115,77 +147,182 @@ class InWarmupError(JSONRPCError):
     RPC_ERROR_CODE = -28
 
 
+def _service_config(service_url=None, service_port=None, btc_conf_file=None):
+    """Return the service URL, credentials and cookie file of a proxy
+
+    The URL and credentials are read from btc_conf_file and the node's
+    cookie file if service_url is None. The cookie file is None unless the
+    credentials were read from it.
+    """
+    authpair = None
+    used_cookie_file = None
+
+    if service_url is None:
+        # Figure out the path to the bitcoin.conf file
+        if btc_conf_file is None:
+            if platform.system() == 'Darwin':
+                btc_conf_file = os.path.expanduser('~/Library/Application Support/Bitcoin/')
+            elif platform.system() == 'Windows':
+                btc_conf_file = os.path.join(os.environ['APPDATA'], 'Bitcoin')
+            else:
+                btc_conf_file = os.path.expanduser('~/.bitcoin')
+            btc_conf_file = os.path.join(btc_conf_file, 'bitcoin.conf')
+
+        # Bitcoin Core accepts empty rpcuser, not specified in btc_conf_file
+        conf = {'rpcuser': ""}
+
+        # Extract contents of bitcoin.conf to build service_url
+        try:
+            with open(btc_conf_file, 'r') as fd:
+                for line in fd.readlines():
+                    if '#' in line:
+                        line = line[:line.index('#')]
+                    if '=' not in line:
+                        continue
+                    k, v = line.split('=', 1)
+                    conf[k.strip()] = v.strip()
+
+        # Treat a missing bitcoin.conf as though it were empty
+        except FileNotFoundError:
+            pass
+
+        if service_port is None:
+            service_port = bitcoin.params.RPC_PORT
+        conf['rpcport'] = int(conf.get('rpcport', service_port))
+        conf['rpchost'] = conf.get('rpcconnect', 'localhost')
+
+        service_url = ('%s://%s:%d' %
+            ('http', conf['rpchost'], conf['rpcport']))
+
+        cookie_dir = conf.get('datadir', os.path.dirname(btc_conf_file))
+        if bitcoin.params.NAME != "mainnet":
+            cookie_dir = os.path.join(cookie_dir, bitcoin.params.NAME)
+        cookie_file = os.path.join(cookie_dir, ".cookie")
+        try:
+            with open(cookie_file, 'r') as fd:
+                authpair = fd.read()
+            used_cookie_file = cookie_file
+        except IOError as err:
+            if 'rpcpassword' in conf:
+                authpair = "%s:%s" % (conf['rpcuser'], conf['rpcpassword'])
+
+            else:
+                raise ValueError('Cookie file unusable (%s) and rpcpassword not specified in the configuration file: %r' % (err, btc_conf_file))
+
+    else:
+        url = urlparse.urlparse(service_url)
+        authpair = "%s:%s" % (url.username, url.password)
+
+    return service_url, authpair, used_cookie_file
+
+
+class _Credentials(object):
+    """Credentials of a proxy, read again from the cookie file if there is
+    one when the node rejects them"""
+
+    def __init__(self, authpair, cookie_file=None):
+        self.authpair = None
+        self.header = None
+        self.cookie_file = cookie_file
+        if authpair is not None:
+            self.set(authpair)
+
+    def set(self, authpair):
+        self.authpair = authpair
+        self.header = b"Basic " + base64.b64encode(authpair.encode('utf8'))
+
+    def reread(self):
+        """Read the cookie file again, return True if the credentials changed"""
+        if self.cookie_file is None:
+            return False
+        try:
+            with open(self.cookie_file, 'r') as fd:
+                authpair = fd.read()
+        except IOError:
+            return False
+        if authpair == self.authpair:
+            return False
+        self.set(authpair)
+        return True
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of keep-alive HTTP connections to one server
+
+    At most max_connections connections are in use at a time; acquire()
+    blocks until one is released. Connections are created on demand by
+    factory() and kept for reuse when released. A closed connection
+    reconnects by itself on its next request, so connections that failed are
+    closed and go back to the pool as well.
+    """
+
+    def __init__(self, factory, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.factory = factory
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle = collections.deque()
+
+    def acquire(self, timeout=None):
+        """Return a connection, None if none was released within timeout"""
+        if not self._slots.acquire(timeout=timeout):
+            return None
+        try:
+            with self._lock:
+                # most recently used first, it is the most likely to be alive
+                if self._idle:
+                    return self._idle.pop()
+            return self.factory()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Return a connection acquired with acquire() to the pool"""
+        with self._lock:
+            self._idle.append(conn)
+        self._slots.release()
+
+    def close(self):
+        """Close the idle connections"""
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+
+
 class BaseProxy(object):
     """Base JSON-RPC proxy class. Contains only private methods; do not use
-    directly."""
+    directly.
+
+    Proxies are thread-safe and meant to be long-lived: calls are made over a
+    pool of up to max_connections keep-alive connections. Calls to
+    idempotent_methods that fail because the connection dropped are retried
+    up to retries times on a fresh connection. If the credentials were read
+    from the node's cookie file and reread_cookie is True, the file is read
+    again when the node rejects them, e.g. after it restarted. With rest
+    True, blocks and transactions are fetched in binary from the node's
+    REST interface, if it is enabled (-rest), rather than as hex in JSON.
+    """
 
     def __init__(self,
                  service_url=None,
                  service_port=None,
                  btc_conf_file=None,
                  timeout=DEFAULT_HTTP_TIMEOUT,
-                 connection=None):
-
-        # Create a dummy connection early on so if __init__() fails prior to
-        # __conn being created __del__() can detect the condition and handle it
-        # correctly.
-        self.__conn = None
-        authpair = None
-
-        if service_url is None:
-            # Figure out the path to the bitcoin.conf file
-            if btc_conf_file is None:
-                if platform.system() == 'Darwin':
-                    btc_conf_file = os.path.expanduser('~/Library/Application Support/Bitcoin/')
-                elif platform.system() == 'Windows':
-                    btc_conf_file = os.path.join(os.environ['APPDATA'], 'Bitcoin')
-                else:
-                    btc_conf_file = os.path.expanduser('~/.bitcoin')
-                btc_conf_file = os.path.join(btc_conf_file, 'bitcoin.conf')
-
-            # Bitcoin Core accepts empty rpcuser, not specified in btc_conf_file
-            conf = {'rpcuser': ""}
-
-            # Extract contents of bitcoin.conf to build service_url
-            try:
-                with open(btc_conf_file, 'r') as fd:
-                    for line in fd.readlines():
-                        if '#' in line:
-                            line = line[:line.index('#')]
-                        if '=' not in line:
-                            continue
-                        k, v = line.split('=', 1)
-                        conf[k.strip()] = v.strip()
-
-            # Treat a missing bitcoin.conf as though it were empty
-            except FileNotFoundError:
-                pass
-
-            if service_port is None:
-                service_port = bitcoin.params.RPC_PORT
-            conf['rpcport'] = int(conf.get('rpcport', service_port))
-            conf['rpchost'] = conf.get('rpcconnect', 'localhost')
-
-            service_url = ('%s://%s:%d' %
-                ('http', conf['rpchost'], conf['rpcport']))
-
-            cookie_dir = conf.get('datadir', os.path.dirname(btc_conf_file))
-            if bitcoin.params.NAME != "mainnet":
-                cookie_dir = os.path.join(cookie_dir, bitcoin.params.NAME)
-            cookie_file = os.path.join(cookie_dir, ".cookie")
-            try:
-                with open(cookie_file, 'r') as fd:
-                    authpair = fd.read()
-            except IOError as err:
-                if 'rpcpassword' in conf:
-                    authpair = "%s:%s" % (conf['rpcuser'], conf['rpcpassword'])
+                 connection=None,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 retries=DEFAULT_RETRIES,
+                 idempotent_methods=IDEMPOTENT_METHODS,
+                 reread_cookie=True,
+                 rest=False):
 
-                else:
-                    raise ValueError('Cookie file unusable (%s) and rpcpassword not specified in the configuration file: %r' % (err, btc_conf_file))
+        # Create the pool attribute early on so if __init__() fails prior to
+        # the pool being created __del__() can detect the condition and handle
+        # it correctly.
+        self.__pool = None
 
-        else:
-            url = urlparse.urlparse(service_url)
-            authpair = "%s:%s" % (url.username, url.password)
+        service_url, authpair, cookie_file = _service_config(service_url, service_port, btc_conf_file)
+        self.__credentials = _Credentials(authpair, cookie_file if reread_cookie else None)
 
         self.__service_url = service_url
         self.__url = urlparse.urlparse(service_url)
@@ -197,40 +334,36 @@ class BaseProxy(object):
             port = httplib.HTTP_PORT
         else:
             port = self.__url.port
-        self.__id_count = 0
-
-        if authpair is None:
-            self.__auth_header = None
-        else:
-            authpair = authpair.encode('utf8')
-            self.__auth_header = b"Basic " + base64.b64encode(authpair)
+        self.__id_count = itertools.count(1)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__idempotent_methods = idempotent_methods
+        self.__rest = set(_REST_RESOURCES if rest else ())
 
         if connection:
-            self.__conn = connection
+            # a single connection supplied by the caller, always reused
+            self.__pool = ConnectionPool(lambda: connection, max_connections=1)
         else:
-            self.__conn = httplib.HTTPConnection(self.__url.hostname, port=port,
-                                                 timeout=timeout)
+            hostname = self.__url.hostname
+            self.__pool = ConnectionPool(lambda: httplib.HTTPConnection(hostname, port=port, timeout=timeout),
+                                         max_connections=max_connections)
 
-    def _call(self, service_name, *args):
-        self.__id_count += 1
+    def _call(self, service_name, *args, timeout=None):
+        """Call an RPC method
 
+        timeout - seconds to wait for the connection and the response,
+                  the proxy's timeout by default
+        """
         postdata = json.dumps({'version': '1.1',
                                'method': service_name,
                                'params': args,
-                               'id': self.__id_count})
+                               'id': next(self.__id_count)})
 
-        headers = {
-            'Host': self.__url.hostname,
-            'User-Agent': DEFAULT_USER_AGENT,
-            'Content-type': 'application/json',
-        }
+        response = self._post(postdata, service_name in self.__idempotent_methods, timeout)
+        return self._get_result(response)
 
-        if self.__auth_header is not None:
-            headers['Authorization'] = self.__auth_header
-
-        self.__conn.request('POST', self.__url.path, postdata, headers)
-
-        response = self._get_response()
+    @staticmethod
+    def _get_result(response):
         err = response.get('error')
         if err is not None:
             if isinstance(err, dict):
@@ -244,28 +377,179 @@ class BaseProxy(object):
         else:
             return response['result']
 
-    def _batch(self, rpc_call_list):
-        postdata = json.dumps(list(rpc_call_list))
+    def _batch(self, rpc_call_list, timeout=None):
+        rpc_call_list = list(rpc_call_list)
+        postdata = json.dumps(rpc_call_list)
+        idempotent = all(c.get('method') in self.__idempotent_methods for c in rpc_call_list)
+        return self._post(postdata, idempotent, timeout)
 
-        headers = {
-            'Host': self.__url.hostname,
-            'User-Agent': DEFAULT_USER_AGENT,
-            'Content-type': 'application/json',
-        }
+    def _call_many(self, calls, chunk_size=DEFAULT_BATCH_SIZE, timeout=None):
+        """Call RPC methods in batched requests
 
-        if self.__auth_header is not None:
-            headers['Authorization'] = self.__auth_header
+        calls - list of (method name, params list) tuples
 
-        self.__conn.request('POST', self.__url.path, postdata, headers)
-        return self._get_response()
+        Returns the results in the order of calls, with a JSONRPCError in
+        place of the result of each call that failed. Requests of up to
+        chunk_size calls are sent concurrently over the pooled connections.
+        """
+        requests = [{'version': '1.1', 'method': name, 'params': params, 'id': next(self.__id_count)}
+                    for name, params in calls]
+        chunks = [requests[i:i + chunk_size] for i in range(0, len(requests), chunk_size)]
+        responses = [None] * len(chunks)
+        errors = []
+        todo = iter(range(len(chunks)))
+
+        def worker():
+            for i in todo:
+                chunk = chunks[i]
+                idempotent = all(c['method'] in self.__idempotent_methods for c in chunk)
+                try:
+                    responses[i] = self._post(json.dumps(chunk), idempotent, timeout)
+                except Exception as err:
+                    errors.append(err)
+                    return
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(len(chunks), self.__pool.max_connections) - 1)]
+        for t in threads:
+            t.start()
+        worker()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+        return self._match_responses(chunks, responses)
 
-    def _get_response(self):
-        http_response = self.__conn.getresponse()
+    @classmethod
+    def _match_responses(cls, chunks, responses):
+        """Return the results of the calls in chunks in order, given the
+        responses to the batched requests of each chunk"""
+        results = []
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, list):
+                # responses may come in any order
+                by_id = {r.get('id'): r for r in response if isinstance(r, dict)}
+            else:
+                # the whole request was rejected
+                by_id = {c['id']: response for c in chunk}
+            for c in chunk:
+                try:
+                    results.append(cls._get_result(by_id.get(c['id'], {})))
+                except JSONRPCError as err:
+                    results.append(err)
+        return results
+
+    def batch(self, calls=None, return_errors=False, chunk_size=DEFAULT_BATCH_SIZE, timeout=None):
+        """Make many calls in batched requests
+
+        calls is an iterable of (method name, arg, ...) tuples. Each call is
+        made as the method of the same name of the proxy would make it, so
+        Proxy methods return their usual types, and the results are returned
+        in the order of calls. The error of the first call that failed is
+        raised, unless return_errors is True; then errors are returned in
+        place of the results.
+
+        Without calls, returns an RPCBatch that collects the calls made on
+        it and sends them when its with block exits:
+
+            with proxy.batch() as b:
+                calls = [b.getblock(h) for h in hashes]
+            blocks = [c.result() for c in calls]
+
+        Requests of up to chunk_size calls are sent concurrently over the
+        pooled connections.
+        """
+        b = RPCBatch(self, chunk_size=chunk_size, timeout=timeout)
+        if calls is None:
+            return b
+        pending = [getattr(b, call[0])(*call[1:]) for call in calls]
+        b.send()
+        return _batch_results(pending, return_errors)
+
+    def _post(self, postdata, idempotent, timeout=None):
+        """POST a JSON-RPC request body and return the decoded response"""
+        http_response, rdata = self._request('POST', self.__url.path, postdata, idempotent, timeout)
+        return self._get_response(http_response, rdata)
+
+    def _rest_get(self, resource, name, timeout=None):
+        """Return the body of GET /rest/<resource>/<name>.bin
+
+        Returns None if REST is not enabled for the proxy or the node did not
+        serve the request; the caller then makes the call over JSON-RPC.
+        """
+        if resource not in self.__rest:
+            return None
+        http_response, rdata = self._request('GET', '/rest/%s/%s.bin' % (resource, name), None, True, timeout)
+        if http_response.status == 200:
+            return rdata
+        if http_response.status == 404 and not rdata.strip():
+            # REST is disabled on the node, a missing object comes with a
+            # "not found" message
+            self.__rest.discard(resource)
+        return None
+
+    def _request(self, method, path, body, idempotent, timeout=None):
+        """Make an HTTP request and return the response and its body
+
+        The request is sent again on connection failures if idempotent is
+        True, and once with the new credentials if the cookie file changed.
+        """
+        if timeout is None:
+            timeout = self.__timeout
+        attempt = 0
+        reread_cookie = True
+        while True:
+            headers = {
+                'Host': self.__url.hostname,
+                'User-Agent': DEFAULT_USER_AGENT,
+            }
+            if body is not None:
+                headers['Content-type'] = 'application/json'
+            if self.__credentials.header is not None:
+                headers['Authorization'] = self.__credentials.header
+
+            conn = self.__pool.acquire(timeout)
+            if conn is None:
+                raise JSONRPCError({
+                    'code': -341, 'message': 'timed out waiting for a connection to the server'})
+            try:
+                conn.timeout = timeout
+                if getattr(conn, 'sock', None) is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request(method, path, body, headers)
+                http_response = conn.getresponse()
+                rdata = http_response.read()
+                if http_response.will_close:
+                    conn.close()
+            except _CONNECTION_ERRORS:
+                conn.close()
+                if not idempotent or attempt >= self.__retries:
+                    raise
+                # the first retry is immediate, a dropped keep-alive is the
+                # usual cause; back off if the server is not accepting
+                if attempt:
+                    time.sleep(min(0.1 * 2 ** (attempt - 1), 1.0))
+                attempt += 1
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            finally:
+                self.__pool.release(conn)
+
+            if http_response.status == 401 and reread_cookie and self.__credentials.reread():
+                reread_cookie = False
+                continue
+            return http_response, rdata
+
+    @staticmethod
+    def _get_response(http_response, rdata):
         if http_response is None:
             raise JSONRPCError({
                 'code': -342, 'message': 'missing HTTP response from server'})
 
-        rdata = http_response.read().decode('utf8')
+        rdata = rdata.decode('utf8')
         try:
             return json.loads(rdata, parse_float=decimal.Decimal)
         except Exception:
@@ -276,12 +560,197 @@ class BaseProxy(object):
                                rdata, '...' if len(rdata) > 20 else ''))})
 
     def close(self):
-        if self.__conn is not None:
-            self.__conn.close()
+        """Close the idle connections; they reconnect when used again"""
+        if self.__pool is not None:
+            self.__pool.close()
 
     def __del__(self):
-        if self.__conn is not None:
-            self.__conn.close()
+        self.close()
+
+
+class _DeferredCall(BaseException):
+    """Stops a proxy method at its RPC call while it is recorded"""
+
+
+_NO_RESPONSE = object()
+
+
+class _ProxyMethod(object):
+    """A method of a proxy class, run apart from a proxy
+
+    record() runs the method up to the RPC call it makes and returns that
+    call; replay() runs it again with the response to the call. In between
+    the call can be made any way, batched or asynchronously, and the result
+    is still converted, and errors mapped, by the method itself.
+    """
+
+    def __init__(self, proxy_class, method, args, kwargs):
+        self._proxy_class = proxy_class
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+        self._response = _NO_RESPONSE
+
+    def __getattr__(self, name):
+        # helpers of the proxy's methods, e.g. Proxy._addnode()
+        method = getattr(self._proxy_class, name, None)
+        if not name.startswith('_') or name.startswith('__') or not callable(method):
+            raise AttributeError(name)
+        return types.MethodType(method, self)
+
+    def _rest_get(self, resource, name, timeout=None):
+        # batched and asynchronous calls are made over JSON-RPC
+        return None
+
+    def _call(self, service_name, *args, timeout=None):
+        response, self._response = self._response, _NO_RESPONSE
+        if response is _NO_RESPONSE:
+            raise _DeferredCall(service_name, list(args))
+        if isinstance(response, JSONRPCError):
+            raise response
+        return response
+
+    def record(self):
+        """Return the (method name, params) of the RPC call the method makes"""
+        try:
+            self._method(self, *self._args, **self._kwargs)
+        except _DeferredCall as deferred:
+            return deferred.args
+        raise TypeError('%s() makes no RPC call' % self._method.__name__)
+
+    def replay(self, response):
+        """Return the result of the method given the response to its call
+
+        response is the result of the call, or a JSONRPCError if it failed.
+        """
+        self._response = response
+        try:
+            return self._method(self, *self._args, **self._kwargs)
+        except _DeferredCall:
+            raise TypeError('%s() makes more than one RPC call' % self._method.__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _proxy_method_class(name):
+    # named after the proxy, for the messages of the errors its methods raise
+    return type(name, (_ProxyMethod,), {})
+
+
+def _proxy_method(proxy, method, args, kwargs, proxy_class=None):
+    proxy_class = proxy_class or type(proxy)
+    return _proxy_method_class(type(proxy).__name__)(proxy_class, method, args, kwargs)
+
+
+class BatchCall(object):
+    """A call collected by an RPCBatch, holding its outcome once sent"""
+
+    def __init__(self, name, params, method=None):
+        self.name = name
+        self.params = params
+        self._method = method
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def _set_response(self, response):
+        if self._method is not None:
+            try:
+                self._result = self._method.replay(response)
+            except Exception as err:
+                self._exception = err
+        elif isinstance(response, JSONRPCError):
+            self._exception = response
+        else:
+            self._result = response
+        self._done = True
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        """Return the result of the call, raise its error if it failed"""
+        if not self._done:
+            raise RuntimeError('%s() has not been sent yet' % self.name)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Return the error of the call, None if it succeeded"""
+        if not self._done:
+            raise RuntimeError('%s() has not been sent yet' % self.name)
+        return self._exception
+
+
+class RPCBatch(object):
+    """Calls collected to be sent to a proxy in batched requests
+
+    Calling a method on the batch returns a BatchCall, which gets its result
+    once the batch is sent with send() or by leaving its with block. Methods
+    the proxy class defines, like Proxy.getblock(), return the same types
+    and raise the same errors as when called on the proxy. Other names are
+    sent as raw calls.
+    """
+
+    def __init__(self, proxy, chunk_size=DEFAULT_BATCH_SIZE, timeout=None):
+        self._proxy = proxy
+        self._chunk_size = chunk_size
+        self._timeout = timeout
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        f = lambda *args, **kwargs: self._add(_batch_call(self._proxy, name, args, kwargs))
+        f.__name__ = name
+        return f
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def _add(self, call):
+        self._calls.append(call)
+        return call
+
+    def send(self):
+        """Send the calls collected so far"""
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        responses = self._proxy._call_many([(c.name, c.params) for c in calls],
+                                           chunk_size=self._chunk_size, timeout=self._timeout)
+        for call, response in zip(calls, responses):
+            call._set_response(response)
+
+
+def _batch_call(proxy, name, args, kwargs, proxy_class=None):
+    """Return a BatchCall of proxy's method name, a raw call if there is none"""
+    proxy_class = proxy_class or type(proxy)
+    method = getattr(proxy_class, name, None)
+    if not callable(method) or hasattr(BaseProxy, name):
+        return BatchCall(name, list(args))
+    method = _proxy_method(proxy, method, args, kwargs, proxy_class)
+    return BatchCall(*method.record(), method=method)
+
+
+def _batch_results(calls, return_errors):
+    results = []
+    for call in calls:
+        if call.exception() is None:
+            results.append(call.result())
+        elif return_errors:
+            results.append(call.exception())
+        else:
+            raise call.exception()
+    return results
 
 
 class RawProxy(BaseProxy):
@@ -312,7 +781,7 @@ class RawProxy(BaseProxy):
             raise AttributeError
 
         # Create a callable to do the actual call
-        f = lambda *args: self._call(name, *args)
+        f = lambda *args, timeout=None: self._call(name, *args, timeout=timeout)
 
         # Make debuggers show <function bitcoin.rpc.name> rather than <function
         # bitcoin.rpc.<lambda>>
@@ -348,6 +817,18 @@ class Proxy(BaseProxy):
         be used.
 
         ``timeout`` - timeout in seconds before the HTTP interface times out
+
+        ``max_connections`` - calls made concurrently from several threads,
+        each over its own keep-alive connection
+
+        ``retries`` - times a call to one of ``idempotent_methods`` is sent
+        again when the connection fails
+
+        ``reread_cookie`` - read the cookie file again if the node rejects
+        the credentials read from it
+
+        ``rest`` - fetch blocks and transactions in binary from the node's
+        REST interface, falling back to JSON-RPC when it is not enabled
         """
 
         super(Proxy, self).__init__(service_url=service_url,
@@ -356,9 +837,9 @@ class Proxy(BaseProxy):
                                     timeout=timeout,
                                     **kwargs)
 
-    def call(self, service_name, *args):
+    def call(self, service_name, *args, timeout=None):
         """Call an RPC method by name and raw (JSON encodable) arguments"""
-        return self._call(service_name, *args)
+        return self._call(service_name, *args, timeout=timeout)
 
     def dumpprivkey(self, addr):
         """Return the private key matching an address
@@ -473,9 +954,12 @@ class Proxy(BaseProxy):
             return CBlockHeader.deserialize(unhexlify(r))
 
 
-    def getblock(self, block_hash):
+    def getblock(self, block_hash, lazy=False):
         """Get block <block_hash>
 
+        lazy - If true a CLazyBlock is returned, which decodes its
+               transactions when they are accessed
+
         Raises IndexError if block_hash is not valid.
         """
         try:
@@ -483,6 +967,10 @@ class Proxy(BaseProxy):
         except TypeError:
             raise TypeError('%s.getblock(): block_hash must be bytes; got %r instance' %
                     (self.__class__.__name__, block_hash.__class__))
+        cls = CLazyBlock if lazy else CBlock
+        r = self._rest_get('block', block_hash)
+        if r is not None:
+            return cls.deserialize(r)
         try:
             # With this change ( https://github.com/bitcoin/bitcoin/commit/96c850c20913b191cff9f66fedbb68812b1a41ea#diff-a0c8f511d90e83aa9b5857e819ced344 ),
             # bitcoin core's rpc takes 0/1/2 instead of true/false as the 2nd argument which specifies verbosity, since v0.15.0.
@@ -491,7 +979,7 @@ class Proxy(BaseProxy):
         except InvalidAddressOrKeyError as ex:
             raise IndexError('%s.getblock(): %s (%d)' %
                     (self.__class__.__name__, ex.error['message'], ex.error['code']))
-        return CBlock.deserialize(unhexlify(r))
+        return cls.deserialize(bytes.fromhex(r))
 
     def getblockcount(self):
         """Return the number of blocks in the longest block chain"""
@@ -564,6 +1052,10 @@ class Proxy(BaseProxy):
         Note that if all txouts are spent and the transaction index is not
         enabled the transaction may not be available.
         """
+        if not verbose:
+            r = self._rest_get('tx', b2lx(txid))
+            if r is not None:
+                return CTransaction.deserialize(r)
         try:
             r = self._call('getrawtransaction', b2lx(txid), 1 if verbose else 0)
         except InvalidAddressOrKeyError as ex:
@@ -579,7 +1071,7 @@ class Proxy(BaseProxy):
             del r['vout']
             r['blockhash'] = lx(r['blockhash']) if 'blockhash' in r else None
         else:
-            r = CTransaction.deserialize(unhexlify(r))
+            r = CTransaction.deserialize(bytes.fromhex(r))
 
         return r
 
@@ -776,6 +1268,282 @@ class Proxy(BaseProxy):
     def removenode(self, node):
         return self._addnode(node, 'remove')
 
+
+# A kept-alive connection closed by the server ends its stream early.
+_ASYNC_CONNECTION_ERRORS = _CONNECTION_ERRORS + (asyncio.IncompleteReadError,)
+
+_HTTPStatus = collections.namedtuple('_HTTPStatus', 'status reason')
+
+
+class _AsyncHTTPConnection(object):
+    """Keep-alive HTTP/1.1 client connection over asyncio streams"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, path, body, headers):
+        """POST body to path, return the (_HTTPStatus, body) of the response"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = ['POST %s HTTP/1.1' % (path or '/'), 'Content-Length: %d' % len(body)]
+        lines += ['%s: %s' % (k, v.decode('ascii') if isinstance(v, bytes) else v) for k, v in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise httplib.RemoteDisconnected('Remote end closed connection without response')
+        try:
+            version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise httplib.BadStatusLine(status_line)
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            response_headers[k.strip().lower()] = v.strip()
+
+        connection = response_headers.get('connection', '').lower()
+        will_close = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+        if 'content-length' in response_headers:
+            rdata = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    break
+                chunks.append((await self.reader.readexactly(size + 2))[:size])
+            # skip the trailer
+            while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            rdata = b''.join(chunks)
+        else:
+            rdata = await self.reader.read()
+            will_close = True
+        if will_close:
+            self.close()
+        return _HTTPStatus(status, reason), rdata
+
+
+class AsyncConnectionPool(object):
+    """Pool of keep-alive HTTP connections to one server for asyncio
+
+    Like ConnectionPool, at most max_connections connections are in use at a
+    time and acquire() waits until one is released. The pool belongs to the
+    event loop it is first used in, so it can be created outside of it.
+    """
+
+    def __init__(self, host, port, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        # created by the first acquire(), before Python 3.10 a Semaphore is
+        # bound to the event loop current when it is created
+        self._slots = None
+        self._idle = []
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        await self._slots.acquire()
+        # most recently used first, it is the most likely to be alive
+        if self._idle:
+            return self._idle.pop()
+        return _AsyncHTTPConnection(self.host, self.port)
+
+    def release(self, conn):
+        self._idle.append(conn)
+        self._slots.release()
+
+    def close(self):
+        """Close the idle connections"""
+        for conn in self._idle:
+            conn.close()
+
+
+class AsyncBaseProxy(object):
+    """Base asyncio JSON-RPC proxy class; do not use directly.
+
+    Takes the arguments of BaseProxy and behaves the same, with calls made
+    from coroutines: up to max_connections calls are in flight at a time,
+    and the timeout of a call covers waiting for a connection, retries and
+    the response.
+    """
+
+    _proxy_class = None
+
+    def __init__(self,
+                 service_url=None,
+                 service_port=None,
+                 btc_conf_file=None,
+                 timeout=DEFAULT_HTTP_TIMEOUT,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 retries=DEFAULT_RETRIES,
+                 idempotent_methods=IDEMPOTENT_METHODS,
+                 reread_cookie=True):
+
+        service_url, authpair, cookie_file = _service_config(service_url, service_port, btc_conf_file)
+        self.__credentials = _Credentials(authpair, cookie_file if reread_cookie else None)
+        self.__url = urlparse.urlparse(service_url)
+
+        if self.__url.scheme not in ('http',):
+            raise ValueError('Unsupported URL scheme %r' % self.__url.scheme)
+
+        self.__id_count = itertools.count(1)
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__idempotent_methods = idempotent_methods
+        self.__pool = AsyncConnectionPool(self.__url.hostname, self.__url.port or httplib.HTTP_PORT,
+                                          max_connections=max_connections)
+
+    async def _call(self, service_name, *args, timeout=None):
+        """Call an RPC method
+
+        timeout - seconds to wait for the connection and the response,
+                  the proxy's timeout by default
+        """
+        postdata = json.dumps({'version': '1.1',
+                               'method': service_name,
+                               'params': args,
+                               'id': next(self.__id_count)})
+
+        response = await self._post(postdata, service_name in self.__idempotent_methods, timeout)
+        return BaseProxy._get_result(response)
+
+    async def _call_many(self, calls, chunk_size=DEFAULT_BATCH_SIZE, timeout=None):
+        """Call RPC methods in batched requests, see BaseProxy._call_many()"""
+        requests = [{'version': '1.1', 'method': name, 'params': params, 'id': next(self.__id_count)}
+                    for name, params in calls]
+        chunks = [requests[i:i + chunk_size] for i in range(0, len(requests), chunk_size)]
+        responses = await asyncio.gather(*(
+            self._post(json.dumps(chunk), all(c['method'] in self.__idempotent_methods for c in chunk), timeout)
+            for chunk in chunks))
+        return BaseProxy._match_responses(chunks, responses)
+
+    async def batch(self, calls, return_errors=False, chunk_size=DEFAULT_BATCH_SIZE, timeout=None):
+        """Make many calls in batched requests, see BaseProxy.batch()"""
+        pending = [_batch_call(self, call[0], call[1:], {}, self._proxy_class) for call in calls]
+        responses = await self._call_many([(c.name, c.params) for c in pending],
+                                          chunk_size=chunk_size, timeout=timeout)
+        for call, response in zip(pending, responses):
+            call._set_response(response)
+        return _batch_results(pending, return_errors)
+
+    async def _post(self, postdata, idempotent, timeout=None):
+        if timeout is None:
+            timeout = self.__timeout
+        return await asyncio.wait_for(self.__post(postdata.encode('utf8'), idempotent), timeout)
+
+    async def __post(self, postdata, idempotent):
+        attempt = 0
+        reread_cookie = True
+        while True:
+            headers = {
+                'Host': self.__url.hostname,
+                'User-Agent': DEFAULT_USER_AGENT,
+                'Content-type': 'application/json',
+            }
+            if self.__credentials.header is not None:
+                headers['Authorization'] = self.__credentials.header
+
+            conn = await self.__pool.acquire()
+            try:
+                http_response, rdata = await conn.request(self.__url.path, postdata, headers)
+            except _ASYNC_CONNECTION_ERRORS:
+                conn.close()
+                if not idempotent or attempt >= self.__retries:
+                    raise
+                if attempt:
+                    await asyncio.sleep(min(0.1 * 2 ** (attempt - 1), 1.0))
+                attempt += 1
+                continue
+            except BaseException:
+                # including cancellation by a timeout
+                conn.close()
+                raise
+            finally:
+                self.__pool.release(conn)
+
+            if http_response.status == 401 and reread_cookie and self.__credentials.reread():
+                reread_cookie = False
+                continue
+            return BaseProxy._get_response(http_response, rdata)
+
+    def close(self):
+        """Close the idle connections; they reconnect when used again"""
+        self.__pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncRawProxy(AsyncBaseProxy):
+    """Low-level asyncio proxy to a bitcoin JSON-RPC service
+
+    The asyncio counterpart of RawProxy: ``await proxy.getblockcount()``.
+    """
+
+    _proxy_class = RawProxy
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError
+
+        # Create a callable returning the coroutine of the call
+        f = lambda *args, timeout=None: self._call(name, *args, timeout=timeout)
+        f.__name__ = name
+        return f
+
+
+class AsyncProxy(AsyncBaseProxy):
+    """asyncio proxy to a bitcoin RPC service
+
+    Has the methods of Proxy as coroutines, taking and returning the same
+    types: ``block = await proxy.getblock(block_hash)``.
+    """
+
+    _proxy_class = Proxy
+
+    async def call(self, service_name, *args, timeout=None):
+        """Call an RPC method by name and raw (JSON encodable) arguments"""
+        return await self._call(service_name, *args, timeout=timeout)
+
+
+def _async_proxy_method(method):
+    @functools.wraps(method)
+    async def f(self, *args, **kwargs):
+        call = _proxy_method(self, method, args, kwargs, Proxy)
+        name, params = call.record()
+        try:
+            response = await self._call(name, *params)
+        except JSONRPCError as err:
+            response = err
+        return call.replay(response)
+    f.__qualname__ = 'AsyncProxy.' + method.__name__
+    return f
+
+
+for _name, _method in list(vars(Proxy).items()):
+    if not _name.startswith('_') and _name not in vars(AsyncProxy) and callable(_method):
+        setattr(AsyncProxy, _name, _async_proxy_method(_method))
+del _name, _method
+
+
 __all__ = (
     'JSONRPCError',
     'ForbiddenBySafeModeError',
@@ -785,6 +1553,12 @@ __all__ = (
     'VerifyRejectedError',
     'VerifyAlreadyInChainError',
     'InWarmupError',
+    'ConnectionPool',
+    'BatchCall',
+    'RPCBatch',
     'RawProxy',
     'Proxy',
+    'AsyncConnectionPool',
+    'AsyncRawProxy',
+    'AsyncProxy',
 )
@@ -18,9 +18,27 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-"""Reference implementation for Bech32 and segwit addresses."""
+"""Bech32/Bech32m and segwit addresses
 
+Based on the reference implementation. The checksum is computed two
+characters at a time through a lookup table, characters are mapped to values
+with bytes.translate, and witness programs are converted from and to 5 bit
+characters as whole integers.
+
+Segwit addresses use the Bech32 checksum of BIP173 for every witness version
+unless a spec is given; pass spec=None to follow BIP350, Bech32 for version
+0 and Bech32m for later versions.
+"""
+
+import functools
 import sys
+from enum import Enum
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
 _bchr = chr
 _bord = lambda x: ord(x) if isinstance(x, str) else x
 if sys.version > '3':
@@ -31,16 +49,68 @@ if sys.version > '3':
 CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
 
 
+class Encoding(Enum):
+    """Enumeration type to list the various supported encodings."""
+    BECH32 = 1
+    BECH32M = 2
+
+
+BECH32M_CONST = 0x2bc830a3
+
+_GENERATOR = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+
+
+def _polymod_table(nchars):
+    # The checksum is linear over GF(2), so the bits shifted out by nchars
+    # steps of the reference loop determine what they xor into the rest.
+    table = []
+    for top in range(1 << (5 * nchars)):
+        chk = top << (30 - 5 * nchars)
+        for _ in range(nchars):
+            t = chk >> 25
+            chk = (chk & 0x1ffffff) << 5
+            for i in range(5):
+                chk ^= _GENERATOR[i] if ((t >> i) & 1) else 0
+        table.append(chk)
+    return table
+
+_POLYMOD1 = _polymod_table(1)
+_POLYMOD2 = _polymod_table(2)
+
+# values of the characters of CHARSET, both cases, 0xff for anything else
+_VALUES = bytearray(b'\xff' * 256)
+for _i, _c in enumerate(CHARSET):
+    _VALUES[ord(_c)] = _i
+    _VALUES[ord(_c.upper())] = _i
+_VALUES = bytes(_VALUES)
+
+_CHARS = bytes.maketrans(bytes(range(32)), CHARSET.encode('ascii'))
+
+# characters to int() digits
+_INT_DIGITS = str.maketrans(CHARSET, '0123456789abcdefghijklmnopqrstuv')
+
+_PRINTABLE = bytes(range(33, 127))
+
+# checksum characters, 10 bits at a time
+_PAIRS = [a + b for a in CHARSET for b in CHARSET]
+
+_CONSTS = {Encoding.BECH32: 1, Encoding.BECH32M: BECH32M_CONST}
+
+
+def _polymod(chk, values):
+    """Continue the checksum chk over values, bytes of 5 bit values"""
+    t2 = _POLYMOD2
+    if len(values) & 1:
+        chk = ((chk & 0x1ffffff) << 5) ^ values[0] ^ _POLYMOD1[chk >> 25]
+        values = values[1:]
+    for a, b in zip(values[::2], values[1::2]):
+        chk = ((chk & 0xfffff) << 10) ^ (a << 5 | b) ^ t2[chk >> 20]
+    return chk
+
+
 def bech32_polymod(values):
     """Internal function that computes the Bech32 checksum."""
-    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
-    chk = 1
-    for value in values:
-        top = chk >> 25
-        chk = (chk & 0x1ffffff) << 5 ^ value
-        for i in range(5):
-            chk ^= generator[i] if ((top >> i) & 1) else 0
-    return chk
+    return _polymod(1, bytes(values))
 
 
 def bech32_hrp_expand(hrp):
@@ -48,40 +118,97 @@ def bech32_hrp_expand(hrp):
     return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
 
 
+@functools.lru_cache(maxsize=64)
+def _hrp_polymod(hrp):
+    """Checksum state after the expanded HRP, None if hrp is not valid"""
+    try:
+        raw = hrp.encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if not hrp or hrp.lower() != hrp or raw.translate(None, _PRINTABLE):
+        return None
+    return _polymod(1, bytes(bech32_hrp_expand(hrp)))
+
+
+def _spec(chk):
+    if chk == 1:
+        return Encoding.BECH32
+    if chk == BECH32M_CONST:
+        return Encoding.BECH32M
+    return None
+
+
 def bech32_verify_checksum(hrp, data):
-    """Verify a checksum given HRP and converted data characters."""
-    return bech32_polymod(bech32_hrp_expand(hrp) + data) == 1
+    """Verify a checksum given HRP and converted data characters.
+
+    Returns the Encoding of the checksum, or None if it is not valid.
+    """
+    return _spec(bech32_polymod(bech32_hrp_expand(hrp) + data))
 
 
-def bech32_create_checksum(hrp, data):
+def bech32_create_checksum(hrp, data, spec=Encoding.BECH32):
     """Compute the checksum values given HRP and data."""
     values = bech32_hrp_expand(hrp) + data
-    polymod = bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ 1
+    polymod = bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ _CONSTS[spec]
     return [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
 
 
-def bech32_encode(hrp, data):
+def bech32_encode(hrp, data, spec=Encoding.BECH32):
     """Compute a Bech32 string given HRP and data values."""
-    combined = data + bech32_create_checksum(hrp, data)
-    return hrp + '1' + ''.join([CHARSET[d] for d in combined])
+    combined = data + bech32_create_checksum(hrp, data, spec)
+    return hrp + '1' + bytes(combined).translate(_CHARS).decode('ascii')
+
+
+def _bech32_decode(bech):
+    """Split and check a Bech32 or Bech32m string
+
+    Returns (hrp, data, values, spec) with data the lower case characters
+    after the separator and values their values, checksum included, or None
+    if the string is not valid.
+    """
+    if len(bech) > 90:
+        return None
+    try:
+        raw = bech.encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if raw.translate(None, _PRINTABLE):
+        return None
+    lower = bech.lower()
+    if lower != bech and bech.upper() != bech:
+        return None
+    pos = lower.rfind('1')
+    if pos < 1 or pos + 7 > len(lower):
+        return None
+    data = lower[pos + 1:]
+    values = data.encode('ascii').translate(_VALUES)
+    if b'\xff' in values:
+        return None
+    hrp = lower[:pos]
+    chk = _hrp_polymod(hrp)
+    if chk is None:
+        return None
+    spec = _spec(_polymod(chk, values))
+    if spec is None:
+        return None
+    return (hrp, data, values, spec)
 
 
 def bech32_decode(bech):
     """Validate a Bech32 string, and determine HRP and data."""
-    if ((any(ord(x) < 33 or ord(x) > 126 for x in bech)) or
-            (bech.lower() != bech and bech.upper() != bech)):
+    r = _bech32_decode(bech)
+    if r is None or r[3] != Encoding.BECH32:
         return (None, None)
-    bech = bech.lower()
-    pos = bech.rfind('1')
-    if pos < 1 or pos + 7 > len(bech) or len(bech) > 90:
-        return (None, None)
-    if not all(x in CHARSET for x in bech[pos+1:]):
-        return (None, None)
-    hrp = bech[:pos]
-    data = [CHARSET.find(x) for x in bech[pos+1:]]
-    if not bech32_verify_checksum(hrp, data):
-        return (None, None)
-    return (hrp, data[:-6])
+    return (r[0], list(r[2][:-6]))
+
+
+def bech32m_decode(bech):
+    """Validate a Bech32 or Bech32m string, and determine HRP, data and
+    the Encoding of the checksum."""
+    r = _bech32_decode(bech)
+    if r is None:
+        return (None, None, None)
+    return (r[0], list(r[2][:-6]), r[3])
 
 
 def convertbits(data, frombits, tobits, pad=True):
@@ -108,24 +235,253 @@ def convertbits(data, frombits, tobits, pad=True):
     return ret
 
 
-def decode(hrp, addr):
+def _segwit_decode(hrp, addr, spec):
+    """Decode a segwit address to (witver, witprog bytes), or None"""
+    r = _bech32_decode(addr)
+    if r is None or r[0] != hrp:
+        return None
+    hrpgot, data, values, got = r
+    witver = values[0]
+    if witver > 16:
+        return None
+    if got != (spec or (Encoding.BECH32 if witver == 0 else Encoding.BECH32M)):
+        return None
+    # the program is the big endian number of the characters between the
+    # version and the checksum, with less than 5 zero bits of padding
+    nbits = 5 * (len(data) - 7)
+    pad = nbits & 7
+    if pad >= 5 or nbits < 16:
+        return None
+    n = int(data[1:-6].translate(_INT_DIGITS), 32)
+    if n & ((1 << pad) - 1):
+        return None
+    witprog = (n >> pad).to_bytes(nbits >> 3, 'big')
+    if len(witprog) > 40:
+        return None
+    if witver == 0 and len(witprog) != 20 and len(witprog) != 32:
+        return None
+    return (witver, witprog)
+
+
+def _segwit_encode(hrp, witver, witprog, spec):
+    """Encode a segwit address, witprog as bytes, or return None"""
+    chk = _hrp_polymod(hrp)
+    if chk is None or not (0 <= witver <= 16) or not (2 <= len(witprog) <= 40):
+        return None
+    if witver == 0 and len(witprog) != 20 and len(witprog) != 32:
+        return None
+    nchars = (len(witprog) * 8 + 4) // 5
+    if len(hrp) + nchars + 8 > 90:
+        return None
+    # the version and the zero padded program as one number, read two
+    # characters at a time for both the checksum and the string
+    n = int.from_bytes(witprog, 'big') << (5 * nchars - 8 * len(witprog))
+    if nchars & 1:
+        n |= witver << (5 * nchars)
+        nbits = 5 * nchars + 5
+        out = []
+    else:
+        chk = ((chk & 0x1ffffff) << 5) ^ witver ^ _POLYMOD1[chk >> 25]
+        nbits = 5 * nchars
+        out = [CHARSET[witver]]
+    pairs = _PAIRS
+    t2 = _POLYMOD2
+    for shift in range(nbits - 10, -1, -10):
+        c = (n >> shift) & 0x3ff
+        chk = ((chk & 0xfffff) << 10) ^ c ^ t2[chk >> 20]
+        out.append(pairs[c])
+    for _ in range(3):
+        chk = ((chk & 0xfffff) << 10) ^ t2[chk >> 20]
+    chk ^= _CONSTS[spec or (Encoding.BECH32 if witver == 0 else Encoding.BECH32M)]
+    out.append(pairs[chk >> 20] + pairs[(chk >> 10) & 0x3ff] + pairs[chk & 0x3ff])
+    return hrp + '1' + ''.join(out)
+
+
+def decode(hrp, addr, spec=Encoding.BECH32):
     """Decode a segwit address."""
-    hrpgot, data = bech32_decode(addr)
-    if hrpgot != hrp:
-        return (None, None)
-    decoded = convertbits(data[1:], 5, 8, False)
-    if decoded is None or len(decoded) < 2 or len(decoded) > 40:
-        return (None, None)
-    if data[0] > 16:
-        return (None, None)
-    if data[0] == 0 and len(decoded) != 20 and len(decoded) != 32:
+    r = _segwit_decode(hrp, addr, spec)
+    if r is None:
         return (None, None)
-    return (data[0], decoded)
+    return (r[0], list(r[1]))
 
 
-def encode(hrp, witver, witprog):
+def encode(hrp, witver, witprog, spec=Encoding.BECH32):
     """Encode a segwit address."""
-    ret = bech32_encode(hrp, [witver] + convertbits(witprog, 8, 5))
-    if decode(hrp, ret) == (None, None):
-        return None
-    return ret
+    return _segwit_encode(hrp, witver, bytes(witprog), spec)
+
+
+# rows per NumPy batch, small enough for the temporaries to stay in cache
+_NP_CHUNK = 4096
+
+
+def _np_polymod(chk, values):
+    """Continue the checksum chk over the rows of values with NumPy
+
+    values is an n x m uint8 array of 5 bit values. Returns the n checksums
+    as a uint64 array.
+    """
+    t1 = _np.array(_POLYMOD1, dtype=_np.uint64)
+    t2 = _np.array(_POLYMOD2, dtype=_np.uint64)
+    chk = _np.full(len(values), chk, dtype=_np.uint64)
+    m = values.shape[1]
+    if m & 1:
+        chk = ((chk & _np.uint64(0x1ffffff)) << _np.uint64(5)) ^ values[:, 0] ^ t1[chk >> _np.uint64(25)]
+    for j in range(m & 1, m, 2):
+        pair = (values[:, j].astype(_np.uint64) << _np.uint64(5)) | values[:, j + 1]
+        chk = ((chk & _np.uint64(0xfffff)) << _np.uint64(10)) ^ pair ^ t2[chk >> _np.uint64(20)]
+    return chk
+
+
+def _np_to_values(progs, nchars):
+    """Split the rows of progs, zero padded, into nchars 5 bit values"""
+    n, length = progs.shape
+    width = (length + 4) // 5 * 5
+    if width != length:
+        padded = _np.zeros((n, width), dtype=_np.uint8)
+        padded[:, :length] = progs
+        progs = padded
+    # 5 bytes make 8 values
+    g = progs.reshape(n, -1, 5).astype(_np.uint64)
+    words = ((g[:, :, 0] << _np.uint64(32)) | (g[:, :, 1] << _np.uint64(24)) | (g[:, :, 2] << _np.uint64(16))
+             | (g[:, :, 3] << _np.uint64(8)) | g[:, :, 4])
+    shifts = _np.arange(35, -1, -5, dtype=_np.uint64)
+    values = (words[:, :, None] >> shifts) & _np.uint64(31)
+    return values.astype(_np.uint8).reshape(n, -1)[:, :nchars]
+
+
+def _np_from_values(values, nbytes):
+    """Join the 5 bit values of every row into nbytes bytes, dropping the
+    padding bits"""
+    n, nchars = values.shape
+    width = (nchars + 7) // 8 * 8
+    if width != nchars:
+        padded = _np.zeros((n, width), dtype=_np.uint8)
+        padded[:, :nchars] = values
+        values = padded
+    g = values.reshape(n, -1, 8).astype(_np.uint64)
+    words = _np.zeros(g.shape[:2], dtype=_np.uint64)
+    for k in range(8):
+        words |= g[:, :, k] << _np.uint64(35 - 5 * k)
+    shifts = _np.arange(32, -1, -8, dtype=_np.uint64)
+    progs = (words[:, :, None] >> shifts) & _np.uint64(0xff)
+    return progs.astype(_np.uint8).reshape(n, -1)[:, :nbytes]
+
+
+def _np_encode_many(hrp, witver, witprogs, spec):
+    r = [None] * len(witprogs)
+    chk = _hrp_polymod(hrp)
+    if chk is None or not (0 <= witver <= 16):
+        return r
+    const = _np.uint64(_CONSTS[spec or (Encoding.BECH32 if witver == 0 else Encoding.BECH32M)])
+    chk = ((chk & 0x1ffffff) << 5) ^ witver ^ _POLYMOD1[chk >> 25]
+    charset = _np.frombuffer(CHARSET.encode('ascii'), dtype=_np.uint8)
+    prefix = _np.frombuffer((hrp + '1' + CHARSET[witver]).encode('ascii'), dtype=_np.uint8)
+
+    by_length = {}
+    for i, witprog in enumerate(witprogs):
+        by_length.setdefault(len(witprog), []).append(i)
+    for length, idxs in by_length.items():
+        if not (2 <= length <= 40) or (witver == 0 and length != 20 and length != 32):
+            continue
+        nchars = (length * 8 + 4) // 5
+        if len(hrp) + nchars + 8 > 90:
+            continue
+        width = len(prefix) + nchars + 6
+        for start in range(0, len(idxs), _NP_CHUNK):
+            chunk = idxs[start:start + _NP_CHUNK]
+            progs = _np.frombuffer(b''.join(bytes(witprogs[i]) for i in chunk),
+                                   dtype=_np.uint8).reshape(len(chunk), length)
+            values = _np.zeros((len(chunk), nchars + 6), dtype=_np.uint8)
+            values[:, :nchars] = _np_to_values(progs, nchars)
+            checksum = _np_polymod(chk, values) ^ const
+            for k in range(6):
+                values[:, nchars + k] = (checksum >> _np.uint64(25 - 5 * k)) & _np.uint64(31)
+
+            out = _np.empty((len(chunk), width), dtype=_np.uint8)
+            out[:, :len(prefix)] = prefix
+            out[:, len(prefix):] = charset[values]
+            text = out.tobytes().decode('ascii')
+            for j, i in enumerate(chunk):
+                r[i] = text[j * width:(j + 1) * width]
+    return r
+
+
+def _np_decode_many(hrp, addrs, spec):
+    r = [(None, None)] * len(addrs)
+    chk = _hrp_polymod(hrp)
+    if chk is None:
+        return r
+    hrp_chars = _np.frombuffer((hrp + '1').encode('ascii'), dtype=_np.uint8)
+    values_table = _np.frombuffer(_VALUES, dtype=_np.uint8)
+
+    # anything shorter than hrp, the separator, the version, 2 bytes of
+    # program and the checksum is not a valid address
+    by_length = {}
+    for i, addr in enumerate(addrs):
+        if len(hrp_chars) + 11 <= len(addr) <= 90:
+            by_length.setdefault(len(addr), []).append(i)
+    for length, idxs in by_length.items():
+        nchars = length - len(hrp_chars) - 7
+        nbytes = 5 * nchars >> 3
+        pad = 5 * nchars & 7
+        if pad >= 5 or nbytes > 40:
+            continue
+        for start in range(0, len(idxs), _NP_CHUNK):
+            chunk = idxs[start:start + _NP_CHUNK]
+            try:
+                raw = ''.join(addrs[i] for i in chunk).encode('ascii')
+            except UnicodeEncodeError:
+                # not ascii, decode the chunk one by one to find which
+                for i in chunk:
+                    r[i] = _segwit_decode(hrp, addrs[i], spec) or r[i]
+                continue
+            m = _np.frombuffer(raw, dtype=_np.uint8).reshape(len(chunk), length)
+            upper = (m >= 65) & (m <= 90)
+            ok = ~(upper.any(axis=1) & ((m >= 97) & (m <= 122)).any(axis=1))
+            m = m | (upper.view(_np.uint8) << 5)
+            ok &= (m[:, :len(hrp_chars)] == hrp_chars).all(axis=1)
+            values = values_table[m[:, len(hrp_chars):]]
+            ok &= (values != 0xff).all(axis=1)
+            values &= 31
+
+            checksum = _np_polymod(chk, values)
+            witver = values[:, 0]
+            if spec is None:
+                ok &= _np.where(witver == 0, checksum == 1, checksum == BECH32M_CONST)
+            else:
+                ok &= checksum == _CONSTS[spec]
+            ok &= witver <= 16
+            if nbytes != 20 and nbytes != 32:
+                ok &= witver != 0
+            if pad:
+                ok &= (values[:, nchars] & ((1 << pad) - 1)) == 0
+
+            progs = _np_from_values(values[:, 1:nchars + 1], nbytes).tobytes()
+            witver = witver.tolist()
+            for j in _np.flatnonzero(ok).tolist():
+                r[chunk[j]] = (witver[j], progs[j * nbytes:(j + 1) * nbytes])
+    return r
+
+
+def decode_many(hrp, addrs, spec=Encoding.BECH32):
+    """Decode many segwit addresses
+
+    Returns a list of (witver, witprog) with witprog as bytes, or
+    (None, None) for the addresses that are not valid. With NumPy the
+    checksums of addresses of the same length are computed together.
+    """
+    if _np is not None:
+        return _np_decode_many(hrp, addrs, spec)
+    invalid = (None, None)
+    return [_segwit_decode(hrp, addr, spec) or invalid for addr in addrs]
+
+
+def encode_many(hrp, witver, witprogs, spec=Encoding.BECH32):
+    """Encode many witness programs of the same version
+
+    Returns a list of addresses, None for the programs that cannot be
+    encoded. With NumPy programs of the same length are encoded together.
+    """
+    if _np is not None:
+        return _np_encode_many(hrp, witver, witprogs, spec)
+    return [_segwit_encode(hrp, witver, bytes(witprog), spec) for witprog in witprogs]
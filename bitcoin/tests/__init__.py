@@ -10,3 +10,17 @@
 # LICENSE file.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+
+import contextlib
+
+
+@contextlib.contextmanager
+def without_numpy(module):
+    """Hide numpy from a module that imports it as _np when available, so
+    that its pure Python fallback is exercised"""
+    np = module._np
+    module._np = None
+    try:
+        yield
+    finally:
+        module._np = np
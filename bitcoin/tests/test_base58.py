@@ -36,6 +36,63 @@ class Test_base58(unittest.TestCase):
             self.assertEqual(act_base58, exp_base58)
             self.assertEqual(act_bin, exp_bin)
 
+    def test_invalid_characters(self):
+        for invalid in ('0', 'O', 'I', 'l', '1A1zP1eP5QGe#', '\u00e9', '1 1'):
+            with self.assertRaises(InvalidBase58Error):
+                decode(invalid)
+
+    def test_check(self):
+        data = unhexlify(b'62e907b15cbf27d5425399ebf6f0fb50ebb88f18')
+        self.assertEqual(encode_check(data, 0), '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa')
+        self.assertEqual(decode_check('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'), (data, 0))
+        with self.assertRaises(Base58ChecksumError):
+            decode_check('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb')
+
+        datas = [bytes([i]) * 20 for i in range(10)] + [b'\x00' * 20, b'', data]
+        for nVersion in (0, 5, 111, 196):
+            expected = [encode_check(d, nVersion) for d in datas]
+            self.assertEqual(encode_check_many(datas, nVersion), expected)
+            self.assertEqual([decode_check(s) for s in expected], [(d, nVersion) for d in datas])
+
+    def test_cache(self):
+        cache = Base58Cache(max_entries=3)
+        datas = [bytes([i]) * 20 for i in range(4)]
+        strs = [encode_check(d, 0) for d in datas]
+
+        self.assertEqual(encode_check(datas[0], 0, cache), strs[0])
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(encode_check(datas[0], 0, cache), strs[0])
+        self.assertEqual(decode_check(strs[0], cache), (datas[0], 0))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        # the version is part of the key
+        self.assertEqual(encode_check(datas[0], 5, cache), encode_check(datas[0], 5))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        self.assertEqual(encode_check_many(datas + datas, 0, cache), strs + strs)
+        self.assertEqual(len(cache), 3)
+        # datas[0] was evicted, the most recently used ones are kept
+        self.assertIsNone(cache.get((datas[0], 0)))
+        self.assertEqual(cache.get(strs[3]), (datas[3], 0))
+
+        # a pair is kept or evicted as a whole, whichever half was looked up
+        cache.clear()
+        for d, s in zip(datas[:3], strs):
+            cache.add(d, 0, s)
+        self.assertEqual(cache.get((datas[0], 0)), strs[0])
+        self.assertEqual(cache.get(strs[1]), (datas[1], 0))
+        cache.add(datas[3], 0, strs[3])
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(strs[2]))
+        self.assertIsNone(cache.get((datas[2], 0)))
+        self.assertEqual(cache.get(strs[0]), (datas[0], 0))
+        self.assertEqual(cache.get((datas[1], 0)), strs[1])
+        self.assertEqual(cache.get((datas[3], 0)), strs[3])
+
+        with self.assertRaises(Base58ChecksumError):
+            decode_check(strs[3][:-1] + 'z', cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
 class Test_CBase58Data(unittest.TestCase):
     def test_from_data(self):
         b = CBase58Data.from_bytes(b"b\xe9\x07\xb1\\\xbf'\xd5BS\x99\xeb\xf6\xf0\xfbP\xeb\xb8\x8f\x18", 0)
@@ -46,6 +103,13 @@ class Test_CBase58Data(unittest.TestCase):
         self.assertEqual(b.nVersion, 196)
         self.assertEqual(str(b), '2MyJKxYR2zNZZsZ39SgkCXWCfQtXKhnWSWq')
 
+    def test_encode_many(self):
+        datas = [b"b\xe9\x07\xb1\\\xbf'\xd5BS\x99\xeb\xf6\xf0\xfbP\xeb\xb8\x8f\x18", b'\x00' * 20]
+        self.assertEqual(CBase58Data.encode_many(datas, 0),
+                         [str(CBase58Data.from_bytes(d, 0)) for d in datas])
+        with self.assertRaises(ValueError):
+            CBase58Data.encode_many(datas, 256)
+
     def test_invalid_base58_exception(self):
         invalids = ('', # missing everything
                     '#', # invalid character
@@ -27,9 +27,11 @@ if sys.version > '3':
 
 from binascii import unhexlify
 
+import bitcoin.segwit_addr
+from bitcoin.tests import without_numpy
 from bitcoin.core.script import CScript, OP_0, OP_1, OP_16
 from bitcoin.bech32 import *
-from bitcoin.segwit_addr import encode, decode
+from bitcoin.segwit_addr import Encoding, encode, decode, encode_many, decode_many
 
 
 def load_test_vectors(name):
@@ -63,6 +65,73 @@ class Test_bech32(unittest.TestCase):
             self.assertEqual(act_bech32.lower(), exp_bech32.lower())
             self.assertEqual(to_scriptPubKey(*act_bin), _tobytes(exp_bin))
 
+    def test_polymod(self):
+        def reference(values):
+            generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+            chk = 1
+            for value in values:
+                top = chk >> 25
+                chk = (chk & 0x1ffffff) << 5 ^ value
+                for i in range(5):
+                    chk ^= generator[i] if ((top >> i) & 1) else 0
+            return chk
+
+        for values in ([], [0], [31], list(range(32)), list(range(31, -1, -1)) * 3):
+            self.assertEqual(bitcoin.segwit_addr.bech32_polymod(values), reference(values))
+
+    def test_bech32m(self):
+        # BIP350 test vectors
+        for valid in ('A1LQFN3A', 'a1lqfn3a', 'abcdef1l7aum6echk45nj3s0wdvt2fg8x9yrzpqzd3ryx',
+                      'split1checkupstagehandshakeupstreamerranterredcaperredlc445v', '?1v759aa'):
+            self.assertEqual(bitcoin.segwit_addr.bech32m_decode(valid)[2], Encoding.BECH32M)
+            self.assertEqual(bitcoin.segwit_addr.bech32_decode(valid), (None, None))
+        self.assertEqual(bitcoin.segwit_addr.bech32m_decode('a12uel5l')[2], Encoding.BECH32)
+
+        for exp_bech32, exp_bin in (
+                ('BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4', '0014751e76e8199196d454941c45d1b3a323f1433bd6'),
+                ('bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kt5nd6y',
+                 '5128751e76e8199196d454941c45d1b3a323f1433bd6751e76e8199196d454941c45d1b3a323f1433bd6'),
+                ('BC1SW50QGDZ25J', '6002751e'),
+                ('bc1zw508d6qejxtdg4y5r3zarvaryvaxxpcs', '5210751e76e8199196d454941c45d1b3a323'),
+                ('bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0',
+                 '512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')):
+            exp_bin = unhexlify(exp_bin)
+            witver = self.op_decode(exp_bin[0])
+            act_bin = decode('bc', exp_bech32, spec=None)
+            self.assertEqual(to_scriptPubKey(*act_bin), exp_bin)
+            self.assertEqual(encode('bc', witver, exp_bin[2:], spec=None), exp_bech32.lower())
+            if witver:
+                # not a BIP173 address
+                self.assertEqual(decode('bc', exp_bech32), (None, None))
+                self.assertEqual(decode('bc', encode('bc', witver, exp_bin[2:]), spec=None), (None, None))
+
+    def test_many(self):
+        self.check_many()
+
+    def test_many_without_numpy(self):
+        with without_numpy(bitcoin.segwit_addr):
+            self.check_many()
+
+    def check_many(self):
+        witprogs = [bytes([i]) * n for i, n in enumerate((20, 32, 20, 2, 40, 1, 41, 20, 5, 32))]
+        for hrp in ('bc', 'tb', 'bcrt', 'BC', ''):
+            for witver in (0, 1, 16, 17):
+                for spec in (Encoding.BECH32, Encoding.BECH32M, None):
+                    addrs = encode_many(hrp, witver, witprogs, spec)
+                    self.assertEqual(addrs, [encode(hrp, witver, p, spec) for p in witprogs])
+
+                    valid = [a for a in addrs if a is not None]
+                    # upper case, mixed case, a bad checksum and the wrong hrp
+                    candidates = valid + [a.upper() for a in valid] + ['x' + a[1:] for a in valid] \
+                                 + [a[:-1] + ('q' if a[-1] != 'q' else 'p') for a in valid] \
+                                 + [a[:5] + a[5:].upper() for a in valid] + ['', 'bc1', 'bc1\u00e9' + 'q' * 40]
+                    for spec2 in (Encoding.BECH32, Encoding.BECH32M, None):
+                        expected = [decode(hrp.lower(), a, spec2) for a in candidates]
+                        expected = [(v, bytes(p)) if v is not None else (None, None) for v, p in expected]
+                        self.assertEqual(decode_many(hrp.lower(), candidates, spec2), expected)
+                    self.assertEqual([d[1] for d in decode_many(hrp, valid, spec)],
+                                     [p for p in witprogs if encode(hrp, witver, p, spec)])
+
 class Test_CBech32Data(unittest.TestCase):
     def test_from_data(self):
         b = CBech32Data.from_bytes(0, unhexlify('751e76e8199196d454941c45d1b3a323f1433bd6'))
@@ -75,3 +144,10 @@ class Test_CBech32Data(unittest.TestCase):
             msg = '%r should have raised Bech32Error but did not' % invalid
             with self.assertRaises(Bech32Error, msg=msg):
                 CBech32Data(invalid)
+
+    def test_encode_many(self):
+        witprogs = [unhexlify('751e76e8199196d454941c45d1b3a323f1433bd6'), b'\x01' * 32]
+        self.assertEqual(CBech32Data.encode_many(0, witprogs),
+                         [str(CBech32Data.from_bytes(0, p)) for p in witprogs])
+        with self.assertRaises(ValueError):
+            CBech32Data.encode_many(17, witprogs)
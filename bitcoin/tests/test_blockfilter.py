@@ -0,0 +1,205 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+import bitcoin.blockfilter
+import bitcoin.core
+import bitcoin.tests.test_core
+from bitcoin.tests import without_numpy
+from bitcoin.core import x, lx
+from bitcoin.blockfilter import *
+
+
+def random_filter(rand, n):
+    block_hash = rand.getrandbits(256).to_bytes(32, 'little')
+    k0, k1 = struct.unpack(b'<QQ', block_hash[:16])
+    elements = [rand.getrandbits(8 * 25).to_bytes(25, 'little') for _ in range(n)]
+    gcs = GCSFilter.from_elements(k0, k1, BASIC_FILTER_P, BASIC_FILTER_M, elements)
+    return CBlockFilter(block_hash, gcs.encoded), elements
+
+
+class Test_SipHash(unittest.TestCase):
+    def test(self):
+        k0 = 0x0706050403020100
+        k1 = 0x0F0E0D0C0B0A0908
+        self.assertEqual(SipHash(k0, k1, b''), 0x726fdb47dd0e0e31)
+        self.assertEqual(SipHash(k0, k1, bytes(range(8))), 0x93f5f5799a932462)
+        self.assertEqual(SipHash(k0, k1, bytes(range(15))), 0xa129ca6149be45e5)
+
+    def test_numpy(self):
+        if bitcoin.blockfilter._np is None:
+            self.skipTest('numpy not available')
+        np = bitcoin.blockfilter._np
+        rand = random.Random(1)
+        keys = [(rand.getrandbits(64), rand.getrandbits(64)) for _ in range(3)]
+        for length in (0, 1, 7, 8, 9, 25, 34):
+            elems = [rand.getrandbits(8 * length).to_bytes(length, 'little') for _ in range(5)]
+            hashes = bitcoin.blockfilter._np_siphash(np.array(keys, dtype=np.uint64),
+                                                     b''.join(elems), len(elems), length)
+            self.assertEqual(hashes.tolist(), [[SipHash(k0, k1, e) for e in elems] for k0, k1 in keys])
+
+
+class Test_GCSFilter(unittest.TestCase):
+    def test_empty(self):
+        gcs = GCSFilter.from_elements(0, 0, BASIC_FILTER_P, BASIC_FILTER_M, [])
+        self.assertEqual(gcs.encoded, b'\x00')
+        self.assertFalse(gcs.match(b''))
+
+    def test_roundtrip(self):
+        self.check_roundtrip()
+
+    def test_roundtrip_without_numpy(self):
+        with without_numpy(bitcoin.blockfilter):
+            self.check_roundtrip()
+
+    def check_roundtrip(self):
+        rand = random.Random(2)
+        for n in (1, 2, 10, 300, 1000):
+            elements = [rand.randbytes(rand.randint(1, 40)) for _ in range(n)]
+            built = GCSFilter.from_elements(1, 2, BASIC_FILTER_P, BASIC_FILTER_M, elements)
+            gcs = GCSFilter(1, 2, BASIC_FILTER_P, BASIC_FILTER_M, built.encoded)
+            self.assertEqual(gcs.N, len(set(elements)))
+            values = gcs.decode()
+            self.assertEqual(values, sorted(gcs.hash_to_range(e) for e in set(elements)))
+            self.assertEqual(values, built.decode())
+            for e in elements:
+                self.assertTrue(gcs.match(e))
+
+    def test_large_quotient(self):
+        # small M so that the deltas need unary runs longer than a 64 bit window
+        elements = [bytes([i]) for i in range(4)]
+        built = GCSFilter.from_elements(5, 6, 2, 1 << 10, elements)
+        gcs = GCSFilter(5, 6, 2, 1 << 10, built.encoded)
+        self.assertEqual(gcs.decode(), built.decode())
+
+    def test_truncated(self):
+        built = GCSFilter.from_elements(1, 2, BASIC_FILTER_P, BASIC_FILTER_M, [b'a', b'b', b'c'])
+        gcs = GCSFilter(1, 2, BASIC_FILTER_P, BASIC_FILTER_M, built.encoded[:-2])
+        with self.assertRaises(ValueError):
+            gcs.decode()
+
+
+class Test_CBlockFilter(unittest.TestCase):
+    def test_genesis(self):
+        # BIP158 test vector, testnet genesis block
+        block = bitcoin.core.CoreTestNetParams.GENESIS_BLOCK
+        f = CBlockFilter.from_block(block)
+        self.assertEqual(f.encoded, x('019dfca8'))
+        self.assertEqual(f.ComputeHeader(b'\x00' * 32),
+                         lx('21584579b7eb08997773e5aeff3a7f932700042d0ed2a6129012b7d7ae81b750'))
+
+        f2 = CBlockFilter.deserialize(f.serialize())
+        self.assertEqual(f2.block_hash, block.GetHash())
+        self.assertEqual(f2.encoded, f.encoded)
+        self.assertTrue(f2.match_any([block.vtx[0].vout[0].scriptPubKey]))
+
+    def test_from_block(self):
+        block = bitcoin.core.CBlock.deserialize(bitcoin.tests.test_core.Test_CLazyBlock.serialized)
+        prev_scripts = [bitcoin.core.CScript(x('76a914') + bytes(20) + x('88ac')), b'']
+        f = CBlockFilter.from_block(block, prev_scripts)
+        scripts = set(bytes(txout.scriptPubKey) for tx in block.vtx for txout in tx.vout)
+        scripts.add(bytes(prev_scripts[0]))
+        self.assertEqual(f.filter.N, len(scripts))
+        self.assertTrue(f.match_any(scripts))
+        for s in scripts:
+            self.assertTrue(f.match_any([s]))
+
+
+class Test_match_filters(unittest.TestCase):
+    def test(self):
+        self.check()
+
+    def test_without_numpy(self):
+        with without_numpy(bitcoin.blockfilter):
+            self.check()
+
+    def check(self):
+        rand = random.Random(3)
+        filters = []
+        elements = []
+        for n in (0, 1, 50, 200) * 5:
+            f, e = random_filter(rand, n)
+            filters.append(f)
+            elements.append(e)
+        queries = [rand.getrandbits(8 * 25).to_bytes(25, 'little') for _ in range(100)]
+        expected = [i for i, f in enumerate(filters) if f.match_any(queries)]
+        self.assertEqual(match_filters(filters, queries), expected)
+
+        queries += [elements[2][0], elements[11][-1]]
+        matched = match_filters(filters, queries)
+        self.assertEqual(matched, [i for i, f in enumerate(filters) if f.match_any(queries)])
+        self.assertIn(2, matched)
+        self.assertIn(11, matched)
+        self.assertEqual(match_filters(filters, []), [])
+        self.assertEqual(match_filters([], queries), [])
+
+
+class Test_BlockFilterStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'basic')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test(self):
+        rand = random.Random(4)
+        filters = [random_filter(rand, n) for n in (3, 0, 40, 7)]
+        headers = []
+        with BlockFilterStore(self.path) as store:
+            self.assertEqual(store.tip_header(), b'\x00' * 32)
+            for f, e in filters[:2]:
+                headers.append(store.append(f))
+            # reads interleaved with appends
+            self.assertEqual(store.get(1).encoded, filters[1][0].encoded)
+            for f, e in filters[2:]:
+                headers.append(store.append(f))
+            self.assertEqual(len(store), 4)
+            self.assertEqual(store.tip_header(), headers[-1])
+
+        prev = b'\x00' * 32
+        for f, e in filters:
+            prev = f.ComputeHeader(prev)
+        self.assertEqual(headers[-1], prev)
+
+        with BlockFilterStore(self.path) as store:
+            self.assertEqual(len(store), 4)
+            self.assertEqual(store.tip_header(), headers[-1])
+            for h, (f, e) in enumerate(filters):
+                self.assertEqual(store.get(h).encoded, f.encoded)
+                self.assertEqual(store.get_block_hash(h), f.block_hash)
+                self.assertEqual(store.get_header(h), headers[h])
+            self.assertEqual(store.match_range([filters[2][1][5], filters[3][1][0]], 0), [2, 3])
+            self.assertEqual(store.match_range([filters[2][1][5], filters[3][1][0]], 1, 3), [2])
+            with self.assertRaises(IndexError):
+                store.get(4)
+
+    def test_recovery(self):
+        rand = random.Random(5)
+        filters = [random_filter(rand, 10)[0] for _ in range(3)]
+        with BlockFilterStore(self.path) as store:
+            for f in filters:
+                store.append(f)
+        # a torn record and filter data without a record
+        with open(self.path + '.idx', 'r+b') as fd:
+            fd.truncate(os.path.getsize(self.path + '.idx') - 10)
+        with open(self.path + '.dat', 'ab') as fd:
+            fd.write(b'garbage')
+
+        with BlockFilterStore(self.path) as store:
+            self.assertEqual(len(store), 2)
+            self.assertEqual(os.path.getsize(self.path + '.dat'),
+                             len(filters[0].encoded) + len(filters[1].encoded))
+            store.append(filters[2])
+            self.assertEqual(store.get(2).encoded, filters[2].encoded)
+            self.assertEqual(store.get_header(2),
+                             filters[2].ComputeHeader(filters[1].ComputeHeader(filters[0].ComputeHeader(b'\x00' * 32))))
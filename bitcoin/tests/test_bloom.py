@@ -11,10 +11,15 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
 import unittest
 
+import bitcoin.bloom
 import bitcoin.core
+import bitcoin.tests.test_core
+from bitcoin.tests import without_numpy
 from bitcoin.core import x
+from bitcoin.core.script import *
 from bitcoin.bloom import *
 
 class Test_MurmurHash3(unittest.TestCase):
@@ -39,6 +44,11 @@ class Test_MurmurHash3(unittest.TestCase):
         T(0x8034d2a0, 0x00000000, "0011223344556677")
         T(0xb4698def, 0x00000000, "001122334455667788")
 
+    def test_many(self):
+        seeds = (0x00000000, 0xFBA4C795, 0xffffffff)
+        for data in ("", "00", "ff", "0011", "001122", "00112233", "0011223344", "001122334455667788"):
+            self.assertEqual(MurmurHash3Many(seeds, x(data)), [MurmurHash3(seed, x(data)) for seed in seeds])
+
 
 class Test_CBloomFilter(unittest.TestCase):
     def test_create_insert_serialize(self):
@@ -100,3 +110,169 @@ class Test_CBloomFilter(unittest.TestCase):
         filter.insert(pubkeyhash)
 
         self.assertEqual(filter.serialize(), x('038fc16b080000000000000001'))
+
+    def check_many(self):
+        filter = CBloomFilter(100, 0.01, 2147483649, CBloomFilter.UPDATE_ALL)
+        elems = [os.urandom(n) for n in (0, 1, 2, 3, 4, 5, 20, 20, 32, 33, 65)]
+        elems.append(bitcoin.core.COutPoint(os.urandom(32), 1))
+        expected = CBloomFilter(100, 0.01, 2147483649, CBloomFilter.UPDATE_ALL)
+        for elem in elems[::2]:
+            expected.insert(elem)
+
+        filter.insert_many(elems[::2])
+        self.assertEqual(filter.vData, expected.vData)
+        probe = elems + [os.urandom(20) for _ in range(100)]
+        self.assertEqual(filter.contains_many(probe), [expected.contains(elem) for elem in probe])
+        self.assertEqual(filter.contains_many([]), [])
+
+        full = CBloomFilter.deserialize(x('01ff050000000000000001'))
+        full.insert_many(elems)
+        self.assertEqual(full.vData, bytearray(b'\xff'))
+        self.assertEqual(full.contains_many(elems), [True] * len(elems))
+
+    def test_many(self):
+        self.check_many()
+
+    def test_many_without_numpy(self):
+        with without_numpy(bitcoin.bloom):
+            self.check_many()
+
+
+class Test_IsRelevantAndUpdate(unittest.TestCase):
+    # block 99960, three transactions
+    serialized = bitcoin.tests.test_core.Test_CLazyBlock.serialized
+
+    def setUp(self):
+        self.block = bitcoin.core.CBlock.deserialize(self.serialized)
+        (self.coinbase, self.tx1, self.tx2) = self.block.vtx
+
+    def spending(self, tx, n):
+        return bitcoin.core.CTransaction([bitcoin.core.CTxIn(bitcoin.core.COutPoint(tx.GetTxid(), n))],
+                                         [bitcoin.core.CTxOut(1, CScript())])
+
+    def test_txid(self):
+        filter = CBloomFilter(10, 0.000001, 0, CBloomFilter.UPDATE_ALL)
+        filter.insert(self.tx1.GetTxid())
+        self.assertTrue(filter.IsRelevantAndUpdate(self.tx1))
+        self.assertFalse(filter.IsRelevantAndUpdate(self.tx2))
+
+    def test_inputs(self):
+        filter = CBloomFilter(10, 0.000001, 0, CBloomFilter.UPDATE_ALL)
+        filter.insert(self.tx1.vin[0].prevout)
+        self.assertTrue(filter.IsRelevantAndUpdate(self.tx1))
+        self.assertFalse(filter.IsRelevantAndUpdate(self.tx2))
+
+        filter = CBloomFilter(10, 0.000001, 0, CBloomFilter.UPDATE_ALL)
+        filter.insert(list(self.tx2.vin[0].scriptSig)[0])
+        self.assertTrue(filter.IsRelevantAndUpdate(self.tx2))
+        self.assertFalse(filter.IsRelevantAndUpdate(self.tx1))
+
+    def test_outputs_update(self):
+        pubkey_hash = x('66a3b2e43cfa5c6d9b2f0095f7be5a5cb608478c')
+        for flags, updated in ((CBloomFilter.UPDATE_ALL, True),
+                               (CBloomFilter.UPDATE_P2PUBKEY_ONLY, False),
+                               (CBloomFilter.UPDATE_NONE, False)):
+            filter = CBloomFilter(10, 0.000001, 0, flags)
+            filter.insert(pubkey_hash)
+            self.assertTrue(filter.IsRelevantAndUpdate(self.tx2))
+            self.assertFalse(filter.IsRelevantAndUpdate(self.tx1))
+            self.assertEqual(filter.IsRelevantAndUpdate(self.spending(self.tx2, 0)), updated)
+            self.assertFalse(filter.IsRelevantAndUpdate(self.spending(self.tx2, 1)))
+
+        # the coinbase pays to a pubkey
+        pubkey = list(self.coinbase.vout[0].scriptPubKey)[0]
+        for flags, updated in ((CBloomFilter.UPDATE_ALL, True),
+                               (CBloomFilter.UPDATE_P2PUBKEY_ONLY, True),
+                               (CBloomFilter.UPDATE_NONE, False)):
+            filter = CBloomFilter(10, 0.000001, 0, flags)
+            filter.insert(pubkey)
+            self.assertTrue(filter.IsRelevantAndUpdate(self.coinbase))
+            self.assertEqual(filter.IsRelevantAndUpdate(self.spending(self.coinbase, 0)), updated)
+
+    def test_empty(self):
+        # a zero-size filter matches everything
+        filter = CBloomFilter.deserialize(x('00') + x('0a000000') + x('00000000') + x('01'))
+        self.assertEqual(filter.vData, b'')
+        self.assertTrue(filter.IsRelevantAndUpdate(self.tx1))
+        self.assertTrue(filter.IsRelevantAndUpdate(self.coinbase))
+        self.assertEqual(filter.vData, b'')
+
+        merkle_block = CMerkleBlock.from_block(self.block, filter)
+        self.assertEqual([i for i, txid in merkle_block.vMatchedTxn], [0, 1, 2])
+
+    def test_is_pubkey_or_multisig(self):
+        from bitcoin.bloom import _is_pubkey_or_multisig
+        k33 = b'\x02' + b'\x11' * 32
+        k65 = b'\x04' + b'\x11' * 64
+        def T(script, expected):
+            self.assertEqual(_is_pubkey_or_multisig(bytes(script)), expected)
+        T(CScript([k33, OP_CHECKSIG]), True)
+        T(CScript([k65, OP_CHECKSIG]), True)
+        T(CScript([b'\x05' + k33[1:], OP_CHECKSIG]), False)
+        T(CScript([k33, OP_CHECKSIGVERIFY]), False)
+        T(CScript([1, k33, k65, 2, OP_CHECKMULTISIG]), True)
+        T(CScript([2, k33, k65, 2, OP_CHECKMULTISIG]), True)
+        T(CScript([3, k33, k65, 2, OP_CHECKMULTISIG]), False)
+        T(CScript([1, k33, k65, 3, OP_CHECKMULTISIG]), False)
+        T(CScript([1, k33, b'\x11' * 20, 2, OP_CHECKMULTISIG]), False)
+        T(CScript([1, k33, 1, OP_CHECKMULTISIG, OP_CHECKMULTISIG]), False)
+        T(CScript([0, 0, OP_CHECKMULTISIG]), False)
+        T(CScript([OP_DUP, OP_HASH160, b'\x11' * 20, OP_EQUALVERIFY, OP_CHECKSIG]), False)
+
+
+class Test_CMerkleBlock(unittest.TestCase):
+    serialized = Test_IsRelevantAndUpdate.serialized
+
+    def test_from_block(self):
+        self.check_from_block()
+
+    def test_from_block_without_numpy(self):
+        with without_numpy(bitcoin.bloom):
+            self.check_from_block()
+
+    def check_from_block(self):
+        block = bitcoin.core.CBlock.deserialize(self.serialized)
+        lazy = bitcoin.core.CLazyBlock.deserialize(self.serialized)
+        filters = []
+        for b in (block, lazy):
+            filter = CBloomFilter(10, 0.000001, 0, CBloomFilter.UPDATE_ALL)
+            filter.insert(x('68c6c2b3c0bc4a8eeb10d16a300d627a31a3b585'))
+            merkle_block = CMerkleBlock.from_block(b, filter)
+            self.assertEqual(merkle_block.vMatchedTxn, [(1, block.vtx[1].GetTxid())])
+            self.assertEqual(merkle_block.header, block.get_header())
+            root, matches = merkle_block.txn.extract_matches()
+            self.assertEqual(root, block.hashMerkleRoot)
+            self.assertEqual(matches, merkle_block.vMatchedTxn)
+
+            deserialized = CMerkleBlock.deserialize(merkle_block.serialize())
+            self.assertEqual(deserialized.txn.extract_matches(), (root, matches))
+            filters.append(filter)
+        self.assertEqual(filters[0].vData, filters[1].vData)
+        self.assertTrue(filters[0].contains(bitcoin.core.COutPoint(block.vtx[1].GetTxid(), 0)))
+
+        merkle_block = CMerkleBlock.from_block(lazy, txids={block.vtx[0].GetTxid(), block.vtx[2].GetTxid()})
+        self.assertEqual([i for i, txid in merkle_block.vMatchedTxn], [0, 2])
+        self.assertEqual(merkle_block.txn.extract_matches(), (block.hashMerkleRoot, merkle_block.vMatchedTxn))
+
+    def test_partial_merkle_tree(self):
+        import random
+        rand = random.Random(37)
+        for n in (1, 2, 3, 4, 5, 7, 8, 9, 31, 100, 255):
+            txids = [os.urandom(32) for _ in range(n)]
+            root = bitcoin.core.CBlock.build_merkle_tree_from_txids(txids)[-1]
+            for att in range(4):
+                matches = [rand.random() < 0.1 * att for _ in range(n)]
+                tree = CPartialMerkleTree.deserialize(CPartialMerkleTree(txids, matches).serialize())
+                self.assertEqual(tree.extract_matches(),
+                                 (root, [(i, txid) for i, txid in enumerate(txids) if matches[i]]))
+
+                # a modified tree doesn't yield the same root or is invalid
+                if len(tree.vHash) > 1:
+                    tree.vHash[rand.randrange(len(tree.vHash))] = os.urandom(32)
+                    self.assertNotEqual(tree.extract_matches()[0], root)
+                tree.vHash.append(os.urandom(32))
+                with self.assertRaises(ValueError):
+                    tree.extract_matches()
+
+        with self.assertRaises(ValueError):
+            CPartialMerkleTree().extract_matches()
@@ -17,7 +17,7 @@ import os
 
 from bitcoin.core import *
 
-def load_test_vectors(name):
+def load_test_vectors(name, block_cls=CBlock):
     with open(os.path.dirname(__file__) + '/data/' + name, 'r') as fd:
         for test_case in json.load(fd):
             # Comments designated by single length strings
@@ -31,14 +31,16 @@ def load_test_vectors(name):
             if fHeader:
                 blk = CBlockHeader.deserialize(x(serialized_blk))
             else:
-                blk = CBlock.deserialize(x(serialized_blk))
+                blk = block_cls.deserialize(x(serialized_blk))
 
             yield (comment, fHeader, fCheckPoW, cur_time, blk)
 
 
 class Test_CheckBlock(unittest.TestCase):
+    block_cls = CBlock
+
     def test_checkblock_valid(self):
-        for comment, fHeader, fCheckPoW, cur_time, blk in load_test_vectors('checkblock_valid.json'):
+        for comment, fHeader, fCheckPoW, cur_time, blk in load_test_vectors('checkblock_valid.json', self.block_cls):
             try:
                 if fHeader:
                     CheckBlockHeader(blk, fCheckPoW=fCheckPoW, cur_time=cur_time)
@@ -48,7 +50,7 @@ class Test_CheckBlock(unittest.TestCase):
                 self.fail('Failed "%s" with error %r' % (comment, err))
 
     def test_checkblock_invalid(self):
-        for comment, fHeader, fCheckPoW, cur_time, blk in load_test_vectors('checkblock_invalid.json'):
+        for comment, fHeader, fCheckPoW, cur_time, blk in load_test_vectors('checkblock_invalid.json', self.block_cls):
             try:
                 if fHeader:
                     CheckBlockHeader(blk, fCheckPoW=fCheckPoW, cur_time=cur_time)
@@ -58,3 +60,6 @@ class Test_CheckBlock(unittest.TestCase):
                 continue
 
             self.fail('Invalid block "%s" passed checks' % comment)
+
+class Test_CheckBlock_Lazy(Test_CheckBlock):
+    block_cls = CLazyBlock
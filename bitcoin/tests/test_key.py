@@ -11,8 +11,10 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import hashlib
 import unittest
 
+import bitcoin.core.key
 from bitcoin.core.key import *
 from bitcoin.core import x
 
@@ -25,7 +27,9 @@ class Test_CPubKey(unittest.TestCase):
             self.assertEqual(key.is_compressed, is_compressed)
 
         T('', False, False, False)
-        T('00', True, True, False) # why is this valid?
+        # OpenSSL takes the point at infinity as valid, libsecp256k1 and
+        # Bitcoin Core do not
+        T('00', True, not bitcoin.core.key._libsecp256k1_enable_verification, False)
         T('01', True, False, False)
         T('02', True, False, False)
 
@@ -39,3 +43,111 @@ class Test_CPubKey(unittest.TestCase):
 
         T('0478d430274f8c5ec1321338151e9f27f4c676a008bdf8638d07c0b6be9ab35c71a1518063243acd4dfe96b66e3f2ec8013c8e072cd09b3834a19f81f659cc3455',
           True, True, False)
+
+class Test_ParseDERLax(unittest.TestCase):
+    def test(self):
+        def T(hex_sig, expected):
+            compact = bitcoin.core.key._parse_der_lax(x(hex_sig))
+            if expected is not None:
+                expected = x(expected)
+            self.assertEqual(compact, expected)
+
+        r = '11' * 32
+        s = '22' * 32
+        T('3044' + '0220' + r + '0220' + s, r + s)
+        # short integers are left padded, leading zeros dropped
+        T('3008' + '02020001' + '0202ff01', '00' * 31 + '01' + '00' * 30 + 'ff01')
+        # negative integers are taken as unsigned
+        T('3044' + '0220' + 'ff' * 32 + '0220' + s, 'ff' * 32 + s)
+        # bogus sequence length, long form integer lengths, trailing garbage
+        T('3001' + '02820020' + r + '0283000020' + s + 'abcd', r + s)
+        T('3081ff' + '0220' + r + '0220' + s, r + s)
+        # integers too large for the curve give a zero signature
+        T('3045' + '0221' + '01' + r + '0220' + s, '00' * 64)
+
+        T('', None)
+        T('31', None)
+        T('30', None)
+        T('3000', None)
+        T('3006' + '0201' + '01' + '03', None)
+        T('3006' + '0203' + '01', None)
+        T('3085' + '0201010201', None)
+        T('3008' + '02880100000000000000' + '020101', None)
+
+
+@unittest.skipUnless(bitcoin.core.key._libsecp256k1_enable_verification,
+                     'libsecp256k1 not available')
+class Test_VerifyLibsecp256k1(unittest.TestCase):
+    def verify_both(self, pub, h, sig):
+        bitcoin.core.key.use_libsecp256k1_for_verification(False)
+        try:
+            expected = CPubKey(pub).verify(h, sig)
+        finally:
+            bitcoin.core.key.use_libsecp256k1_for_verification(True)
+        self.assertEqual(CPubKey(pub).verify(h, sig), expected)
+        return expected
+
+    def test(self):
+        key = CECKey()
+        key.set_secretbytes(hashlib.sha256(b'libsecp256k1').digest())
+        key.set_compressed(True)
+        pub = key.get_pubkey()
+        h = hashlib.sha256(b'msg').digest()
+        sig = key.sign(h)
+
+        self.assertTrue(key.verify(h, sig))
+        self.assertTrue(self.verify_both(pub, h, sig))
+        self.assertFalse(self.verify_both(pub, h[::-1], sig))
+        self.assertFalse(self.verify_both(pub, h, b''))
+        self.assertFalse(self.verify_both(b'\x02' + b'\x00' * 32, h, sig))
+
+        # high S signatures are valid by consensus
+        n = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+        rlen = sig[3]
+        r = sig[4:4 + rlen]
+        s = int.from_bytes(sig[6 + rlen:], 'big')
+        high_s = (n - s).to_bytes(33, 'big')
+        high_sig = bytes([0x30, 4 + rlen + 33, 0x02, rlen]) + r + bytes([0x02, 33]) + high_s
+        self.assertTrue(self.verify_both(pub, h, high_sig))
+
+    def test_pubkey_parsed_once(self):
+        key = CECKey()
+        key.set_secretbytes(hashlib.sha256(b'libsecp256k1').digest())
+        pub = CPubKey(key.get_pubkey())
+        h = hashlib.sha256(b'msg').digest()
+        self.assertTrue(pub.verify(h, key.sign(h)))
+        parsed = pub._libsecp256k1_pubkey
+        self.assertTrue(pub.verify(h, key.sign(h)))
+        self.assertIs(pub._libsecp256k1_pubkey, parsed)
+
+    def test_openssl_key_lazy(self):
+        key = CECKey()
+        key.set_secretbytes(hashlib.sha256(b'libsecp256k1').digest())
+        h = hashlib.sha256(b'msg').digest()
+        pub = CPubKey(key.get_pubkey())
+        self.assertTrue(pub.is_fullyvalid)
+        self.assertTrue(pub.verify(h, key.sign(h)))
+        self.assertIsNone(pub._openssl_key)
+        self.assertFalse(CPubKey(b'\x02' + b'\x00' * 32).is_fullyvalid)
+
+        # OpenSSL is still there for what libsecp256k1 does not handle
+        self.assertEqual(pub._cec_key.get_pubkey(), pub)
+        self.assertIsNotNone(pub._openssl_key)
+
+    def test_ceckey_cache(self):
+        key = CECKey()
+        key.set_secretbytes(hashlib.sha256(b'libsecp256k1').digest())
+        pub = key.get_pubkey()
+        h = hashlib.sha256(b'msg').digest()
+        sig = key.sign(h)
+        self.assertTrue(key.verify(h, sig))
+        parsed = key._libsecp256k1_pubkey
+        self.assertTrue(key.verify(h, sig))
+        self.assertIs(key._libsecp256k1_pubkey, parsed)
+
+        # a new key is parsed again
+        key.set_secretbytes(hashlib.sha256(b'other').digest())
+        self.assertFalse(key.verify(h, sig))
+        self.assertTrue(key.verify(h, key.sign(h)))
+        key.set_pubkey(pub)
+        self.assertTrue(key.verify(h, sig))
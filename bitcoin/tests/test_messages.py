@@ -9,12 +9,20 @@
 # propagated, or distributed except according to the terms contained in the
 # LICENSE file.
 
+import random
+import socket
+import struct
 import unittest
 
+import bitcoin
+from bitcoin.core import CBlock, CLazyBlock, COutPoint, CTransaction, CTxIn, CTxOut
+from bitcoin.core.script import CScript
+from bitcoin.core.serialize import Hash
 from bitcoin.messages import msg_version, msg_verack, msg_addr, msg_alert, \
     msg_inv, msg_getdata, msg_getblocks, msg_getheaders, msg_headers, msg_tx, \
     msg_block, msg_getaddr, msg_ping, msg_pong, msg_mempool, MsgSerializable, \
-    msg_notfound, msg_reject
+    msg_notfound, msg_reject, MessageFramer, MSG_HEADER_SIZE
+from bitcoin.net import CInv
 
 import sys
 if sys.version > '3':
@@ -135,3 +143,110 @@ class Test_messages(unittest.TestCase):
         m = msg_verack()
         b = m.to_bytes()
         self.assertEqual(self.verackbytes, b)
+
+
+def make_frame(command, payload):
+    return (bitcoin.params.MESSAGE_START + command.ljust(12, b'\x00') +
+            struct.pack(b'<I', len(payload)) + Hash(payload)[:4] + payload)
+
+
+class Test_MessageFramer(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        txs = [CTransaction([CTxIn(COutPoint(rand.getrandbits(256).to_bytes(32, 'little'), i))],
+                            [CTxOut(i, CScript(b'\x51'))]) for i in range(50)]
+        self.block = msg_block()
+        self.block.block = CBlock(nNonce=1, vtx=txs)
+        self.tx = msg_tx()
+        self.tx.tx = txs[0]
+        inv = msg_inv()
+        inv.inv = [CInv() for _ in range(3)]
+        for i in inv.inv:
+            i.type = 1
+            i.hash = txs[0].GetTxid()
+        self.msgs = [msg_version(), msg_verack(), inv, self.tx, self.block, msg_ping(7), self.block]
+        self.stream = b''.join(m.to_bytes() for m in self.msgs)
+
+    def check_stream(self, framer, stream, expected):
+        rand = random.Random(1)
+        got = []
+        pos = 0
+        while pos < len(stream):
+            n = rand.randint(1, 700)
+            framer.feed(stream[pos:pos + n])
+            pos += n
+            got.extend(m.to_bytes() for m in framer)
+        self.assertEqual(got, [m.to_bytes() for m in expected])
+        self.assertEqual(len(framer), 0)
+
+    def test_chunks(self):
+        for buffer_size in (64, 4096, 1 << 20):
+            self.check_stream(MessageFramer(buffer_size=buffer_size), self.stream, self.msgs)
+
+    def test_unknown_command(self):
+        stream = make_frame(b'sendcmpct', b'\x00' * 9) + self.stream
+        self.check_stream(MessageFramer(buffer_size=256), stream, self.msgs)
+
+        framer = MessageFramer()
+        framer.feed(stream)
+        command, payload = framer.read_frame()
+        self.assertEqual(command, b'sendcmpct')
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual(bytes(payload), b'\x00' * 9)
+        self.assertIsInstance(framer.read_message(), msg_version)
+
+    def test_lazy(self):
+        framer = MessageFramer(buffer_size=1024, lazy=True)
+        framer.feed(self.stream)
+        msgs = list(framer)
+        blocks = [m for m in msgs if isinstance(m, msg_block)]
+        self.assertEqual(len(blocks), 2)
+        for m in blocks:
+            self.assertIsInstance(m.block, CLazyBlock)
+            self.assertIsInstance(m.block._view.obj, bytearray)
+        # the buffer the blocks reference is not reused
+        framer.feed(self.stream)
+        list(framer)
+        for m in blocks:
+            self.assertEqual(m.block.vtx[7].GetTxid(), self.block.block.vtx[7].GetTxid())
+            self.assertEqual(m.block.GetHash(), self.block.block.GetHash())
+
+        # small blocks are copied out
+        framer = MessageFramer(buffer_size=1 << 20, lazy=True)
+        framer.feed(self.block.to_bytes())
+        m = framer.read_message()
+        self.assertIsInstance(m.block._view.obj, bytes)
+        framer.feed(b'\x00' * 100000)
+        self.assertEqual(m.block.serialize(), self.block.block.serialize())
+
+    def test_errors(self):
+        framer = MessageFramer()
+        framer.feed(b'\xf8' + self.stream[1:])
+        with self.assertRaises(ValueError):
+            framer.read_message()
+
+        bad = bytearray(self.tx.to_bytes())
+        bad[-1] ^= 1
+        framer = MessageFramer()
+        framer.feed(bytes(bad))
+        with self.assertRaises(ValueError):
+            framer.read_message()
+
+        # rejected from the header alone
+        framer = MessageFramer(max_size=1000)
+        framer.feed(self.block.to_bytes()[:MSG_HEADER_SIZE])
+        with self.assertRaises(ValueError):
+            framer.read_message()
+
+    def test_receive(self):
+        a, b = socket.socketpair()
+        try:
+            framer = MessageFramer(buffer_size=512)
+            a.sendall(self.stream)
+            a.close()
+            got = []
+            while framer.receive(b):
+                got.extend(framer)
+            self.assertEqual([m.to_bytes() for m in got], [m.to_bytes() for m in self.msgs])
+        finally:
+            b.close()
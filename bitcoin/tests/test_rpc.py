@@ -11,9 +11,405 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import asyncio
+import base64
+import decimal
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
-from bitcoin.rpc import Proxy
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    ThreadingHTTPServer = None
+
+import bitcoin
+from bitcoin.core import CBlock, CLazyBlock, COutPoint, CTransaction, CTxIn, CTxOut, b2lx, b2x
+from bitcoin.core.script import CScript
+from bitcoin.rpc import AsyncProxy, AsyncRawProxy, JSONRPCError, Proxy, RawProxy
+
+
+class JSONRPCHandler(BaseHTTPRequestHandler if ThreadingHTTPServer else object):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with server.lock:
+            server.peers.add(self.client_address)
+            server.requests += 1
+        if server.auth is not None and self.headers.get('Authorization') != server.auth:
+            self.reply(401, b'')
+            return
+        request = json.loads(body)
+        if isinstance(request, list):
+            # a server may answer a batch in any order
+            response = [self.dispatch(r) for r in reversed(request)]
+        else:
+            response = self.dispatch(request)
+        self.reply(200, json.dumps(response).encode())
+        if server.drop:
+            # close without announcing it, as a keep-alive timeout does
+            self.close_connection = True
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.gets += 1
+        if not server.rest:
+            self.reply(404, b'')
+            return
+        resource, _, name = self.path[len('/rest/'):].partition('/')
+        name = name[:-len('.bin')]
+        objects = {'block': server.blocks, 'tx': server.txs}[resource]
+        if name in objects:
+            self.reply(200, bytes.fromhex(objects[name]))
+        else:
+            self.reply(404, ('%s not found\r\n' % name).encode())
+
+    def dispatch(self, request):
+        method, params = request['method'], request['params']
+        if method == 'sleep':
+            time.sleep(params[0])
+            result = params[0]
+        elif method == 'getblockcount':
+            with self.server.lock:
+                self.server.calls += 1
+                result = self.server.calls
+        elif method == 'echo':
+            result = params
+        elif method == 'getblock' and params[0] in self.server.blocks:
+            result = self.server.blocks[params[0]]
+        elif method == 'getblock':
+            return {'result': None, 'error': {'code': -5, 'message': 'Block not found'}, 'id': request['id']}
+        elif method == 'getrawtransaction' and params[0] in self.server.txs:
+            result = self.server.txs[params[0]]
+        elif method == 'getrawtransaction':
+            return {'result': None, 'error': {'code': -5, 'message': 'No such mempool or blockchain transaction'},
+                    'id': request['id']}
+        elif method == 'getblockhash' and params[0] < len(self.server.blocks):
+            result = list(self.server.blocks)[params[0]]
+        elif method == 'getblockhash':
+            return {'result': None, 'error': {'code': -8, 'message': 'Block height out of range'}, 'id': request['id']}
+        else:
+            return {'result': None, 'error': {'code': -32601, 'message': 'Method not found'}, 'id': request['id']}
+        return {'result': result, 'error': None, 'id': request['id']}
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(ThreadingHTTPServer is None, 'http.server.ThreadingHTTPServer not available')
+class JSONRPCServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JSONRPCHandler)
+        self.server.daemon_threads = True
+        # clients that timed out leave broken pipes behind
+        self.server.handle_error = lambda request, client_address: None
+        self.server.lock = threading.Lock()
+        self.server.peers = set()
+        self.server.calls = 0
+        self.server.requests = 0
+        self.server.blocks = {}
+        self.server.txs = {}
+        self.server.gets = 0
+        self.server.rest = True
+        self.server.auth = None
+        self.server.drop = False
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.url = 'http://u:p@127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Test_BaseProxy(JSONRPCServerTestCase):
+    def test_call(self):
+        proxy = RawProxy(self.url)
+        self.assertEqual(proxy.echo(1, 'a', 0.5), [1, 'a', decimal.Decimal('0.5')])
+        self.assertEqual(Proxy(self.url).call('echo', 2), [2])
+        with self.assertRaises(JSONRPCError) as cm:
+            proxy.nosuchmethod()
+        self.assertEqual(cm.exception.error['code'], -32601)
+
+    def test_keepalive(self):
+        proxy = RawProxy(self.url)
+        for i in range(5):
+            self.assertEqual(proxy.getblockcount(), i + 1)
+        self.assertEqual(len(self.server.peers), 1)
+        proxy.close()
+        self.assertEqual(proxy.getblockcount(), 6)
+
+    def test_threads(self):
+        proxy = RawProxy(self.url, max_connections=3)
+        results = []
+
+        def worker(i):
+            results.append((proxy.sleep(0.1), proxy.echo(i)))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(r[1][0] for r in results), list(range(9)))
+        self.assertLessEqual(len(self.server.peers), 3)
+
+    def test_dropped_keepalive(self):
+        self.server.drop = True
+        proxy = RawProxy(self.url)
+        for i in range(3):
+            self.assertEqual(proxy.getblockcount(), i + 1)
+        # not retried, but the connection is usable again afterwards
+        with self.assertRaises(ConnectionError):
+            proxy.echo(1)
+        self.assertEqual(proxy.echo(2), [2])
+
+        proxy = RawProxy(self.url, retries=0)
+        proxy.getblockcount()
+        with self.assertRaises(ConnectionError):
+            proxy.getblockcount()
+
+    def test_timeout(self):
+        proxy = RawProxy(self.url, max_connections=1)
+        with self.assertRaises(socket.timeout):
+            proxy.sleep(0.5, timeout=0.1)
+        self.assertEqual(proxy.sleep(0.1), decimal.Decimal('0.1'))
+
+        t = threading.Thread(target=proxy.sleep, args=(0.5,))
+        t.start()
+        time.sleep(0.1)
+        with self.assertRaises(JSONRPCError) as cm:
+            proxy.echo(1, timeout=0.1)
+        self.assertEqual(cm.exception.error['code'], -341)
+        t.join()
+
+    def test_cookie_reread(self):
+        datadir = tempfile.mkdtemp()
+        try:
+            cookie_dir = datadir
+            if bitcoin.params.NAME != 'mainnet':
+                cookie_dir = os.path.join(datadir, bitcoin.params.NAME)
+                os.mkdir(cookie_dir)
+            conf_file = os.path.join(datadir, 'bitcoin.conf')
+            with open(conf_file, 'w') as fd:
+                fd.write('rpcconnect=127.0.0.1\nrpcport=%d\n' % self.server.server_address[1])
+
+            def set_cookie(authpair):
+                with open(os.path.join(cookie_dir, '.cookie'), 'w') as fd:
+                    fd.write(authpair)
+                self.server.auth = 'Basic ' + base64.b64encode(authpair.encode()).decode()
+
+            set_cookie('__cookie__:1')
+            proxy = Proxy(btc_conf_file=conf_file)
+            self.assertEqual(proxy.call('echo', 1), [1])
+            # node restarted with a new cookie
+            set_cookie('__cookie__:2')
+            self.assertEqual(proxy.call('echo', 2), [2])
+
+            proxy = Proxy(btc_conf_file=conf_file, reread_cookie=False)
+            set_cookie('__cookie__:3')
+            with self.assertRaises(JSONRPCError):
+                proxy.call('echo', 3)
+            proxy = Proxy(btc_conf_file=conf_file)
+
+            self.server.auth = 'Basic x'
+            with self.assertRaises(JSONRPCError) as cm:
+                proxy.call('echo', 3)
+            self.assertEqual(cm.exception.error['code'], -342)
+        finally:
+            shutil.rmtree(datadir)
+
+class Test_batch(JSONRPCServerTestCase):
+    def setUp(self):
+        super(Test_batch, self).setUp()
+        self.blocks = [CBlock(nNonce=i) for i in range(5)]
+        self.server.blocks = {b2lx(b.GetHash()): b2x(b.serialize()) for b in self.blocks}
+
+    def test_raw(self):
+        proxy = RawProxy(self.url, max_connections=2)
+        self.assertEqual(proxy.batch([('echo', i, 'a') for i in range(250)]),
+                         [[i, 'a'] for i in range(250)])
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(proxy.batch([]), [])
+
+        results = proxy.batch([('echo', 1), ('nosuchmethod',), ('getblockcount',)], return_errors=True)
+        self.assertEqual(results[0], [1])
+        self.assertIsInstance(results[1], JSONRPCError)
+        self.assertEqual(results[1].error['code'], -32601)
+        self.assertEqual(results[2], 1)
+        with self.assertRaises(JSONRPCError):
+            proxy.batch([('echo', 1), ('nosuchmethod',)])
+
+    def test_typed(self):
+        proxy = Proxy(self.url)
+        missing = b'\x01' * 32
+        with proxy.batch(chunk_size=2) as b:
+            calls = [b.getblock(block.GetHash()) for block in self.blocks]
+            calls.append(b.getblock(missing))
+            hashes = [b.getblockhash(i) for i in (0, 4, 5)]
+            raw = b.call('echo', 1)
+            self.assertEqual(len(b), 10)
+        self.assertEqual(self.server.requests, 5)
+        for call, block in zip(calls, self.blocks):
+            self.assertEqual(call.result().GetHash(), block.GetHash())
+        with self.assertRaises(IndexError):
+            calls[-1].result()
+        self.assertEqual([h.result() for h in hashes[:2]], [self.blocks[0].GetHash(), self.blocks[4].GetHash()])
+        self.assertIsInstance(hashes[2].exception(), IndexError)
+        self.assertEqual(raw.result(), [1])
+
+        results = proxy.batch([('getblockhash', 1), ('getblockhash', 9), ('getblockcount',)], return_errors=True)
+        self.assertEqual(results[0], self.blocks[1].GetHash())
+        self.assertIsInstance(results[1], IndexError)
+        self.assertEqual(results[2], 1)
+
+    def test_not_sent(self):
+        proxy = Proxy(self.url)
+        with self.assertRaises(ValueError):
+            with proxy.batch() as b:
+                call = b.getblockcount()
+                raise ValueError
+        self.assertEqual(self.server.requests, 0)
+        with self.assertRaises(RuntimeError):
+            call.result()
+        b.send()
+        self.assertEqual(call.result(), 1)
+
+class Test_AsyncProxy(JSONRPCServerTestCase):
+    def setUp(self):
+        super(Test_AsyncProxy, self).setUp()
+        self.blocks = [CBlock(nNonce=i) for i in range(5)]
+        self.server.blocks = {b2lx(b.GetHash()): b2x(b.serialize()) for b in self.blocks}
+
+    def test_call(self):
+        async def run():
+            async with AsyncRawProxy(self.url) as proxy:
+                self.assertEqual(await proxy.echo(1, 'a', 0.5), [1, 'a', decimal.Decimal('0.5')])
+                with self.assertRaises(JSONRPCError) as cm:
+                    await proxy.nosuchmethod()
+                self.assertEqual(cm.exception.error['code'], -32601)
+                for i in range(3):
+                    self.assertEqual(await proxy.getblockcount(), i + 1)
+
+            async with AsyncProxy(self.url) as proxy:
+                block = await proxy.getblock(self.blocks[2].GetHash())
+                self.assertEqual(block.GetHash(), self.blocks[2].GetHash())
+                with self.assertRaises(IndexError):
+                    await proxy.getblock(b'\x01' * 32)
+                self.assertEqual(await proxy.getblockhash(1), self.blocks[1].GetHash())
+                self.assertEqual(await proxy.call('echo', 2), [2])
+        asyncio.run(run())
+        self.assertEqual(len(self.server.peers), 2)
+
+    def test_concurrency(self):
+        async def run():
+            async with AsyncRawProxy(self.url, max_connections=4) as proxy:
+                return await asyncio.gather(*(proxy.echo(i) for i in range(100)),
+                                            *(proxy.sleep(0.05) for i in range(8)))
+        results = asyncio.run(run())
+        self.assertEqual(results[:100], [[i] for i in range(100)])
+        self.assertLessEqual(len(self.server.peers), 4)
+
+    def test_created_outside_loop(self):
+        raw_proxy = AsyncRawProxy(self.url, max_connections=2)
+        proxy = AsyncProxy(self.url, max_connections=2)
+
+        async def run():
+            async with raw_proxy, proxy:
+                return await asyncio.gather(*(raw_proxy.sleep(0.05) for i in range(6)),
+                                            *(proxy.call('echo', i) for i in range(6)))
+        results = asyncio.run(run())
+        self.assertEqual(results, [decimal.Decimal('0.05')] * 6 + [[i] for i in range(6)])
+        self.assertLessEqual(len(self.server.peers), 4)
+
+    def test_dropped_keepalive(self):
+        self.server.drop = True
+
+        async def run():
+            async with AsyncRawProxy(self.url) as proxy:
+                for i in range(3):
+                    self.assertEqual(await proxy.getblockcount(), i + 1)
+                with self.assertRaises(ConnectionError):
+                    await proxy.echo(1)
+                self.assertEqual(await proxy.echo(2), [2])
+        asyncio.run(run())
+
+    def test_timeout(self):
+        async def run():
+            async with AsyncRawProxy(self.url, max_connections=1) as proxy:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await proxy.sleep(0.5, timeout=0.1)
+                self.assertEqual(await proxy.sleep(0.1), decimal.Decimal('0.1'))
+        asyncio.run(run())
+
+    def test_batch(self):
+        async def run():
+            async with AsyncProxy(self.url) as proxy:
+                return await proxy.batch([('getblock', b.GetHash()) for b in self.blocks] +
+                                         [('getblockhash', 9), ('call', 'echo', 1)],
+                                         return_errors=True, chunk_size=3)
+        results = asyncio.run(run())
+        self.assertEqual([r.GetHash() for r in results[:5]], [b.GetHash() for b in self.blocks])
+        self.assertIsInstance(results[5], IndexError)
+        self.assertEqual(results[6], [1])
+        self.assertEqual(self.server.requests, 3)
+
+
+class Test_rest(JSONRPCServerTestCase):
+    def setUp(self):
+        super(Test_rest, self).setUp()
+        self.txs = [CTransaction([CTxIn(COutPoint(b'\x01' * 32, i))], [CTxOut(i, CScript(b'\x51'))])
+                    for i in range(3)]
+        self.blocks = [CBlock(nNonce=i, vtx=[tx]) for i, tx in enumerate(self.txs)]
+        self.server.blocks = {b2lx(b.GetHash()): b2x(b.serialize()) for b in self.blocks}
+        self.server.txs = {b2lx(tx.GetTxid()): b2x(tx.serialize()) for tx in self.txs}
+
+    def check(self, proxy):
+        for block in self.blocks:
+            self.assertEqual(proxy.getblock(block.GetHash()).serialize(), block.serialize())
+        lazy = proxy.getblock(self.blocks[1].GetHash(), lazy=True)
+        self.assertIsInstance(lazy, CLazyBlock)
+        self.assertEqual(lazy.vtx[0].GetTxid(), self.txs[1].GetTxid())
+        tx = self.txs[2]
+        self.assertEqual(proxy.getrawtransaction(tx.GetTxid()).serialize(), tx.serialize())
+        with self.assertRaises(IndexError):
+            proxy.getblock(b'\x02' * 32)
+        with self.assertRaises(IndexError):
+            proxy.getrawtransaction(b'\x02' * 32)
+
+    def test(self):
+        self.check(Proxy(self.url, rest=True))
+        self.assertEqual(self.server.gets, 7)
+        # only the missing objects were looked up over JSON-RPC as well
+        self.assertEqual(self.server.requests, 2)
+
+    def test_disabled(self):
+        self.check(Proxy(self.url))
+        self.assertEqual(self.server.gets, 0)
+
+        self.server.rest = False
+        self.server.requests = 0
+        self.check(Proxy(self.url, rest=True))
+        # one attempt per endpoint
+        self.assertEqual(self.server.gets, 2)
+        self.assertEqual(self.server.requests, 7)
+
 
 class Test_RPC(unittest.TestCase):
     # Tests disabled, see discussion below.
@@ -435,3 +435,115 @@ class Test_IsLowDERSignature(unittest.TestCase):
     def test_low_s_value(self):
         sig = x('3045022100b135074e08cc93904a1712b2600d3cb01899a5b1cc7498caa4b8585bcf5f27e7022074ab544045285baef0a63f0fb4c95e577dcbf5c969c0bf47c7da8e478909d669')
         self.assertTrue(IsLowDERSignature(sig))
+
+def _reference_raw_signature_hash(script, txTo, inIdx, hashtype):
+    """Legacy signature hash computed from a modified copy of txTo"""
+    import struct
+    import bitcoin.core
+
+    HASH_ONE = b'\x01' + b'\x00'*31
+    if inIdx >= len(txTo.vin):
+        return (HASH_ONE, "inIdx %d out of range (%d)" % (inIdx, len(txTo.vin)))
+    txtmp = bitcoin.core.CMutableTransaction.from_tx(txTo)
+
+    for txin in txtmp.vin:
+        txin.scriptSig = b''
+    txtmp.vin[inIdx].scriptSig = FindAndDelete(script, CScript([OP_CODESEPARATOR]))
+
+    if (hashtype & 0x1f) == SIGHASH_NONE:
+        txtmp.vout = []
+        for i in range(len(txtmp.vin)):
+            if i != inIdx:
+                txtmp.vin[i].nSequence = 0
+
+    elif (hashtype & 0x1f) == SIGHASH_SINGLE:
+        if inIdx >= len(txtmp.vout):
+            return (HASH_ONE, "outIdx %d out of range (%d)" % (inIdx, len(txtmp.vout)))
+        tmp = txtmp.vout[inIdx]
+        txtmp.vout = [bitcoin.core.CTxOut() for i in range(inIdx)] + [tmp]
+        for i in range(len(txtmp.vin)):
+            if i != inIdx:
+                txtmp.vin[i].nSequence = 0
+
+    if hashtype & SIGHASH_ANYONECANPAY:
+        txtmp.vin = [txtmp.vin[inIdx]]
+
+    txtmp.wit = bitcoin.core.CTxWitness()
+    s = txtmp.serialize() + struct.pack(b"<i", hashtype)
+    return (bitcoin.core.Hash(s), None)
+
+class Test_RawSignatureHash(unittest.TestCase):
+    HASHTYPES = (0, SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE, 4,
+                 SIGHASH_ALL | SIGHASH_ANYONECANPAY,
+                 SIGHASH_NONE | SIGHASH_ANYONECANPAY,
+                 SIGHASH_SINGLE | SIGHASH_ANYONECANPAY)
+
+    def check_tx(self, script, tx):
+        cache = PrecomputedTransactionData(tx)
+        for inIdx in range(len(tx.vin) + 1):
+            for hashtype in self.HASHTYPES:
+                expected = _reference_raw_signature_hash(script, tx, inIdx, hashtype)
+                self.assertEqual(RawSignatureHash(script, tx, inIdx, hashtype), expected)
+                self.assertEqual(RawSignatureHash(script, tx, inIdx, hashtype, cache), expected)
+
+    def test_script_vectors(self):
+        from bitcoin.tests.test_scripteval import load_test_vectors, Test_EvalScript
+        create_test_txs = Test_EvalScript('test_script_valid').create_test_txs
+        for name in ('script_valid.json', 'script_invalid.json'):
+            for scriptSig, scriptPubKey, flags, comment, test_case in load_test_vectors(name):
+                (txCredit, txSpend) = create_test_txs(scriptSig, scriptPubKey)
+                try:
+                    FindAndDelete(scriptPubKey, CScript([OP_CODESEPARATOR]))
+                except CScriptInvalidError:
+                    continue
+                self.check_tx(scriptPubKey, txSpend)
+
+    def test_tx_vectors(self):
+        from bitcoin.tests.test_transactions import load_test_vectors
+        for name in ('tx_valid.json', 'tx_invalid.json'):
+            for prevouts, tx, enforceP2SH in load_test_vectors(name):
+                for script in prevouts.values():
+                    try:
+                        FindAndDelete(script, CScript([OP_CODESEPARATOR]))
+                    except CScriptInvalidError:
+                        continue
+                    self.check_tx(script, tx)
+
+
+class Test_ClassifyScriptPubKey(unittest.TestCase):
+    def test_templates(self):
+        h20 = b'\x11' * 20
+        h32 = b'\x22' * 32
+        T = lambda *ops: CScript(ops)
+        cases = (
+            (T(OP_DUP, OP_HASH160, h20, OP_EQUALVERIFY, OP_CHECKSIG), (TX_PUBKEYHASH, h20)),
+            (T(OP_HASH160, h20, OP_EQUAL), (TX_SCRIPTHASH, h20)),
+            (T(OP_0, h20), (TX_WITNESS_V0_KEYHASH, h20)),
+            (T(OP_0, h32), (TX_WITNESS_V0_SCRIPTHASH, h32)),
+
+            # wrong opcodes, lengths or non-canonical pushes
+            (T(OP_DUP, OP_HASH160, h20, OP_EQUALVERIFY, OP_CHECKSIGVERIFY), (TX_NONSTANDARD, None)),
+            (T(OP_DUP, OP_HASH160, h20 + b'\x00', OP_EQUALVERIFY, OP_CHECKSIG), (TX_NONSTANDARD, None)),
+            (CScript(x('76a94c14') + h20 + x('88ac')), (TX_NONSTANDARD, None)),
+            (T(OP_HASH160, h20, OP_EQUALVERIFY), (TX_NONSTANDARD, None)),
+            (T(OP_1, h32), (TX_NONSTANDARD, None)),
+            (T(OP_0, h32[:31]), (TX_NONSTANDARD, None)),
+            (T(b'\x02' * 33, OP_CHECKSIG), (TX_NONSTANDARD, None)),
+            (CScript(), (TX_NONSTANDARD, None)),
+        )
+        for script, expected in cases:
+            self.assertEqual(ClassifyScriptPubKey(script), expected)
+            self.assertEqual(ClassifyScriptPubKey(bytes(script)), expected)
+            self.assertEqual(ClassifyScriptPubKey(memoryview(bytes(script))), expected)
+        self.assertEqual(ClassifyScriptPubKeys([s for s, _ in cases]), [e for _, e in cases])
+        self.assertIs(type(ClassifyScriptPubKey(cases[0][0])[1]), bytes)
+
+    def test_block(self):
+        from bitcoin.core import CBlock, CTransaction, CTxIn, CTxOut
+        h20 = b'\x33' * 20
+        txs = [CTransaction([CTxIn()], [CTxOut(1, CScript([OP_RETURN]))]),
+               CTransaction([CTxIn()], []),
+               CTransaction([CTxIn()], [CTxOut(1, CScript([OP_0, h20])), CTxOut(1, CScript([OP_HASH160, h20, OP_EQUAL]))])]
+        self.assertEqual(ClassifyBlockOutputs(CBlock(vtx=txs)),
+                         [[(TX_NONSTANDARD, None)], [],
+                          [(TX_WITNESS_V0_KEYHASH, h20), (TX_SCRIPTHASH, h20)]])
@@ -11,6 +11,8 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import concurrent.futures
+import hashlib
 import json
 import os
 import unittest
@@ -21,6 +23,7 @@ if sys.version > '3':
 
 from binascii import unhexlify
 
+import bitcoin.core.scripteval
 from bitcoin.core import *
 from bitcoin.core.script import *
 from bitcoin.core.scripteval import *
@@ -113,3 +116,291 @@ class Test_EvalScript(unittest.TestCase):
                 continue
 
             self.fail('Expected %r to fail' % test_case)
+
+
+    def test_codeseparator_witness_v0(self):
+        # BIP143 P2WSH example with OP_CODESEPARATOR, the signatures are not
+        # checked, only the signature hashes they are checked against
+        tx = CTransaction.deserialize(x('0100000002fe3dc9208094f3ffd12645477b3dc56f60ec4fa8e6f5d67c565d1c6b9216b36e0000000000ffffffff0815cf020f013ed6cf91d29f4202e8a58726b1ac6c79da47c23d1bee0a6925f80000000000ffffffff0100f2052a010000001976a914a30741f8145e5acadf23f751864167f32e0963f788ac00000000'))
+        witnessScript = CScript(x('21026dccc749adc2a9d0d89497ac511f760f45c47dc5ed9cf352a58ac706453880aeadab210255a9626aebf5e29c0e6538428ba0d1dcf6ca98ffdf086aa8ced5e0d0215ea465ac'))
+        amount = int(49*COIN)
+
+        hashes = []
+        class RecordingCache(SignatureCache):
+            def verify(self, h, pubkey, sig):
+                hashes.append(h)
+                return True
+
+        orig_cache = bitcoin.core.scripteval.signature_cache
+        bitcoin.core.scripteval.signature_cache = RecordingCache()
+        try:
+            sig = b'\x30' + bytes([SIGHASH_SINGLE])
+            stack = [sig, sig]
+            EvalScript(stack, witnessScript, tx, 1, amount=amount, sigversion=SIGVERSION_WITNESS_V0)
+        finally:
+            bitcoin.core.scripteval.signature_cache = orig_cache
+        self.assertEqual(stack, [b'\x01'])
+        self.assertEqual(hashes, [x('82dde6e4f1e94d02c2b7ad03d2115d691f48d064e9d52f58194a6637e4194391'),
+                                  x('fef7bd749cce710c5c052bd796df1af0d935e59cea63736268bcbe2d2134fc47')])
+
+
+class Test_SignatureCache(unittest.TestCase):
+    PUBKEY = unhexlify(b'0378d430274f8c5ec1321338151e9f27f4c676a008bdf8638d07c0b6be9ab35c71')
+
+    def test_add_contains(self):
+        cache = SignatureCache()
+        h = b'\x11'*32
+        self.assertFalse(cache.contains(h, self.PUBKEY, b'\x30sig'))
+        cache.add(h, self.PUBKEY, b'\x30sig')
+        self.assertTrue(cache.contains(h, self.PUBKEY, b'\x30sig'))
+        self.assertFalse(cache.contains(h, self.PUBKEY, b'\x30sih'))
+        self.assertFalse(cache.contains(b'\x12'*32, self.PUBKEY, b'\x30sig'))
+        # pubkey and sig boundary is part of the entry
+        self.assertFalse(cache.contains(h, self.PUBKEY + b'\x30', b'sig'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['hit_rate'], 0.2)
+
+        # known signatures are not verified again
+        self.assertTrue(cache.verify(h, self.PUBKEY, b'\x30sig'))
+        self.assertEqual(cache.stats()['pubkey_misses'], 0)
+
+        cache.clear()
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertFalse(cache.contains(h, self.PUBKEY, b'\x30sig'))
+
+    def test_bounded(self):
+        cache = SignatureCache(max_entries=10)
+        for i in range(20):
+            cache.add(bytes([i])*32, self.PUBKEY, b'sig')
+        # least recently used entries are evicted first
+        cache.contains(b'\x0a'*32, self.PUBKEY, b'sig')
+        cache.add(b'\xff'*32, self.PUBKEY, b'sig')
+        self.assertEqual(cache.stats()['entries'], 10)
+        self.assertTrue(cache.contains(b'\x0a'*32, self.PUBKEY, b'sig'))
+        self.assertFalse(cache.contains(b'\x0b'*32, self.PUBKEY, b'sig'))
+        self.assertTrue(cache.contains(b'\x13'*32, self.PUBKEY, b'sig'))
+
+    def test_get_key(self):
+        cache = SignatureCache(max_pubkeys=1)
+        key = cache.get_key(self.PUBKEY)
+        self.assertEqual(key, self.PUBKEY)
+        self.assertTrue(key.is_fullyvalid)
+        self.assertIs(cache.get_key(self.PUBKEY), key)
+
+        # invalid keys are not cached
+        invalid = b'\x02' + b'\x00'*32
+        self.assertIsNot(cache.get_key(invalid), cache.get_key(invalid))
+
+        stats = cache.stats()
+        self.assertEqual(stats['pubkeys'], 1)
+        self.assertEqual(stats['pubkey_hits'], 1)
+        self.assertEqual(stats['pubkey_misses'], 3)
+
+    def test_verify_script(self):
+        from bitcoin.wallet import CKey
+
+        key = CKey(hashlib.sha256(b'sigcache').digest())
+        scriptPubKey = CScript([key.pub, OP_CHECKSIG])
+        txCredit, txSpend = Test_EvalScript('test_script_valid').create_test_txs(CScript(), scriptPubKey)
+        txSpend = CMutableTransaction.from_tx(txSpend)
+        h = SignatureHash(scriptPubKey, txSpend, 0, SIGHASH_ALL)
+        txSpend.vin[0].scriptSig = CScript([key.sign(h) + bytes([SIGHASH_ALL])])
+
+        cache = SignatureCache()
+        orig_cache = bitcoin.core.scripteval.signature_cache
+        bitcoin.core.scripteval.signature_cache = cache
+        try:
+            VerifyScript(txSpend.vin[0].scriptSig, scriptPubKey, txSpend, 0)
+            self.assertEqual(cache.stats()['entries'], 1)
+            VerifyScript(txSpend.vin[0].scriptSig, scriptPubKey, txSpend, 0)
+            self.assertEqual(cache.stats()['hits'], 1)
+
+            # invalid signatures are not cached
+            txSpend.nLockTime = 1
+            with self.assertRaises(ValidationError):
+                VerifyScript(txSpend.vin[0].scriptSig, scriptPubKey, txSpend, 0)
+            self.assertEqual(cache.stats()['entries'], 1)
+        finally:
+            bitcoin.core.scripteval.signature_cache = orig_cache
+
+
+class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self, max_workers):
+        super(RecordingExecutor, self).__init__(max_workers)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super(RecordingExecutor, self).submit(*args, **kwargs)
+
+
+class Test_VerifyScripts(unittest.TestCase):
+    # scripts without signatures so that no EC maths is involved
+    SPK = CScript([OP_ADD, 5, OP_EQUAL])
+
+    def setUp(self):
+        # the test blocks are far smaller than what is worth parallelizing
+        orig = bitcoin.core.scripteval.PARALLEL_MIN_INPUTS
+        self.addCleanup(setattr, bitcoin.core.scripteval, 'PARALLEL_MIN_INPUTS', orig)
+        bitcoin.core.scripteval.PARALLEL_MIN_INPUTS = 1
+
+    def make_block(self, n_tx=5, n_in=4):
+        prevouts = {}
+        vtx = [CTransaction([CTxIn(COutPoint(), CScript([OP_0, OP_0]))], [CTxOut(0, self.SPK)])]
+        for i in range(n_tx):
+            vin = []
+            for j in range(n_in):
+                prevout = COutPoint(Hash(bytes([i, j])), j)
+                prevouts[prevout] = self.SPK
+                vin.append(CTxIn(prevout, CScript([2, 3])))
+            vtx.append(CTransaction(vin, [CTxOut(0, self.SPK)]))
+        # spends an output created earlier in the block
+        vtx.append(CTransaction([CTxIn(COutPoint(vtx[1].GetTxid(), 0), CScript([1, 4]))], [CTxOut(0, self.SPK)]))
+        return CBlock(vtx=vtx), prevouts
+
+    def replace_scriptSig(self, block, tx_index, inIdx, scriptSig):
+        tx = CMutableTransaction.from_tx(block.vtx[tx_index])
+        tx.vin[inIdx].scriptSig = scriptSig
+        vtx = list(block.vtx)
+        vtx[tx_index] = CTransaction.from_tx(tx)
+        return CBlock(vtx=vtx)
+
+    def test_valid(self):
+        block, prevouts = self.make_block()
+        for max_workers in (1, 2):
+            VerifyBlockScripts(block, prevouts, flags={SCRIPT_VERIFY_P2SH}, max_workers=max_workers)
+            VerifyTransactionInputs(block.vtx[1], prevouts, max_workers=max_workers)
+
+    def test_first_failure_reported(self):
+        block, prevouts = self.make_block()
+        block = self.replace_scriptSig(block, 4, 3, CScript([2, 2]))
+        block = self.replace_scriptSig(block, 2, 1, CScript([1, 1]))
+        for max_workers in (1, 2, 3):
+            with self.assertRaises(VerifyInputError) as cm:
+                VerifyBlockScripts(block, prevouts, max_workers=max_workers)
+            self.assertEqual(cm.exception.tx_index, 2)
+            self.assertEqual(cm.exception.inIdx, 1)
+            self.assertEqual(cm.exception.txid, block.vtx[2].GetTxid())
+            self.assertIn('scriptPubKey returned false', str(cm.exception))
+
+        with self.assertRaises(VerifyInputError) as cm:
+            VerifyTransactionInputs(block.vtx[4], prevouts, max_workers=2)
+        self.assertEqual(cm.exception.tx_index, 0)
+        self.assertEqual(cm.exception.inIdx, 3)
+
+    def test_in_process(self):
+        block, prevouts = self.make_block(n_tx=4, n_in=4)
+        with RecordingExecutor(2) as executor:
+            VerifyBlockScripts(block, prevouts, executor=executor)
+            self.assertGreater(executor.submitted, 1)
+
+            executor.submitted = 0
+            bitcoin.core.scripteval.PARALLEL_MIN_INPUTS = 18
+            VerifyBlockScripts(block, prevouts, executor=executor)
+            self.assertEqual(executor.submitted, 0)
+            with self.assertRaises(VerifyInputError):
+                VerifyBlockScripts(self.replace_scriptSig(block, 3, 1, CScript([1, 1])), prevouts, executor=executor)
+            self.assertEqual(executor.submitted, 0)
+
+        # without an executor no pool is started unless asked for
+        orig = concurrent.futures.ProcessPoolExecutor
+        def fail(*args, **kwargs):
+            raise AssertionError('process pool started')
+        concurrent.futures.ProcessPoolExecutor = fail
+        try:
+            bitcoin.core.scripteval.PARALLEL_MIN_INPUTS = 1
+            VerifyBlockScripts(block, prevouts)
+            VerifyTransactionInputs(block.vtx[1], prevouts)
+        finally:
+            concurrent.futures.ProcessPoolExecutor = orig
+
+    def test_witness_program(self):
+        from bitcoin.wallet import CKey
+
+        key = CKey(hashlib.sha256(b'witness').digest())
+        p2wpkh = CScript([OP_0, Hash160(key.pub)])
+        # a valid signature, but of the wrong hash
+        witness = CTxInWitness(CScriptWitness([key.sign(b'\x00' * 32) + bytes([SIGHASH_ALL]), key.pub]))
+        prevouts = {COutPoint(Hash(b'p2wpkh'), 0): p2wpkh,
+                    COutPoint(Hash(b'p2sh-p2wpkh'), 0): p2wpkh.to_p2sh_scriptPubKey()}
+        scriptSigs = [CScript(), CScript([p2wpkh])]
+        for prevout, scriptSig in zip(prevouts, scriptSigs):
+            tx = CTransaction([CTxIn(COutPoint(Hash(b'legacy'), 0), CScript([2, 3])),
+                               CTxIn(prevout, scriptSig)],
+                              [CTxOut(0, self.SPK)],
+                              witness=CTxWitness([CTxInWitness(), witness]))
+            all_prevouts = dict(prevouts)
+            all_prevouts[tx.vin[0].prevout] = self.SPK
+            coinbase = CTransaction([CTxIn(COutPoint(), CScript([OP_0, OP_0]))], [CTxOut(0, self.SPK)])
+            block = CBlock(vtx=[coinbase, tx])
+            for max_workers in (1, 2):
+                with self.assertRaises(VerifyInputError) as cm:
+                    VerifyTransactionInputs(tx, all_prevouts, flags={SCRIPT_VERIFY_P2SH}, max_workers=max_workers)
+                self.assertEqual(cm.exception.inIdx, 1)
+                self.assertIn('witness program', str(cm.exception))
+                with self.assertRaises(VerifyInputError) as cm:
+                    VerifyBlockScripts(block, all_prevouts, flags={SCRIPT_VERIFY_P2SH}, max_workers=max_workers)
+                self.assertEqual((cm.exception.tx_index, cm.exception.inIdx), (1, 1))
+
+        # P2SH redeeming a script that is not a witness program is verified
+        redeemScript = CScript([OP_ADD, 5, OP_EQUAL])
+        tx = CTransaction([CTxIn(COutPoint(Hash(b'p2sh'), 0), CScript([2, 3, redeemScript]))], [CTxOut(0, self.SPK)])
+        VerifyTransactionInputs(tx, {tx.vin[0].prevout: redeemScript.to_p2sh_scriptPubKey()}, flags={SCRIPT_VERIFY_P2SH})
+
+    def test_missing_prevout(self):
+        block, prevouts = self.make_block()
+        del prevouts[block.vtx[3].vin[2].prevout]
+        for max_workers in (1, 2):
+            with self.assertRaises(VerifyInputError) as cm:
+                VerifyBlockScripts(block, prevouts, max_workers=max_workers)
+            self.assertEqual((cm.exception.tx_index, cm.exception.inIdx), (3, 2))
+            self.assertIn('not found', str(cm.exception))
+
+
+class Test_CompileScript(unittest.TestCase):
+    def test_compile(self):
+        script = CScript([OP_1, OP_IF, b'\xaa', OP_ELSE, OP_DUP, OP_ELSE, OP_ENDIF, OP_NOTIF, OP_16])
+        compiled = CompiledScript(script)
+        self.assertEqual(compiled.ops, (OP_1, OP_IF, 1, OP_ELSE, OP_DUP, OP_ELSE, OP_ENDIF, OP_NOTIF, OP_16))
+        self.assertEqual(compiled.pcs, (0, 1, 2, 4, 5, 6, 7, 8, 9))
+        self.assertEqual(compiled.data, (None, None, b'\xaa', None, None, None, None, None, None))
+        self.assertEqual(compiled.pushes, (b'\x01', None, b'\xaa', None, None, None, None, None, b'\x10'))
+        self.assertEqual(compiled.opcounts, (0, 0, 1, 1, 2, 3, 4, 5, 6, 6))
+        self.assertEqual(compiled.jumps, (None, 3, None, 5, None, 6, None, 9, None))
+        self.assertIsNone(compiled.errors)
+        self.assertIsNone(compiled.error)
+
+    def test_errors(self):
+        compiled = CompiledScript(CScript(bytes(CScript([OP_0, OP_IF, OP_CAT, OP_ENDIF, b'\x00' * 521])) + b'\x02\x00'))
+        self.assertIsNone(compiled.jumps)
+        self.assertEqual(compiled.errors[:2], (None, None))
+        self.assertEqual(compiled.errors[2], (EvalScriptError, ('opcode OP_CAT is disabled',)))
+        self.assertEqual(compiled.errors[4][0], EvalScriptError)
+        self.assertEqual(compiled.error, (CScriptTruncatedPushDataError, ('PUSHDATA(2): truncated data', b'\x00')))
+
+    def test_cache(self):
+        scriptPubKey = CScript([OP_DUP, OP_HASH160, b'\x11' * 20, OP_EQUALVERIFY, OP_CHECKSIG])
+        self.assertIs(CompileScript(scriptPubKey), CompileScript(scriptPubKey))
+        # push only scripts, i.e. scriptSigs, are not cached
+        scriptSig = CScript([b'\x30' * 71, b'\x02' * 33])
+        self.assertIsNot(CompileScript(scriptSig), CompileScript(scriptSig))
+
+    def test_skipped_branch(self):
+        # opcodes in untaken branches count towards the limit
+        tx = CTransaction([CTxIn()], [CTxOut()])
+        script = CScript([OP_0, OP_IF] + [OP_NOP] * (MAX_SCRIPT_OPCODES - 2) + [OP_ENDIF, OP_1])
+        stack = []
+        EvalScript(stack, script, tx, 0)
+        self.assertEqual(stack, [b'\x01'])
+        with self.assertRaises(MaxOpCountError):
+            EvalScript([], CScript([OP_NOP] + list(script)), tx, 0)
+
+        stack = []
+        EvalScript(stack, CScript([OP_1, OP_IF, OP_2, OP_ELSE, OP_RETURN, OP_ELSE, OP_3, OP_ENDIF]), tx, 0)
+        self.assertEqual(stack, [b'\x02', b'\x03'])
+        with self.assertRaises(EvalScriptError):
+            EvalScript([], CScript([OP_0, OP_IF, OP_1, OP_ELSE, OP_RETURN, OP_ENDIF]), tx, 0)
@@ -115,6 +115,20 @@ class Test_Segwit(unittest.TestCase):
                 0, SIGHASH_SINGLE|SIGHASH_ANYONECANPAY, value, SIGVERSION_WITNESS_V0),
             x('511e8e52ed574121fc1b654970395502128263f62662e076dc6baf05c2e6a99b'))
 
+    def test_signaturehash_precomputed(self):
+        unsigned_tx   = x('010000000136641869ca081e70f394c6948e8af409e18b619df2ed74aa106c1ca29787b96e0100000000ffffffff0200e9a435000000001976a914389ffce9cd9ae88dcc0631e88a821ffdbe9bfe2688acc0832f05000000001976a9147480a33f950689af511e6e84c138dbbd3c3ee41588ac00000000')
+        value        = int(9.87654321*COIN)
+        witnessscript= CScript(x('56210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba32103b28f0c28bfab54554ae8c658ac5c3e0ce6e79ad336331f78c428dd43eea8449b21034b8113d703413d57761b8b9781957b8c0ac1dfe69f492580ca4195f50376ba4a21033400f6afecb833092a9a21cfdf1ed1376e58c5d1f47de74683123987e967a8f42103a6d48b1131e94ba04d9737d61acdaa1322008af9602b3b14862c07a1789aac162102d8b661b0b3302ee2f162b09e07a55ad5dfbe673a9f01d9f0c19617681024306b56ae'))
+
+        tx = CTransaction.deserialize(unsigned_tx)
+        txdata = PrecomputedTransactionData(tx)
+        for hashtype in (SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE):
+            for anyonecanpay in (0, SIGHASH_ANYONECANPAY):
+                self.assertEqual(SignatureHash(witnessscript, tx, 0, hashtype | anyonecanpay, value,
+                                               SIGVERSION_WITNESS_V0, cache=txdata),
+                                 SignatureHash(witnessscript, tx, 0, hashtype | anyonecanpay, value,
+                                               SIGVERSION_WITNESS_V0))
+
     def test_checkblock(self):
         # (No witness) coinbase generated by Bitcoin Core
         str_coinbase = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff03520101ffffffff0100f2052a01000000232102960c90bc04a631cb17922e4f5d80ac75fd590a88b8baaa5a3d5086ac85e4d788ac00000000'
@@ -11,7 +11,7 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import unittest, random
+import struct, unittest, random
 
 from binascii import unhexlify
 
@@ -107,6 +107,35 @@ class Test_BytesSerializer(unittest.TestCase):
         T(b'0200')
         T(b'ff00000000000000ff11223344', SerializationError) # > max_size
 
+class Test_BytesCursor(unittest.TestCase):
+    def test_read(self):
+        for buf in (b'\x01\x02\x03\x04', bytearray(b'\x01\x02\x03\x04'), memoryview(b'\x01\x02\x03\x04')):
+            f = BytesCursor(buf)
+            self.assertEqual(f.peek(2), b'\x01\x02')
+            self.assertEqual(f.tell(), 0)
+            self.assertEqual(f.read(1), b'\x01')
+            self.assertIsInstance(f.read(1), bytes)
+            self.assertEqual(f.remaining(), 2)
+            f.seek(-1, 1)
+            self.assertEqual(f.read(), b'\x02\x03\x04')
+            self.assertEqual(f.read(1), b'')
+
+    def test_unpack(self):
+        st = struct.Struct(b'<HI')
+        f = BytesCursor(unhexlify(b'0100020000000300'))
+        self.assertEqual(ser_unpack(f, st), (1, 2))
+        self.assertEqual(f.tell(), 6)
+        with self.assertRaises(SerializationTruncationError):
+            ser_unpack(f, st)
+
+    def test_matches_stream(self):
+        import io
+        for value in (b'', b'\x00'*0xfc, b'\x01'*0xfd, b'\x02'*0x10000):
+            serialized = BytesSerializer.serialize(value) + b'\xff'
+            self.assertEqual(BytesSerializer.stream_deserialize(BytesCursor(serialized)), value)
+            self.assertEqual(BytesSerializer.stream_deserialize(io.BytesIO(serialized)), value)
+            self.assertEqual(BytesSerializer.deserialize(memoryview(serialized)), value)
+
 class Test_Compact(unittest.TestCase):
     def test_from_compact_zero(self):
         self.assertEqual(uint256_from_compact(0x00123456), 0)
@@ -203,6 +203,14 @@ class Test_P2PKHBitcoinAddress(unittest.TestCase):
         with self.assertRaises(CBitcoinAddressError):
             P2PKHBitcoinAddress.from_scriptPubKey(x('2200000000000000000000000000000000000000000000000000000000000000000000ac'))
 
+    def test_encode_many(self):
+        hashes = [bytes([i]) * 20 for i in range(5)]
+        for cls in (P2PKHBitcoinAddress, P2SHBitcoinAddress):
+            addrs = cls.encode_many(hashes)
+            self.assertEqual(addrs, [str(cls.from_bytes(h)) for h in hashes])
+            self.assertEqual([CBitcoinAddress(a) for a in addrs], hashes)
+            self.assertEqual([type(CBitcoinAddress(a)) for a in addrs], [cls] * 5)
+
     def test_from_valid_pubkey(self):
         """Create P2PKHBitcoinAddress's from valid pubkeys"""
 
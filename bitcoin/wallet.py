@@ -34,6 +34,10 @@ import bitcoin.core.key
 import bitcoin.core.script as script
 
 
+# base58 strings of recently used addresses, see bitcoin.base58.Base58Cache
+address_cache = bitcoin.base58.Base58Cache()
+
+
 class CBitcoinAddress(object):
 
     def __new__(cls, s):
@@ -52,6 +56,10 @@ class CBitcoinAddress(object):
     @classmethod
     def from_scriptPubKey(cls, scriptPubKey):
         """Convert a scriptPubKey to a subclass of CBitcoinAddress"""
+        (script_type, h) = script.ClassifyScriptPubKey(scriptPubKey)
+        if script_type != script.TX_NONSTANDARD:
+            return _ADDRESS_FROM_HASH[script_type](h)
+
         try:
             return CBech32BitcoinAddress.from_scriptPubKey(scriptPubKey)
         except CBitcoinAddressError:
@@ -114,6 +122,8 @@ class CBech32BitcoinAddress(bitcoin.bech32.CBech32Data, CBitcoinAddress):
 class CBase58BitcoinAddress(bitcoin.base58.CBase58Data, CBitcoinAddress):
     """A Base58-encoded Bitcoin address"""
 
+    _cache = address_cache
+
     @classmethod
     def from_bytes(cls, data, nVersion):
         self = super(CBase58BitcoinAddress, cls).from_bytes(data, nVersion)
@@ -162,6 +172,13 @@ class P2SHBitcoinAddress(CBase58BitcoinAddress):
 
         return super(P2SHBitcoinAddress, cls).from_bytes(data, nVersion)
 
+    @classmethod
+    def encode_many(cls, hashes, nVersion=None):
+        """Return the address strings of many script hashes"""
+        if nVersion is None:
+            nVersion = bitcoin.params.BASE58_PREFIXES['SCRIPT_ADDR']
+        return super(P2SHBitcoinAddress, cls).encode_many(hashes, nVersion)
+
     @classmethod
     def from_redeemScript(cls, redeemScript):
         """Convert a redeemScript to a P2SH address
@@ -204,6 +221,13 @@ class P2PKHBitcoinAddress(CBase58BitcoinAddress):
 
         return super(P2PKHBitcoinAddress, cls).from_bytes(data, nVersion)
 
+    @classmethod
+    def encode_many(cls, hashes, nVersion=None):
+        """Return the address strings of many pubkey hashes"""
+        if nVersion is None:
+            nVersion = bitcoin.params.BASE58_PREFIXES['PUBKEY_ADDR']
+        return super(P2PKHBitcoinAddress, cls).encode_many(hashes, nVersion)
+
     @classmethod
     def from_pubkey(cls, pubkey, accept_invalid=False):
         """Create a P2PKH bitcoin address from a pubkey
@@ -236,6 +260,10 @@ class P2PKHBitcoinAddress(CBase58BitcoinAddress):
 
         accept_bare_checksig          - Treat bare-checksig as P2PKH scriptPubKeys (default True)
         """
+        (script_type, h) = script.ClassifyScriptPubKey(scriptPubKey)
+        if script_type in (script.TX_PUBKEYHASH, script.TX_WITNESS_V0_KEYHASH):
+            return cls.from_bytes(h, bitcoin.params.BASE58_PREFIXES['PUBKEY_ADDR'])
+
         if accept_non_canonical_pushdata:
             # Canonicalize script pushes
             scriptPubKey = script.CScript(scriptPubKey) # in case it's not a CScript instance yet
@@ -333,6 +361,15 @@ class P2WPKHBitcoinAddress(CBech32BitcoinAddress):
     def to_redeemScript(self):
         return script.CScript([script.OP_DUP, script.OP_HASH160, self, script.OP_EQUALVERIFY, script.OP_CHECKSIG])
 
+
+_ADDRESS_FROM_HASH = {
+    script.TX_PUBKEYHASH: P2PKHBitcoinAddress.from_bytes,
+    script.TX_SCRIPTHASH: P2SHBitcoinAddress.from_bytes,
+    script.TX_WITNESS_V0_KEYHASH: lambda h: P2WPKHBitcoinAddress.from_bytes(0, h),
+    script.TX_WITNESS_V0_SCRIPTHASH: lambda h: P2WSHBitcoinAddress.from_bytes(0, h),
+}
+
+
 class CKey(object):
     """An encapsulated private key
 
@@ -0,0 +1,188 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Request body limits and parsing.
+
+The Content-Length of a request is checked against the configured maximum
+body size before anything is read from wsgi.input. Json array bodies can be
+parsed incrementally so that callers fanning out one upstream call per array
+element can start before the whole body has arrived."""
+
+import json
+
+import uwsgi
+
+from exr import codec
+
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+DEFAULT_MAX_PARAMS = 1000
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WS = ' \t\n\r'
+
+
+class RequestError(ValueError):
+    """Request rejected because of its body, code is the xrouter error code."""
+    code = 1004
+
+
+class BodyTooLarge(RequestError):
+    code = 1004
+
+
+class TooManyParams(RequestError):
+    code = 1025
+
+
+class InvalidJson(RequestError):
+    code = 1004
+
+
+def _opt_int(name: str, xrfunc: str, default: int) -> int:
+    """Returns the per method option NAME_xrfunc, falling back to NAME and then
+    to the default."""
+    v = uwsgi.opt.get(name + '_' + xrfunc, uwsgi.opt.get(name, b''))
+    try:
+        return int(v.decode('utf8')) if v else default
+    except ValueError:
+        return default
+
+
+def max_body_size(xrfunc: str) -> int:
+    return _opt_int('MAX_BODY_SIZE', xrfunc, DEFAULT_MAX_BODY_SIZE)
+
+
+def max_params(xrfunc: str) -> int:
+    return _opt_int('MAX_PARAMS', xrfunc, DEFAULT_MAX_PARAMS)
+
+
+def content_length(env: dict, xrfunc: str) -> int:
+    """Returns the request Content-Length, raises BodyTooLarge if it exceeds
+    the maximum body size for the method."""
+    try:
+        size = int(env.get('CONTENT_LENGTH', 0))
+    except ValueError:
+        size = 0
+    limit = max_body_size(xrfunc)
+    if size > limit:
+        raise BodyTooLarge(f'Bad request: request body of {size} bytes exceeds the limit of {limit} bytes for {xrfunc}')
+    return size
+
+
+def _check_count(count: int, limit: int):
+    if limit and count > limit:
+        raise TooManyParams(f'Bad request: too many parameters, the limit is {limit}')
+
+
+def iter_json_array(stream, length: int, limit: int = 0, chunk_size: int = CHUNK_SIZE):
+    """Yields the elements of a json array read from stream as soon as each
+    element is complete. At most length bytes are read. Raises TooManyParams
+    once more than limit elements have been seen (0 means no limit) and
+    InvalidJson if the body is not a json array. Elements that are complete
+    are yielded before the rest of the body is validated."""
+    buf = ''
+    pos = 0
+    remaining = length
+    pending = b''  # incomplete utf8 sequence at the end of the last chunk
+
+    def more(min_size: int) -> bool:
+        nonlocal buf, pos, remaining, pending
+        if remaining <= 0:
+            return False
+        data = stream.read(min(max(chunk_size, min_size), remaining))
+        if not data:
+            remaining = 0
+            return False
+        remaining -= len(data)
+        data = pending + data
+        try:
+            text = data.decode('utf8')
+            pending = b''
+        except UnicodeDecodeError as e:
+            if e.start < len(data) - 3 or remaining <= 0:
+                raise InvalidJson(f'Bad request: invalid utf8 in request body: {e.reason}')
+            text, pending = data[:e.start].decode('utf8'), data[e.start:]
+        buf = buf[pos:] + text
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            if pos < len(buf) or not more(0):
+                return
+
+    skip_ws()
+    if pos >= len(buf):
+        if pending:
+            raise InvalidJson('Bad request: invalid utf8 in request body')
+        return
+    if buf[pos] != '[':
+        raise InvalidJson('Bad request: expected a json array of parameters')
+
+    pos += 1
+    count = 0
+    skip_ws()
+    if pos < len(buf) and buf[pos] == ']':
+        pos += 1
+    else:
+        while True:
+            skip_ws()
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if more(len(buf) - pos):
+                    continue
+                raise InvalidJson(f'Bad request: invalid json: {e.msg}')
+            # an element not followed by a delimiter yet may have been cut short,
+            # e.g. a number split across two chunks
+            j = end
+            while j < len(buf) and buf[j] in _WS:
+                j += 1
+            if (j >= len(buf) or buf[j] not in ',]') and more(len(buf) - pos):
+                continue
+            pos = end
+            count += 1
+            _check_count(count, limit)
+            yield value
+            skip_ws()
+            if pos >= len(buf):
+                raise InvalidJson('Bad request: unterminated json array')
+            if buf[pos] == ']':
+                pos += 1
+                break
+            if buf[pos] != ',':
+                raise InvalidJson(f'Bad request: unexpected character {buf[pos]!r} in json array')
+            pos += 1
+
+    skip_ws()
+    if pos < len(buf) or pending:
+        raise InvalidJson('Bad request: unexpected data after json array')
+
+
+def read_params(env: dict, xrfunc: str, lazy: bool = False):
+    """Reads the json parameters posted with an xrouter call. With lazy the
+    body must be a json array and the parameters are returned as an iterator
+    that parses the body while it is consumed, otherwise the parsed value is
+    returned. An empty body is an empty parameter list, bodies that are not
+    valid json raise InvalidJson."""
+    size = content_length(env, xrfunc)
+    limit = max_params(xrfunc)
+    if size <= 0:
+        return []
+    stream = env.get('wsgi.input')
+    if lazy:
+        return iter_json_array(stream, size, limit)
+    request_body = stream.read(size)
+    if not request_body.strip():
+        return []
+    try:
+        params = codec.loads(request_body)
+    except ValueError as e:
+        raise InvalidJson(f'Bad request: invalid json: {e}')
+    _check_count(len(params) if isinstance(params, (list, dict)) else 1, limit)
+    return params
@@ -0,0 +1,59 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Json serialization used on the request path.
+
+The fastest available backend is selected at import, orjson or ujson when
+installed and the standard library json module otherwise. dumps() always
+returns utf8 encoded bytes that can be sent as is, loads() accepts bytes or
+str and raises ValueError on input the backend does not accept, e.g. orjson
+rejects the NaN and Infinity the standard library allows. Values the fast
+backends reject when serializing (e.g. integers wider than 64 bits or
+non-string dict keys) are handled by falling back to the standard library.
+Note that orjson decodes integers wider than 64 bits as floats and ujson
+rejects them, so upstream replies are not decoded with loads(): they are
+forwarded as is, or decoded with the standard library when they have to be
+looked into."""
+
+import json
+
+try:
+    import orjson as _backend
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson as _backend
+        BACKEND = 'ujson'
+    except ImportError:
+        _backend = None
+        BACKEND = 'json'
+
+
+def _std_dumps(obj: any) -> bytes:
+    return json.dumps(obj, separators=(',', ':')).encode('utf8')
+
+
+def _std_loads(data):
+    return json.loads(data)
+
+
+if BACKEND == 'orjson':
+    def dumps(obj: any) -> bytes:
+        try:
+            return _backend.dumps(obj)
+        except TypeError:
+            return _std_dumps(obj)
+
+    loads = _backend.loads
+elif BACKEND == 'ujson':
+    def dumps(obj: any) -> bytes:
+        try:
+            return _backend.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf8')
+        except (TypeError, OverflowError):
+            return _std_dumps(obj)
+
+    loads = _backend.loads
+else:
+    dumps = _std_dumps
+    loads = _std_loads
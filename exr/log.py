@@ -0,0 +1,125 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Structured logging with deferred formatting.
+
+Loggers returned by get_logger accept keyword fields in addition to the
+message, e.g. log.debug('call_xrfunc', token=token, env=env). Level checks
+happen before any of the fields are touched and the fields are only rendered
+when a handler actually emits the record, so debug logging on the request path
+costs next to nothing when the log level is above DEBUG. Output is either the
+usual text line with key=value pairs appended or one json object per line, and
+records below WARNING can be sampled."""
+
+import json
+import logging
+import math
+import random
+
+# keyword arguments understood by logging.Logger._log
+_LOG_KWARGS = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s - %(message)s'
+DATE_FORMAT = '[%Y-%m-%d:%H:%M:%S]'
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger adapter that moves keyword fields into the record. process() is
+    only invoked by the adapter after the level check passed."""
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, {})
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _LOG_KWARGS}
+        if fields:
+            extra = kwargs.setdefault('extra', {})
+            extra['fields'] = fields
+        return msg, kwargs
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(name))
+
+
+def _request_id() -> str:
+    # tracing requires flask and uwsgi, resolve it when a record is formatted
+    try:
+        from exr import tracing
+        return tracing.request_id()
+    except Exception:
+        return ''
+
+
+class TextFormatter(logging.Formatter):
+    """Appends the structured fields to the message as key=value pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line json objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        rid = _request_id()
+        if rid:
+            doc['request_id'] = rid
+        fields = getattr(record, 'fields', None)
+        if fields:
+            doc.update(fields)
+        if record.exc_info:
+            doc['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes a random sample of records below WARNING, warnings and errors
+    are always passed."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def parse_sample_rate(value) -> float:
+    """Returns the sample rate clamped to [0, 1] or None if value is not a
+    number."""
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(rate):
+        return None
+    return min(max(rate, 0.0), 1.0)
+
+
+def setup(level: str = 'WARNING', json_output: bool = False, sample_rate: any = 1.0):
+    """Configures the root logger. The sample rate may be passed as a string,
+    e.g. straight from the environment, an invalid rate logs a warning and
+    disables sampling."""
+    rate = parse_sample_rate(sample_rate)
+    handler = logging.StreamHandler()
+    if json_output:
+        handler.setFormatter(JsonFormatter(datefmt=DATE_FORMAT))
+    else:
+        handler.setFormatter(TextFormatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+    if rate is not None and rate < 1.0:
+        handler.addFilter(SamplingFilter(rate))
+    logging.basicConfig(level=level, handlers=[handler])
+    if rate is None:
+        logging.warning('Invalid log sample rate %r, logging all records', sample_rate)
@@ -0,0 +1,271 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Prometheus-style request metrics.
+
+Every uwsgi worker records into its own in-memory registry and periodically
+writes a snapshot of it to a per-process file in a shared memory directory
+(/dev/shm by default). The metrics endpoint merges the snapshots of all
+workers, so the numbers served are aggregated across the whole uwsgi pool
+without any cross-process locking on the request path."""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import uwsgi
+from flask import g, request
+
+from exr import tracing
+
+# Latency buckets in seconds, upper bounds of the histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Trace spans that are reported as request phases
+PHASES = ('upstream', 'signing', 'auth')
+# Maximum number of distinct label sets per metric, protects against
+# unbounded cardinality from client controlled path segments
+MAX_SERIES = 2000
+OVERFLOW = '_overflow'
+
+HELP = {
+    'exr_requests_total': ('counter', 'Total number of requests handled'),
+    'exr_request_bytes_total': ('counter', 'Total number of request body bytes received'),
+    'exr_response_bytes_total': ('counter', 'Total number of response body bytes sent'),
+    'exr_request_duration_seconds': ('histogram', 'Total request latency'),
+    'exr_phase_duration_seconds': ('histogram', 'Request latency spent in upstream calls, signing and auth/db'),
+}
+
+
+class Registry:
+    """Thread-safe in-process store of counters and histograms. Series are keyed
+    by metric name and a tuple of (label, value) pairs."""
+
+    def __init__(self, buckets=BUCKETS, max_series=MAX_SERIES):
+        self.buckets = buckets
+        self.max_series = max_series
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _key(self, store: dict, name: str, labels: tuple):
+        key = (name, labels)
+        if key not in store and len(store) >= self.max_series:
+            return name, tuple((k, OVERFLOW) for k, _ in labels)
+        return key
+
+    def inc(self, name: str, labels: tuple, value=1):
+        with self.lock:
+            key = self._key(self.counters, name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self.lock:
+            key = self._key(self.histograms, name, labels)
+            h = self.histograms.get(key)
+            if h is None:
+                # bucket counts followed by sum and count
+                h = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'counters': [[n, list(l), v] for (n, l), v in self.counters.items()],
+                'histograms': [[n, list(l), list(h)] for (n, l), h in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict):
+        """Adds the series of a snapshot produced by another registry."""
+        with self.lock:
+            for n, l, v in snapshot.get('counters', []):
+                key = (n, tuple(tuple(p) for p in l))
+                self.counters[key] = self.counters.get(key, 0) + v
+            for n, l, h in snapshot.get('histograms', []):
+                key = (n, tuple(tuple(p) for p in l))
+                cur = self.histograms.get(key)
+                if cur is None:
+                    self.histograms[key] = list(h)
+                else:
+                    self.histograms[key] = [a + b for a, b in zip(cur, h)]
+
+    def render(self) -> str:
+        """Returns the registry in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines += _help_lines(name)
+                seen.add(name)
+            lines.append(f'{name}{_fmt_labels(labels)} {_fmt_value(value)}')
+        for (name, labels), h in histograms:
+            if name not in seen:
+                lines += _help_lines(name)
+                seen.add(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, h):
+                cumulative += count
+                lines.append(f'{name}_bucket{_fmt_labels(labels + (("le", _fmt_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_fmt_labels(labels + (("le", "+Inf"),))} {h[-1]}')
+            lines.append(f'{name}_sum{_fmt_labels(labels)} {_fmt_value(h[-2])}')
+            lines.append(f'{name}_count{_fmt_labels(labels)} {h[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _help_lines(name: str) -> list:
+    kind, text = HELP.get(name, ('untyped', name))
+    return [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+
+
+def _fmt_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for k, v in labels)
+    return '{' + pairs + '}'
+
+
+def _fmt_value(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+registry = Registry()
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return uwsgi.opt.get('METRICS', b'true').decode('utf8').lower() in ('true', '1')
+
+
+def metrics_dir() -> str:
+    d = uwsgi.opt.get('METRICS_DIR', b'').decode('utf8')
+    if not d:
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        d = os.path.join(base, 'exrproxy-metrics')
+    return d
+
+
+def flush_interval() -> float:
+    try:
+        return float(uwsgi.opt.get('METRICS_FLUSH_INTERVAL', b'1').decode('utf8'))
+    except ValueError:
+        return 1.0
+
+
+def init():
+    """Clears snapshots left over from a previous run. Called once when the app
+    is loaded, before uwsgi forks its workers."""
+    if not enabled():
+        return
+    d = metrics_dir()
+    try:
+        os.makedirs(d, exist_ok=True)
+        for f in os.listdir(d):
+            if f.startswith('worker-'):
+                os.remove(os.path.join(d, f))
+    except OSError as e:
+        logging.warning('Failed to initialize metrics dir %s: %s', d, e)
+
+
+def flush(force=False):
+    """Writes this worker's snapshot to the shared metrics dir, at most once
+    per flush interval unless forced."""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < flush_interval():
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return  # another thread is already flushing
+    try:
+        _last_flush = now
+        d = metrics_dir()
+        os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, f'worker-{os.getpid()}.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(registry.snapshot(), fp)
+        os.replace(tmp, path)
+    except OSError as e:
+        logging.warning('Failed to flush metrics: %s', e)
+    finally:
+        _flush_lock.release()
+
+
+def collect() -> Registry:
+    """Returns a registry with the merged snapshots of all workers."""
+    flush(force=True)
+    merged = Registry()
+    d = metrics_dir()
+    try:
+        files = [f for f in os.listdir(d) if f.startswith('worker-') and f.endswith('.json')]
+    except OSError:
+        files = []
+    for f in files:
+        try:
+            with open(os.path.join(d, f)) as fp:
+                merged.merge(json.load(fp))
+        except (OSError, ValueError):
+            continue  # worker is replacing its snapshot
+    return merged
+
+
+def request_labels() -> tuple:
+    """Labels of the current request, derived from the path and the values set
+    on the application context by the request decorators."""
+    parts = request.path.split('/')
+    namesp = parts[1] if len(parts) > 1 and parts[1] in ('xr', 'xrs') else ''
+    view_args = request.view_args or {}
+    tier = ''
+    project = g.get('project')
+    if project is not None:
+        tier = str(0 if not project.hydra else 2 if project.archive_mode else 1)
+    return (
+        ('namespace', namesp),
+        ('token', g.get('token', '')),
+        ('method', g.get('xrfunc', '')),
+        ('evm', view_args.get('evm', '')),
+        ('tier', tier),
+    )
+
+
+def before_request():
+    g._metrics_start = time.perf_counter()
+
+
+def after_request(response):
+    """Records the metrics of the finished request."""
+    if not enabled():
+        return response
+    try:
+        labels = request_labels()
+        start = g.pop('_metrics_start', None)
+        if start is not None:  # not set if the request was rejected before our hook
+            registry.observe('exr_request_duration_seconds', labels, time.perf_counter() - start)
+        t = tracing.current()
+        if t is not None:
+            for name, elapsed in t.totals().items():
+                if name in PHASES:
+                    registry.observe('exr_phase_duration_seconds', labels + (('phase', name),), elapsed)
+        registry.inc('exr_requests_total', labels + (('status', str(response.status_code)),))
+        registry.inc('exr_request_bytes_total', labels, request.content_length or 0)
+        registry.inc('exr_response_bytes_total', labels, response.content_length or 0)
+        flush()
+    except Exception as e:
+        logging.warning('Failed to record metrics: %s', getattr(e, 'message', repr(e)))
+    return response
+
+
+def render() -> str:
+    return collect().render()
@@ -0,0 +1,177 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+# The exr package imports uwsgi, run with:
+#
+#     uwsgi --pythonpath . --pyrun exr/tests/test_body.py
+
+import io
+import json
+import unittest
+
+try:
+    import uwsgi
+except ImportError:
+    raise unittest.SkipTest('requires uwsgi')
+
+from exr import body
+
+
+class Stream(io.BytesIO):
+    """Request body that records the reads made from it."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.reads.append(len(data))
+        return data
+
+
+def parse(data: bytes, chunk_size: int, limit: int = 0) -> list:
+    return list(body.iter_json_array(Stream(data), len(data), limit, chunk_size))
+
+
+class Test_iter_json_array(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        docs = [
+            [],
+            [1],
+            ['00000000000000000000000000000000000000000000000000000000000000ff', 12345678, -1.5e-3, 10 ** 30],
+            [True, False, None, {'hash': 'ab', 'n': [1, 2]}, [[], {}], ''],
+            ['quote " backslash \\ newline \n', 'café', '€100', '\U0001d11e clef', 'é' * 7],
+        ]
+        for doc in docs:
+            for sep in ((',', ':'), (' , ', ' : ')):
+                data = json.dumps(doc, ensure_ascii=False, separators=sep).encode('utf8')
+                for padded in (data, b' \n' + data + b'\r\n '):
+                    # every chunk boundary, including inside multibyte characters and numbers
+                    for chunk_size in range(1, len(padded) + 1):
+                        self.assertEqual(parse(padded, chunk_size), doc, (padded, chunk_size))
+
+    def test_number_at_chunk_boundary(self):
+        # the first chunk holds a complete number that is only part of the element
+        self.assertEqual(parse(b'[123,456789]', 7), [123, 456789])
+        self.assertEqual(parse(b'[123, 4567 ]', 9), [123, 4567])
+        self.assertEqual(parse(b'[1.5e10]', 4), [1.5e10])
+        self.assertEqual(parse(b'[-0.25]', 3), [-0.25])
+
+    def test_utf8_split(self):
+        data = '["€", "\U0001d11e"]'.encode('utf8')
+        for chunk_size in range(1, len(data) + 1):
+            self.assertEqual(parse(data, chunk_size), ['€', '\U0001d11e'])
+
+    def test_lazy(self):
+        ids = ['%064x' % i for i in range(100)]
+        data = json.dumps(ids).encode('utf8')
+        stream = Stream(data)
+        it = body.iter_json_array(stream, len(data), chunk_size=256)
+        self.assertEqual(next(it), ids[0])
+        self.assertEqual(stream.reads, [256])
+        self.assertEqual(list(it), ids[1:])
+        self.assertEqual(sum(stream.reads), len(data))
+
+    def test_length(self):
+        # nothing past the content length is read
+        data = b'[1, 2]'
+        stream = Stream(data + b'[3]')
+        self.assertEqual(list(body.iter_json_array(stream, len(data), chunk_size=4)), [1, 2])
+        self.assertEqual(stream.read(), b'[3]')
+        self.assertEqual(list(body.iter_json_array(Stream(b''), 0)), [])
+        self.assertEqual(list(body.iter_json_array(Stream(b' \n '), 3)), [])
+
+    def test_limit(self):
+        data = json.dumps(list(range(10))).encode('utf8')
+        self.assertEqual(parse(data, 3, limit=10), list(range(10)))
+        self.assertEqual(parse(data, 3, limit=0), list(range(10)))
+        it = body.iter_json_array(Stream(data), len(data), limit=4, chunk_size=3)
+        self.assertEqual([next(it) for _ in range(4)], [0, 1, 2, 3])
+        with self.assertRaises(body.TooManyParams) as cm:
+            next(it)
+        self.assertEqual(cm.exception.code, 1025)
+
+    def test_malformed(self):
+        for data in (b'[', b'[1', b'[1,', b'[1,]', b'[,1]', b'[1 2]', b'[1;2]', b'[nul]', b'["abc]',
+                     b'[1]xx', b'[1] ]', b'[][]', b'{"a": 1}', b'"abc"', b'1', b'null', b'x',
+                     b'["\xff"]', b'["\xe2\x82"]', b'["\xe2\x82', b'[1] \xe2\x82'):
+            for chunk_size in (1, 2, 3, 64):
+                with self.assertRaises(body.InvalidJson, msg=(data, chunk_size)) as cm:
+                    parse(data, chunk_size)
+                self.assertEqual(cm.exception.code, 1004)
+
+    def test_short_body(self):
+        # the client closed the connection before sending content length bytes
+        with self.assertRaises(body.InvalidJson):
+            list(body.iter_json_array(Stream(b'[1, 2'), 100, chunk_size=2))
+
+
+class Test_read_params(unittest.TestCase):
+    def setUp(self):
+        opt = dict(uwsgi.opt)
+        self.addCleanup(lambda: (uwsgi.opt.clear(), uwsgi.opt.update(opt)))
+
+    def read(self, data: bytes, xrfunc: str = 'xrGetBlocks', lazy: bool = False, length: int = None):
+        env = {'CONTENT_LENGTH': str(len(data) if length is None else length), 'wsgi.input': Stream(data)}
+        params = body.read_params(env, xrfunc, lazy=lazy)
+        return list(params) if lazy else params
+
+    def test_params(self):
+        for lazy in (False, True):
+            self.assertEqual(self.read(b'["a", 1]', lazy=lazy), ['a', 1])
+            self.assertEqual(self.read(b'', lazy=lazy), [])
+            self.assertEqual(self.read(b'\n', lazy=lazy), [])
+            self.assertEqual(self.read(b' \r\n', lazy=lazy), [])
+        self.assertEqual(self.read(b'{"hash": "ab"}'), {'hash': 'ab'})
+        self.assertEqual(self.read(b'"ab"'), 'ab')
+        self.assertEqual(body.read_params({}, 'xrGetBlockCount'), [])
+
+    def test_malformed(self):
+        for data in (b'[1, 2', b'[1]xx', b'{"a": }', b'not json', b'["\xff"]'):
+            for lazy in (False, True):
+                with self.assertRaises(body.InvalidJson, msg=(data, lazy)):
+                    self.read(data, lazy=lazy)
+        # fan-out calls require an array of ids
+        for data in (b'{"a": 1, "b": 2}', b'"abc"'):
+            with self.assertRaises(body.InvalidJson):
+                self.read(data, lazy=True)
+
+    def test_max_params(self):
+        uwsgi.opt['MAX_PARAMS'] = b'2'
+        uwsgi.opt['MAX_PARAMS_xrGetTransactions'] = b'3'
+        for lazy in (False, True):
+            self.assertEqual(self.read(b'[1, 2]', lazy=lazy), [1, 2])
+            with self.assertRaises(body.TooManyParams):
+                self.read(b'[1, 2, 3]', lazy=lazy)
+            self.assertEqual(self.read(b'[1, 2, 3]', 'xrGetTransactions', lazy=lazy), [1, 2, 3])
+        with self.assertRaises(body.TooManyParams):
+            self.read(b'{"a": 1, "b": 2, "c": 3}')
+
+        # 0 disables the limit
+        uwsgi.opt['MAX_PARAMS'] = b'0'
+        for lazy in (False, True):
+            self.assertEqual(self.read(b'[1, 2, 3]', lazy=lazy), [1, 2, 3])
+
+    def test_max_body_size(self):
+        uwsgi.opt['MAX_BODY_SIZE'] = b'8'
+        uwsgi.opt['MAX_BODY_SIZE_xrGetBlock'] = b'16'
+        self.assertEqual(self.read(b'[1, 2]'), [1, 2])
+        self.assertEqual(self.read(b'["abcdefgh"]', 'xrGetBlock'), ['abcdefgh'])
+        for lazy in (False, True):
+            stream = Stream(b'["abcdefgh"]')
+            with self.assertRaises(body.BodyTooLarge) as cm:
+                body.read_params({'CONTENT_LENGTH': '12', 'wsgi.input': stream}, 'xrGetBlocks', lazy=lazy)
+            self.assertEqual(cm.exception.code, 1004)
+            self.assertEqual(stream.reads, [])  # rejected before reading
+        # the declared length is checked, not what the client actually sends
+        with self.assertRaises(body.BodyTooLarge):
+            self.read(b'[]', length=1 << 30)
+        self.assertEqual(body.max_body_size('xrGetBlocks'), 8)
+        uwsgi.opt['MAX_BODY_SIZE'] = b'lots'
+        self.assertEqual(body.max_body_size('xrGetBlocks'), body.DEFAULT_MAX_BODY_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+# The exr package imports uwsgi, run with:
+#
+#     uwsgi --pythonpath . --pyrun exr/tests/test_codec.py
+
+import json
+import unittest
+
+try:
+    import uwsgi
+except ImportError:
+    raise unittest.SkipTest('requires uwsgi')
+
+from exr import codec
+
+
+class Test_codec(unittest.TestCase):
+    def test_round_trip(self):
+        for obj in ([], {}, [1, -2, 1.5, True, False, None], 'café €',
+                    {'result': {'hash': '0x' + 'ab' * 32, 'transactions': [{'nonce': '0x1'}]}, 'error': None, 'id': 1}):
+            data = codec.dumps(obj)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(json.loads(data), obj)
+            self.assertEqual(codec.loads(data), obj)
+            self.assertEqual(codec.loads(data.decode('utf8')), obj)
+        self.assertEqual(codec.dumps({'a': [1, 2]}), b'{"a":[1,2]}')
+
+    def test_dumps_fallback(self):
+        # values the fast backends reject are serialized by the standard library
+        self.assertEqual(json.loads(codec.dumps([2 ** 64, -2 ** 70])), [2 ** 64, -2 ** 70])
+        self.assertEqual(json.loads(codec.dumps({1: 'a'})), {'1': 'a'})
+        with self.assertRaises(TypeError):
+            codec.dumps({'a': object()})
+
+    def test_loads_invalid(self):
+        for data in (b'', b'[1,', b'[1]x', b'{"a" 1}', b"['a']", b'["\xff"]', '{'):
+            with self.assertRaises(ValueError, msg=data):
+                codec.loads(data)
+
+    @unittest.skipUnless(codec.BACKEND == 'orjson', 'orjson not installed')
+    def test_loads_backend_grammar(self):
+        # invalid input is not parsed a second time by the standard library
+        for data in (b'NaN', b'[Infinity]', b'[-Infinity]'):
+            self.assertIsNotNone(json.loads(data))
+            with self.assertRaises(ValueError):
+                codec.loads(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
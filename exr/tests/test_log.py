@@ -0,0 +1,126 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+# The exr package imports uwsgi, run with:
+#
+#     uwsgi --pythonpath . --pyrun exr/tests/test_log.py
+
+import contextlib
+import io
+import json
+import logging
+import unittest
+
+try:
+    import uwsgi
+except ImportError:
+    raise unittest.SkipTest('requires uwsgi')
+
+from exr import log
+
+
+class Rendered:
+    """Field value that counts how often it was rendered."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'rendered'
+
+
+class LogTestCase(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        self.addCleanup(setattr, root, 'handlers', handlers)
+        self.addCleanup(root.setLevel, level)
+        root.handlers = []
+        self.stream = io.StringIO()
+
+    def setup(self, *args, **kwargs):
+        with contextlib.redirect_stderr(self.stream):
+            log.setup(*args, **kwargs)
+        return logging.getLogger().handlers[0]
+
+    def lines(self) -> list:
+        return self.stream.getvalue().splitlines()
+
+
+class Test_StructuredLogger(LogTestCase):
+    def test_deferred(self):
+        self.setup('INFO')
+        logger = log.get_logger('exr.test')
+        field = Rendered()
+        logger.debug('call_xrfunc', token='BLOCK', env=field)
+        self.assertEqual(field.count, 0)
+        self.assertEqual(self.lines(), [])
+
+        logger.info('call_xrfunc %s', 'xrGetBlockCount', token='BLOCK', env=field)
+        self.assertEqual(field.count, 1)
+        self.assertRegex(self.lines()[0], r'INFO - call_xrfunc xrGetBlockCount token=BLOCK env=rendered$')
+
+    def test_json(self):
+        self.setup('DEBUG', json_output=True)
+        logger = log.get_logger('exr.test')
+        logger.debug('request params', params=[1, 'a'], env=Rendered())
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            logger.error('failed %d', 2, exc_info=True)
+        docs = self.records()
+        self.assertEqual({k: docs[0][k] for k in ('level', 'logger', 'message', 'params', 'env')},
+                         {'level': 'DEBUG', 'logger': 'exr.test', 'message': 'request params',
+                          'params': [1, 'a'], 'env': 'rendered'})
+        self.assertNotIn('request_id', docs[0])
+        self.assertEqual(docs[1]['message'], 'failed 2')
+        self.assertIn('ValueError: bad', docs[1]['exc_info'])
+
+    def records(self) -> list:
+        decoder = json.JSONDecoder()
+        text, pos, docs = self.stream.getvalue(), 0, []
+        while pos < len(text):
+            doc, pos = decoder.raw_decode(text, pos)
+            docs.append(doc)
+            pos += 1  # newline
+        return docs
+
+
+class Test_Sampling(LogTestCase):
+    def test_filter(self):
+        f = log.SamplingFilter(0.0)
+        record = lambda level: logging.LogRecord('exr', level, __file__, 1, 'msg', (), None)
+        self.assertFalse(f.filter(record(logging.DEBUG)))
+        self.assertFalse(f.filter(record(logging.INFO)))
+        self.assertTrue(f.filter(record(logging.WARNING)))
+        self.assertTrue(f.filter(record(logging.ERROR)))
+        self.assertTrue(log.SamplingFilter(1.0).filter(record(logging.DEBUG)))
+
+    def test_parse_sample_rate(self):
+        for value, rate in (('1', 1.0), ('0.25', 0.25), (0.5, 0.5), ('0', 0.0), ('2', 1.0), ('-1', 0.0),
+                            ('inf', 1.0), ('', None), ('all', None), ('nan', None), (None, None)):
+            self.assertEqual(log.parse_sample_rate(value), rate, value)
+
+    def test_setup(self):
+        handler = self.setup('INFO', sample_rate='0.1')
+        self.assertEqual([f.rate for f in handler.filters], [0.1])
+
+        logging.getLogger().handlers = []
+        handler = self.setup('INFO', sample_rate='-5')
+        self.assertEqual([f.rate for f in handler.filters], [0.0])
+
+        logging.getLogger().handlers = []
+        handler = self.setup('INFO', sample_rate='1')
+        self.assertEqual(handler.filters, [])
+
+    def test_setup_invalid(self):
+        handler = self.setup('INFO', sample_rate='half')
+        self.assertEqual(handler.filters, [])
+        self.assertEqual(len(logging.getLogger().handlers), 1)
+        self.assertRegex(self.lines()[0], r"WARNING - Invalid log sample rate 'half', logging all records$")
+
+
+if __name__ == '__main__':
+    unittest.main()
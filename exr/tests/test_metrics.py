@@ -0,0 +1,179 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+# The exr package imports uwsgi, run with:
+#
+#     uwsgi --pythonpath . --pyrun exr/tests/test_metrics.py
+
+import json
+import os
+import tempfile
+import unittest
+
+try:
+    import uwsgi
+except ImportError:
+    raise unittest.SkipTest('requires uwsgi')
+
+from flask import Flask, g
+
+from exr import metrics
+from plugins import app as webapp
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        opt = dict(uwsgi.opt)
+        self.addCleanup(lambda: (uwsgi.opt.clear(), uwsgi.opt.update(opt)))
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        uwsgi.opt['METRICS_DIR'] = self.dir.encode('utf8')
+        registry = metrics.registry
+        self.addCleanup(setattr, metrics, 'registry', registry)
+        metrics.registry = metrics.Registry()
+
+    def write_worker(self, pid: int, registry: metrics.Registry):
+        with open(os.path.join(self.dir, f'worker-{pid}.json'), 'w') as fp:
+            json.dump(registry.snapshot(), fp)
+
+
+class Test_Registry(unittest.TestCase):
+    def test_snapshot_merge(self):
+        labels = (('token', 'BLOCK'), ('method', 'xrGetBlockCount'))
+        r = metrics.Registry(buckets=(0.1, 1.0))
+        r.inc('requests', labels)
+        r.inc('requests', labels, 2)
+        r.observe('latency', labels, 0.05)
+        r.observe('latency', labels, 0.5)
+        r.observe('latency', labels, 5.0)
+        self.assertEqual(r.counters, {('requests', labels): 3})
+        self.assertEqual(r.histograms, {('latency', labels): [1, 1, 5.55, 3]})
+
+        # snapshots are written as json, merged label tuples must match the originals
+        merged = metrics.Registry(buckets=(0.1, 1.0))
+        merged.merge(json.loads(json.dumps(r.snapshot())))
+        merged.merge(json.loads(json.dumps(r.snapshot())))
+        self.assertEqual(merged.counters, {('requests', labels): 6})
+        self.assertEqual(merged.histograms, {('latency', labels): [2, 2, 11.1, 6]})
+
+    def test_max_series(self):
+        r = metrics.Registry(max_series=2)
+        for token in ('a', 'b', 'c', 'd'):
+            r.inc('requests', (('token', token),))
+        self.assertEqual(r.counters, {
+            ('requests', (('token', 'a'),)): 1,
+            ('requests', (('token', 'b'),)): 1,
+            ('requests', (('token', metrics.OVERFLOW),)): 2,
+        })
+
+    def test_render(self):
+        r = metrics.Registry(buckets=(0.1, 1.0))
+        r.inc('exr_requests_total', (('token', 'a"b\\c\n'), ('status', '200')))
+        r.observe('exr_request_duration_seconds', (('token', 'BLOCK'),), 0.05)
+        r.observe('exr_request_duration_seconds', (('token', 'BLOCK'),), 0.5)
+        r.observe('exr_request_duration_seconds', (('token', 'BLOCK'),), 2.0)
+        self.assertEqual(r.render(), '\n'.join([
+            '# HELP exr_requests_total Total number of requests handled',
+            '# TYPE exr_requests_total counter',
+            'exr_requests_total{token="a\\"b\\\\c\\n",status="200"} 1',
+            '# HELP exr_request_duration_seconds Total request latency',
+            '# TYPE exr_request_duration_seconds histogram',
+            'exr_request_duration_seconds_bucket{token="BLOCK",le="0.1"} 1',
+            'exr_request_duration_seconds_bucket{token="BLOCK",le="1.0"} 2',
+            'exr_request_duration_seconds_bucket{token="BLOCK",le="+Inf"} 3',
+            'exr_request_duration_seconds_sum{token="BLOCK"} 2.55',
+            'exr_request_duration_seconds_count{token="BLOCK"} 3',
+        ]) + '\n')
+
+
+class Test_Workers(MetricsTestCase):
+    def test_flush(self):
+        metrics.registry.inc('exr_requests_total', (('token', 'BLOCK'),))
+        metrics.flush(force=True)
+        with open(os.path.join(self.dir, f'worker-{os.getpid()}.json')) as fp:
+            self.assertEqual(json.load(fp)['counters'], [['exr_requests_total', [['token', 'BLOCK']], 1]])
+        self.assertEqual([f for f in os.listdir(self.dir) if f.endswith('.tmp')], [])
+
+        # unforced flushes are rate limited
+        uwsgi.opt['METRICS_FLUSH_INTERVAL'] = b'3600'
+        metrics.registry.inc('exr_requests_total', (('token', 'BLOCK'),))
+        metrics.flush()
+        with open(os.path.join(self.dir, f'worker-{os.getpid()}.json')) as fp:
+            self.assertEqual(json.load(fp)['counters'], [['exr_requests_total', [['token', 'BLOCK']], 1]])
+
+    def test_collect(self):
+        labels = (('token', 'BLOCK'),)
+        metrics.registry.inc('exr_requests_total', labels)
+        metrics.registry.observe('exr_request_duration_seconds', labels, 0.2)
+        other = metrics.Registry()
+        other.inc('exr_requests_total', labels, 2)
+        other.inc('exr_requests_total', (('token', 'ETH'),))
+        other.observe('exr_request_duration_seconds', labels, 0.3)
+        self.write_worker(1, other)
+        with open(os.path.join(self.dir, 'worker-2.json'), 'w') as fp:
+            fp.write('{"counters": [')  # snapshot being replaced
+
+        merged = metrics.collect()
+        self.assertEqual(merged.counters, {
+            ('exr_requests_total', labels): 3,
+            ('exr_requests_total', (('token', 'ETH'),)): 1,
+        })
+        h = merged.histograms[('exr_request_duration_seconds', labels)]
+        self.assertEqual(h[-1], 2)
+        self.assertAlmostEqual(h[-2], 0.5)
+
+    def test_init(self):
+        self.write_worker(1, metrics.Registry())
+        with open(os.path.join(self.dir, 'other'), 'w'):
+            pass
+        metrics.init()
+        self.assertEqual(os.listdir(self.dir), ['other'])
+
+
+class Test_Endpoint(MetricsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = Flask('test')
+        self.app.register_blueprint(webapp)
+        self.app.before_request(metrics.before_request)
+        self.app.after_request(metrics.after_request)
+
+        @self.app.route('/xr/<token>/<method>', methods=['POST'])
+        def xr(token, method):
+            g.token = token
+            g.xrfunc = method
+            return 'result'
+
+        self.client = self.app.test_client()
+
+    def test_metrics(self):
+        self.assertEqual(self.client.post('/xr/BLOCK/xrGetBlockCount', data=b'[]').status_code, 200)
+        self.assertEqual(self.client.post('/xr/BLOCK/xrGetBlockCount', data=b'[]').status_code, 200)
+        other = metrics.Registry()
+        other.inc('exr_requests_total', (('namespace', 'xr'), ('token', 'BLOCK'), ('method', 'xrGetBlockCount'),
+                                         ('evm', ''), ('tier', ''), ('status', '200')))
+        self.write_worker(1, other)
+
+        res = self.client.get('/xrs/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/plain')
+        self.assertEqual(res.mimetype_params['version'], '0.0.4')
+        lines = res.get_data(as_text=True).splitlines()
+        labels = 'namespace="xr",token="BLOCK",method="xrGetBlockCount",evm="",tier=""'
+        self.assertIn('# TYPE exr_requests_total counter', lines)
+        self.assertIn('exr_requests_total{' + labels + ',status="200"} 3', lines)
+        self.assertIn('exr_request_bytes_total{' + labels + '} 4', lines)
+        self.assertIn('exr_response_bytes_total{' + labels + '} 12', lines)
+        self.assertIn('exr_request_duration_seconds_count{' + labels + '} 2', lines)
+
+    def test_disabled(self):
+        uwsgi.opt['METRICS'] = b'false'
+        self.assertEqual(self.client.post('/xr/BLOCK/xrGetBlockCount', data=b'[]').status_code, 200)
+        self.assertEqual(metrics.registry.counters, {})
+        self.assertEqual(self.client.get('/xrs/metrics').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""Lightweight per-request tracing.
+
+Each request gets a request id (taken from the X-Request-Id header when the
+client supplies one) and a list of timed spans that is kept on the application
+context. Spans nest, so a span opened while another one is active records it
+as its parent. When the request finishes the span timings are summarized in a
+Server-Timing response header and a sample of the traces is exported as json
+lines to a file or to a local collector over udp."""
+
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import uwsgi
+from flask import g, has_request_context, request
+
+_export_lock = threading.Lock()
+_export_fp = None
+_export_pid = None
+_export_sock = None
+
+
+class Trace:
+    """Spans recorded for a single request."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.stack = [0]
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def totals(self) -> dict:
+        """Returns the total duration in seconds of the spans grouped by name."""
+        res = {}
+        for s in self.spans:
+            res[s['name']] = res.get(s['name'], 0.0) + s['duration']
+        return res
+
+    def to_json(self) -> dict:
+        return {
+            'request_id': self.request_id,
+            'start': self.start_time,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            'spans': [{
+                'id': s['id'],
+                'parent': s['parent'],
+                'name': s['name'],
+                'start_ms': round(s['start'] * 1000, 3),
+                'duration_ms': round(s['duration'] * 1000, 3),
+                'attrs': s['attrs'],
+            } for s in self.spans],
+        }
+
+
+def current() -> Trace:
+    """Returns the trace of the current request or None outside of a request."""
+    if not has_request_context():
+        return None
+    return g.get('_trace')
+
+
+def request_id() -> str:
+    t = current()
+    return t.request_id if t else ''
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block as a span of the current request trace. Can
+    also be used as a function decorator. Does nothing outside of a request."""
+    t = current()
+    if t is None:
+        yield
+        return
+    s = {'id': len(t.spans) + 1, 'parent': t.stack[-1], 'name': name, 'attrs': attrs, 'duration': 0.0}
+    t.spans.append(s)
+    t.stack.append(s['id'])
+    start = time.perf_counter()
+    s['start'] = start - t.start
+    try:
+        yield
+    finally:
+        s['duration'] = time.perf_counter() - start
+        t.stack.pop()
+
+
+def safe_url(url: str) -> str:
+    """Strips credentials from a url so that it can be recorded on a span."""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if parts.port:
+        host += ':' + str(parts.port)
+    return host + parts.path
+
+
+def server_timing(t: Trace) -> str:
+    """Formats the Server-Timing header value. The proxy overhead is the total
+    request time minus the time spent waiting on upstream endpoints."""
+    totals = t.totals()
+    total = t.elapsed()
+    upstream = totals.get('upstream', 0.0)
+    metrics = [('upstream', upstream, len([s for s in t.spans if s['name'] == 'upstream']))]
+    if 'signing' in totals:
+        metrics.append(('signing', totals['signing'], 0))
+    if 'auth' in totals:
+        metrics.append(('auth', totals['auth'], 0))
+    metrics.append(('proxy', max(total - upstream, 0.0), 0))
+    metrics.append(('total', total, 0))
+    res = []
+    for name, dur, count in metrics:
+        desc = f';desc="{count} calls"' if count else ''
+        res.append(f'{name};dur={dur * 1000:.3f}{desc}')
+    return ', '.join(res)
+
+
+def sample_rate() -> float:
+    try:
+        return float(uwsgi.opt.get('TRACE_SAMPLE_RATE', b'0').decode('utf8'))
+    except ValueError:
+        return 0.0
+
+
+def export(record: dict):
+    """Writes the trace record to the configured exporter. Supported exporters
+    are a json lines file path or a udp://host:port collector address."""
+    global _export_fp, _export_pid, _export_sock
+    target = uwsgi.opt.get('TRACE_EXPORT', b'').decode('utf8')
+    if not target:
+        return
+    line = json.dumps(record, separators=(',', ':'))
+    try:
+        with _export_lock:
+            if target.startswith('udp://'):
+                if _export_sock is None:
+                    _export_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    _export_sock.setblocking(False)
+                addr = urlsplit(target)
+                _export_sock.sendto(line.encode('utf8'), (addr.hostname, addr.port))
+            else:
+                # reopen after fork so every worker has its own handle
+                if _export_fp is None or _export_fp.name != target or _export_pid != os.getpid():
+                    _export_fp = open(target, 'a', buffering=1)
+                    _export_pid = os.getpid()
+                _export_fp.write(line + '\n')
+    except (OSError, TypeError) as e:
+        logging.warning('Failed to export trace: %s', e)
+
+
+def before_request():
+    rid = request.headers.get('X-Request-Id', '')
+    if not re.fullmatch(r'[\w.\-]{1,64}', rid):
+        rid = uuid.uuid4().hex
+    g._trace = Trace(rid)
+
+
+def after_request(response):
+    """Adds the request id and Server-Timing headers, and exports the trace
+    if the request is sampled."""
+    t = g.get('_trace')
+    if t is None:
+        return response
+    try:
+        response.headers['X-Request-Id'] = t.request_id
+        if uwsgi.opt.get('TRACE_SERVER_TIMING', b'true').decode('utf8').lower() in ('true', '1'):
+            response.headers['Server-Timing'] = server_timing(t)
+        rate = sample_rate()
+        if rate > 0 and random.random() < rate:
+            record = t.to_json()
+            record['path'] = request.path
+            record['status'] = response.status_code
+            export(record)
+    except Exception as e:
+        logging.warning('Failed to finish trace: %s', getattr(e, 'message', repr(e)))
+    return response
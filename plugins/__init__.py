@@ -2,7 +2,7 @@
 # Distributed under the MIT software license, see the accompanying
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 
-from flask import Blueprint
+from flask import Blueprint, Response
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
@@ -42,5 +42,15 @@ def e():
     return info()
 
 
+@app.route('/xrs/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    # exr requires uwsgi, import here so plugin utils remain importable in unit tests
+    from exr import metrics as exr_metrics
+    if not exr_metrics.enabled():
+        return Response(status=404)
+    return Response(response=exr_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 def info():
     return '<h1>Enterprise XRouter host</h1>'
@@ -3,15 +3,16 @@
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 
 import json
-import logging
 import os
 import threading
 import uwsgi
 
-import requests
 from flask import Blueprint, Response, g, jsonify, request
 from requests.auth import HTTPDigestAuth
 
+import exr
+from exr import codec
+from exr.log import get_logger
 
 from plugins.evm_passthrough import util
 from plugins.projects.database.models import db_session, select, Project
@@ -22,6 +23,7 @@ from plugins import limiter
 app = Blueprint('evm_passthrough', __name__)
 limiter.limit("50/minute;3000/hour;72000/day")(app)
 req_handler = RequestHandler()
+log = get_logger(__name__)
 
 
 @app.errorhandler(400)
@@ -85,15 +87,15 @@ def handle_request(evm, project_id, path=None):
         for d in data:
             method = d['method']
             params = d['params']
-            logging.debug('Received Method: {}, Params: {}'.format(method, params))
+            log.debug('Received jsonrpc call', method=method, params=params)
             env_disallowed_methods = uwsgi.opt.get('ETH_HOST_DISALLOWED_METHODS', b'eth_accounts,db_putString,db_getString,db_putHex,db_getHex').decode('utf8')
             # env_disallowed_methods = os.environ.get('ETH_HOST_DISALLOWED_METHODS',
             #                                         'eth_accounts,db_putString,db_getString,db_putHex,db_getHex')
             if method in set(env_disallowed_methods.split(',')):
                 return unauthorized_error(f'disallowed method {method}')
     except Exception as e:
-        logging.debug(e)
-        return Response(headers=project_headers, response=json.dumps({
+        log.debug('%s', e)
+        return Response(headers=project_headers, response=codec.dumps({
             'message': "malformed json post data",
             'error': 1000
         }))
@@ -101,7 +103,7 @@ def handle_request(evm, project_id, path=None):
     try:
         evms = uwsgi.opt.get('HYDRA',b'').decode('utf8').split(',')
         if evm.upper() not in evms:
-            return Response(headers=project_headers, response=json.dumps({
+            return Response(headers=project_headers, response=codec.dumps({
             'message': f"{evm} not found in HYDRA configs",
             'error': 1000
         }))
@@ -121,26 +123,30 @@ def handle_request(evm, project_id, path=None):
         if eth_user:  # only set auth params if defined
             auth = HTTPDigestAuth(eth_user, eth_pass)
             for d in data:
-                response = requests.post(host, headers={**headers,**project_headers}, data=json.dumps(d), auth=auth, timeout=15)
-                results.append(response.json())
+                response = exr.upstream_post(host, headers={**headers,**project_headers}, data=codec.dumps(d), auth=auth, timeout=15)
+                results.append(response.content)
         else:
             for d in data:
-                response = requests.post(host, headers={**headers,**project_headers}, data=json.dumps(d), timeout=15)
-                results.append(response.json())
+                response = exr.upstream_post(host, headers={**headers,**project_headers}, data=codec.dumps(d), timeout=15)
+                results.append(response.content)
 
         # Update api count in background
         update_api_thread = threading.Thread(target=update_api_count, name="update_api_count", args=[project_id])
         update_api_thread.start()
 
-        # If batch request return list
-        return Response(headers={**headers,**project_headers}, response=json.dumps(results if batch or len(results) > 1 else results[0]))
+        # If batch request return list, a single reply is forwarded as is
+        if batch or len(results) > 1:
+            # upstream replies are decoded with the standard library, which
+            # keeps integers wider than 64 bits exact
+            return Response(headers={**headers,**project_headers}, response=codec.dumps([json.loads(r) for r in results]))
+        return Response(headers={**headers,**project_headers}, response=results[0])
     except Exception as e:
-        logging.debug(e)
+        log.debug('%s', e)
         response = {
             'message': "An error has occurred!",
             'error': 1000
         }
-        return Response(headers=project_headers, response=json.dumps(response), status=400)
+        return Response(headers=project_headers, response=codec.dumps(response), status=400)
 
 
 @app.route('/xrs/evm_passthrough/chains', methods=['GET'])
@@ -149,7 +155,7 @@ def evm_passthough_chains():
     response = {
     "evms": evms
     }
-    return Response(response=json.dumps(response), status=200)
+    return Response(response=codec.dumps(response), status=200)
 
 
 @app.route('/xrs/evm_passthrough', methods=['HEAD', 'GET'])
@@ -188,5 +194,5 @@ See https://api.blocknet.org/#hydra-api for API usage.
 
 def update_api_count(project_id):
     res = req_handler.post_update_api_count(project_id)
-    logging.debug('update_api_count {} {}'.format(project_id, res))
+    log.debug('update_api_count', project_id=project_id, res=res)
 
@@ -3,12 +3,15 @@
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 
 import datetime
-import logging
 from enum import IntEnum
 from functools import wraps
 from flask import g, request, jsonify
+from exr import tracing
+from exr.log import get_logger
 from plugins.projects.database.models import db_session, Project, Payment
 
+log = get_logger(__name__)
+
 
 class ApiError(IntEnum):
     MISSING_API_KEY = 1
@@ -86,7 +89,7 @@ def api_error_msg(msg: str, code: ApiError):
 def authenticate(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        logging.debug(f'{request.headers} {request.view_args["project_id"]}')
+        log.debug('authenticate', headers=request.headers, project_id=request.view_args.get('project_id'))
         if 'help' not in request.base_url and 'evm_passthrough' not in request.base_url:
             if 'Api-Key' not in request.headers:
                 return api_error_msg('Missing Api-Key header', ApiError.MISSING_API_KEY)
@@ -97,7 +100,7 @@ def authenticate(f):
         if 'help' not in request.base_url and 'evm_passthrough' not in request.base_url:
             api_key = request.headers.get('Api-Key')
 
-        with db_session:
+        with tracing.span('auth'), db_session:
             if 'help' in request.base_url or 'evm_passthrough' in request.base_url:
                 if 'evm_passthrough' in request.base_url:
                     if 'Api-Key' in request.headers:
@@ -143,7 +146,7 @@ def authenticate(f):
 def half_authenticate(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        logging.debug(f'{request.headers} {request.view_args["project_id"]}')
+        log.debug('authenticate', headers=request.headers, project_id=request.view_args.get('project_id'))
         if 'Api-Key' not in request.headers:
             return api_error_msg('Missing Api-Key header', ApiError.MISSING_API_KEY)
         if 'project_id' not in request.view_args:
@@ -152,7 +155,7 @@ def half_authenticate(f):
         project_id = request.view_args['project_id']
         api_key = request.headers.get('Api-Key')
 
-        with db_session:
+        with tracing.span('auth'), db_session:
            project = Project.get(name=project_id, api_key=api_key)
            payment = Payment.get(project=project_id)
 
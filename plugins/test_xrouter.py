@@ -0,0 +1,118 @@
+# Copyright (c) 2022 The Blocknet developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+# xrouter imports uwsgi, run with:
+#
+#     uwsgi --pythonpath . --pyrun plugins/test_xrouter.py
+
+import io
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import uwsgi
+except ImportError:
+    raise unittest.SkipTest('requires uwsgi')
+
+import exr
+from exr import body
+from plugins import xrouter
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Answers json-rpc and monero daemon calls, the result echoes the call."""
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, request))
+        if self.path == '/get_transactions':
+            response = {'txs': [{'tx_hash': h} for h in request['txs_hashes']], 'status': 'OK'}
+        elif request['params'] == ['wide']:
+            response = {'id': request['id'], 'result': {'n': 123456789012345678901234567890, 'm': -2 ** 64 - 1}}
+        elif request['method'] == 'get_block_count':
+            response = {'id': request['id'], 'result': {'count': 2500000, 'status': 'OK'}}
+        else:
+            response = {'id': request['id'], 'result': {'method': request['method'], 'params': request['params']}}
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Test_call_xrfunc(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        opt = dict(uwsgi.opt)
+        self.addCleanup(lambda: (uwsgi.opt.clear(), uwsgi.opt.update(opt)))
+        for token in ('XMR', 'BLOCK'):
+            uwsgi.opt['RPC_%s_HOSTIP' % token] = b'127.0.0.1'
+            uwsgi.opt['RPC_%s_PORT' % token] = str(self.server.server_address[1]).encode()
+            uwsgi.opt['RPC_%s_USER' % token] = b'user'
+            uwsgi.opt['RPC_%s_PASS' % token] = b'pass'
+
+    def call(self, token: str, xrfunc: str, data: bytes):
+        env = {'CONTENT_LENGTH': str(len(data)), 'wsgi.input': io.BytesIO(data)}
+        return xrouter.call_xrfunc(exr.XR, token, xrfunc, env)
+
+    def test_xmr_getblocks(self):
+        hashes = ['%064x' % i for i in (1, 2, 3)]
+        res = self.call('XMR', 'xrGetBlocks', json.dumps(hashes).encode())
+        self.assertEqual(res, [{'method': 'get_block', 'params': {'hash': h}} for h in hashes])
+        self.assertEqual([(path, r['params']) for path, r in self.server.requests],
+                         [('/json_rpc', {'hash': h}) for h in hashes])
+
+    def test_xmr_gettransactions(self):
+        hashes = ['%064x' % i for i in (1, 2)]
+        res = self.call('XMR', 'xrGetTransactions', json.dumps(hashes).encode())
+        self.assertEqual(res, [{'txs': [{'tx_hash': h}], 'status': 'OK'} for h in hashes])
+        self.assertEqual(self.server.requests, [('/get_transactions', {'txs_hashes': [h], 'decode_as_json': True})
+                                                for h in hashes])
+
+    def test_xmr_single(self):
+        self.assertEqual(self.call('XMR', 'xrGetBlockCount', b''), '2500000')
+        self.assertEqual(self.call('XMR', 'xrGetBlock', b'["ab"]'), {'method': 'get_block', 'params': {'hash': 'ab'}})
+
+    def test_getblocks(self):
+        res = self.call('BLOCK', 'xrGetBlocks', b'["a", "b"]')
+        self.assertEqual(res, [{'method': 'getblock', 'params': [h]} for h in ('a', 'b')])
+        res = self.call('BLOCK', 'xrGetTransactions', b'["a"]')
+        self.assertEqual(res, [{'method': 'getrawtransaction', 'params': ['a', 1]}])
+
+    def test_wide_integers(self):
+        # upstream integers wider than 64 bits are kept exact
+        wide = {'n': 123456789012345678901234567890, 'm': -2 ** 64 - 1}
+        self.assertEqual(self.call('BLOCK', 'xrGetBlock', b'["wide"]'), wide)
+        self.assertEqual(self.call('BLOCK', 'xrGetBlocks', b'["wide", "wide"]'), [wide, wide])
+
+    def test_malformed(self):
+        for token in ('XMR', 'BLOCK'):
+            with self.assertRaises(body.InvalidJson):
+                self.call(token, 'xrGetBlocks', b'{"a": 1}')
+            with self.assertRaises(body.InvalidJson):
+                self.call(token, 'xrGetBlock', b'["a"')
+
+
+if __name__ == '__main__':
+    unittest.main()
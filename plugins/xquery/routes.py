@@ -2,13 +2,13 @@
 # Distributed under the MIT software license, see the accompanying
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 
-import json
 import logging
 import os
 import threading
 import uwsgi
-import requests
 from flask import Blueprint, Response, g, jsonify, request
+import exr
+from exr import codec
 from plugins.projects.middleware import authenticate
 from plugins.projects.util.request_handler import RequestHandler
 from plugins import limiter
@@ -58,8 +58,8 @@ def handle_request(project_id, path=None):
         host = 'http://'+host_ip+':'+host_port+'/v1/graphql'
         headers = {'content-type': 'application/json'}
         if path in ['indexer','indexer/']:
-            response = requests.post(host, headers=headers, json=request.get_json(), timeout=300)
-            resp = json.dumps(response.json())
+            response = exr.upstream_post(host, headers=headers, data=codec.dumps(request.get_json()), timeout=300)
+            resp = response.content
             header = response.headers
             header['Content-Type']='application/json'
             header['Content-Length']=len(resp)
@@ -77,7 +77,7 @@ def handle_request(project_id, path=None):
             'message': "An error has occurred!",
             'error': 1000
         }
-        return Response(headers={**headers,**project_headers}.items(), response=json.dumps(response), status=400)
+        return Response(headers={**headers,**project_headers}.items(), response=codec.dumps(response), status=400)
 
 
 @app.route('/xrs/xquery', methods=['HEAD', 'GET'])
@@ -3,23 +3,28 @@
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 
 import json
-import logging
 
-import requests
 import uwsgi
 from flask import Blueprint, g, request
 from requests.auth import HTTPDigestAuth
 from plugins import limiter
 import exr
+from exr import body, codec, tracing
+from exr.log import get_logger
 
 app = Blueprint('xrouter', __name__)
 limiter.limit("50/minute;3000/hour;72000/day")(app)
+log = get_logger(__name__)
+
+# xrouter calls that make one upstream call per posted id
+FANOUT_METHODS = ('xrgetblocks', 'xrgettransactions')
+
 
 @app.route('/xr/<token>/<method>', methods=['GET', 'POST', 'HEAD'])
 @exr.dec_check_token_method
 @exr.dec_handle_payment
 def xr(token, method):
-    logging.debug('xr handle request: %s %s', token, method)
+    log.debug('xr handle request: %s %s', token, method)
     return handle_request(request, exr.XR)
 
 
@@ -27,10 +32,11 @@ def xr(token, method):
 @exr.dec_check_token_method
 @exr.dec_handle_payment
 def xrs(service):
-    logging.debug('xrs handle request: %s', service)
+    log.debug('xrs handle request: %s', service)
     return handle_request(request, exr.XRS)
 
 
+@tracing.span('handle_request')
 def handle_request(req, namesp):
     token = g.token
     xrfunc = g.xrfunc
@@ -38,6 +44,11 @@ def handle_request(req, namesp):
     try:
         response = call_xrfunc(namesp, token, xrfunc, req.environ)
         return exr.send_response(response, exr.config.get_snodekey())
+    except body.RequestError as e:
+        return exr.send_response({
+            'code': e.code,
+            'error': str(e)
+        }, exr.config.get_snodekey())
     except ValueError as e:
         return exr.send_response({
             'code': 1002,
@@ -51,8 +62,9 @@ def handle_request(req, namesp):
         }, exr.config.get_snodekey())
 
 
+@tracing.span('call_xrfunc')
 def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
-    logging.debug('call_xrfunc_namesp: {} token: {} xrfunc: {} env: {}'.format(namesp, token, xrfunc, env))
+    log.debug('call_xrfunc', namesp=namesp, token=token, xrfunc=xrfunc, env=env)
     is_xrouter_plugin = namesp == exr.XRS
 
     # obtain host info
@@ -63,31 +75,19 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
     rpcver = uwsgi.opt.get('RPC_' + token + '_VER', b'1.0').decode('utf8')
     rpcmethod = ''
 
-    try:
-        request_body_size = int(env.get('CONTENT_LENGTH', 0))
-    except ValueError:
-        request_body_size = 0
-
-    params = []
-    logging.debug('checking request_body_size')
-    if request_body_size > 0:
-        request_body = env.get('wsgi.input').read(request_body_size)
-        if request_body != b'\n':
-            try:
-                data = request_body.decode('utf8')
-                logging.debug('request_body_data: {}'.format(data))
-                params = json.loads(data)
-                logging.debug('params: {}'.format(params))
-            except:
-                pass
+    # fan-out calls iterate the ids while the json array is still being received
+    lazy = not is_xrouter_plugin and xrfunc.lower() in FANOUT_METHODS
+    params = body.read_params(env, xrfunc, lazy=lazy)
+    if not lazy:
+        log.debug('request params', params=params)
 
     if is_xrouter_plugin:
-        logging.debug('is_xrouter_plugin: {}'.format(is_xrouter_plugin))
+        log.debug('xrouter plugin call', token=token)
         if 'RPC_' + token + '_METHOD' in uwsgi.opt:
-            logging.debug('rpcmethod set')
+            log.debug('rpcmethod set')
             rpcmethod = uwsgi.opt.get('RPC_' + token + '_METHOD', b'').decode('utf8')
         elif 'URL_' + token + '_HOSTIP' in uwsgi.opt:
-            logging.debug('CALL_URL_is_xr_plugin_xrfunc: {} params: {} env: {}'.format(xrfunc, params, env))
+            log.debug('call_url xrouter plugin', xrfunc=xrfunc, params=params, env=env)
             return call_url(xrfunc, params, env)
 
     if not rpchost or not rpcport or not rpcuser or not rpcpass or (is_xrouter_plugin and not rpcmethod):
@@ -116,7 +116,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
         if l_xr_method == 'xrdecoderawtransaction':
             pass
         if l_xr_method == 'xrgetblockcount':
-            payload = json.dumps({
+            payload = codec.dumps({
                 'id': 1,
                 'method': rpc_method,
                 'params': params,
@@ -124,13 +124,13 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             })
 
             try:        
-                res = requests.post(rpcurl, headers=headers, data=payload)
+                res = exr.upstream_post(rpcurl, headers=headers, data=payload)
                 try:
                     response = parse_result(json.loads(res.content))
                     count = int(response, 16)
                     return count
                 except ValueError:
-                    return res.content.decode('utf8')  # return raw string if json decode fails
+                    return res.content  # return raw response if json decode fails
             except:
                 return {
                     'code': 1002,
@@ -148,7 +148,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             else:
                 params = [params[0], False]
 
-            payload = json.dumps({
+            payload = codec.dumps({
                 'id': 1,
                 'method': rpc_method,
                 'params': params,
@@ -156,13 +156,13 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             })
 
             try:        
-                res = requests.post(rpcurl, headers=headers, data=payload)
+                res = exr.upstream_post(rpcurl, headers=headers, data=payload)
                 try:
                     response = json.loads(res.content)
                     block_hash = str(response['result']['hash'])
                     return block_hash
                 except ValueError:
-                    return res.content.decode('utf8')  # return raw string if json decode fails
+                    return res.content  # return raw response if json decode fails
             except:
                 return {
                     'code': 1002,
@@ -184,14 +184,14 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
                 params2 = [parsed_id, False]
                 if l_xr_method == 'xrgettransactions':
                     params2 = [parsed_id] # transactions doesn't support 2nd parameter
-                payload = json.dumps({
+                payload = codec.dumps({
                     'id': 1,
                     'method': rpc_method2,
                     'params': params2,
                     'jsonrpc': rpcver
                 })
                 try:
-                    res = requests.post(rpcurl, headers=headers, data=payload)
+                    res = exr.upstream_post(rpcurl, headers=headers, data=payload)
                     response += [parse_result(json.loads(res.content))]
                 except:
                     return {
@@ -218,14 +218,14 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
                 params2 = [b_id]
                 if l_xr_method == 'xrgettransactions' or l_xr_method == 'xrgetblocks':
                     params2 += [1]
-                payload = json.dumps({
+                payload = codec.dumps({
                     'id': 1,
                     'method': rpc_method,
                     'params': params2,
                     'jsonrpc': rpcver
                 })
                 try:
-                    res = requests.post(rpcurl, headers=headers, data=payload)
+                    res = exr.upstream_post(rpcurl, headers=headers, data=payload)
                     response += [parse_result(json.loads(res.content))]
                 except:
                     return {
@@ -240,24 +240,25 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
     elif l_token == 'xmr':
         rpcurl = 'http://' + rpchost + ':' + rpcport + '/json_rpc'
         auth = HTTPDigestAuth(rpcuser,rpcpass)
-        payload = json.dumps({
-            'id': 1,
-            'method': rpc_method,
-            'params': params,
-            'jsonrpc': rpcver
-        })
+        if l_xr_method not in FANOUT_METHODS:  # fan-out ids are consumed below
+            payload = codec.dumps({
+                'id': 1,
+                'method': rpc_method,
+                'params': params,
+                'jsonrpc': rpcver
+            })
 
         if l_xr_method == 'xrdecoderawtransaction':
             pass
         if l_xr_method == 'xrgetblockcount':
             try:                
-                res = requests.post(rpcurl, headers=headers, data=payload, auth=auth)
+                res = exr.upstream_post(rpcurl, headers=headers, data=payload, auth=auth)
                 try:
                     response = json.loads(res.content)
                     count = str(response['result']['count'])
                     return count
                 except ValueError:
-                    return res.content.decode('utf8')  # return raw string if json decode fails
+                    return res.content  # return raw response if json decode fails
             except:
                 return {
                     'code': 1002,
@@ -266,7 +267,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
         if l_xr_method == 'xrgetblockhash':
             params[0] = int(params[0])
         if l_xr_method == 'xrgetblock':
-            payload = json.dumps({
+            payload = codec.dumps({
                 'id': 1,
                 'method': rpc_method,
                 'params': {'hash':params[0]},
@@ -277,14 +278,14 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             for b_id in params:
                 params2 = b_id
                 if l_xr_method == 'xrgetblocks':
-                    payload = json.dumps({
+                    payload = codec.dumps({
                         'id': 1,
                         'method': rpc_method,
                         'params': {'hash':params2},
                         'jsonrpc': rpcver
                     })
                 try:
-                    res = requests.post(rpcurl, headers=headers, data=payload, auth=auth)
+                    res = exr.upstream_post(rpcurl, headers=headers, data=payload, auth=auth)
                     response += [parse_result(json.loads(res.content))]
                 except:
                     return {
@@ -294,7 +295,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             return response
         if l_xr_method == 'xrgettransaction':
             rpcurl = 'http://' + rpchost + ':' + rpcport + '/get_transactions'
-            payload = json.dumps({
+            payload = codec.dumps({
                 'txs_hashes': [params[0]],
                 'decode_as_json': True
             })
@@ -304,12 +305,12 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             for b_id in params:
                 params2 = b_id
                 if l_xr_method == 'xrgettransactions':
-                    payload = json.dumps({
+                    payload = codec.dumps({
                         'txs_hashes': [params2],
                         'decode_as_json': True
                     })
                 try:
-                    res = requests.post(rpcurl, headers=headers, data=payload, auth=auth)
+                    res = exr.upstream_post(rpcurl, headers=headers, data=payload, auth=auth)
                     response += [parse_result(json.loads(res.content))]
                 except:
                     return {
@@ -319,18 +320,18 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
             return response
         if l_xr_method == 'xrsendtransaction':
             rpcurl = 'http://' + rpchost + ':' + rpcport + '/send_raw_transaction'
-            payload = json.dumps({
+            payload = codec.dumps({
                 'tx_as_hex': params[0],
                 'do_not_relay': False
             })
 
         try:            
-            res = requests.post(rpcurl, headers=headers, data=payload, auth=auth)
+            res = exr.upstream_post(rpcurl, headers=headers, data=payload, auth=auth)
             try:
                 response = parse_result(json.loads(res.content))
                 return response
             except ValueError:
-                return res.content.decode('utf8')  # return raw string if json decode fails
+                return res.content  # return raw response if json decode fails
         except:
             return {
                 'code': 1002,
@@ -353,14 +354,14 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
                 params2 = [b_id]
                 if l_xr_method == 'xrgettransactions':
                     params2 += [1]
-                payload = json.dumps({
+                payload = codec.dumps({
                     'id': 1,
                     'method': rpc_method,
                     'params': params2,
                     'jsonrpc': rpcver
                 })
                 try:
-                    res = requests.post(rpcurl, headers=headers, data=payload)
+                    res = exr.upstream_post(rpcurl, headers=headers, data=payload)
                     response += [parse_result(json.loads(res.content))]
                 except:
                     return {
@@ -373,7 +374,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
         if l_xr_method == 'xrsendtransaction':
             pass
 
-    payload = json.dumps({
+    payload = codec.dumps({
         'id': 1,
         'method': rpc_method,
         'params': params,
@@ -381,7 +382,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
     })
 
     try:        
-        res = requests.post(rpcurl, headers=headers, data=payload)
+        res = exr.upstream_post(rpcurl, headers=headers, data=payload)
         try:
             if not is_xrouter_plugin:
                     response = parse_result(json.loads(res.content))
@@ -389,7 +390,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
                     response = json.loads(res.content)
             return response
         except ValueError:
-            return res.content.decode('utf8')  # return raw string if json decode fails
+            return res.content  # return raw response if json decode fails
     except:
         return {
             'code': 1002,
@@ -398,7 +399,7 @@ def call_xrfunc(namesp: str, token: str, xrfunc: str, env: dict):
 
 
 def call_url(xrfunc: str, params: any, env: dict):
-    logging.debug('### call_url_params: {}'.format(params))
+    log.debug('call_url', params=params)
     rpchost = uwsgi.opt.get('URL_' + xrfunc + '_HOSTIP', b'').decode('utf8')
     rpcport = uwsgi.opt.get('URL_' + xrfunc + '_PORT', b'').decode('utf8')
     rpcurl = 'http://' + rpchost + ':' + rpcport + str(env.get('PATH_INFO', b''))
@@ -409,17 +410,13 @@ def call_url(xrfunc: str, params: any, env: dict):
         'XR-Signature': str(env.get('HTTP_XR_SIGNATURE', b'')),
         'XR-Payment': str(env.get('HTTP_XR_PAYMENT', b'')),
     }
-    payload = '' if len(params) == 0 else json.dumps(params)
+    payload = '' if len(params) == 0 else codec.dumps(params)
 
     try:
-        logging.debug('call_url payload: {} headers: {} rpcurl: {}'.format(payload,headers,rpcurl))
-        res = requests.post(rpcurl, headers=headers, data=payload)
-        try:
-            logging.debug('call_url_post_response: {}'.format(res.text))
-            response = res.text
-            return response
-        except:
-            return res.content.decode('utf8')
+        log.debug('call_url post', payload=payload, headers=headers, rpcurl=tracing.safe_url(rpcurl))
+        res = exr.upstream_post(rpcurl, headers=headers, data=payload)
+        log.debug('call_url response', content=res.content)
+        return res.content
     except:
         return {
             'code': 1002,
@@ -9,7 +9,7 @@ import importlib
 import uwsgi
 from flask import Flask
 import bitcoin.wallet
-from exr import config
+from exr import config, log, metrics, tracing
 from plugins import app as webapp, xrouter
 from plugins import limiter
 
@@ -17,13 +17,17 @@ app = Flask('main')
 limiter.init_app(app)
 app.register_blueprint(webapp)
 app.register_blueprint(xrouter.app)
+app.before_request(tracing.before_request)
+app.before_request(metrics.before_request)
+app.after_request(tracing.after_request)
+app.after_request(metrics.after_request)
 
 # logging
 LOGLEVEL = os.environ.get('LOGLEVEL', 'WARNING').upper()
 #LOGLEVEL = os.environ.get('LOGLEVEL', 'INFO').upper()
-logging.basicConfig(level=LOGLEVEL,
-                    format='%(asctime)s %(levelname)s - %(message)s',
-                    datefmt='[%Y-%m-%d:%H:%M:%S]')
+LOG_JSON = os.environ.get('LOG_JSON', 'false').lower() in ('true', '1')
+LOG_SAMPLE_RATE = os.environ.get('LOG_SAMPLE_RATE', '1')
+log.setup(LOGLEVEL, json_output=LOG_JSON, sample_rate=LOG_SAMPLE_RATE)
 
 UTXO_PLUGIN_METHODS = ['getutxos','getrawtransaction','getrawmempool','getblockcount','sendrawtransaction','gettransaction','getblock','getblockhash','heights','fees','getbalance','getaddresshistory','ping']
 
@@ -71,4 +75,5 @@ if __name__ == 'wsgi':
             logging.error('bad service node key: %s', getattr(e, 'message', repr(e)))
             exit(1)
 
+    metrics.init()
     load_plugins()